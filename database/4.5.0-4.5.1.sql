@@ -0,0 +1,5 @@
+-- heartbeat counter used to measure the lag of the replicas
+CREATE TABLE `heartbeat` (
+  `beat` bigint(20) unsigned NOT NULL DEFAULT '0'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8 COMMENT='Incremented by the server to measure the lag of the replicas';
+INSERT INTO `heartbeat` (`beat`) VALUES (0);
@@ -30,16 +30,21 @@
 #  Henry Precheur <henry@precheur.org> (2004)
 
 from twisted.internet import reactor, defer
+from twisted.python.runtime import seconds
 from pokernetwork.util.trace import format_exc
 
+from uuid import uuid4
+
 from pokernetwork.user import User, checkNameAndPassword, checkAuth
 
 from pokerpackets.packets import *
 from pokerpackets.networkpackets import *
+from pokerpackets.dictpack import packet2dict
 
 from pokernetwork.pokerexplain import PokerExplain
 from pokernetwork.pokerrestclient import PokerRestClient
 from pokernetwork.pokerpacketizer import createCache, history2packets, private2public
+from pokernetwork.pokerqueue import PacketQueue
 
 from pokerengine.pokertournament import TOURNAMENT_STATE_REGISTERING, TOURNAMENT_STATE_CANCELED, TOURNAMENT_STATE_RUNNING
 from pokerengine.pokergame import init_i18n as pokergame_init_i18n
@@ -49,6 +54,33 @@ log = network_log.get_child('pokeravatar')
 
 DEFAULT_PLAYER_USER_DATA = {'ready': True}
 
+#
+# PokerAvatar.handlePacketLogic looks up the handler of a packet in
+# PACKET_HANDLERS, filled by the @handles decorator of the methods.
+#
+#   HANDLER_PUBLIC    handled before checking that the user is authorized
+#   HANDLER_LOBBY     handled regardless of the tables
+#   HANDLER_TABLE     handled if the packet is for a table the avatar joined
+#   HANDLER_NO_TABLE  handled if the packet is not for such a table
+#
+# The handlers are looked up by name so that a subclass can override them.
+#
+HANDLER_PUBLIC = 'public'
+HANDLER_LOBBY = 'lobby'
+HANDLER_TABLE = 'table'
+HANDLER_NO_TABLE = 'no_table'
+
+NO_HANDLER = (None, None)
+
+PACKET_HANDLERS = {}
+
+def handles(kind, *packet_types):
+    def register(function):
+        for packet_type in packet_types:
+            PACKET_HANDLERS[packet_type] = (kind, function.__name__)
+        return function
+    return register
+
 class PokerAvatar:
 
     log = log.get_child('PokerAvatar')
@@ -61,9 +93,10 @@ class PokerAvatar:
         self.localeFunc = None
         self.roles = set()
         self.service = service
+        self.metrics = getattr(service, 'metrics', None)
         self.tables = {}
         self.user = User()
-        self._packets_queue = []
+        self._packets_queue = PacketQueue()
         self.warnedPacketExcess = False
         self.tourneys = []
         self.setExplain(0)
@@ -255,11 +288,12 @@ class PokerAvatar:
         """takes PokerAvatar object and a newPackets as arguments, and
         extends the self._queue_packets variable by that packet.  Checking
         is done to make sure we haven't exceeded server-wide limits on
-        packet queue length.  PokerAvatar will be force-disconnected if
-        the packets exceed the value of
-        self.service.getClientQueuedPacketMax().  A warning will be
-        printed when the packet queue reaches 75% of the limit imposed by
-        self.service.getClientQueuedPacketMax()"""
+        packet queue length.  When the limit imposed by
+        self.service.getClientQueuedPacketMax() is reached, the state
+        packets superseded by a more recent one are removed from the
+        queue. PokerAvatar will be force-disconnected if the packets
+        still exceed the limit.  A warning will be printed when the
+        packet queue reaches 75% of the limit"""
         # This method was introduced when we added the force-disconnect as
         # the stop-gap.
         self._packets_queue.extend(newPackets)
@@ -274,17 +308,19 @@ class PokerAvatar:
                     warnVal,
                     self.service.getClientQueuedPacketMax()
                 )
+            if len(self._packets_queue) >= self.service.getClientQueuedPacketMax():
+                removed = self._packets_queue.compact()
+                if removed:
+                    self.log.debug("user %d lags, %d superseded packets removed from the queue", self.getSerial(), removed)
             if len(self._packets_queue) >= self.service.getClientQueuedPacketMax():
                 self.service.forceAvatarDestroy(self)
 
     def resetPacketsQueue(self):
         self.warnedPacketExcess = False
-        queue = self._packets_queue
-        self._packets_queue = []
-        return queue
+        return self._packets_queue.reset()
 
     def removeGamePacketsQueue(self, game_id):
-        self._packets_queue = filter(lambda packet: not hasattr(packet, "game_id") or packet.game_id != game_id, self._packets_queue)
+        self._packets_queue.remove(game_id)
 
     def sendPacket(self, packet):
         # switch the game to the avatar's locale temporarily
@@ -314,6 +350,17 @@ class PokerAvatar:
         if self.localeFunc:
             pokergame_init_i18n('', pokergameSavedUnder)
 
+    def spectatorProtocol(self):
+        """The protocol the packets of a spectator stream are written to
+        as bytes shared with the other spectators, or None if they must go
+        through sendPacket (locale, explain or queue)."""
+        protocol = self.protocol
+        if self.localeFunc or self.explain or self._queue_packets or protocol is None:
+            return None
+        if getattr(protocol, 'packetsEncoding', None) is None or protocol.packetsEncoding() is None:
+            return None
+        return protocol
+
     def sendPacketVerbose(self, packet):
         if hasattr(packet, 'type') and packet.type != PACKET_PING:
             self.log.debug("sendPacket: %s", packet)
@@ -381,6 +428,27 @@ class PokerAvatar:
         else:
             return self.handlePacketDefer(packet)
 
+    def handleRoutedPacket(self, packet):
+        #
+        # used by the front of a supervised server: packets related to a
+        # table or a tourney owned by a worker are forwarded to it and
+        # the answers are sent to the client when they come back.
+        #
+        resthost, game_id = self.service.packet2resthost(packet)
+        if not resthost:
+            return self.handlePacket(packet)
+        if not self.distributed_uid:
+            self.setDistributedArgs(uuid4().hex, uuid4().hex)
+        if self.isLogged():
+            #
+            # the worker authenticates the session with the memcache
+            # entry, the same way PokerSite.updateSession does for REST
+            #
+            self.service.memcache.set(self.distributed_auth, str(self.getSerial()), time=0)
+        data = Packet.JSON.encode(packet2dict(packet, False))
+        self.distributePacket(packet, data, resthost, game_id)
+        return []
+
     def handlePokerState(self, packet, resthost, game_id):
         packets = []
         if not self.explain: return packets
@@ -455,7 +523,7 @@ class PokerAvatar:
             self.longPollReturn()
             return []
 
-        self.handlePacketLogic(packet)
+        self.handlePacketMeasured(packet)
         packets = self.resetPacketsQueue()
         if len(packets) == 1 and isinstance(packets[0], defer.Deferred):
             d = packets[0]
@@ -474,517 +542,592 @@ class PokerAvatar:
 
     def handlePacket(self, packet):
         self.queuePackets()
-        self.handlePacketLogic(packet)
+        self.handlePacketMeasured(packet)
         self.noqueuePackets()
         return self.resetPacketsQueue()
 
+    def handlePacketMeasured(self, packet):
+        if not self.metrics:
+            return self.handlePacketLogic(packet)
+        start = seconds()
+        try:
+            self.handlePacketLogic(packet)
+        finally:
+            self.metrics.record(packet.type, seconds() - start)
+
     def handlePacketLogic(self, packet):
         if packet.type != PACKET_PING:
             self.log.debug("handlePacketLogic: %s", packet)
 
-        if packet.type == PACKET_POKER_EXPLAIN:
-            if self.setExplain(packet.value):
-                self.sendPacketVerbose(PacketAck())
-            else:
-                self.sendPacketVerbose(PacketError(other_type = PACKET_POKER_EXPLAIN))
-            return
-        
-        if packet.type == PACKET_POKER_SET_LOCALE:
-            if self.setLocale(packet.locale):
-                self.sendPacketVerbose(PacketAck())
-            else:
-                self.sendPacketVerbose(PacketPokerError(
-                     serial = self.getSerial(), 
-                     other_type = PACKET_POKER_SET_LOCALE
-                ))
+        kind, name = PACKET_HANDLERS.get(packet.type, NO_HANDLER)
+        if kind == HANDLER_PUBLIC:
+            getattr(self, name)(packet)
             return
 
-        if packet.type == PACKET_POKER_STATS_QUERY:
-            self.sendPacketVerbose(self.service.stats(packet.string))
-            return
-        
-        if packet.type == PACKET_POKER_MONITOR:
-            self.sendPacketVerbose(self.service.monitor(self))
-            return
-        
-        if packet.type == PACKET_PING:
-            return
-        
         if not self.isAuthorized(packet.type):
             self.sendPacketVerbose(PacketAuthRequest())
             return
 
-        if packet.type in (PACKET_LOGIN,PACKET_AUTH):
-            if self.isLogged():
-                self.sendPacketVerbose(PacketError(
-                    other_type = PACKET_LOGIN,
-                    code = PacketLogin.LOGGED,
-                    message = "already logged in"
-                ))
-            else:
-                self.auth(packet)
-            return
+        if kind == HANDLER_LOBBY:
+            #
+            # a lobby handler returns True when the packet must also go
+            # through the table dispatch below
+            #
+            if not getattr(self, name)(packet):
+                return
+            kind, name = NO_HANDLER
 
-        if packet.type == PACKET_POKER_GET_PLAYER_PLACES:
-            if packet.serial != 0:
-                self.sendPacketVerbose(self.service.getPlayerPlaces(packet.serial))
-            else:
-                self.sendPacketVerbose(self.service.getPlayerPlacesByName(packet.name))
-            return
+        table = self.packet2table(packet)
+        if table:
+            self.log.debug("packet for table %s", table.game.id)
+            if kind == HANDLER_TABLE:
+                getattr(self, name)(packet, table, table.game)
+            table.update()
+        elif kind == HANDLER_NO_TABLE:
+            getattr(self, name)(packet)
+
+    #
+    # Handlers of the packets that do not need to be authorized
+    #
+    @handles(HANDLER_PUBLIC, PACKET_POKER_EXPLAIN)
+    def handlePacketPokerExplain(self, packet):
+        if self.setExplain(packet.value):
+            self.sendPacketVerbose(PacketAck())
+        else:
+            self.sendPacketVerbose(PacketError(other_type = PACKET_POKER_EXPLAIN))
 
-        if packet.type == PACKET_POKER_GET_PLAYER_INFO:
-            self.sendPacketVerbose(self.getPlayerInfo())
-            return
+    @handles(HANDLER_PUBLIC, PACKET_POKER_SET_LOCALE)
+    def handlePacketPokerSetLocale(self, packet):
+        if self.setLocale(packet.locale):
+            self.sendPacketVerbose(PacketAck())
+        else:
+            self.sendPacketVerbose(PacketPokerError(
+                 serial = self.getSerial(), 
+                 other_type = PACKET_POKER_SET_LOCALE
+            ))
 
-        if packet.type == PACKET_POKER_GET_USER_INFO:
-            if self.getSerial() == packet.serial:
-                self.getUserInfo(packet.serial)
-            else:
-                self.log.inform("attempt to get user info for user %d by user %d", packet.serial, self.getSerial())
-            return
+    @handles(HANDLER_PUBLIC, PACKET_POKER_STATS_QUERY)
+    def handlePacketPokerStatsQuery(self, packet):
+        self.sendPacketVerbose(self.service.stats(packet.string))
 
-        elif packet.type == PACKET_POKER_GET_PERSONAL_INFO:
-            if self.getSerial() == packet.serial:
-                self.getPersonalInfo(packet.serial)
-            else:
-                self.log.inform("attempt to get personal info for user %d by user %d", packet.serial, self.getSerial())
-                self.sendPacketVerbose(PacketAuthRequest())
-            return
-        elif packet.type == PACKET_SET_OPTION:
-            if self.getSerial() == packet.serial:
-                self.setOption(packet.game_id, packet.option_id, packet.value)
-            else:
-                self.log.inform("attempt to set a option for user %d by user %d", packet.serial, self.getSerial())
-            return
-        elif packet.type == PACKET_POKER_PLAYER_INFO:
-            if self.getSerial() == packet.serial:
-                if self.setPlayerInfo(packet):
-                    self.sendPacketVerbose(packet)
-                else:
-                    self.sendPacketVerbose(PacketError(
-                        other_type = PACKET_POKER_PLAYER_INFO,
-                        code = PACKET_POKER_PLAYER_INFO,
-                        message = "Failed to save set player information"
-                    ))
-            else:
-                self.log.inform("attempt to set player info for player %d by player %d", packet.serial, self.getSerial())
-            return
-                
-        elif packet.type == PACKET_POKER_PERSONAL_INFO:
-            if self.getSerial() == packet.serial:
-                self.setPersonalInfo(packet)
-            else:
-                self.log.inform("attempt to set player info for player %d by player %d", packet.serial, self.getSerial())
-            return
+    @handles(HANDLER_PUBLIC, PACKET_POKER_MONITOR)
+    def handlePacketPokerMonitor(self, packet):
+        self.sendPacketVerbose(self.service.monitor(self))
 
-        elif packet.type == PACKET_POKER_CASH_IN:
-            if self.getSerial() == packet.serial:
-                self.sendPacket(self.service.cashIn(packet))
-            else:
-                self.log.inform("attempt to cash in for user %d by user %d", packet.serial, self.getSerial())
-                self.sendPacketVerbose(PacketPokerError(serial = self.getSerial(), other_type = PACKET_POKER_CASH_IN))
-            return
+    @handles(HANDLER_PUBLIC, PACKET_PING)
+    def handlePacketPing(self, packet):
+        pass
 
-        elif packet.type == PACKET_POKER_CASH_OUT:
-            if self.getSerial() == packet.serial:
-                self.sendPacketVerbose(self.service.cashOut(packet))
-            else:
-                self.log.inform("attempt to cash out for user %d by user %d", packet.serial, self.getSerial())
-                self.sendPacketVerbose(PacketPokerError(serial = self.getSerial(), other_type = PACKET_POKER_CASH_OUT))
-            return
+    #
+    # Handlers of the packets that are not related to a table
+    #
+    @handles(HANDLER_LOBBY, PACKET_LOGIN, PACKET_AUTH)
+    def handlePacketLogin(self, packet):
+        if self.isLogged():
+            self.sendPacketVerbose(PacketError(
+                other_type = PACKET_LOGIN,
+                code = PacketLogin.LOGGED,
+                message = "already logged in"
+            ))
+        else:
+            self.auth(packet)
 
-        elif packet.type == PACKET_POKER_CASH_QUERY:
-            self.sendPacketVerbose(self.service.cashQuery(packet))
-            return
+    @handles(HANDLER_LOBBY, PACKET_POKER_GET_PLAYER_PLACES)
+    def handlePacketPokerGetPlayerPlaces(self, packet):
+        if packet.serial != 0:
+            self.sendPacketVerbose(self.service.getPlayerPlaces(packet.serial))
+        else:
+            self.sendPacketVerbose(self.service.getPlayerPlacesByName(packet.name))
 
-        elif packet.type == PACKET_POKER_CASH_OUT_COMMIT:
-            self.sendPacketVerbose(self.service.cashOutCommit(packet))
-            return
+    @handles(HANDLER_LOBBY, PACKET_POKER_GET_PLAYER_INFO)
+    def handlePacketPokerGetPlayerInfo(self, packet):
+        self.sendPacketVerbose(self.getPlayerInfo())
 
-        elif packet.type == PACKET_POKER_SET_ROLE:
-            self.sendPacketVerbose(self.setRole(packet))
-            return 
+    @handles(HANDLER_LOBBY, PACKET_POKER_GET_USER_INFO)
+    def handlePacketPokerGetUserInfo(self, packet):
+        if self.getSerial() == packet.serial:
+            self.getUserInfo(packet.serial)
+        else:
+            self.log.inform("attempt to get user info for user %d by user %d", packet.serial, self.getSerial())
 
-        elif packet.type in (PACKET_POKER_SET_ACCOUNT,PACKET_POKER_CREATE_ACCOUNT):
-            if self.getSerial() != packet.serial:
-                packet.serial = 0
-            self.sendPacketVerbose(self.service.setAccount(packet))
-            return
+    @handles(HANDLER_LOBBY, PACKET_POKER_GET_PERSONAL_INFO)
+    def handlePacketPokerGetPersonalInfo(self, packet):
+        if self.getSerial() == packet.serial:
+            self.getPersonalInfo(packet.serial)
+        else:
+            self.log.inform("attempt to get personal info for user %d by user %d", packet.serial, self.getSerial())
+            self.sendPacketVerbose(PacketAuthRequest())
 
-        if packet.type == PACKET_POKER_TOURNEY_SELECT:
-            tourneys = self.service.tourneySelect(packet.string)
-            
-            self.sendPacketVerbose(PacketPokerTourneyList(
-                packets = [PacketPokerTourney(**tourney) for tourney in tourneys]
-            ))
-            tourneyInfo = self.service.tourneySelectInfo(packet, tourneys)
-            if tourneyInfo:
-                self.sendPacketVerbose(tourneyInfo)
-            return
-        
-        elif packet.type == PACKET_POKER_TOURNEY_REQUEST_PLAYERS_LIST:
-            self.sendPacketVerbose(self.service.tourneyPlayersList(packet.tourney_serial))
-            return
+    @handles(HANDLER_LOBBY, PACKET_SET_OPTION)
+    def handlePacketSetOption(self, packet):
+        if self.getSerial() == packet.serial:
+            self.setOption(packet.game_id, packet.option_id, packet.value)
+        else:
+            self.log.inform("attempt to set a option for user %d by user %d", packet.serial, self.getSerial())
 
-        elif packet.type == PACKET_POKER_GET_TOURNEY_MANAGER:
-            self.sendPacketVerbose(self.service.tourneyManager(packet.tourney_serial))
-            return
-        
-        elif packet.type == PACKET_POKER_GET_TOURNEY_PLAYER_STATS:
-            if self.getSerial() == packet.serial:
-                self.sendPacketVerbose(self.service.tourneyPlayerStats(packet.tourney_serial,packet.serial))
+    @handles(HANDLER_LOBBY, PACKET_POKER_PLAYER_INFO)
+    def handlePacketPokerPlayerInfo(self, packet):
+        if self.getSerial() == packet.serial:
+            if self.setPlayerInfo(packet):
+                self.sendPacketVerbose(packet)
             else:
-                self.log.inform("attempt to receive stats in tournament %d for player %d by player %d",
-                    packet.tourney_serial, packet.serial, self.getSerial()
-                )
-            return
+                self.sendPacketVerbose(PacketError(
+                    other_type = PACKET_POKER_PLAYER_INFO,
+                    code = PACKET_POKER_PLAYER_INFO,
+                    message = "Failed to save set player information"
+                ))
+        else:
+            self.log.inform("attempt to set player info for player %d by player %d", packet.serial, self.getSerial())
+
+    @handles(HANDLER_LOBBY, PACKET_POKER_PERSONAL_INFO)
+    def handlePacketPokerPersonalInfo(self, packet):
+        if self.getSerial() == packet.serial:
+            self.setPersonalInfo(packet)
+        else:
+            self.log.inform("attempt to set player info for player %d by player %d", packet.serial, self.getSerial())
+
+    @handles(HANDLER_LOBBY, PACKET_POKER_CASH_IN)
+    def handlePacketPokerCashIn(self, packet):
+        if self.getSerial() == packet.serial:
+            self.sendPacket(self.service.cashIn(packet))
+        else:
+            self.log.inform("attempt to cash in for user %d by user %d", packet.serial, self.getSerial())
+            self.sendPacketVerbose(PacketPokerError(serial = self.getSerial(), other_type = PACKET_POKER_CASH_IN))
+
+    @handles(HANDLER_LOBBY, PACKET_POKER_CASH_OUT)
+    def handlePacketPokerCashOut(self, packet):
+        if self.getSerial() == packet.serial:
+            self.sendPacketVerbose(self.service.cashOut(packet))
+        else:
+            self.log.inform("attempt to cash out for user %d by user %d", packet.serial, self.getSerial())
+            self.sendPacketVerbose(PacketPokerError(serial = self.getSerial(), other_type = PACKET_POKER_CASH_OUT))
+
+    @handles(HANDLER_LOBBY, PACKET_POKER_CASH_QUERY)
+    def handlePacketPokerCashQuery(self, packet):
+        self.sendPacketVerbose(self.service.cashQuery(packet))
+
+    @handles(HANDLER_LOBBY, PACKET_POKER_CASH_OUT_COMMIT)
+    def handlePacketPokerCashOutCommit(self, packet):
+        self.sendPacketVerbose(self.service.cashOutCommit(packet))
+
+    @handles(HANDLER_LOBBY, PACKET_POKER_SET_ROLE)
+    def handlePacketPokerSetRole(self, packet):
+        self.sendPacketVerbose(self.setRole(packet))
+
+    @handles(HANDLER_LOBBY, PACKET_POKER_SET_ACCOUNT, PACKET_POKER_CREATE_ACCOUNT)
+    def handlePacketPokerSetAccount(self, packet):
+        if self.getSerial() != packet.serial:
+            packet.serial = 0
+        self.sendPacketVerbose(self.service.setAccount(packet))
+
+    @handles(HANDLER_LOBBY, PACKET_POKER_TOURNEY_SELECT)
+    def handlePacketPokerTourneySelect(self, packet):
+        tourneys = self.service.tourneySelect(packet.string)
         
-        elif packet.type == PACKET_POKER_TOURNEY_REGISTER:
-            if self.getSerial() == packet.serial:
-                self.service.autorefill(packet.serial)
-                self.service.tourneyRegister(packet)
-                self.tourneyUpdates(packet.serial)
-            else:
-                self.log.inform("attempt to register in tournament %d for player %d by player %d",
-                    packet.tourney_serial, packet.serial, self.getSerial()
-                )
-            return
-            
-        elif packet.type == PACKET_POKER_TOURNEY_UNREGISTER:
-            if self.getSerial() == packet.serial:
-                self.sendPacketVerbose(self.service.tourneyUnregister(packet))
-                self.tourneyUpdates(packet.serial)
-            else:
-                self.log.inform("attempt to unregister from tournament %d for player %d by player %d",
-                    packet.tourney_serial, packet.serial, self.getSerial()
-                )
-            return
-            
-        elif packet.type == PACKET_POKER_TABLE_REQUEST_PLAYERS_LIST:
-            self.listPlayers(packet)
-            return
+        self.sendPacketVerbose(PacketPokerTourneyList(
+            packets = [PacketPokerTourney(**tourney) for tourney in tourneys]
+        ))
+        tourneyInfo = self.service.tourneySelectInfo(packet, tourneys)
+        if tourneyInfo:
+            self.sendPacketVerbose(tourneyInfo)
 
-        elif packet.type == PACKET_POKER_TABLE_SELECT:
-            self.listTables(packet)
-            return
+    @handles(HANDLER_LOBBY, PACKET_POKER_TOURNEY_REQUEST_PLAYERS_LIST)
+    def handlePacketPokerTourneyRequestPlayersList(self, packet):
+        self.sendPacketVerbose(self.service.tourneyPlayersList(packet.tourney_serial))
 
-        elif packet.type == PACKET_POKER_HAND_SELECT:
-            self.listHands(packet, self.getSerial())
-            return
+    @handles(HANDLER_LOBBY, PACKET_POKER_GET_TOURNEY_MANAGER)
+    def handlePacketPokerGetTourneyManager(self, packet):
+        self.sendPacketVerbose(self.service.tourneyManager(packet.tourney_serial))
 
-        elif packet.type == PACKET_POKER_HAND_HISTORY:
-            if self.getSerial() == packet.serial:
-                self.sendPacketVerbose(self.service.getHandHistory(packet.game_id, packet.serial))
-            else:
-                self.log.inform("attempt to get history of player %d by player %d", packet.serial, self.getSerial())
-            return
+    @handles(HANDLER_LOBBY, PACKET_POKER_GET_TOURNEY_PLAYER_STATS)
+    def handlePacketPokerGetTourneyPlayerStats(self, packet):
+        if self.getSerial() == packet.serial:
+            self.sendPacketVerbose(self.service.tourneyPlayerStats(packet.tourney_serial,packet.serial))
+        else:
+            self.log.inform("attempt to receive stats in tournament %d for player %d by player %d",
+                packet.tourney_serial, packet.serial, self.getSerial()
+            )
 
-        elif packet.type == PACKET_POKER_HAND_SELECT_ALL:
-            self.listHands(packet, None)
-            return
+    @handles(HANDLER_LOBBY, PACKET_POKER_TOURNEY_REGISTER)
+    def handlePacketPokerTourneyRegister(self, packet):
+        if self.getSerial() == packet.serial:
+            self.service.autorefill(packet.serial)
+            d = self.service.tourneyRegisterAsync(packet)
+            d.addCallback(lambda registered: self.tourneyUpdates(packet.serial))
+        else:
+            self.log.inform("attempt to register in tournament %d for player %d by player %d",
+                packet.tourney_serial, packet.serial, self.getSerial()
+            )
+
+    @handles(HANDLER_LOBBY, PACKET_POKER_TOURNEY_UNREGISTER)
+    def handlePacketPokerTourneyUnregister(self, packet):
+        if self.getSerial() == packet.serial:
+            self.sendPacketVerbose(self.service.tourneyUnregister(packet))
+            self.tourneyUpdates(packet.serial)
+        else:
+            self.log.inform("attempt to unregister from tournament %d for player %d by player %d",
+                packet.tourney_serial, packet.serial, self.getSerial()
+            )
+
+    @handles(HANDLER_LOBBY, PACKET_POKER_TABLE_REQUEST_PLAYERS_LIST)
+    def handlePacketPokerTableRequestPlayersList(self, packet):
+        self.listPlayers(packet)
+
+    @handles(HANDLER_LOBBY, PACKET_POKER_TABLE_SELECT)
+    def handlePacketPokerTableSelect(self, packet):
+        self.listTables(packet)
 
-        elif packet.type == PACKET_POKER_TABLE_JOIN:
-            if packet.game_id not in self.service.tables:
-                description = self.service.loadTableConfig(packet.game_id)
-                if not description:
-                    self.log.inform("Could not load table config: %d", packet.game_id)
-                    # check if player is on any of servers tables (in case of missed PacketPokerTableMove)
-                    for table_serial, table in self.service.tables.iteritems():
-                        if self.getSerial() in table.game.serial2player:
-                            self.sendPacketVerbose(PacketPokerTableMove(
-                                serial = self.getSerial(),
-                                game_id = packet.game_id,
-                                to_game_id = table_serial
-                            ))
-                            break
-                    else:
-                        self.sendPacketVerbose(PacketError(
+    @handles(HANDLER_LOBBY, PACKET_POKER_HAND_SELECT)
+    def handlePacketPokerHandSelect(self, packet):
+        self.listHands(packet, self.getSerial())
+
+    @handles(HANDLER_LOBBY, PACKET_POKER_HAND_HISTORY)
+    def handlePacketPokerHandHistory(self, packet):
+        if self.getSerial() == packet.serial:
+            self.sendPacketVerbose(self.service.getHandHistory(packet.game_id, packet.serial))
+        else:
+            self.log.inform("attempt to get history of player %d by player %d", packet.serial, self.getSerial())
+
+    @handles(HANDLER_LOBBY, PACKET_POKER_HAND_SELECT_ALL)
+    def handlePacketPokerHandSelectAll(self, packet):
+        self.listHands(packet, None)
+
+    @handles(HANDLER_LOBBY, PACKET_POKER_TABLE_JOIN)
+    def handlePacketPokerTableJoin(self, packet):
+        if packet.game_id not in self.service.tables:
+            description = self.service.loadTableConfig(packet.game_id)
+            if not description:
+                self.log.inform("Could not load table config: %d", packet.game_id)
+                # check if player is on any of servers tables (in case of missed PacketPokerTableMove)
+                for table_serial, table in self.service.tables.iteritems():
+                    if self.getSerial() in table.game.serial2player:
+                        self.sendPacketVerbose(PacketPokerTableMove(
                             serial = self.getSerial(),
-                            code = PacketPokerTableJoin.DOES_NOT_EXIST,
-                            message = "The requested table does not exists.",
-                            other_type = packet.type
+                            game_id = packet.game_id,
+                            to_game_id = table_serial
                         ))
-                    return
-                self.service.spawnTable(packet.game_id, **description)
-            self.performPacketPokerTableJoin(packet)
-            return
+                        break
+                else:
+                    self.sendPacketVerbose(PacketError(
+                        serial = self.getSerial(),
+                        code = PacketPokerTableJoin.DOES_NOT_EXIST,
+                        message = "The requested table does not exists.",
+                        other_type = packet.type
+                    ))
+                return
+            self.service.spawnTable(packet.game_id, **description)
+        self.performPacketPokerTableJoin(packet)
+
+    @handles(HANDLER_LOBBY, PACKET_POKER_TABLE_PICKER)
+    def handlePacketPokerTablePicker(self, packet):
+        self.performPacketPokerTablePicker(packet)
 
-        elif packet.type == PACKET_POKER_TABLE_PICKER:
-            self.performPacketPokerTablePicker(packet)
+    @handles(HANDLER_LOBBY, PACKET_POKER_UPDATE_MONEY)
+    def handlePacketPokerUpdateMoney(self, packet):
+        if not self.user.hasPrivilege(User.ADMIN) and tourney.bailor_serial != serial:
+            self.log.error("User %d has no admin privileges to update money", (self.user.serial))
+            self.sendPacketVerbose(PacketError(
+                other_type = PACKET_POKER_UPDATE_MONEY,
+                code = PacketPokerUpdateMoney.NO_ADMIN,
+                message = "User %d has no admin privileges to update money" % (self.user.serial)
+            ))
+            return
+        self.log.inform("got: %s", str(packet))
+        # this packet is not handled with other table packets since this action will most likley
+        # be requested by an admin useres that has not joined yet to the table
+        if packet.game_id not in self.service.tables:
+            self.log.error("PACKET_POKER_UPDATE_MONEY: table %r does not exist", packet.game_id)
+            self.sendPacketVerbose(PacketError(
+                other_type = PACKET_POKER_UPDATE_MONEY,
+                code = PacketPokerUpdateMoney.NO_TABLE,
+                message = "table %r does not exist" % (packet.game_id)
+            ))
             return
+        table = self.service.tables[packet.game_id]
+        if len(packet.serials) != len(packet.chips):
+            self.sendPacketVerbose(PacketError(
+                other_type = PACKET_POKER_UPDATE_MONEY,
+                code = PacketPokerUpdateMoney.SERIALS_MONEY_MISMATCH,
+                message = "unequal amount of serials and money"
+            ))
+            return
+        player_money = zip(packet.serials, packet.chips)
+        if not table.updatePlayersMoney(player_money, absolute_values=packet.absolute):
+            # do not return here, since it is possible, that something has changed
+            self.log.error("something went wrong while updating player money for game %d, %r", packet.game_id, player_money)
+            self.sendPacketVerbose(PacketError(
+                other_type = PACKET_POKER_UPDATE_MONEY,
+                code = PacketPokerUpdateMoney.OTHER_ERROR,
+                message = "table %r does not exist" % (packet.game_id)
+            ))
+        self.sendPacketVerbose(PacketAck())
+        table.update()
+        # the table the avatar joined, if any, is updated as well
+        return True
 
-        elif packet.type == PACKET_POKER_UPDATE_MONEY:
-            if not self.user.hasPrivilege(User.ADMIN) and tourney.bailor_serial != serial:
-                self.log.error("User %d has no admin privileges to update money", (self.user.serial))
-                self.sendPacketVerbose(PacketError(
-                    other_type = PACKET_POKER_UPDATE_MONEY,
-                    code = PacketPokerUpdateMoney.NO_ADMIN,
-                    message = "User %d has no admin privileges to update money" % (self.user.serial)
-                ))
-                return
-            self.log.inform("got: %s", str(packet))
-            # this packet is not handled with other table packets since this action will most likley
-            # be requested by an admin useres that has not joined yet to the table
-            if packet.game_id not in self.service.tables:
-                self.log.error("PACKET_POKER_UPDATE_MONEY: table %r does not exist", packet.game_id)
-                self.sendPacketVerbose(PacketError(
-                    other_type = PACKET_POKER_UPDATE_MONEY,
-                    code = PacketPokerUpdateMoney.NO_TABLE,
-                    message = "table %r does not exist" % (packet.game_id)
-                ))
-                return
-            table = self.service.tables[packet.game_id]
-            if len(packet.serials) != len(packet.chips):
-                self.sendPacketVerbose(PacketError(
-                    other_type = PACKET_POKER_UPDATE_MONEY,
-                    code = PacketPokerUpdateMoney.SERIALS_MONEY_MISMATCH,
-                    message = "unequal amount of serials and money"
-                ))
-                return
-            player_money = zip(packet.serials, packet.chips)
-            if not table.updatePlayersMoney(player_money, absolute_values=packet.absolute):
-                # do not return here, since it is possible, that something has changed
-                self.log.error("something went wrong while updating player money for game %d, %r", packet.game_id, player_money)
-                self.sendPacketVerbose(PacketError(
-                    other_type = PACKET_POKER_UPDATE_MONEY,
-                    code = PacketPokerUpdateMoney.OTHER_ERROR,
-                    message = "table %r does not exist" % (packet.game_id)
-                ))
+    @handles(HANDLER_LOBBY, PACKET_POKER_HAND_REPLAY)
+    def handlePacketPokerHandReplay(self, packet):
+        table = self.packet2table(packet)
+        if not table or table.game.hand_serial != packet.serial or table.game.isEndOrNull():
+            self.handReplay(packet.game_id, packet.serial)
+        else:
+            self.log.inform("attempt get a hand replay for hand still is progress for game %d and hand %d by player %d",
+                packet.game_id, packet.serial, self.getSerial()
+            )
+
+    #
+    # Handlers of the packets for a table the avatar joined, the table is
+    # updated after each of them
+    #
+    @handles(HANDLER_TABLE, PACKET_POKER_READY_TO_PLAY)
+    def handlePacketPokerReadyToPlay(self, packet, table, game):
+        if self.getSerial() == packet.serial:
+            ack = table.readyToPlay(packet.serial)
+            if ack:
+                self.sendPacketVerbose(ack)
+        else:
+            self.log.inform("attempt to set ready to play for player %d by player %d",
+                packet.serial,
+                self.getSerial()
+            )
+
+    @handles(HANDLER_TABLE, PACKET_POKER_PROCESSING_HAND)
+    def handlePacketPokerProcessingHand(self, packet, table, game):
+        if self.getSerial() == packet.serial:
+            self.sendPacketVerbose(table.processingHand(packet.serial))
+        else:
+            self.log.inform("attempt to set processing hand for player %d by player %d",
+                packet.serial,
+                self.getSerial()
+            )
+
+    @handles(HANDLER_TABLE, PACKET_POKER_START)
+    def handlePacketPokerStart(self, packet, table, game):
+        if not game.isEndOrNull():
+            self.log.inform("player %d tried to start a new game while in game", self.getSerial())
+            self.sendPacketVerbose(PacketPokerStart(game_id = game.id))
+        elif self.service.shutting_down:
+            self.log.inform("server shutting down")
+        else:
+            self.log.inform("player %d tried to start a new game but is not the owner of the table", self.getSerial())
+
+    @handles(HANDLER_TABLE, PACKET_POKER_SEAT)
+    def handlePacketPokerSeat(self, packet, table, game):
+        self.performPacketPokerSeat(packet, table, game)
+
+    @handles(HANDLER_TABLE, PACKET_POKER_BUY_IN)
+    def handlePacketPokerBuyIn(self, packet, table, game):
+        self.performPacketPokerBuyIn(packet, table, game)
+
+    @handles(HANDLER_TABLE, PACKET_POKER_REBUY)
+    def handlePacketPokerRebuy(self, packet, table, game):
+        if self.getSerial() == packet.serial:
+            self.service.autorefill(packet.serial)
+            table.rebuyPlayerRequest(packet.serial, packet.amount)
             self.sendPacketVerbose(PacketAck())
-            table.update()
+        else:
+            self.log.inform("attempt to rebuy for player %d by player %d", packet.serial, self.getSerial())
 
-        table = self.packet2table(packet)
-        if packet.type == PACKET_POKER_HAND_REPLAY:
-            if not table or table.game.hand_serial != packet.serial or table.game.isEndOrNull():
-                self.handReplay(packet.game_id, packet.serial)
-            else:
-                self.log.inform("attempt get a hand replay for hand still is progress for game %d and hand %d by player %d",
-                    packet.game_id, packet.serial, self.getSerial()
-                )
-            return
+    @handles(HANDLER_TABLE, PACKET_POKER_CHAT)
+    def handlePacketPokerChat(self, packet, table, game):
+        if self.getSerial() == packet.serial:
+            table.chatPlayer(self, packet.message[:128])
+        else:
+            self.log.inform("attempt to chat for player %d by player %d", packet.serial, self.getSerial())
 
-        if table:
-            self.log.debug("packet for table %s", table.game.id)
-            game = table.game
+    @handles(HANDLER_TABLE, PACKET_POKER_PLAYER_LEAVE)
+    def handlePacketPokerPlayerLeave(self, packet, table, game):
+        if self.getSerial() == packet.serial:
+            table.leavePlayer(self)
+        else:
+            self.log.inform("attempt to leave for player %d by player %d", packet.serial, self.getSerial())
 
-            if packet.type == PACKET_POKER_READY_TO_PLAY:
-                if self.getSerial() == packet.serial:
-                    ack = table.readyToPlay(packet.serial)
-                    if ack:
-                        self.sendPacketVerbose(ack)
-                else:
-                    self.log.inform("attempt to set ready to play for player %d by player %d",
-                        packet.serial,
-                        self.getSerial()
-                    )
-
-            elif packet.type == PACKET_POKER_PROCESSING_HAND:
-                if self.getSerial() == packet.serial:
-                    self.sendPacketVerbose(table.processingHand(packet.serial))
-                else:
-                    self.log.inform("attempt to set processing hand for player %d by player %d",
-                        packet.serial,
-                        self.getSerial()
-                    )
-
-            elif packet.type == PACKET_POKER_START:
-                if not game.isEndOrNull():
-                    self.log.inform("player %d tried to start a new game while in game", self.getSerial())
-                    self.sendPacketVerbose(PacketPokerStart(game_id = game.id))
-                elif self.service.shutting_down:
-                    self.log.inform("server shutting down")
-                else:
-                    self.log.inform("player %d tried to start a new game but is not the owner of the table", self.getSerial())
+    @handles(HANDLER_TABLE, PACKET_POKER_SIT)
+    def handlePacketPokerSit(self, packet, table, game):
+        self.performPacketPokerSit(packet, table)
 
-            elif packet.type == PACKET_POKER_SEAT:
-                self.performPacketPokerSeat(packet, table, game)
+    @handles(HANDLER_TABLE, PACKET_POKER_SIT_OUT)
+    def handlePacketPokerSitOut(self, packet, table, game):
+        if self.getSerial() == packet.serial:
+            table.sitOutPlayer(self)
+        else:
+            self.log.inform("attempt to sit out for player %d by player %d", packet.serial, self.getSerial())
 
-            elif packet.type == PACKET_POKER_BUY_IN:
-                self.performPacketPokerBuyIn(packet, table, game)
+    @handles(HANDLER_TABLE, PACKET_POKER_AUTO_BLIND_ANTE)
+    def handlePacketPokerAutoBlindAnte(self, packet, table, game):
+        if self.getSerial() == packet.serial:
+            table.autoBlindAnte(self, True)
+        else:
+            self.log.inform("attempt to set auto blind/ante for player %d by player %d", packet.serial, self.getSerial())
 
-            elif packet.type == PACKET_POKER_REBUY:
-                if self.getSerial() == packet.serial:
-                    self.service.autorefill(packet.serial)
-                    table.rebuyPlayerRequest(packet.serial, packet.amount)
-                    self.sendPacketVerbose(PacketAck())
-                else:
-                    self.log.inform("attempt to rebuy for player %d by player %d", packet.serial, self.getSerial())
+    @handles(HANDLER_TABLE, PACKET_POKER_NOAUTO_BLIND_ANTE)
+    def handlePacketPokerNoautoBlindAnte(self, packet, table, game):
+        if self.getSerial() == packet.serial:
+            table.autoBlindAnte(self, False)
+        else:
+            self.log.inform("attempt to set auto blind/ante for player %d by player %d",packet.serial, self.getSerial())
 
-            elif packet.type == PACKET_POKER_CHAT:
-                if self.getSerial() == packet.serial:
-                    table.chatPlayer(self, packet.message[:128])
-                else:
-                    self.log.inform("attempt to chat for player %d by player %d", packet.serial, self.getSerial())
+    @handles(HANDLER_TABLE, PACKET_POKER_AUTO_MUCK)
+    def handlePacketPokerAutoMuck(self, packet, table, game):
+        if (self.getSerial() == packet.serial) and game.getPlayer(packet.serial):
+            game.autoMuck(packet.serial, packet.auto_muck)
+        else:
+            self.log.inform("attempt to set auto muck for player %d by player %d, or player is not in game", packet.serial, self.getSerial())
 
-            elif packet.type == PACKET_POKER_PLAYER_LEAVE:
-                if self.getSerial() == packet.serial:
-                    table.leavePlayer(self)
-                else:
-                    self.log.inform("attempt to leave for player %d by player %d", packet.serial, self.getSerial())
+    @handles(HANDLER_TABLE, PACKET_POKER_MUCK_ACCEPT)
+    def handlePacketPokerMuckAccept(self, packet, table, game):
+        if self.getSerial() == packet.serial:
+            table.muckAccept(self)
+        else:
+            self.log.inform("attempt to accept muck for player %d by player %d", packet.serial, self.getSerial())
 
-            elif packet.type == PACKET_POKER_SIT:
-                self.performPacketPokerSit(packet, table)
-                
-            elif packet.type == PACKET_POKER_SIT_OUT:
-                if self.getSerial() == packet.serial:
-                    table.sitOutPlayer(self)
-                else:
-                    self.log.inform("attempt to sit out for player %d by player %d", packet.serial, self.getSerial())
-                
-            elif packet.type == PACKET_POKER_AUTO_BLIND_ANTE:
-                if self.getSerial() == packet.serial:
-                    table.autoBlindAnte(self, True)
-                else:
-                    self.log.inform("attempt to set auto blind/ante for player %d by player %d", packet.serial, self.getSerial())
-                
-            elif packet.type == PACKET_POKER_NOAUTO_BLIND_ANTE:
-                if self.getSerial() == packet.serial:
-                    table.autoBlindAnte(self, False)
-                else:
-                    self.log.inform("attempt to set auto blind/ante for player %d by player %d",packet.serial, self.getSerial())
-            
-            elif packet.type == PACKET_POKER_AUTO_MUCK:
-                if (self.getSerial() == packet.serial) and game.getPlayer(packet.serial):
-                    game.autoMuck(packet.serial, packet.auto_muck)
-                else:
-                    self.log.inform("attempt to set auto muck for player %d by player %d, or player is not in game", packet.serial, self.getSerial())
-                
-            elif packet.type == PACKET_POKER_MUCK_ACCEPT:
-                if self.getSerial() == packet.serial:
-                    table.muckAccept(self)
-                else:
-                    self.log.inform("attempt to accept muck for player %d by player %d", packet.serial, self.getSerial())
-                    
-            elif packet.type == PACKET_POKER_MUCK_DENY:
-                if self.getSerial() == packet.serial:
-                    table.muckDeny(self)
-                else:
-                    self.log.inform("attempt to deny muck for player %d by player %d", packet.serial, self.getSerial())
-                
-            elif packet.type == PACKET_POKER_AUTO_PLAY:
-                if (self.getSerial() == packet.serial) and game.getPlayer(packet.serial):
-                    table.game.autoPlay(packet.serial, packet.auto_play)
-                else:
-                    self.log.inform("attempt to set auto play for player %d by player %d, or player is not in game", packet.serial, self.getSerial())
+    @handles(HANDLER_TABLE, PACKET_POKER_MUCK_DENY)
+    def handlePacketPokerMuckDeny(self, packet, table, game):
+        if self.getSerial() == packet.serial:
+            table.muckDeny(self)
+        else:
+            self.log.inform("attempt to deny muck for player %d by player %d", packet.serial, self.getSerial())
 
-            elif packet.type == PACKET_POKER_BLIND:
-                if (self.getSerial() == packet.serial) and game.isPlaying(packet.serial):
-                    game.blind(packet.serial)
-                else:
-                    self.log.inform("attempt to pay the blind of player %d by player %d, or player is not not playing", packet.serial, self.getSerial())
+    @handles(HANDLER_TABLE, PACKET_POKER_AUTO_PLAY)
+    def handlePacketPokerAutoPlay(self, packet, table, game):
+        if (self.getSerial() == packet.serial) and game.getPlayer(packet.serial):
+            table.game.autoPlay(packet.serial, packet.auto_play)
+        else:
+            self.log.inform("attempt to set auto play for player %d by player %d, or player is not in game", packet.serial, self.getSerial())
 
-            elif packet.type == PACKET_POKER_WAIT_BIG_BLIND:
-                if self.getSerial() == packet.serial:
-                    game.waitBigBlind(packet.serial)
-                else:
-                    self.log.inform("attempt to wait for big blind of player %d by player %d", packet.serial, self.getSerial())
+    @handles(HANDLER_TABLE, PACKET_POKER_BLIND)
+    def handlePacketPokerBlind(self, packet, table, game):
+        if (self.getSerial() == packet.serial) and game.isPlaying(packet.serial):
+            game.blind(packet.serial)
+        else:
+            self.log.inform("attempt to pay the blind of player %d by player %d, or player is not not playing", packet.serial, self.getSerial())
 
-            elif packet.type == PACKET_POKER_ANTE:
-                if (self.getSerial() == packet.serial) and game.isPlaying(packet.serial):
-                    game.ante(packet.serial)
-                else:
-                    self.log.inform("attempt to pay the ante of player %d by player %d, or player is not not playing", packet.serial, self.getSerial())
+    @handles(HANDLER_TABLE, PACKET_POKER_WAIT_BIG_BLIND)
+    def handlePacketPokerWaitBigBlind(self, packet, table, game):
+        if self.getSerial() == packet.serial:
+            game.waitBigBlind(packet.serial)
+        else:
+            self.log.inform("attempt to wait for big blind of player %d by player %d", packet.serial, self.getSerial())
 
-            elif packet.type == PACKET_POKER_LOOK_CARDS:
-                table.broadcast(packet)
-                
-            elif packet.type == PACKET_POKER_FOLD:
-                if (self.getSerial() == packet.serial) and game.isPlaying(packet.serial):
-                    game.fold(packet.serial)
-                else:
-                    self.log.inform("attempt to fold for player %d by player %d, or player is not not playing", packet.serial, self.getSerial())
+    @handles(HANDLER_TABLE, PACKET_POKER_ANTE)
+    def handlePacketPokerAnte(self, packet, table, game):
+        if (self.getSerial() == packet.serial) and game.isPlaying(packet.serial):
+            game.ante(packet.serial)
+        else:
+            self.log.inform("attempt to pay the ante of player %d by player %d, or player is not not playing", packet.serial, self.getSerial())
 
-            elif packet.type == PACKET_POKER_CALL:
-                if (self.getSerial() == packet.serial) and game.isPlaying(packet.serial):
-                    game.call(packet.serial)
-                else:
-                    self.log.inform("attempt to call for player %d by player %d, or player is not not playing", packet.serial, self.getSerial())
+    @handles(HANDLER_TABLE, PACKET_POKER_LOOK_CARDS)
+    def handlePacketPokerLookCards(self, packet, table, game):
+        table.broadcast(packet)
 
-            elif packet.type == PACKET_POKER_RAISE:
-                if (self.getSerial() == packet.serial) and game.isPlaying(packet.serial):
-                    game.callNraise(packet.serial, packet.amount)
-                else:
-                    self.log.inform("attempt to raise for player %d by player %d, or player is not not playing", packet.serial, self.getSerial())
+    @handles(HANDLER_TABLE, PACKET_POKER_FOLD)
+    def handlePacketPokerFold(self, packet, table, game):
+        if (self.getSerial() == packet.serial) and game.isPlaying(packet.serial):
+            game.fold(packet.serial)
+        else:
+            self.log.inform("attempt to fold for player %d by player %d, or player is not not playing", packet.serial, self.getSerial())
 
-            elif packet.type == PACKET_POKER_CHECK:
-                if (self.getSerial() == packet.serial) and game.isPlaying(packet.serial):
-                    game.check(packet.serial)
-                else:
-                    self.log.inform("attempt to check for player %d by player %d, or player is not not playing", packet.serial, self.getSerial())
-
-            elif packet.type == PACKET_POKER_TOURNEY_REBUY:
-                if self.getSerial() == packet.serial:
-                    success, error = self.service.tourneyRebuyRequest(packet.tourney_serial, packet.serial)
-                    if success:
-                        self.sendPacketVerbose(PacketAck())
-                    else:
-                        self.sendPacketVerbose(PacketError(
-                            serial = packet.serial,
-                            other_type = PACKET_POKER_TOURNEY_REBUY,
-                            code = error
-                        ))
-                else:
-                    self.log.inform("attempt to rebuy for player %d by player %d", packet.serial, self.getSerial())
+    @handles(HANDLER_TABLE, PACKET_POKER_CALL)
+    def handlePacketPokerCall(self, packet, table, game):
+        if (self.getSerial() == packet.serial) and game.isPlaying(packet.serial):
+            game.call(packet.serial)
+        else:
+            self.log.inform("attempt to call for player %d by player %d, or player is not not playing", packet.serial, self.getSerial())
 
-            elif packet.type == PACKET_POKER_TABLE_QUIT:
-                table.quitPlayer(self)
+    @handles(HANDLER_TABLE, PACKET_POKER_RAISE)
+    def handlePacketPokerRaise(self, packet, table, game):
+        if (self.getSerial() == packet.serial) and game.isPlaying(packet.serial):
+            game.callNraise(packet.serial, packet.amount)
+        else:
+            self.log.inform("attempt to raise for player %d by player %d, or player is not not playing", packet.serial, self.getSerial())
 
-            table.update()
-    
-        elif packet.type == PACKET_POKER_TABLE: # can only be done by User.ADMIN
-            table = self.createTable(packet)
-            
-        elif packet.type == PACKET_POKER_CREATE_TOURNEY: # can only be done by User.ADMIN
-            if self.getSerial() == packet.serial:
-                self.sendPacketVerbose(self.performPacketPokerCreateTourney(packet))
-            else:
-                self.log.inform("attempt to create tourney for player %d by player %d", packet.serial, self.getSerial())
-                self.sendPacketVerbose(PacketAuthRequest())
-        
-        elif packet.type == PACKET_POKER_TOURNEY_START:
-            if self.getSerial() == packet.serial:
-                self.sendPacketVerbose(self.performPacketPokerTourneyStart(packet))
-            else:
-                self.log.inform("attempt to start tournament %d for player %d by player %d",
-                    packet.tourney_serial, packet.serial, self.getSerial()
-                )
-                
-        elif packet.type == PACKET_POKER_TOURNEY_CANCEL:
-            if self.getSerial() == packet.serial:
-                self.sendPacketVerbose(self.performPacketPokerTourneyCancel(packet))
-            else:
-                self.log.inform("attempt to cancel tournament %d for player %d by player %d",
-                    packet.tourney_serial, packet.serial, self.getSerial()
-                )
-                
-        
-        elif packet.type == PACKET_QUIT:
-            for table in self.tables.values():
-                table.quitPlayer(self)
+    @handles(HANDLER_TABLE, PACKET_POKER_CHECK)
+    def handlePacketPokerCheck(self, packet, table, game):
+        if (self.getSerial() == packet.serial) and game.isPlaying(packet.serial):
+            game.check(packet.serial)
+        else:
+            self.log.inform("attempt to check for player %d by player %d, or player is not not playing", packet.serial, self.getSerial())
 
-        elif packet.type == PACKET_LOGOUT:
-            if self.isLogged():
-                for table in self.tables.values():
-                    table.quitPlayer(self)
-                self.logout()
+    @handles(HANDLER_TABLE, PACKET_POKER_TOURNEY_REBUY)
+    def handlePacketPokerTourneyRebuy(self, packet, table, game):
+        if self.getSerial() == packet.serial:
+            success, error = self.service.tourneyRebuyRequest(packet.tourney_serial, packet.serial)
+            if success:
+                self.sendPacketVerbose(PacketAck())
             else:
                 self.sendPacketVerbose(PacketError(
-                    code = PacketLogout.NOT_LOGGED_IN,
-                    message = "Not logged in",
-                    other_type = PACKET_LOGOUT
+                    serial = packet.serial,
+                    other_type = PACKET_POKER_TOURNEY_REBUY,
+                    code = error
                 ))
         else:
-            pass
+            self.log.inform("attempt to rebuy for player %d by player %d", packet.serial, self.getSerial())
+
+    @handles(HANDLER_TABLE, PACKET_POKER_TABLE_QUIT)
+    def handlePacketPokerTableQuit(self, packet, table, game):
+        table.quitPlayer(self)
+
+    #
+    # Handlers of the packets that are ignored, apart from updating the
+    # table, when they are for a table the avatar joined
+    #
+    @handles(HANDLER_NO_TABLE, PACKET_POKER_TABLE)
+    def handlePacketPokerTable(self, packet): # can only be done by User.ADMIN
+        self.createTable(packet)
+
+    @handles(HANDLER_NO_TABLE, PACKET_POKER_CREATE_TOURNEY)
+    def handlePacketPokerCreateTourney(self, packet): # can only be done by User.ADMIN
+        if self.getSerial() == packet.serial:
+            self.sendPacketVerbose(self.performPacketPokerCreateTourney(packet))
+        else:
+            self.log.inform("attempt to create tourney for player %d by player %d", packet.serial, self.getSerial())
+            self.sendPacketVerbose(PacketAuthRequest())
+
+    @handles(HANDLER_NO_TABLE, PACKET_POKER_TOURNEY_START)
+    def handlePacketPokerTourneyStart(self, packet):
+        if self.getSerial() == packet.serial:
+            self.sendPacketVerbose(self.performPacketPokerTourneyStart(packet))
+        else:
+            self.log.inform("attempt to start tournament %d for player %d by player %d",
+                packet.tourney_serial, packet.serial, self.getSerial()
+            )
+
+    @handles(HANDLER_NO_TABLE, PACKET_POKER_TOURNEY_CANCEL)
+    def handlePacketPokerTourneyCancel(self, packet):
+        if self.getSerial() == packet.serial:
+            self.sendPacketVerbose(self.performPacketPokerTourneyCancel(packet))
+        else:
+            self.log.inform("attempt to cancel tournament %d for player %d by player %d",
+                packet.tourney_serial, packet.serial, self.getSerial()
+            )
+
+    @handles(HANDLER_NO_TABLE, PACKET_QUIT)
+    def handlePacketQuit(self, packet):
+        for table in self.tables.values():
+            table.quitPlayer(self)
+
+    @handles(HANDLER_NO_TABLE, PACKET_LOGOUT)
+    def handlePacketLogout(self, packet):
+        if self.isLogged():
+            for table in self.tables.values():
+                table.quitPlayer(self)
+            self.logout()
+        else:
+            self.sendPacketVerbose(PacketError(
+                code = PacketLogout.NOT_LOGGED_IN,
+                message = "Not logged in",
+                other_type = PACKET_LOGOUT
+            ))
 
     # The "perform" methods below are designed so that the a minimal
     # amount of code related to receiving a packet that appears in the
-    # handlePacketLogic() giant if statement above.  The primary motive
+    # packet handlers above.  The primary motive
     # for this is for things like PacketTablePicker(), that need to
     # perform operations *as if* the client has sent additional packets.
     # The desire is to keep completely parity between what the individual
     # packets do by themselves, and what "super-packets" like
-    # PacketTablePicker() do.  A secondary benefit is that it makes that
-    # giant if statement in handlePacketLogic() above a bit smaller.
+    # PacketTablePicker() do.  A secondary benefit is that it keeps the
+    # packet handlers above small.
     # -------------------------------------------------------------------------
     def performPacketPokerTableJoin(
                                     self, packet, table = None,
@@ -1316,7 +1459,7 @@ class PokerAvatar:
                 buy_in_payed = player.buy_in_payed
             ))
             if self.service.has_ladder:
-                packet = self.service.getLadder(game.id, table.currency_serial, player.serial)
+                packet = table.getLadder(player.serial)
                 if packet.type == PACKET_POKER_PLAYER_STATS:
                     self.sendPacketVerbose(packet)
             if not game.isPlaying(player.serial):
@@ -1350,16 +1493,21 @@ class PokerAvatar:
             # the serial of some packets, for instance the cards
             # of his hand. We rely on private2public to turn the
             # packet containing cards custom cards into placeholders
-            # in this case.
+            # in this case. The replay is shared by the avatars joining
+            # during the same step of the hand. With join_snapshot the
+            # clients that do not explain get the state of the hand
+            # instead: PokerExplain rebuilds the bets and the pots from
+            # the actions of the players.
             #
-            packets, previous_dealer, errors = history2packets(game.historyGet(), game.id, -1, createCache()) #@UnusedVariable
-            for error in errors: table.log.error("%s", error)
+            if table.join_snapshot and not self.explain:
+                past_packets = table.getHandSnapshot()
+            else:
+                past_packets = table.getHandReplay()
+            for past_packet in past_packets:
+                self.sendPacketVerbose(private2public(past_packet, self.getSerial()))
             
             timeout_packet = table.getCurrentTimeoutWarning()
-            if timeout_packet: packets.append(timeout_packet)
-            
-            for past_packet in packets:
-                self.sendPacketVerbose(private2public(past_packet, self.getSerial()))
+            if timeout_packet: self.sendPacketVerbose(timeout_packet)
         
         self.sendPacketVerbose(PacketPokerStreamMode(game_id = game.id))
 
@@ -67,6 +67,7 @@ from pokerpackets.networkpackets import *
 from pokerpackets.clientpackets import *
 from pokernetwork.pokerclient import PokerClientFactory, PokerClientProtocol
 from pokernetwork.pokerbotlogic import StringGenerator, NoteGenerator, PokerBot
+from pokernetwork.pokerboteval import BotEvaluator
 
 class PokerBotProtocol(PokerClientProtocol):
 
@@ -293,6 +294,8 @@ def makeService(configuration):
     
     PokerBotFactory.string_generator = StringGenerator(settings.headerGet("/settings/@name_prefix"))
     PokerBot.note_generator = NoteGenerator(settings.headerGet("/settings/currency"))
+    PokerBot.evaluator = BotEvaluator(settings)
+    reactor.addSystemEventTrigger('before', 'shutdown', PokerBot.evaluator.stop)
 
     host, port = settings.headerGet("/settings/servers").split(':')
     port = int(port)
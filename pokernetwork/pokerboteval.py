@@ -0,0 +1,336 @@
+#
+# -*- py-indent-offset: 4; coding: utf-8; mode: python -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Equity of the hands of the bots (PokerBot.eval), off the reactor.
+#
+#   <eval preflop="@config.pokernetwork.paths.conf@/preflop-equity.bin"
+#         processes="2" batch="32" cache="100000"/>
+#
+# Before the flop, the equity of a hold'em hand only depends on its class
+# (the ranks and whether they are suited) and on the number of opponents.
+# It is read from a table of 169 classes by 9 opponents built once with
+#
+#   python -m pokernetwork.pokerboteval preflop-equity.bin [iterations]
+#
+# The other equities are Monte Carlo simulations, as game.handEV, run by a
+# pool of processes. The requests of all the bots made during a reactor
+# tick are sent together, in batches, and the results are cached by
+# (pocket, board, opponents).
+#
+import sys
+import struct
+from array import array
+from collections import OrderedDict
+from multiprocessing import Pool, cpu_count
+from os.path import exists
+
+from twisted.internet import reactor, defer
+
+from pokernetwork import log as network_log
+log = network_log.get_child('pokerboteval')
+
+NOCARD = 255
+RANKS = 13
+CLASSES = RANKS * RANKS
+MAX_OPPONENTS = 9
+
+#
+# variants that poker_eval simulates with pockets and a board of 5 cards,
+# the others are evaluated with game.handEV
+#
+BOARD_VARIANTS = ('holdem', 'omaha', 'omaha8')
+
+def handClass(pocket):
+    """Index of the class of a hold'em pocket in a 13x13 matrix: pairs on
+    the diagonal, suited hands above (the highest rank is the row), offsuit
+    hands below."""
+    rank1, rank2 = pocket[0] % RANKS, pocket[1] % RANKS
+    high, low = max(rank1, rank2), min(rank1, rank2)
+    if high != low and pocket[0] / RANKS == pocket[1] / RANKS:
+        return high * RANKS + low
+    return low * RANKS + high
+
+def classPocket(index):
+    """A pocket of the class index."""
+    row, column = divmod(index, RANKS)
+    if row > column:
+        return (row, column)
+    return (row, column + RANKS)
+
+def failed(requests, e):
+    """The same error for each of the requests."""
+    return [(False, "%s: %s" % (e.__class__.__name__, e))] * len(requests)
+
+_poker_eval = None
+
+def evaluate(requests):
+    """Run in the processes of the pool: the equity, between 0 and 1000,
+    of each (variant, pocket, board, opponents, iterations) request, as a
+    list of (True, ev) or (False, error message)."""
+    global _poker_eval
+    if _poker_eval is None:
+        try:
+            from pokereval import PokerEval
+            _poker_eval = PokerEval()
+        except Exception, e:
+            return failed(requests, e)
+    results = []
+    for variant, pocket, board, opponents, iterations in requests:
+        try:
+            pockets = [list(pocket)] + [[NOCARD] * len(pocket) for _ in xrange(opponents)]
+            result = _poker_eval.poker_eval(
+                game = variant,
+                pockets = pockets,
+                board = list(board) + [NOCARD] * (5 - len(board)),
+                fill_pockets = 1,
+                iterations = iterations
+            )
+            results.append((True, result["eval"][0]["ev"]))
+        except Exception, e:
+            results.append((False, "%s: %s" % (e.__class__.__name__, e)))
+    return results
+
+class PreflopEquity:
+    """Equity, between 0 and 1000, of each hold'em hand class against 1 to
+    MAX_OPPONENTS opponents. The file is a header followed by the table as
+    little endian unsigned shorts, i.e. about 3KB."""
+
+    HEADER = struct.Struct('<4sBB')
+    MAGIC = 'PKEQ'
+    VERSION = 1
+
+    def __init__(self, table=None):
+        self.table = table
+
+    def get(self, pocket, opponents):
+        if self.table is None or not 0 < opponents <= MAX_OPPONENTS:
+            return None
+        return self.table[(opponents - 1) * CLASSES + handClass(pocket)]
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            magic, version, max_opponents = PreflopEquity.HEADER.unpack(f.read(PreflopEquity.HEADER.size))
+            if magic != PreflopEquity.MAGIC or version != PreflopEquity.VERSION or max_opponents != MAX_OPPONENTS:
+                raise ValueError("%s is not a preflop equity table" % path)
+            table = array('H')
+            table.fromstring(f.read())
+        if sys.byteorder != 'little':
+            table.byteswap()
+        if len(table) != CLASSES * MAX_OPPONENTS:
+            raise ValueError("%s is truncated" % path)
+        return PreflopEquity(table)
+
+    def save(self, path):
+        table = array('H', self.table)
+        if sys.byteorder != 'little':
+            table.byteswap()
+        with open(path, 'wb') as f:
+            f.write(PreflopEquity.HEADER.pack(PreflopEquity.MAGIC, PreflopEquity.VERSION, MAX_OPPONENTS))
+            f.write(table.tostring())
+
+    @staticmethod
+    def build(iterations):
+        table = array('H')
+        for opponents in xrange(1, MAX_OPPONENTS + 1):
+            requests = [('holdem', classPocket(index), (), opponents, iterations) for index in xrange(CLASSES)]
+            for ok, ev in evaluate(requests):
+                if not ok:
+                    raise Exception(ev)
+                table.append(int(ev))
+        return PreflopEquity(table)
+
+class EquityCache:
+    """Least recently used equities."""
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        ev = self.entries.pop(key, None)
+        if ev is not None:
+            self.entries[key] = ev
+        return ev
+
+    def set(self, key, ev):
+        self.entries.pop(key, None)
+        self.entries[key] = ev
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+class BotEvaluator:
+
+    log = log.get_child('BotEvaluator')
+
+    def __init__(self, settings):
+        properties = settings.headerGetProperties("/settings/eval")
+        properties = properties[0] if properties else {}
+        #
+        # with processes="0", the default when there is no <eval>, the
+        # simulations run in the reactor, batched and cached all the same
+        if properties:
+            self.processes = int(properties.get('processes', max(1, cpu_count() - 1)))
+        else:
+            self.processes = 0
+        self.batch = max(1, int(properties.get('batch', 32)))
+        self.timeout = float(properties.get('timeout', 60))
+        self.cache = EquityCache(int(properties.get('cache', 100000)))
+        path = properties.get('preflop')
+        if path and exists(path):
+            self.preflop = PreflopEquity.load(path)
+        else:
+            if path:
+                self.log.warn("no preflop equity table at %s, preflop equities are simulated", path)
+            self.preflop = PreflopEquity()
+        self.pool = None
+        self.pending = OrderedDict()
+        self.timer = None
+        #
+        # batch serial => (requests, deferreds, timeout) of the batches sent
+        # to the pool and not answered yet
+        self.running = {}
+        self.running_serial = 0
+        self.stats = {
+            'preflop': 0,
+            'cached': 0,
+            'evaluated': 0,
+            'batches': 0,
+        }
+
+    def handEV(self, game, serial, iterations):
+        """A deferred firing with the equity of serial, between 0 and
+        1000, as returned by game.handEV(serial, iterations)."""
+        if game.variant not in BOARD_VARIANTS:
+            return defer.succeed(game.handEV(serial, iterations))
+        pocket = game.getPlayer(serial).hand.tolist(True)
+        board = [card for card in game.board.tolist(True) if card != NOCARD]
+        opponents = len(game.serialsNotFold()) - 1
+        if opponents <= 0:
+            return defer.succeed(1000)
+        if not board and game.variant == 'holdem':
+            ev = self.preflop.get(pocket, opponents)
+            if ev is not None:
+                self.stats['preflop'] += 1
+                return defer.succeed(ev)
+            #
+            # simulate once per class when there is no table
+            key = (game.variant, classPocket(handClass(pocket)), (), opponents, iterations)
+        else:
+            key = (game.variant, tuple(sorted(pocket)), tuple(sorted(board)), opponents, iterations)
+        ev = self.cache.get(key)
+        if ev is not None:
+            self.stats['cached'] += 1
+            return defer.succeed(ev)
+        d = defer.Deferred()
+        self.pending.setdefault(key, []).append(d)
+        if self.timer is None:
+            self.timer = reactor.callLater(0, self.flush)
+        return d
+
+    def getPool(self):
+        if self.pool is None:
+            self.pool = Pool(self.processes)
+        return self.pool
+
+    def flush(self):
+        if self.timer and self.timer.active():
+            self.timer.cancel()
+        self.timer = None
+        pending, self.pending = self.pending, OrderedDict()
+        keys = pending.keys()
+        for start in xrange(0, len(keys), self.batch):
+            requests = keys[start:start + self.batch]
+            waiting = [pending[key] for key in requests]
+            self.stats['batches'] += 1
+            if self.processes > 0:
+                self.apply(requests, waiting)
+            else:
+                try:
+                    results = evaluate(requests)
+                except Exception, e:
+                    results = failed(requests, e)
+                self._evaluated(requests, waiting, results)
+
+    def apply(self, requests, waiting):
+        """Send a batch to the pool. apply_async has no error callback:
+        a batch that is not answered within timeout seconds, because the
+        worker died or raised, fails."""
+        self.running_serial += 1
+        serial = self.running_serial
+        timer = reactor.callLater(self.timeout, self._applied, serial, None)
+        self.running[serial] = (requests, waiting, timer)
+        try:
+            self.getPool().apply_async(
+                evaluate, (requests,),
+                callback = lambda results: reactor.callFromThread(self._applied, serial, results)
+            )
+        except Exception, e:
+            self._applied(serial, failed(requests, e))
+
+    def _applied(self, serial, results):
+        if serial not in self.running:
+            # timed out or stopped
+            return
+        requests, waiting, timer = self.running.pop(serial)
+        if timer.active():
+            timer.cancel()
+        if results is None:
+            results = [(False, "no answer from the pool after %g seconds" % self.timeout)] * len(requests)
+        self._evaluated(requests, waiting, results)
+
+    def _evaluated(self, requests, waiting, results):
+        for key, deferreds, (ok, ev) in zip(requests, waiting, results):
+            if ok:
+                self.stats['evaluated'] += 1
+                self.cache.set(key, ev)
+                for d in deferreds:
+                    d.callback(ev)
+            else:
+                self.log.error("evaluation of %s failed: %s", key, ev)
+                for d in deferreds:
+                    d.errback(Exception(ev))
+
+    def stop(self):
+        """Terminate the pool, the equities that were not evaluated yet
+        fail."""
+        if self.timer and self.timer.active():
+            self.timer.cancel()
+        self.timer = None
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+        pending, self.pending = self.pending, OrderedDict()
+        running, self.running = self.running, {}
+        for requests, waiting, timer in running.itervalues():
+            if timer.active():
+                timer.cancel()
+            pending.update(zip(requests, waiting))
+        for deferreds in pending.itervalues():
+            for d in deferreds:
+                d.errback(Exception("the evaluator is stopped"))
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print "usage: python -m pokernetwork.pokerboteval preflop-equity.bin [iterations]"
+        sys.exit(1)
+    PreflopEquity.build(int(sys.argv[2]) if len(sys.argv) > 2 else 100000).save(sys.argv[1])
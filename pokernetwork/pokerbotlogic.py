@@ -26,7 +26,7 @@ from os import popen
 from string import rstrip
 from random import randint
 
-from twisted.internet import reactor
+from twisted.internet import reactor, defer
 
 from pokerengine.pokertournament import *
 from pokernetwork.user import checkName
@@ -104,6 +104,7 @@ class NoteGenerator(Pool):
 class PokerBot:
 
     note_generator = NoteGenerator("exit 1")
+    evaluator = None
     log = log.get_child('PokerBot')
     
     def __init__(self, factory):
@@ -292,11 +293,23 @@ class PokerBot:
                 self.play(protocol, game)
 
     def eval(self, game, serial):
+        """A deferred firing with the desired action and the equity of the
+        hand. The equity is computed by the evaluator, outside of the
+        reactor, when there is one."""
         if self.factory.level == 0:
             actions = ("check", "call", "raise")
-            return (actions[randint(0, 2)], -1)
+            return defer.succeed((actions[randint(0, 2)], -1))
 
-        ev = game.handEV(serial, LEVEL2ITERATIONS[self.factory.level]) * 0.001
+        iterations = LEVEL2ITERATIONS[self.factory.level]
+        if self.evaluator:
+            d = self.evaluator.handEV(game, serial, iterations)
+            d.addErrback(lambda reason: game.handEV(serial, iterations))
+        else:
+            d = defer.succeed(game.handEV(serial, iterations))
+        d.addCallback(lambda ev: self.decide(game, serial, ev * 0.001))
+        return d
+
+    def decide(self, game, serial, ev):
         actions = game.possibleActions(serial)
         player = game.serial2player[serial]
         
@@ -344,8 +357,18 @@ class PokerBot:
                 name
             )
             return
-        
-        desired_action, ev = self.eval(game, serial)
+
+        hand_serial = game.hand_serial
+        d = self.eval(game, serial)
+        d.addCallback(lambda (desired_action, ev): self.act(protocol, game, serial, hand_serial, desired_action, ev))
+        return d
+
+    def act(self, protocol, game, serial, hand_serial, desired_action, ev):
+        name = protocol.getName()
+        if game.hand_serial != hand_serial or not game.isRunning() or game.getSerialInPosition() != serial:
+            self.log.inform("%s: no longer in position when the evaluation of the hand completed", name)
+            self.factory.can_disconnect = True
+            return
         self.log.debug("%s serial = %d, hand = %s, board = %s", name, serial, game.getHandAsString(serial), game.getBoardAsString())
         self.log.debug("%s wants to %s (ev = %.2f)", name, desired_action, ev)
         self.log.inform("%s serial = %d, hand = %s, board = %s",
@@ -363,6 +386,6 @@ class PokerBot:
             min_bet, _max_bet, _to_call = game.betLimitsForSerial(serial)
             protocol.sendPacket(PacketPokerRaise(game_id = game.id, serial = serial, amount = min_bet * 2))
         else:
-            self.log.warn("=> unexpected actions = %s", actions)
+            self.log.warn("=> unexpected action = %s", desired_action)
         self.factory.can_disconnect = True
 
@@ -27,7 +27,7 @@
 
 from MySQLdb.constants import ER
 
-from twisted.internet import reactor
+from twisted.internet import reactor, defer
 
 from pokernetwork import currencyclient
 from pokernetwork import pokerlock
@@ -36,7 +36,8 @@ from pokerpackets.networkpackets import *
 from pokernetwork import log as network_log
 log = network_log.get_child('pokercashier')
 
-PokerLock = pokerlock.PokerLock
+PokerLockManager = pokerlock.PokerLockManager
+PokerMySQLLockManager = pokerlock.PokerMySQLLockManager
 
 class PokerCashier:
 
@@ -46,16 +47,19 @@ class PokerCashier:
         self.settings = settings
         self.currency_client = currencyclient.CurrencyClient()
         self.parameters = settings.headerGetProperties("/server/cashier")[0]
-        if 'pokerlock_queue_timeout' in self.parameters:
-            PokerLock.queue_timeout = int(self.parameters['pokerlock_queue_timeout'])
         self.db = None
         self.db_parameters = settings.headerGetProperties("/server/database")[0]
-        self.locks = {}
+        #
+        # lock="local" when this server is the only one using the database
+        #
+        if self.parameters.get('lock', 'mysql') == 'local':
+            self.locks = PokerLockManager()
+        else:
+            self.locks = PokerMySQLLockManager(self.db_parameters, int(self.parameters.get('lock_connections', 4)))
         reactor.callLater(0, self.resumeCommits)
 
     def close(self):
-        for lock in self.locks.values():
-            lock.close()
+        self.locks.close()
         del self.db
         
     def setDb(self, db):
@@ -112,7 +116,6 @@ class PokerCashier:
             self.log.error("cashGeneralFailure: response = %s", reason.value.response)
                 
         if hasattr(packet, "currency_serial"):
-            self.unlock(packet.currency_serial)
             del packet.currency_serial
         return reason
 
@@ -152,7 +155,6 @@ class PokerCashier:
             cursor.close()
             raise
 
-        self.unlock(packet.currency_serial);
         return PacketAck()
 
     def cashInUpdateCounter(self, new_notes, packet, old_notes):
@@ -306,7 +308,6 @@ class PokerCashier:
                 packet = PacketError(other_type = PACKET_POKER_CASH_OUT,
                                      code = PacketPokerCashOut.EMPTY,
                                      message = "no currency note to be collected for currency %d" % currency_serial)                
-        self.unlock(currency_serial);
         return packet
 
     def cashOutCurrencyCommit(self, transaction_id, url):
@@ -400,50 +401,46 @@ class PokerCashier:
 
     def unlock(self, currency_serial):
         name = self.getLockName(currency_serial)
-        if name not in self.locks:
+        if not self.locks.isLocked(name):
             self.log.warn("cashInUnlock: unexpected missing %s in locks (ignored)", name)
             return
-        if not self.locks[name].isAlive():
-            self.log.warn("cashInUnlock: unexpected dead %s pokerlock (ignored)", name)
-            return
-        self.locks[name].release(name)
+        self.locks.release(name)
 
     def lock(self, currency_serial):
         name = self.getLockName(currency_serial)
-
         self.log.debug("get lock %s", name)
-        if name in self.locks:
-            lock = self.locks[name]
-            if lock.isAlive():
-                create_lock = False
-            else:
-                lock.close()
-                create_lock = True
-        else:
-            create_lock = True
-        if create_lock:
-            self.locks[name] = PokerLock(self.db_parameters)
-            self.locks[name].start()
+        return self.locks.acquire(name, int(self.parameters.get('acquire_timeout', 60)))
 
-        return self.locks[name].acquire(name, int(self.parameters.get('acquire_timeout', 60)))
+    def locked(self, currency_serial, function, packet):
+        #
+        # function(lock_name, packet) runs when this request is granted the
+        # lock and the lock is released when it completes, successfully or
+        # not. A request that could not acquire the lock (timeout while
+        # another request holds it) must not release it.
+        #
+        d = self.lock(currency_serial)
+        def granted(lock_name):
+            d = defer.maybeDeferred(function, lock_name, packet)
+            def release(result):
+                self.unlock(currency_serial)
+                return result
+            d.addBoth(release)
+            return d
+        d.addCallback(granted)
+        d.addErrback(self.cashGeneralFailure, packet)
+        return d
         
     def cashIn(self, packet):
         self.log.debug("cashIn: %s", packet)
         currency_serial = self.getCurrencySerial(packet.url)
         packet.currency_serial = currency_serial
-        d = self.lock(currency_serial)
-        d.addCallback(self.cashInValidateNote, packet)
-        d.addErrback(self.cashGeneralFailure, packet)
-        return d
+        return self.locked(currency_serial, self.cashInValidateNote, packet)
     
     def cashOut(self, packet):
         self.log.debug("cashOut: %s", packet)
         currency_serial = self.getCurrencySerial(packet.url)
         packet.currency_serial = currency_serial
-        d = self.lock(currency_serial)
-        d.addCallback(self.cashOutBreakNote, packet)
-        d.addErrback(self.cashGeneralFailure, packet)
-        return d
+        return self.locked(currency_serial, self.cashOutBreakNote, packet)
 
     def cashOutCommit(self, packet):
         self.log.debug("cashOutCommit: %s", packet)
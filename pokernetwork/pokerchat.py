@@ -0,0 +1,251 @@
+#
+# -*- py-indent-offset: 4; coding: utf-8; mode: python -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Chat pipeline of the tables: bad words filter, rate limits and archive.
+#
+#   <badwordschatfilter file="/etc/poker-network/badwords.txt" />
+#   <chatrate user="5" table="40" period="10"/>
+#   <chatarchive flush_delay="1" batch="200" max_pending="10000"/>
+#
+from collections import deque
+
+from twisted.internet import reactor, defer
+from twisted.python.runtime import seconds
+
+from pokernetwork import log as network_log
+log = network_log.get_child('pokerchat')
+
+class ChatFilter:
+    """Case insensitive replacement of a list of words, with an Aho-Corasick
+    automaton. The cost of sub() is linear in the length of the message
+    whatever the number of words. Overlapping words are resolved leftmost
+    longest first. It has the same sub(repl, message) signature as the
+    regular expression it replaces."""
+
+    def __init__(self, words):
+        self.goto = [{}]
+        self.fail = [0]
+        self.word = [0]
+        self.word_suffix = [0]
+        for word in words:
+            word = word.strip().lower()
+            if word:
+                self._add(word)
+        self._build()
+
+    def _add(self, word):
+        state = 0
+        for char in word:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.word.append(0)
+                self.word_suffix.append(0)
+                self.goto[state][char] = next_state
+            state = next_state
+        self.word[state] = len(word)
+
+    def _build(self):
+        #
+        # breadth first so that the failure state of the parent is known.
+        # word_suffix links a state to the longest word that is a proper
+        # suffix of it, so that all the words ending at a position are found
+        # without walking the whole failure chain.
+        #
+        queue = deque(self.goto[0].itervalues())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].iteritems():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.goto[fail].get(char, 0)
+                self.fail[next_state] = fail
+                self.word_suffix[next_state] = fail if self.word[fail] else self.word_suffix[fail]
+
+    def __len__(self):
+        return len(self.goto)
+
+    def matches(self, message):
+        """Return a dict mapping the start of each match to the length of
+        the longest word starting there."""
+        goto = self.goto
+        fail = self.fail
+        word = self.word
+        word_suffix = self.word_suffix
+        starts = {}
+        state = 0
+        for position, char in enumerate(message.lower()):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            found = state if word[state] else word_suffix[state]
+            while found:
+                length = word[found]
+                start = position - length + 1
+                if starts.get(start, 0) < length:
+                    starts[start] = length
+                found = word_suffix[found]
+        return starts
+
+    def sub(self, repl, message):
+        starts = self.matches(message)
+        if not starts:
+            return message
+        result = []
+        position = 0
+        for start in sorted(starts):
+            if start < position:
+                continue
+            result.append(message[position:start])
+            result.append(repl)
+            position = start + starts[start]
+        result.append(message[position:])
+        return "".join(result)
+
+    @staticmethod
+    def fromFile(path):
+        with open(path, 'r') as f:
+            return ChatFilter(f)
+
+class ChatRateLimiter:
+    """Token buckets per user and per table: each of them allows at most
+    user (resp. table) messages per period seconds. A bucket that was not
+    used for a period is full again and is forgotten."""
+
+    def __init__(self, settings):
+        properties = settings.headerGetProperties("/server/chatrate")
+        properties = properties[0] if properties else {}
+        self.period = float(properties.get('period', 10))
+        self.user_max = int(properties.get('user', 0))
+        self.table_max = int(properties.get('table', 0))
+        self.users = {}
+        self.tables = {}
+        self.pruned = seconds()
+
+    def _take(self, buckets, key, capacity, now):
+        tokens, last = buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - last) * capacity / self.period)
+        if tokens < 1:
+            buckets[key] = (tokens, now)
+            return False
+        buckets[key] = (tokens - 1, now)
+        return True
+
+    def allow(self, game_id, serial, now=None):
+        if now is None:
+            now = seconds()
+        if now - self.pruned > self.period:
+            self.prune(now)
+        if self.user_max > 0 and not self._take(self.users, serial, self.user_max, now):
+            return False
+        if self.table_max > 0 and not self._take(self.tables, game_id, self.table_max, now):
+            return False
+        return True
+
+    def prune(self, now):
+        self.pruned = now
+        for buckets in (self.users, self.tables):
+            for key in [key for key, (_tokens, last) in buckets.iteritems() if now - last > self.period]:
+                del buckets[key]
+
+class ChatArchive:
+    """Write the chat messages with one multi-row INSERT every flush_delay
+    seconds or batch messages. When more than max_pending messages wait for
+    the database the oldest ones are dropped."""
+
+    log = log.get_child('ChatArchive')
+
+    def __init__(self, settings, adb):
+        self.adb = adb
+        properties = settings.headerGetProperties("/server/chatarchive")
+        properties = properties[0] if properties else {}
+        self.flush_delay = float(properties.get('flush_delay', 1))
+        self.batch = max(1, int(properties.get('batch', 200)))
+        self.max_pending = max(self.batch, int(properties.get('max_pending', 10000)))
+        self.pending = deque()
+        self.dropped = 0
+        self.timer = None
+        self.writing = None
+
+    def write(self, player_serial, game_id, message):
+        if len(self.pending) >= self.max_pending:
+            self.pending.popleft()
+            self.dropped += 1
+            if self.dropped == 1:
+                self.log.warn("chat archive lagging, dropping the oldest messages")
+        self.pending.append((player_serial, game_id, message))
+        if self.writing is None:
+            if len(self.pending) >= self.batch:
+                self.flush()
+            elif self.timer is None:
+                self.timer = reactor.callLater(self.flush_delay, self.flush)
+
+    def flush(self):
+        if self.timer and self.timer.active():
+            self.timer.cancel()
+        self.timer = None
+        if self.writing is not None or not self.pending:
+            return self.writing
+        count = min(self.batch, len(self.pending))
+        args = []
+        for _ in xrange(count):
+            args.extend(self.pending.popleft())
+        d = self.writing = self.adb.runOperation(
+            "INSERT INTO chat_messages (player_serial, game_id, message) VALUES " + ", ".join(["(%s, %s, %s)"] * count),
+            args
+        )
+        d.addCallbacks(self._writeDone, self._writeFailed, errbackArgs=(count,))
+        return d
+
+    def _writeDone(self, result):
+        self._next()
+        return result
+
+    def _writeFailed(self, fail, count):
+        self.log.error("failed to archive %d chat messages: %r", count, fail)
+        self._next()
+
+    def _next(self):
+        self.writing = None
+        if self.dropped:
+            self.log.warn("%d chat messages were dropped", self.dropped)
+            self.dropped = 0
+        if len(self.pending) >= self.batch:
+            self.flush()
+        elif self.pending and self.timer is None:
+            self.timer = reactor.callLater(self.flush_delay, self.flush)
+
+    def stop(self):
+        """Write all the pending messages, the returned deferred fires
+        when they are written."""
+        d = defer.Deferred()
+        def drain(result=None):
+            if self.writing is not None:
+                self.writing.addBoth(drain)
+            elif self.pending:
+                self.flush().addBoth(drain)
+            else:
+                d.callback(True)
+            return result
+        drain()
+        return d
@@ -24,6 +24,7 @@
 #  Henry Precheur <henry@precheur.org> (2004)
 #
 
+from collections import deque
 
 from twisted.internet import reactor, defer
 from twisted.python.runtime import seconds
@@ -282,10 +283,11 @@ class PokerClientProtocol(UGAMEClientProtocol):
             }
         self.setCurrentGameId(None)
         self.pending_auth_request = False
-        self.publish_packets = []
+        self.publish_packets = deque()
         self.input_packets = []
         self.publish_timer = None
         self.publish_time = 0
+        self._dispatch = {}
         self.publishPackets()
         self.explain = PokerExplain()
         
@@ -330,6 +332,7 @@ class PokerClientProtocol(UGAMEClientProtocol):
             callbacks = self.callbacks[what]
             for name in names:
                 callbacks.setdefault(name, []).append(meth)
+        self._dispatch.clear()
         
     def unregisterHandler(self, what, name, meth):
         if name:
@@ -344,6 +347,7 @@ class PokerClientProtocol(UGAMEClientProtocol):
             callbacks = self.callbacks[what]
             for name in names:
                 callbacks[name].remove(meth)
+        self._dispatch.clear()
         
     def normalizeChips(self, game, chips):
         if game.unit in self.factory.chips_values:
@@ -802,6 +806,11 @@ class PokerClientProtocol(UGAMEClientProtocol):
         publish_time = seconds() + delay
         if publish_time > self.publish_time:
             self.publish_time = publish_time
+            #
+            # the timer was armed for the previous deadline
+            #
+            if self.publish_timer and self.publish_timer.active():
+                self.publish_timer.reset(delay)
             
     def schedulePacket(self, packet):
         if not self.factory.isOutbound(packet) and hasattr(packet, "game_id") and not self.factory.gameExists(packet.game_id):
@@ -813,32 +822,37 @@ class PokerClientProtocol(UGAMEClientProtocol):
             self.publishPacketTriggerTimer()
             
     def unschedulePackets(self, predicate):
-        self.publish_packets = filter(lambda packet: not predicate(packet), self.publish_packets)
-        if self._poll:
+        self.publish_packets = deque(packet for packet in self.publish_packets if not predicate(packet))
+        if not self.publish_packets:
+            self.publishPacketCancelTimer()
+        elif self._poll:
             self.publishPacketTriggerTimer()
         
     def publishPackets(self):
-        delay = 0.01
-        if len(self.publish_packets) > 0:
-            #
-            # If time has not come, make sure we are called at a later time
-            # to reconsider the situation
-            #
+        """Publish the packets until the queue is empty or publishDelay()
+        sets a deadline in the future. The timer is armed again only when
+        packets are left, for the deadline, so that an idle client is
+        never woken up."""
+        self.publish_timer = None
+        while self.publish_packets:
             wait_for = self.publish_time - seconds()
             if wait_for > 0:
                 self.log.debug("publishPacket: %f before next packet is sent", wait_for)
-                delay = wait_for
                 self.block()
-            else:
-                self.publishPacket()
-                if len(self.publish_packets) > 0:
-                    self.block()
-                else:
-                    self.unblock()
-        else:
-            self.unblock()
-            
-        self.publishPacketTriggerTimer(delay)
+                self.publishPacketTriggerTimer(wait_for)
+                return
+            if not self.publishPacket():
+                #
+                # schedulePacket(PacketBootstrap()) wakes the queue up when
+                # the connection is established
+                #
+                self.block()
+                return
+        #
+        # a callback may have scheduled a packet that was published above
+        #
+        self.publishPacketCancelTimer()
+        self.unblock()
 
     def block(self):
         pass
@@ -846,17 +860,24 @@ class PokerClientProtocol(UGAMEClientProtocol):
     def unblock(self):
         pass
 
-    def publishPacketTriggerTimer(self, delay = 0.01):
+    def publishPacketTriggerTimer(self, delay = None):
         if not self.publish_timer or not self.publish_timer.active():
             if len(self.publish_packets) > 0:
+                if delay is None:
+                    delay = max(0, self.publish_time - seconds())
                 self.publish_timer = reactor.callLater(delay, self.publishPackets)
 
+    def publishPacketCancelTimer(self):
+        if self.publish_timer and self.publish_timer.active():
+            self.publish_timer.cancel()
+        self.publish_timer = None
+
     def publishPacket(self):
         packet = self.publish_packets[0]
         if not self.established and not self.factory.isConnectionLess(packet):
             self.log.debug("publishPacket: skip because connection not established")
-            return
-        self.publish_packets.pop(0)
+            return False
+        self.publish_packets.popleft()
         what = 'outbound'
         if hasattr(packet, "game_id"):
             if not self.factory.isOutbound(packet):
@@ -870,11 +891,15 @@ class PokerClientProtocol(UGAMEClientProtocol):
         else:
             what = 'outbound'
 
-        if packet.type in self.callbacks[what]:
-            callbacks = self.callbacks[what][packet.type]
-            for callback in callbacks:
-                callback(self, packet)
+        key = (what, packet.type)
+        callbacks = self._dispatch.get(key)
+        if callbacks is None:
+            callbacks = self._dispatch[key] = tuple(self.callbacks[what].get(packet.type, ()))
+        for callback in callbacks:
+            callback(self, packet)
+        return True
         
     def publishAllPackets(self):
         while len(self.publish_packets) > 0:
-            self.publishPacket()
+            if not self.publishPacket():
+                break
@@ -25,7 +25,12 @@
 #
 import os
 from os.path import exists
+from collections import deque
+from contextlib import closing
 import MySQLdb
+from twisted.internet import reactor, task, threads
+from twisted.python.runtime import seconds
+from twisted.python.threadpool import ThreadPool
 from pokernetwork.util.sql import TimingCursor, TimingDictCursor
 import subprocess
 
@@ -39,6 +44,233 @@ class ExceptionUpgradeFailed(Exception): pass
 
 from pokernetwork.version import Version, version
 
+#
+# Read only queries may be sent to replicas of the database:
+#
+#   <replicas lag_max="2" check="1" sticky="5" connect_timeout="2" retry_max="60">
+#     <replica host="replica1" />
+#     <replica host="replica2" port="3307" />
+#   </replicas>
+#
+# The attributes of a replica that are left out (port, user, password,
+# name) are the same as the attributes of <database>. Every check seconds
+# the primary increments the counter of the heartbeat table and the
+# counter of each replica is read, in a thread: a replica lags by the age
+# of the oldest increment it did not apply yet. The replicas that lag by
+# more than lag_max seconds are not used until the next check. A replica
+# that cannot be reached within connect_timeout seconds is not used nor
+# checked for check seconds, twice as long after each failure up to
+# retry_max seconds. The reads of a player that changed the database less
+# than sticky seconds ago are sent to the primary (see
+# PokerService.readCursor).
+#
+class Replica:
+
+    def __init__(self, parameters, connect_timeout):
+        self.parameters = parameters
+        self.connect_timeout = connect_timeout
+        self.db = None
+        #
+        # the connection of the heartbeat thread
+        #
+        self.heartbeat_db = None
+        self.lag = None
+        self.retry_at = 0
+        self.retry_delay = 0
+
+    def connect(self):
+        db = MySQLdb.connect(
+            host = self.parameters["host"],
+            port = int(self.parameters.get("port", '3306')),
+            user = self.parameters["user"],
+            passwd = self.parameters["password"],
+            db = self.parameters["name"],
+            connect_timeout = self.connect_timeout,
+            cursorclass = TimingCursor
+        )
+        db.autocommit(True)
+        return db
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def closeHeartbeat(self):
+        if self.heartbeat_db is not None:
+            self.heartbeat_db.close()
+            self.heartbeat_db = None
+
+    def cursor(self, *args, **kwargs):
+        if self.db is None:
+            self.db = self.connect()
+        return self.db.cursor(*args, **kwargs)
+
+    def heartbeatCursor(self):
+        if self.heartbeat_db is None:
+            self.heartbeat_db = self.connect()
+        return self.heartbeat_db.cursor()
+
+    def getBeat(self):
+        with closing(self.heartbeatCursor()) as c:
+            c.execute("SELECT beat FROM heartbeat")
+            row = c.fetchone()
+            return row[0] if row else 0
+
+    def incrementBeat(self):
+        with closing(self.heartbeatCursor()) as c:
+            c.execute("UPDATE heartbeat SET beat = LAST_INSERT_ID(beat + 1)")
+            return c.lastrowid
+
+class ReplicaRouter:
+
+    log = log.get_child('ReplicaRouter')
+
+    def __init__(self, database, properties, replicas):
+        self.database = database
+        self.lag_max = float(properties.get('lag_max', 2))
+        self.check = float(properties.get('check', 1))
+        self.retry_max = float(properties.get('retry_max', 60))
+        connect_timeout = int(properties.get('connect_timeout', 2))
+        self.replicas = []
+        for replica in replicas:
+            parameters = dict(database.parameters)
+            parameters.update(replica)
+            self.replicas.append(Replica(parameters, connect_timeout))
+        #
+        # the heartbeat thread increments the counter with its own
+        # connection to the primary
+        #
+        self.primary = Replica(dict(database.parameters), connect_timeout)
+        #
+        # the (beat, time) of the increments of the heartbeat counter that
+        # may not be applied by all the replicas yet
+        #
+        self.beats = deque()
+        self.beats_max = 1000
+        self.forgotten = None
+        self.next = 0
+        #
+        # called with the time of each heartbeat, in the reactor thread
+        #
+        self.heartbeat_listeners = []
+        self.threadpool = None
+        self.loop = None
+
+    def start(self):
+        self.threadpool = ThreadPool(0, 1, 'ReplicaRouter')
+        self.threadpool.start()
+        self.loop = task.LoopingCall(self.beat)
+        self.loop.start(self.check)
+
+    def close(self):
+        if self.loop is not None:
+            if self.loop.running:
+                self.loop.stop()
+            self.loop = None
+        if self.threadpool is not None:
+            self.threadpool.stop()
+            self.threadpool = None
+        self.primary.closeHeartbeat()
+        for replica in self.replicas:
+            replica.closeHeartbeat()
+            replica.close()
+
+    def beat(self):
+        """Runs a heartbeat in the thread of the router, the next one is
+        not started before it completes."""
+        now = seconds()
+        d = threads.deferToThreadPool(reactor, self.threadpool, self.heartbeat, now)
+        d.addCallbacks(self.heartbeatDone, self.heartbeatFailed, (now,), None, (now,))
+        return d
+
+    def heartbeat(self, now):
+        """Increments the counter on the primary and reads it on the
+        replicas that are not waiting for a retry. Returns the increment
+        and, for each replica, the increment it applied, the error that
+        prevented reading it or None if it was not read. Runs in the thread
+        of the router and changes nothing but the heartbeat connections."""
+        try:
+            beat = self.primary.incrementBeat()
+        except MySQLdb.Error:
+            self.primary.closeHeartbeat()
+            raise
+        applied = []
+        for replica in self.replicas:
+            if replica.retry_at > now:
+                applied.append(None)
+                continue
+            try:
+                applied.append(replica.getBeat())
+            except MySQLdb.Error, e:
+                replica.closeHeartbeat()
+                applied.append(e)
+        return beat, applied
+
+    def heartbeatDone(self, result, now):
+        increment, applied = result
+        self.beats.append((increment, now))
+        applied_min = None
+        for replica, replica_applied in zip(self.replicas, applied):
+            if replica_applied is None:
+                continue
+            if isinstance(replica_applied, Exception):
+                self.unavailable(replica, replica_applied, now)
+                continue
+            replica.retry_delay = 0
+            if applied_min is None or replica_applied < applied_min:
+                applied_min = replica_applied
+            if self.forgotten is not None and replica_applied < self.forgotten[0]:
+                replica.lag = now - self.forgotten[1]
+                continue
+            replica.lag = 0
+            for beat, time in self.beats:
+                if beat > replica_applied:
+                    replica.lag = now - time
+                    break
+        #
+        # forget the increments that all the replicas applied, or the
+        # oldest ones if they are too many, the replicas that did not apply
+        # the last forgotten increment lag by its age at least
+        #
+        while self.beats and (
+            (applied_min is not None and self.beats[0][0] <= applied_min) or
+            len(self.beats) > self.beats_max
+        ):
+            self.forgotten = self.beats.popleft()
+        for listener in self.heartbeat_listeners:
+            listener(now)
+
+    def heartbeatFailed(self, reason, now):
+        #
+        # the lags cannot be known without the primary
+        #
+        self.log.warn("heartbeat failed: %s", reason.getErrorMessage())
+        for replica in self.replicas:
+            replica.lag = None
+
+    def unavailable(self, replica, error, now):
+        if replica.lag is not None:
+            self.log.warn("replica %s is not available: %s", replica.parameters['host'], error)
+        replica.close()
+        replica.lag = None
+        replica.retry_delay = min(replica.retry_delay * 2 or self.check, self.retry_max)
+        replica.retry_at = now + replica.retry_delay
+
+    def cursor(self, *args, **kwargs):
+        """Returns a cursor on the next replica, in turn, that did not lag
+        at the last heartbeat or None if there is none."""
+        for _ in xrange(len(self.replicas)):
+            replica = self.replicas[self.next]
+            self.next = (self.next + 1) % len(self.replicas)
+            if replica.lag is None or replica.lag > self.lag_max:
+                continue
+            try:
+                return replica.cursor(*args, **kwargs)
+            except MySQLdb.Error, e:
+                self.unavailable(replica, e, seconds())
+        return None
+
 class PokerDatabase:
 
     log = log.get_child('PokerDatabase')
@@ -123,8 +355,16 @@ class PokerDatabase:
         self.db.autocommit(True)
         self.version = Version(self.getVersionFromDatabase())
         self.log.inform("Database version %s", self.version)
+        replicas = settings.headerGetProperties("/server/replicas")
+        if replicas:
+            self.router = ReplicaRouter(self, replicas[0], settings.headerGetProperties("/server/replicas/replica"))
+            self.router.start()
+        else:
+            self.router = None
 
     def close(self):
+        if getattr(self, 'router', None) is not None:
+            self.router.close()
         if hasattr(self, 'db'):
             self.db.close()
 
@@ -192,6 +432,16 @@ class PokerDatabase:
             self.db.connect()
             return self.db.cursor(*args, **kwargs)
 
+    def readCursor(self, *args, **kwargs):
+        """Same as cursor() for the read only queries: the cursor is on a
+        replica of the database, or on the primary when there is no replica
+        or they all lag."""
+        if self.router is not None:
+            cursor = self.router.cursor(*args, **kwargs)
+            if cursor is not None:
+                return cursor
+        return self.cursor(*args, **kwargs)
+
     def literal(self, args):
         return self.db.literal(args)
 
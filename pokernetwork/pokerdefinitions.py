@@ -0,0 +1,124 @@
+#
+# -*- py-indent-offset: 4; coding: utf-8; mode: python -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Variant and betting structure definitions shared by the games of the
+# process.
+#
+# PokerGame.setVariant and setBettingStructure load the XML files into
+# the Config objects of the game and evaluate XPath expressions on them.
+# The games of the process get a SharedConfig instead, which loads the
+# documents from a cache where each file is parsed once for a given
+# modification time. The documents are shared and must not be modified.
+# A file is parsed again when its modification time changes.
+#
+from os import stat
+from os.path import abspath, expanduser
+
+import libxml2
+
+from pokerengine.pokerengineconfig import Config
+
+from pokernetwork import log as network_log
+log = network_log.get_child('pokerdefinitions')
+
+#
+# the Config objects PokerGame.__init__ creates for the variant and the
+# betting structure and that setVariant and setBettingStructure load
+#
+GAME_CONFIGS = ('_PokerGame__variant', '_PokerGame__betting_structure')
+
+class GameDefinitions:
+
+    log = log.get_child('GameDefinitions')
+
+    def __init__(self):
+        #
+        # path => (modification time, document, XPath context)
+        #
+        self.documents = {}
+        self.hits = 0
+        self.misses = 0
+
+    def find(self, dirs, name):
+        """The absolute path and the modification time of name in the
+        first of dirs where it exists, the way Config.load looks for it."""
+        for directory in dirs:
+            path = abspath(expanduser(directory and (directory + "/" + name) or name))
+            try:
+                return path, stat(path).st_mtime
+            except OSError:
+                continue
+        return None, None
+
+    def load(self, path, mtime):
+        document = self.documents.get(path)
+        if document is None or document[0] != mtime:
+            self.misses += 1
+            doc = libxml2.parseFile(path)
+            document = self.documents[path] = (mtime, doc, doc.xpathNewContext())
+            self.log.debug("parsed %s", path)
+        else:
+            self.hits += 1
+        return document
+
+    def setup(self, game, url, dirs, variant, betting_structure):
+        """Same as game.setVariant(variant) followed by
+        game.setBettingStructure(betting_structure), url and dirs are the
+        arguments the game was created with."""
+        for name in GAME_CONFIGS:
+            config = getattr(game, name, None)
+            if isinstance(config, Config) and not isinstance(config, SharedConfig):
+                setattr(game, name, SharedConfig(config.dirs, self))
+        game.setVariant(variant)
+        game.setBettingStructure(betting_structure)
+        return game
+
+    def clear(self):
+        self.documents = {}
+
+class SharedConfig(Config):
+    """Config of a game that reads its documents from GameDefinitions
+    instead of parsing them."""
+
+    def __init__(self, dirs, definitions):
+        Config.__init__(self, dirs)
+        self.definitions = definitions
+
+    def load(self, path):
+        found, mtime = self.definitions.find(self.dirs, path)
+        if found is None:
+            #
+            # the game reports the missing file
+            #
+            return Config.load(self, path)
+        self.path = found
+        _mtime, self.doc, self.header = self.definitions.load(found, mtime)
+        return True
+
+    def free(self):
+        #
+        # the documents belong to GameDefinitions
+        #
+        self.doc = None
+        self.header = None
+
+definitions = GameDefinitions()
+
+def setup(game, url, dirs, variant, betting_structure):
+    return definitions.setup(game, url, dirs, variant, betting_structure)
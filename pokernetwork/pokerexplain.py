@@ -25,6 +25,7 @@ from twisted.python.runtime import seconds
 from pokerengine.pokerchips import PokerChips
 from pokerengine.pokergame import history2messages
 from pokernetwork.pokergameclient import PokerNetworkGameClient
+from pokernetwork import pokerdefinitions
 from pokerpackets.packets import *
 from pokerpackets.networkpackets import *
 from pokerpackets.clientpackets import *
@@ -33,6 +34,8 @@ log = network_log.get_child('explain')
 
 DEFAULT_PLAYER_USER_DATA = { 'timeout': None }
 
+GAME_URL = "poker.%s.xml"
+
 class PokerGames:
 
     log = log.get_child('PokerGames')
@@ -57,7 +60,7 @@ class PokerGames:
     
     def getOrCreateGame(self, game_id):
         if game_id not in self.games:
-            game = PokerNetworkGameClient("poker.%s.xml", self.dirs)
+            game = PokerNetworkGameClient(GAME_URL, self.dirs)
             game.prefix = self.prefix
             game.id = game_id
             self.games[game_id] = game
@@ -286,8 +289,7 @@ class PokerExplain:
                 new_game.prefix = self._prefix
                 new_game.name = packet.name
                 new_game.setTime(0)
-                new_game.setVariant(packet.variant)
-                new_game.setBettingStructure(packet.betting_structure)
+                pokerdefinitions.setup(new_game, GAME_URL, self.games.dirs, packet.variant, packet.betting_structure)
                 new_game.setMaxPlayers(packet.seats)
                 new_game.registerCallback(self.gameEvent)
                 new_game.level_skin = packet.skin
@@ -0,0 +1,223 @@
+#
+# -*- py-indent-offset: 4; coding: utf-8; mode: python -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Group commit of the hand histories. The finished hands of all tables
+# are buffered and written in a single transaction every flush_delay
+# seconds or as soon as batch hands are waiting:
+#
+#   <handwriter flush_delay="0.05" batch="100" max_pending="2000" max_queued="10000"
+#               retries="5" retry_max="60" serial_block="1"/>
+#
+# When more than max_pending hands wait for the database the writer is
+# congested and the tables delay the next hand until it catches up. The
+# hands finished while more than max_queued hands are waiting are not
+# saved and their deferred fails.
+#
+# A batch that fails to be written is written again after flush_delay
+# seconds, twice as long after each failure up to retry_max seconds. After
+# retries failures the deferreds of its hands fail.
+#
+# When serial_block is greater than one, hand serials are reserved by
+# blocks with a single multi-row INSERT so that starting a hand does not
+# need a database round trip. It relies on the multi-row INSERT getting
+# consecutive serials, which is the case with innodb_autoinc_lock_mode 0
+# or 1.
+#
+from contextlib import closing
+
+from twisted.internet import reactor, defer
+
+from pokernetwork import log as network_log
+log = network_log.get_child('pokerhandwriter')
+
+class PokerHandWriter:
+
+    log = log.get_child('PokerHandWriter')
+
+    def __init__(self, settings, db, adb):
+        self.db = db
+        self.adb = adb
+        properties = settings.headerGetProperties("/server/handwriter")
+        properties = properties[0] if properties else {}
+        self.flush_delay = float(properties.get('flush_delay', 0.05))
+        self.batch = max(1, int(properties.get('batch', 100)))
+        self.max_pending = max(self.batch, int(properties.get('max_pending', 2000)))
+        self.max_queued = max(self.max_pending, int(properties.get('max_queued', 10000)))
+        self.retries = max(0, int(properties.get('retries', 5)))
+        self.retry_max = float(properties.get('retry_max', 60))
+        self.serial_block = max(1, int(properties.get('serial_block', 1)))
+        self.pending = []
+        self.hand2description = {}
+        self.reserved = []
+        self.hand2game = {}
+        self.timer = None
+        self.writing = None
+        self.congested = False
+        #
+        # the number of times the first batch failed to be written
+        #
+        self.failures = 0
+
+    def reserveSerials(self):
+        with closing(self.db.cursor()) as c:
+            c.execute(
+                "INSERT INTO hands (description) VALUES " + ", ".join(["('[]')"] * self.serial_block)
+            )
+            first = int(c.lastrowid)
+        self.reserved = range(first, first + self.serial_block)
+        self.reserved.reverse()
+
+    def createHand(self, game_id, tourney_serial):
+        if not self.reserved:
+            self.reserveSerials()
+        hand_serial = self.reserved.pop()
+        self.hand2game[hand_serial] = (game_id, tourney_serial)
+        return hand_serial
+
+    def getDescription(self, hand_serial):
+        return self.hand2description.get(hand_serial)
+
+    def isCongested(self):
+        return self.congested
+
+    def write(self, hand_serial, description, player_list):
+        if len(self.pending) >= self.max_queued:
+            self.log.crit("%d hands waiting to be saved, hand %d is not saved", len(self.pending), hand_serial)
+            self.hand2game.pop(hand_serial, None)
+            return defer.fail(UserWarning("hand %d is not saved, %d hands are waiting" % (hand_serial, len(self.pending))))
+        d = defer.Deferred()
+        self.pending.append((hand_serial, description, player_list, d))
+        self.hand2description[hand_serial] = description
+        if not self.congested and len(self.pending) >= self.max_pending:
+            self.log.warn("%d hands waiting to be saved, delaying new hands", len(self.pending))
+            self.congested = True
+        if self.writing is None and not self.failures:
+            if len(self.pending) >= self.batch:
+                self.flush()
+            elif self.timer is None:
+                self.timer = reactor.callLater(self.flush_delay, self.flush)
+        return d
+
+    def flush(self):
+        if self.timer and self.timer.active():
+            self.timer.cancel()
+        self.timer = None
+        if self.writing is not None or not self.pending:
+            return self.writing
+        batch, self.pending = self.pending[:self.batch], self.pending[self.batch:]
+        batch = [
+            (hand_serial, description, player_list, d, self.hand2game.pop(hand_serial, None))
+            for hand_serial, description, player_list, d in batch
+        ]
+        d = self.writing = self.adb.runInteraction(self._writeBatch, batch)
+        d.addCallbacks(self._writeDone, self._writeFailed, (batch,), None, (batch,))
+        return d
+
+    def _writeBatch(self, cursor, batch):
+        serials = []
+        description_args = []
+        game_args = []
+        u2h_args = []
+        for hand_serial, description, player_list, _d, game in batch:
+            serials.append(hand_serial)
+            description_args.extend((hand_serial, str(description)))
+            if game:
+                game_args.extend((hand_serial,) + game)
+            for user_serial in player_list:
+                u2h_args.extend((user_serial, hand_serial))
+        sql = "UPDATE hands SET description = CASE serial " + "WHEN %s THEN %s " * len(batch) + "END"
+        args = description_args
+        if game_args:
+            count = len(game_args) / 3
+            sql += ", game_id = CASE serial " + "WHEN %s THEN %s " * count + "ELSE game_id END"
+            sql += ", tourney_serial = CASE serial " + "WHEN %s THEN %s " * count + "ELSE tourney_serial END"
+            args = args + [arg for i in xrange(0, len(game_args), 3) for arg in game_args[i:i+2]]
+            args = args + [arg for i in xrange(0, len(game_args), 3) for arg in (game_args[i], game_args[i+2])]
+        sql += " WHERE serial IN (" + ", ".join(["%s"] * len(serials)) + ")"
+        cursor.execute(sql, args + serials)
+        if u2h_args:
+            cursor.execute(
+                "INSERT INTO user2hand (user_serial, hand_serial) VALUES " + ", ".join(["(%s, %s)"] * (len(u2h_args) / 2)),
+                u2h_args
+            )
+
+    def _writeDone(self, result, batch):
+        self.writing = None
+        self.failures = 0
+        for hand_serial, _description, _player_list, d, _game in batch:
+            self.hand2description.pop(hand_serial, None)
+            d.callback(hand_serial)
+        self._next()
+        return result
+
+    def _writeFailed(self, fail, batch):
+        self.writing = None
+        self.failures += 1
+        if self.failures > self.retries:
+            self.log.crit('failed to save %d hands, giving up: %r', len(batch), fail)
+            self.failures = 0
+            for hand_serial, _description, _player_list, d, _game in batch:
+                self.hand2description.pop(hand_serial, None)
+                d.errback(fail)
+            self._next()
+            return
+        delay = min(self.flush_delay * 2 ** self.failures, self.retry_max)
+        self.log.error('failed to save %d hands, retrying in %g seconds: %r', len(batch), delay, fail)
+        for hand_serial, _description, _player_list, _d, game in batch:
+            if game is not None:
+                self.hand2game[hand_serial] = game
+        self.pending[0:0] = [
+            (hand_serial, description, player_list, d)
+            for hand_serial, description, player_list, d, _game in batch
+        ]
+        self.timer = reactor.callLater(delay, self.flush)
+
+    def _next(self):
+        if self.congested and len(self.pending) < self.batch:
+            self.log.inform("hands are saved in time again")
+            self.congested = False
+        if len(self.pending) >= self.batch:
+            self.flush()
+        elif self.pending and self.timer is None:
+            self.timer = reactor.callLater(self.flush_delay, self.flush)
+
+    def stop(self):
+        """Write all the pending hands and release the reserved serials.
+        The returned deferred fires when everything is written."""
+        d = defer.Deferred()
+        def drain(result=None):
+            if self.writing is not None:
+                self.writing.addBoth(drain)
+            elif self.pending:
+                self.flush().addBoth(drain)
+            else:
+                self.releaseSerials()
+                d.callback(True)
+            return result
+        drain()
+        return d
+
+    def releaseSerials(self):
+        if self.reserved:
+            with closing(self.db.cursor()) as c:
+                c.execute(
+                    "DELETE FROM hands WHERE serial IN (" + ", ".join(["%s"] * len(self.reserved)) + ")",
+                    self.reserved
+                )
+            self.reserved = []
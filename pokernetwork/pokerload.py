@@ -0,0 +1,431 @@
+#
+# -*- py-indent-offset: 4; coding: utf-8; mode: python -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Load generator: thousands of lightweight clients playing on a server
+# over binarypack, msgpack and REST long poll.
+#
+#   <load clients="1000" rate="50" ramp="20" duration="300"
+#         protocols="binarypack,msgpack,rest" msgpack="19386" rest="19384"
+#         table="" report="/tmp/pokerload.json"/>
+#
+# Unlike the bots of pokerbot, the clients do not simulate the game with
+# PokerExplain: they only know their serial, their table and the bets of
+# the current round, which is enough to check, call or fold when the server
+# tells them they are in position. The login latency, the latency between
+# an action and its broadcast and the reactor lag, of the server and of
+# the load generator itself, are reported when the load stops.
+#
+import sys
+import os
+from random import random
+
+from twisted.internet import reactor, protocol, defer
+from twisted.python.runtime import seconds
+from twisted.web import client
+
+from pokerpackets.packets import *
+from pokerpackets.networkpackets import *
+from pokerpackets.dictpack import packet2dict
+
+from pokernetwork import pokernetworkconfig
+from pokernetwork.protocol import UGAMEProtocol, MsgpackProtocol
+from pokernetwork.pokerrestclient import PokerRestClient
+from pokernetwork.pokermetrics import Histogram, ReactorLagProbe
+
+from pokernetwork import log as network_log
+log = network_log.get_child('pokerload')
+
+PROTOCOLS = ('binarypack', 'msgpack', 'rest')
+
+class LoadStats:
+
+    PERCENTILES = (50, 90, 99, 99.9)
+
+    def __init__(self):
+        self.login = Histogram()
+        self.action = Histogram()
+        self.reactor_lag = Histogram()
+        self.counters = dict.fromkeys((
+            'spawned', 'connected', 'failed', 'lost', 'logged', 'refused',
+            'seated', 'unseated', 'errors', 'actions', 'rebuys',
+        ), 0)
+        self.hands = set()
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    @staticmethod
+    def histogramReport(histogram):
+        report = dict(('p%s' % percent, histogram.percentile(percent)) for percent in LoadStats.PERCENTILES)
+        report['count'] = histogram.count
+        report['max'] = histogram.max
+        return report
+
+    def report(self, elapsed, server_lag):
+        report = dict(self.counters)
+        report.update({
+            'seconds': elapsed,
+            'hands': len(self.hands),
+            'hands_per_second': len(self.hands) / elapsed if elapsed > 0 else 0,
+            'login_us': self.histogramReport(self.login),
+            'action_us': self.histogramReport(self.action),
+            'reactor_lag_us': self.histogramReport(self.reactor_lag),
+            'server_reactor_lag_us': server_lag,
+        })
+        return report
+
+def renderReport(report):
+    lines = [
+        "%-24s %d spawned, %d connected, %d failed, %d lost" % ("connections", report['spawned'], report['connected'], report['failed'], report['lost']),
+        "%-24s %d logged, %d refused, %d seated, %d unseated" % ("players", report['logged'], report['refused'], report['seated'], report['unseated']),
+        "%-24s %d hands (%.1f/s), %d actions, %d rebuys, %d errors" % ("play", report['hands'], report['hands_per_second'], report['actions'], report['rebuys'], report['errors']),
+    ]
+    for label, key in (
+        ("login", 'login_us'),
+        ("action to broadcast", 'action_us'),
+        ("reactor lag (load)", 'reactor_lag_us'),
+        ("reactor lag (server)", 'server_reactor_lag_us'),
+    ):
+        histogram = report[key]
+        if not histogram:
+            lines.append("%-24s unknown" % label)
+            continue
+        lines.append("%-24s %s max %.1fms" % (
+            label,
+            " ".join("p%s %.1fms" % (percent, histogram.get('p%s' % percent, 0) / 1000.0) for percent in LoadStats.PERCENTILES),
+            histogram.get('max', 0) / 1000.0
+        ))
+    return "\n".join(lines)
+
+def parseServerLag(text):
+    """The reactor lag quantiles out of the Prometheus text of the
+    /metrics resource of the server (see pokernetwork.pokermetrics)."""
+    report = {}
+    for line in text.splitlines():
+        if line.startswith('poker_reactor_lag_us{quantile="'):
+            quantile, value = line[len('poker_reactor_lag_us{quantile="'):].split('"} ')
+            percent = round(float(quantile) * 100, 3)
+            report['p%s' % (int(percent) if percent.is_integer() else percent)] = int(value)
+        elif line.startswith('poker_reactor_lag_us_max '):
+            report['max'] = int(line.split()[1])
+        elif line.startswith('poker_reactor_lag_us_count '):
+            report['count'] = int(line.split()[1])
+    return report
+
+class LoadPlayer:
+    """The game logic of a client, independent of the protocol: the
+    transport calls start() with the function that sends a packet and
+    packetReceived() for each packet of the server."""
+
+    log = log.get_child('LoadPlayer')
+
+    def __init__(self, generator, name, password):
+        self.generator = generator
+        self.stats = generator.stats
+        self.name = name
+        self.password = password
+        self.send = None
+        self.serial = 0
+        self.game_id = None
+        self.bets = {}
+        self.login_time = None
+        self.action_time = None
+
+    def start(self, send):
+        self.send = send
+        self.stats.count('connected')
+        self.login_time = seconds()
+        send(PacketPokerSetRole(roles = PacketPokerRoles.PLAY))
+        send(PacketLogin(name = self.name, password = self.password))
+
+    def connectionFailed(self, reason):
+        self.stats.count('failed')
+        self.log.debug("%s: connection failed %s", self.name, reason)
+
+    def connectionLost(self, reason):
+        if not self.generator.stopping:
+            self.stats.count('lost')
+            self.log.inform("%s: connection lost %s", self.name, reason)
+
+    def packetReceived(self, packet):
+        packet_type = packet.type
+        if packet_type == PACKET_POKER_PLAYER_CHIPS:
+            if packet.game_id == self.game_id:
+                self.bets[packet.serial] = packet.bet
+                if packet.serial == self.serial and packet.money == 0 and packet.bet == 0:
+                    self.rebuy()
+        elif packet_type in (PACKET_POKER_CALL, PACKET_POKER_CHECK, PACKET_POKER_FOLD):
+            if packet.serial == self.serial and self.action_time is not None:
+                self.stats.action.record(int((seconds() - self.action_time) * 1000000))
+                self.action_time = None
+        elif packet_type == PACKET_POKER_POSITION:
+            if packet.game_id == self.game_id and packet.serial == self.serial:
+                self.act()
+        elif packet_type in (PACKET_POKER_START, PACKET_POKER_STATE):
+            if packet.game_id == self.game_id:
+                self.bets = {}
+                if packet_type == PACKET_POKER_START:
+                    self.stats.hands.add(packet.hand_serial)
+        elif packet_type == PACKET_SERIAL:
+            self.serial = packet.serial
+        elif packet_type == PACKET_AUTH_OK:
+            self.stats.count('logged')
+            self.stats.login.record(int((seconds() - self.login_time) * 1000000))
+            self.send(PacketPokerTableSelect(string = self.generator.table))
+        elif packet_type == PACKET_AUTH_REFUSED:
+            self.stats.count('refused')
+            self.log.warn("%s: login refused %s", self.name, packet.message)
+        elif packet_type == PACKET_POKER_TABLE_LIST:
+            if self.game_id is None:
+                self.join(packet.packets)
+        elif packet_type in (PACKET_POKER_ERROR, PACKET_ERROR):
+            self.stats.count('errors')
+            self.log.debug("%s: %s", self.name, packet)
+
+    def join(self, tables):
+        self.game_id = self.generator.assignTable(tables)
+        if self.game_id is None:
+            self.stats.count('unseated')
+            return
+        self.stats.count('seated')
+        game_id = self.game_id
+        serial = self.serial
+        self.send(PacketPokerTableJoin(game_id = game_id, serial = serial))
+        self.send(PacketPokerSeat(game_id = game_id, serial = serial))
+        self.send(PacketPokerBuyIn(game_id = game_id, serial = serial))
+        self.send(PacketPokerAutoBlindAnte(game_id = game_id, serial = serial))
+        self.send(PacketPokerSit(game_id = game_id, serial = serial))
+
+    def rebuy(self):
+        self.stats.count('rebuys')
+        self.send(PacketPokerRebuy(game_id = self.game_id, serial = self.serial))
+        self.send(PacketPokerSit(game_id = self.game_id, serial = self.serial))
+
+    def act(self):
+        to_call = max(self.bets.values() or [0]) - self.bets.get(self.serial, 0)
+        if to_call <= 0:
+            packet = PacketPokerCheck(game_id = self.game_id, serial = self.serial)
+        elif random() < 0.1:
+            packet = PacketPokerFold(game_id = self.game_id, serial = self.serial)
+        else:
+            packet = PacketPokerCall(game_id = self.game_id, serial = self.serial)
+        self.stats.count('actions')
+        self.action_time = seconds()
+        self.send(packet)
+
+class LoadBinarypackProtocol(UGAMEProtocol):
+
+    log = log.get_child('LoadBinarypackProtocol')
+
+    def protocolEstablished(self):
+        self.factory.player.start(self.sendPacket)
+
+    def packetReceived(self, packet):
+        self.factory.player.packetReceived(packet)
+
+    def connectionLost(self, reason):
+        UGAMEProtocol.connectionLost(self, reason)
+        self.factory.player.connectionLost(reason)
+
+class LoadMsgpackProtocol(MsgpackProtocol):
+
+    log = log.get_child('LoadMsgpackProtocol')
+
+    def connectionMade(self):
+        MsgpackProtocol.connectionMade(self)
+        self.factory.player.start(self.sendPacket)
+
+    def packetReceived(self, packet):
+        self.factory.player.packetReceived(packet)
+
+    def connectionLost(self, reason):
+        MsgpackProtocol.connectionLost(self, reason)
+        self.factory.player.connectionLost(reason)
+
+class LoadClientFactory(protocol.ClientFactory):
+
+    noisy = False
+
+    def __init__(self, player, protocol):
+        self.player = player
+        self.protocol = protocol
+        self.connector = None
+
+    def clientConnectionFailed(self, connector, reason):
+        self.player.connectionFailed(reason)
+
+    def stop(self):
+        if self.connector:
+            self.connector.disconnect()
+
+class LoadRestClient:
+    """A session of the REST resource, with the long poll of
+    PokerRestClient to receive the packets that are not answers."""
+
+    def __init__(self, player, host, port, uid):
+        self.player = player
+        self.rest_client = PokerRestClient(
+            host, port,
+            "/POKER_REST?uid=%s&auth=%s" % (uid, uid),
+            longPollCallback = self.packetsReceived
+        )
+
+    def sendPacket(self, packet):
+        d = self.rest_client.sendPacket(packet, Packet.JSON.encode(packet2dict(packet, False)))
+        d.addCallback(self.packetsReceived)
+        return d
+
+    def packetsReceived(self, packets):
+        for packet in packets:
+            self.player.packetReceived(packet)
+        return packets
+
+    def stop(self):
+        self.rest_client.cancel()
+
+class LoadGenerator:
+
+    log = log.get_child('LoadGenerator')
+
+    def __init__(self, settings):
+        self.settings = settings
+        properties = settings.headerGetProperties("/settings/load")
+        properties = properties[0] if properties else {}
+        self.clients = int(properties.get('clients', 100))
+        self.rate = float(properties.get('rate', 10))
+        self.ramp = float(properties.get('ramp', 0))
+        self.duration = float(properties.get('duration', 60))
+        self.protocols = [name.strip() for name in properties.get('protocols', 'binarypack').split(',') if name.strip()]
+        for name in self.protocols:
+            if name not in PROTOCOLS:
+                raise ValueError("unknown protocol %s, expected one of %s" % (name, ", ".join(PROTOCOLS)))
+        self.table = properties.get('table', '')
+        self.report_path = properties.get('report')
+        self.host, tcp_port = settings.headerGet("/settings/servers").split(':')
+        self.ports = {
+            'binarypack': int(tcp_port),
+            'msgpack': int(properties.get('msgpack', 0)),
+            'rest': int(properties.get('rest', 0)),
+        }
+        self.name_prefix = settings.headerGet("/settings/@name_prefix") or "LOAD"
+        self.stats = LoadStats()
+        self.lag_probe = ReactorLagProbe(self.stats.reactor_lag)
+        self.seats = {}
+        self.transports = []
+        self.spawned = 0
+        self.started = None
+        self.timer = None
+        self.stopping = False
+        self.finished = defer.Deferred()
+
+    def assignTable(self, tables):
+        """The id of the first table that has a seat left among those
+        already given to the clients, or None."""
+        for table in tables:
+            taken = self.seats.get(table.id, table.players)
+            if taken < table.seats:
+                self.seats[table.id] = taken + 1
+                return table.id
+        return None
+
+    def start(self):
+        self.started = seconds()
+        self.lag_probe.start()
+        self.spawn()
+        reactor.callLater(self.duration, self.stop)
+        return self.finished
+
+    def target(self, elapsed):
+        """Number of clients that should be spawned elapsed seconds after
+        the start: the rate grows linearly from 0 to rate during ramp."""
+        if elapsed < self.ramp:
+            spawned = self.rate * elapsed * elapsed / (2 * self.ramp)
+        else:
+            spawned = self.rate * (elapsed - self.ramp / 2)
+        return min(self.clients, int(spawned))
+
+    def spawn(self):
+        self.timer = None
+        target = self.target(seconds() - self.started)
+        while self.spawned < target:
+            self.spawnClient(self.spawned)
+            self.spawned += 1
+        if self.spawned < self.clients and not self.stopping:
+            self.timer = reactor.callLater(0.05, self.spawn)
+
+    def spawnClient(self, index):
+        self.stats.count('spawned')
+        name = "%s%d%05d" % (self.name_prefix, os.getpid() % 1000, index)
+        player = LoadPlayer(self, name, name)
+        protocol_name = self.protocols[index % len(self.protocols)]
+        port = self.ports[protocol_name]
+        if protocol_name == 'rest':
+            transport = LoadRestClient(player, self.host, port, name)
+            player.start(transport.sendPacket)
+        else:
+            transport = LoadClientFactory(player, LoadBinarypackProtocol if protocol_name == 'binarypack' else LoadMsgpackProtocol)
+            transport.connector = reactor.connectTCP(self.host, port, transport)
+        self.transports.append(transport)
+
+    def stop(self):
+        self.stopping = True
+        if self.timer and self.timer.active():
+            self.timer.cancel()
+        self.timer = None
+        self.lag_probe.stop()
+        elapsed = seconds() - self.started
+        d = self.serverLag()
+        d.addCallback(lambda server_lag: self.stats.report(elapsed, server_lag))
+        d.addCallback(self.finish)
+        return d
+
+    def serverLag(self):
+        if not self.ports['rest']:
+            return defer.succeed(None)
+        d = client.getPage("http://%s:%d/metrics" % (self.host, self.ports['rest']), timeout = 10)
+        d.addCallback(parseServerLag)
+        def failed(reason):
+            self.log.warn("server reactor lag unknown (is metrics=\"yes\"?): %s", reason.getErrorMessage())
+            return None
+        d.addErrback(failed)
+        return d
+
+    def finish(self, report):
+        for transport in self.transports:
+            transport.stop()
+        self.transports = []
+        print renderReport(report)
+        if self.report_path:
+            with open(self.report_path, 'w') as f:
+                f.write(Packet.JSON.encode(report))
+        self.finished.callback(report)
+        return report
+
+def run():
+    argv = sys.argv[1:]
+    configuration = argv[-1] if argv and argv[-1][-4:] == ".xml" else "/etc/poker-network/poker.bot.xml"
+    settings = pokernetworkconfig.Config([''])
+    settings.load(configuration)
+    generator = LoadGenerator(settings)
+    reactor.callWhenRunning(generator.start)
+    generator.finished.addBoth(lambda result: reactor.stop())
+    reactor.run()
+
+if __name__ == '__main__':
+    run()
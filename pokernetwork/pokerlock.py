@@ -22,135 +22,230 @@
 #  Loic Dachary <loic@dachary.org>
 #
 
-from twisted.internet import reactor, defer
+from collections import deque
+
+from twisted.internet import reactor, defer, threads
 from twisted.python import failure
-import threading
-import thread
+from twisted.python.threadpool import ThreadPool
 import MySQLdb
-import Queue
-import time
 
 from pokernetwork import log as network_log
 log = network_log.get_child('pokerlock')
 
-class PokerLock(threading.Thread):
+class PokerLockManager:
+    """Named locks of the process. acquire() returns a Deferred that fires
+    with the name of the lock when it is granted, in the order of the
+    requests, or fails with Exception(TIMED_OUT, name) after timeout
+    seconds. Nothing polls: release() hands the lock to the next waiter."""
 
     TIMED_OUT = 1
     DEAD = 2
     RELEASE = 3
 
     acquire_timeout = 60
-    queue_timeout = 2 * 60
-    acquire_sleep = 0.1
-
-    log = log.get_child('PokerLock')
-    
-    def __init__(self, parameters):
-        self.q = Queue.Queue()
-        self.lock = threading.Lock()
-        self.db = None
-        self.running = True
-        self.connect(parameters)
-        threading.Thread.__init__(self, target = self.main)
+
+    log = log.get_child('PokerLockManager')
+
+    def __init__(self):
+        #
+        # name of each lock held => waiters, [ deferred, timer ]
+        #
+        self.locks = {}
+        self.closed = False
+
+    def isLocked(self, name):
+        return name in self.locks
+
+    def acquire(self, name, timeout = acquire_timeout):
+        return self._wait(name, timeout)
+
+    def _wait(self, name, timeout):
+        if self.closed:
+            return defer.fail(Exception(PokerLockManager.DEAD, name))
+        d = defer.Deferred()
+        waiters = self.locks.get(name)
+        if waiters is None:
+            self.log.debug("acquired %s", name)
+            self.locks[name] = deque()
+            d.callback(name)
+        else:
+            self.log.debug("wait for %s, %d waiting", name, len(waiters))
+            waiter = [d, None]
+            waiter[1] = reactor.callLater(timeout, self._timedOut, name, waiter)
+            waiters.append(waiter)
+        return d
+
+    def _timedOut(self, name, waiter):
+        self.log.debug("%s TIMED OUT", name)
+        self.locks[name].remove(waiter)
+        waiter[0].errback(failure.Failure(Exception(PokerLockManager.TIMED_OUT, name)))
+
+    def release(self, name):
+        waiters = self.locks.get(name)
+        if waiters is None:
+            raise Exception(PokerLockManager.RELEASE, name)
+        if waiters:
+            d, timer = waiters.popleft()
+            timer.cancel()
+            #
+            # the lock changes hands now, the waiter runs in the next
+            # iteration of the reactor rather than in the stack of release()
+            #
+            reactor.callLater(0, d.callback, name)
+        else:
+            self.log.debug("released %s", name)
+            del self.locks[name]
+        return defer.succeed(name)
 
     def close(self):
-        if self.isAlive():
-            self.q.put((None, None, None, None))
-            self.join()
-
-        if self.db:
-            self.db.close()
-            self.db = None
-        
-    def stopping(self):
-        self.log.debug("stopping")
-        self.running = False
-
-    def main(self):
-        try:
-            reactor.addSystemEventTrigger('during', 'shutdown', self.stopping)
-            while 1:
-                self.log.debug("loop, queue size %s", self.q.qsize())
-                if not self.running and self.q.empty():
-                    self.log.debug("stopped")
-                    break
-
-                try:
-                    ( name, function, timeout, deferred ) = self.q.get(timeout = PokerLock.queue_timeout)
-                except Queue.Empty:
-                    #
-                    # When timeout, silently terminate the thread
-                    #
-                    self.log.debug("timeout")
-                    break
-                except:
-                    raise
-
-                if not name:
-                    #
-                    # Stop the thread
-                    #
-                    self.log.debug("stop")
-                    break
-
-                try:
-                    function(name, timeout)
-                    if self.running:
-                        reactor.callFromThread(deferred.callback, name)
-                    else:
-                        self.log.debug("release because not running")
-                        self.lock.release()
-                except:
-                    self.log.error("exception in function main() -> release", exc_info=1)
-                    try:
-                        self.lock.release()
-                    except:
-                        self.log.error("failed to release lock after exception", exc_info=1)
-                    reactor.callFromThread(deferred.errback, failure.Failure())
-            self.db.close()
-            self.db = None
-        except:
-            self.log.error("exception", exc_info=1)
-            raise
-
-    def connect(self, parameters):
-        self.db = MySQLdb.connect(
-            host=parameters["host"],
-            user=parameters["user"],
-            passwd=parameters["password"]
+        if self.closed:
+            return
+        self.closed = True
+        for name, waiters in self.locks.items():
+            for d, timer in waiters:
+                timer.cancel()
+                d.errback(failure.Failure(Exception(PokerLockManager.DEAD, name)))
+        self.locks = {}
+
+class PokerMySQLLockManager(PokerLockManager):
+    """The locks are also MySQL named locks, exclusive among all the servers
+    using the same database. The requests for a name wait in the process
+    first, so that a single GET_LOCK per name is pending at any time. A lock
+    that is held keeps the MySQL connection that got it until it is
+    released. There are at most connections connections, used from a pool
+    of as many threads."""
+
+    log = log.get_child('PokerMySQLLockManager')
+
+    def __init__(self, parameters, connections = 4):
+        PokerLockManager.__init__(self)
+        self.parameters = parameters
+        self.connections_max = max(1, connections)
+        self.connections_count = 0
+        self.idle = []
+        self.waiting = deque()
+        self.held = {}
+        self.threadpool = ThreadPool(0, self.connections_max, 'PokerMySQLLockManager')
+        self.threadpool.start()
+        self.shutdown_trigger = reactor.addSystemEventTrigger('during', 'shutdown', self.close)
+
+    def connect(self):
+        return MySQLdb.connect(
+            host=self.parameters["host"],
+            user=self.parameters["user"],
+            passwd=self.parameters["password"]
         )
 
-    def acquire(self, name, timeout = acquire_timeout):
-        self.log.debug("acquire")
-        if not self.isAlive():
-            raise Exception(PokerLock.DEAD, "this PokerLock instance is dead, create a new one")
+    def _query(self, db, sql, args):
+        cursor = db.cursor()
+        try:
+            cursor.execute(sql, args)
+            return cursor.fetchone()[0]
+        finally:
+            cursor.close()
+
+    def _run(self, function, *args):
+        return threads.deferToThreadPool(reactor, self.threadpool, function, *args)
+
+    def _getConnection(self):
+        if self.idle:
+            return defer.succeed(self.idle.pop())
+        if self.connections_count < self.connections_max:
+            self.connections_count += 1
+            d = self._run(self.connect)
+            def failed(reason):
+                self.connections_count -= 1
+                return reason
+            d.addErrback(failed)
+            return d
         d = defer.Deferred()
-        self.q.put((name, self.__acquire, timeout, d))
+        self.waiting.append(d)
+        return d
+
+    def _putConnection(self, db):
+        if self.waiting:
+            self.waiting.popleft().callback(db)
+        else:
+            self.idle.append(db)
+
+    def _dropConnection(self, db):
+        self.connections_count -= 1
+        try:
+            db.close()
+        except Exception:
+            self.log.error("failed to close a connection", exc_info=1)
+        if self.waiting:
+            self._getConnection().chainDeferred(self.waiting.popleft())
+
+    def acquire(self, name, timeout = PokerLockManager.acquire_timeout):
+        granted = []
+        def waited(name):
+            granted.append(name)
+            return self._getConnection()
+        def failed(reason):
+            #
+            # give the lock of the process back, unless the request
+            # failed while waiting for it
+            #
+            if granted:
+                PokerLockManager.release(self, name)
+            return reason
+        d = self._wait(name, timeout)
+        d.addCallback(waited)
+        d.addCallback(self._getLock, name, timeout)
+        d.addErrback(failed)
+        return d
+
+    def _getLock(self, db, name, timeout):
+        d = self._run(self._query, db, "SELECT GET_LOCK(%s, %s)", (name, timeout))
+        def got(result):
+            if result != 1:
+                self._putConnection(db)
+                raise Exception(PokerLockManager.TIMED_OUT, name)
+            self.log.debug("got MySQL lock %s", name)
+            self.held[name] = db
+            return name
+        def failed(reason):
+            self._dropConnection(db)
+            return reason
+        d.addCallbacks(got, failed)
         return d
-        
-    def __acquire(self, name, timeout):
-        self.log.debug("__acquire %s %d", name, timeout)
-        tick = timeout
-        while 1:
-            if self.lock.acquire(0):
-                self.log.debug("acquired")
-                break
-            tick -= PokerLock.acquire_sleep
-            if tick <= 0:
-                self.log.debug("__acquire TIMED OUT")
-                raise Exception(PokerLock.TIMED_OUT, name)
-            self.log.debug("__acquire sleep %f", PokerLock.acquire_sleep)
-            time.sleep(PokerLock.acquire_sleep)
-        self.db.query("SELECT GET_LOCK('%s', %d)" % ( name, timeout))
-        result = self.db.store_result()
-        if result.fetch_row()[0][0] != 1:
-            raise Exception(PokerLock.TIMED_OUT, name)
-        self.log.debug("__acquire got MySQL lock")
 
     def release(self, name):
-        self.log.debug("release %s", name)
-        self.db.query("SELECT RELEASE_LOCK('%s')" % name)
-        result = self.db.store_result()
-        if result.fetch_row()[0][0] != 1:
-            raise Exception(PokerLock.RELEASE, name)
-        self.lock.release()
+        db = self.held.pop(name, None)
+        if db is None:
+            raise Exception(PokerLockManager.RELEASE, name)
+        d = self._run(self._query, db, "SELECT RELEASE_LOCK(%s)", (name,))
+        def released(result):
+            if result != 1:
+                self.log.error("RELEASE_LOCK(%s) returned %s", name, result)
+            self._putConnection(db)
+            PokerLockManager.release(self, name)
+            return name
+        def failed(reason):
+            self.log.error("RELEASE_LOCK(%s) failed: %s", name, reason)
+            self._dropConnection(db)
+            PokerLockManager.release(self, name)
+            return name
+        d.addCallbacks(released, failed)
+        return d
+
+    def close(self):
+        if self.closed:
+            return
+        PokerLockManager.close(self)
+        try:
+            reactor.removeSystemEventTrigger(self.shutdown_trigger)
+        except (ValueError, KeyError):
+            pass
+        self.threadpool.stop()
+        #
+        # closing the connections releases the MySQL locks they hold
+        #
+        for db in self.idle + self.held.values():
+            db.close()
+        self.idle = []
+        self.held = {}
+        for d in self.waiting:
+            d.errback(failure.Failure(Exception(PokerLockManager.DEAD, None)))
+        self.waiting.clear()
@@ -0,0 +1,208 @@
+#
+# -*- py-indent-offset: 4; coding: utf-8; mode: python -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#
+# Per packet type instrumentation, enabled with <server metrics="yes">:
+# number of packets handled, handler latency histogram and outbound
+# packets and bytes. It is read with PokerService.stats and with the
+# /metrics resource of the REST tree. The reactor lag, how late the
+# reactor runs a timer, is recorded at the same time.
+#
+from twisted.internet import reactor
+from twisted.python.runtime import seconds
+
+from pokerpackets.packets import type_id2type
+
+def packetName(packet_type):
+    try:
+        return type_id2type[packet_type].__name__
+    except (KeyError, IndexError, AttributeError):
+        return str(packet_type)
+
+class Histogram(object):
+    """Latency histogram in microseconds with log-linear buckets, in the
+    spirit of HdrHistogram: values below 2 * SUB_BUCKETS have their own
+    bucket, above that each power of two is split in SUB_BUCKETS buckets,
+    which bounds the relative error to 1 / SUB_BUCKETS. Recording a value
+    is a few integer operations and a dict update, there is no lock
+    because everything happens in the reactor thread."""
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    SUB_BUCKETS = 16
+    SUB_BUCKETS_BITS = 4
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    @staticmethod
+    def bucket(value):
+        #
+        # value >> shift keeps the SUB_BUCKETS_BITS + 1 most significant
+        # bits of the value, between SUB_BUCKETS and 2 * SUB_BUCKETS - 1
+        #
+        if value < 2 * Histogram.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - Histogram.SUB_BUCKETS_BITS - 1
+        return Histogram.SUB_BUCKETS * shift + (value >> shift)
+
+    @staticmethod
+    def bucketMax(index):
+        """The largest value that falls in the bucket index."""
+        if index < 2 * Histogram.SUB_BUCKETS:
+            return index
+        shift, offset = divmod(index, Histogram.SUB_BUCKETS)
+        shift -= 1
+        return ((Histogram.SUB_BUCKETS + offset + 1) << shift) - 1
+
+    def record(self, value):
+        # Histogram.bucket inlined, this is called for every packet
+        if value < 32:
+            index = value
+        else:
+            shift = value.bit_length() - 5
+            index = (shift << 4) + (value >> shift)
+        counts = self.counts
+        if index in counts:
+            counts[index] += 1
+        else:
+            counts[index] = 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        if self.count == 0:
+            return 0
+        rank = self.count * percent / 100.0
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self.max, Histogram.bucketMax(index))
+        return self.max
+
+class PacketTypeMetrics(object):
+
+    __slots__ = ('latency', 'packets_out', 'bytes_out')
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.packets_out = 0
+        self.bytes_out = 0
+
+class PacketMetrics:
+
+    PERCENTILES = (50, 90, 99, 99.9)
+
+    def __init__(self):
+        self.types = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.reactor_lag = Histogram()
+
+    def get(self, packet_type):
+        metrics = self.types.get(packet_type)
+        if metrics is None:
+            metrics = self.types[packet_type] = PacketTypeMetrics()
+        return metrics
+
+    def record(self, packet_type, elapsed):
+        """elapsed is the time spent handling a packet, in seconds"""
+        metrics = self.types.get(packet_type) or self.get(packet_type)
+        metrics.latency.record(int(elapsed * 1000000))
+
+    def recordOut(self, packet_type, size):
+        metrics = self.get(packet_type)
+        metrics.packets_out += 1
+        metrics.bytes_out += size
+        self.bytes_out += size
+
+    def recordIn(self, size):
+        self.bytes_in += size
+
+    def report(self):
+        """A dict, suitable for JSON, of the metrics of each packet type
+        that was seen, keyed by the packet name."""
+        report = {}
+        for packet_type, metrics in self.types.iteritems():
+            latency = metrics.latency
+            report[packetName(packet_type)] = {
+                'handled': latency.count,
+                'latency_us': dict(
+                    [('p%s' % percent, latency.percentile(percent)) for percent in self.PERCENTILES] +
+                    [('max', latency.max), ('total', latency.total)]
+                ),
+                'packets_out': metrics.packets_out,
+                'bytes_out': metrics.bytes_out,
+            }
+        return report
+
+    def render(self):
+        """The metrics in the Prometheus text format."""
+        lines = [
+            "poker_bytes_in_total %d" % self.bytes_in,
+            "poker_bytes_out_total %d" % self.bytes_out,
+        ]
+        lag = self.reactor_lag
+        for percent in self.PERCENTILES:
+            lines.append('poker_reactor_lag_us{quantile="%s"} %d' % (percent / 100.0, lag.percentile(percent)))
+        lines.append('poker_reactor_lag_us_max %d' % lag.max)
+        lines.append('poker_reactor_lag_us_count %d' % lag.count)
+        for packet_type in sorted(self.types):
+            metrics = self.types[packet_type]
+            name = packetName(packet_type)
+            latency = metrics.latency
+            lines.append('poker_packets_handled_total{type="%s"} %d' % (name, latency.count))
+            for percent in self.PERCENTILES:
+                lines.append('poker_packet_latency_us{type="%s",quantile="%s"} %d' % (name, percent / 100.0, latency.percentile(percent)))
+            lines.append('poker_packet_latency_us_sum{type="%s"} %d' % (name, latency.total))
+            lines.append('poker_packet_latency_us_count{type="%s"} %d' % (name, latency.count))
+            lines.append('poker_packets_out_total{type="%s"} %d' % (name, metrics.packets_out))
+            lines.append('poker_bytes_out_total{type="%s"} %d' % (name, metrics.bytes_out))
+        return "\n".join(lines) + "\n"
+
+class ReactorLagProbe:
+    """Record in histogram, in microseconds, how late a timer scheduled
+    every interval seconds runs. It is the time the reactor spends in
+    other callbacks before it gets back to its timers, i.e. the delay added
+    to every packet when the server is overloaded."""
+
+    def __init__(self, histogram, interval=0.1):
+        self.histogram = histogram
+        self.interval = interval
+        self.expected = None
+        self.timer = None
+
+    def start(self):
+        self.expected = seconds() + self.interval
+        self.timer = reactor.callLater(self.interval, self._probe)
+
+    def _probe(self):
+        self.histogram.record(max(0, int((seconds() - self.expected) * 1000000)))
+        self.start()
+
+    def stop(self):
+        if self.timer and self.timer.active():
+            self.timer.cancel()
+        self.timer = None
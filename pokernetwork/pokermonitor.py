@@ -0,0 +1,165 @@
+#
+# -*- py-indent-offset: 4; coding: utf-8; mode: python -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#
+# Delivery of the monitor events (PokerService.databaseEvent) to the
+# monitor avatars and plugins, outside of the code paths that emit them.
+#
+#   <monitorbus size="10000" batch="100" flush_delay="0" policy="drop"/>
+#
+from collections import deque
+from itertools import islice
+
+from twisted.internet import reactor
+
+from pokernetwork import log as network_log
+log = network_log.get_child('pokermonitor')
+
+POLICY_DROP = 'drop'
+POLICY_DISCONNECT = 'disconnect'
+
+class MonitorConsumer(object):
+
+    __slots__ = ('key', 'deliver', 'disconnect', 'lossless', 'cursor', 'dropped')
+
+    def __init__(self, key, deliver, disconnect, lossless, cursor):
+        self.key = key
+        self.deliver = deliver
+        self.disconnect = disconnect
+        self.lossless = lossless
+        self.cursor = cursor
+        self.dropped = 0
+
+class MonitorBus:
+    """Ring buffer of the last size events. Each consumer has a cursor in
+    the buffer and is given the events in lists of at most batch events,
+    flush_delay seconds after they are published. A consumer that lags by
+    more than size events either loses the oldest ones (drop) or is
+    disconnected (disconnect) if it can be. A lossless consumer is never
+    subject to the policy: it is given the events it did not get yet
+    before the oldest one is removed from the buffer."""
+
+    log = log.get_child('MonitorBus')
+
+    def __init__(self, settings):
+        properties = settings.headerGetProperties("/server/monitorbus")
+        properties = properties[0] if properties else {}
+        self.size = max(1, int(properties.get('size', 10000)))
+        self.batch = max(1, int(properties.get('batch', 100)))
+        self.flush_delay = float(properties.get('flush_delay', 0))
+        self.policy = properties.get('policy', POLICY_DROP)
+        self.events = deque()
+        #
+        # sequence number of events[0]
+        #
+        self.first = 0
+        self.consumers = []
+        self.timer = None
+        self.stats = {
+            'published': 0,
+            'dropped': 0,
+            'disconnected': 0,
+        }
+
+    def end(self):
+        return self.first + len(self.events)
+
+    def addConsumer(self, key, deliver, disconnect = None, lossless = False):
+        """deliver is called with a list of events, disconnect (if any)
+        without argument when the policy is disconnect and the consumer
+        lags too much. The consumer only gets the events published after
+        it is added."""
+        self.removeConsumer(key)
+        consumer = MonitorConsumer(key, deliver, disconnect, lossless, self.end())
+        self.consumers.append(consumer)
+        return consumer
+
+    def removeConsumer(self, key):
+        self.consumers = [consumer for consumer in self.consumers if consumer.key != key]
+        self._trim()
+
+    def lag(self):
+        end = self.end()
+        return dict((consumer.key, end - consumer.cursor) for consumer in self.consumers)
+
+    def publish(self, event):
+        self.stats['published'] += 1
+        if not self.consumers:
+            return
+        self.events.append(event)
+        if len(self.events) > self.size:
+            for consumer in self.consumers:
+                if consumer.lossless:
+                    while consumer.cursor <= self.first:
+                        self._deliver(consumer, self.end())
+            self.events.popleft()
+            self.first += 1
+        if self.timer is None:
+            self.timer = reactor.callLater(self.flush_delay, self.flush)
+
+    def flush(self):
+        if self.timer and self.timer.active():
+            self.timer.cancel()
+        self.timer = None
+        end = self.end()
+        for consumer in list(self.consumers):
+            if consumer.cursor < self.first:
+                lost = self.first - consumer.cursor
+                if self.policy == POLICY_DISCONNECT and consumer.disconnect:
+                    self.log.warn("monitor %s lags by more than %d events, disconnecting", consumer.key, self.size)
+                    self.stats['disconnected'] += 1
+                    self.consumers.remove(consumer)
+                    consumer.disconnect()
+                    continue
+                if consumer.dropped == 0:
+                    self.log.warn("monitor %s lags by more than %d events, dropping the oldest", consumer.key, self.size)
+                consumer.dropped += lost
+                self.stats['dropped'] += lost
+                consumer.cursor = self.first
+            if consumer.cursor < end:
+                self._deliver(consumer, end)
+        self._trim()
+        if self.events and self.timer is None:
+            self.timer = reactor.callLater(self.flush_delay, self.flush)
+
+    def _deliver(self, consumer, end):
+        stop = min(end, consumer.cursor + self.batch)
+        events = list(islice(self.events, consumer.cursor - self.first, stop - self.first))
+        consumer.cursor = stop
+        try:
+            consumer.deliver(events)
+        except Exception:
+            self.log.error("monitor %s failed to handle %d events", consumer.key, len(events), exc_info=1)
+
+    def _trim(self):
+        #
+        # forget the events that every consumer was given
+        #
+        low = min(consumer.cursor for consumer in self.consumers) if self.consumers else self.end()
+        while self.first < low:
+            self.events.popleft()
+            self.first += 1
+
+    def stop(self):
+        """Deliver all the events waiting in the buffer."""
+        while self.events:
+            self.flush()
+        if self.timer and self.timer.active():
+            self.timer.cancel()
+        self.timer = None
@@ -27,6 +27,55 @@ from pokernetwork.version import version
 from pokernetwork import log as network_log
 log = network_log.get_child('pokernetworkconfig')
 
+class ServerSettings:
+    """The /server settings read when tables are spawned and hands are
+    dealt, parsed once into typed attributes. An instance is never
+    modified: Config.serverSettings() returns a new one after headerSet
+    changed the document, the previous one stays consistent for the
+    readers that hold it."""
+
+    log = log.get_child('ServerSettings')
+
+    def __init__(self, settings):
+        self.header = settings.header
+        delays = settings.headerGetProperties("/server/delays")
+        self.delays = {}
+        for name, value in (delays[0] if delays else {}).iteritems():
+            try:
+                self.delays[name] = float(value)
+            except ValueError:
+                self.log.warn("delay %s=%r is not a number (ignored)", name, value)
+        self.autodeal_check = max(0.01, self.delays.get("autodeal_check", 15))
+        self.autodeal_max = self.delays.get("autodeal_max", 120)
+        self.autodeal_tournament_min = int(self.delays.get("autodeal_tournament_min", 15))
+
+        self.autodeal = settings.headerGet("/server/@autodeal") == "yes"
+        self.autodeal_temporary = settings.headerGet("/server/users/@autodeal_temporary") == "yes"
+        self.decks = tuple(deck.split() for deck in settings.headerGetList("/server/decks/deck"))
+
+        self.joined_max = settings.headerGetInt("/server/@max_joined")
+        if self.joined_max <= 0: self.joined_max = 4000
+        self.sng_timeout = settings.headerGetInt("/server/@sng_timeout")
+        if self.sng_timeout <= 0: self.sng_timeout = 3600
+        self.missed_round_max = settings.headerGetInt("/server/@max_missed_round")
+        if self.missed_round_max <= 0: self.missed_round_max = 10
+        self.client_queued_packet_max = settings.headerGetInt("/server/@max_queued_client_packets")
+        if self.client_queued_packet_max <= 0: self.client_queued_packet_max = 500
+        self.long_poll_timeout = settings.headerGetInt("/server/@long_poll_timeout")
+        if self.long_poll_timeout <= 0: self.long_poll_timeout = 20
+        #
+        # off by default: the clients that rebuild the hand from the
+        # actions (pokerclient, the bots) cannot join from a snapshot
+        #
+        self.join_snapshot = settings.headerGet("/server/@join_snapshot") == "yes"
+
+        spectators = settings.headerGetProperties("/server/spectators")
+        self.spectators = bool(spectators)
+        spectators = spectators[0] if spectators else {}
+        self.spectators_delay = max(0.0, float(spectators.get('delay', 0)))
+        self.spectators_period = max(0.0, float(spectators.get('period', 0)))
+        self.spectators_max = max(0, int(spectators.get('max', 0)))
+
 class Config(pokerengineconfig.Config):
 
     upgrades_repository = None
@@ -37,6 +86,7 @@ class Config(pokerengineconfig.Config):
         pokerengineconfig.Config.__init__(self, *args, **kwargs)
         self.version = version
         self.notify_updates = []
+        self.server_settings = None
 
     def loadFromString(self, string):
         self.path = "<string>"
@@ -53,6 +103,16 @@ class Config(pokerengineconfig.Config):
         else:
             return status
 
+    def serverSettings(self):
+        #
+        # the snapshot is also rebuilt when the document is replaced,
+        # by load() or by assigning header
+        #
+        server_settings = self.server_settings
+        if server_settings is None or server_settings.header is not self.header:
+            server_settings = self.server_settings = ServerSettings(self)
+        return server_settings
+
     def notifyUpdates(self, method):
         if method not in self.notify_updates:
             self.notify_updates.append(method)
@@ -63,6 +123,12 @@ class Config(pokerengineconfig.Config):
         
     def headerSet(self, name, value):
         result = pokerengineconfig.Config.headerSet(self, name, value)
+        #
+        # replaced before the methods of notifyUpdates are called so that
+        # they read the new values
+        #
+        if self.server_settings is not None:
+            self.server_settings = ServerSettings(self)
         for method in self.notify_updates:
             method(self)
         return result
@@ -1,4 +1,7 @@
+from collections import OrderedDict
+
 from pokerengine.pokercards import PokerCards
+from pokerengine.pokerchips import PokerChips
 from pokerpackets.packets import *
 from pokerpackets.networkpackets import *
 from pokerengine.pokertournament import TOURNAMENT_REBUY_ERROR_USER, TOURNAMENT_REBUY_ERROR_TIMEOUT, TOURNAMENT_REBUY_ERROR_MONEY, TOURNAMENT_REBUY_ERROR_OTHER
@@ -241,6 +244,80 @@ def history2packets(history, game_id, previous_dealer, cache):
             errors.append("history2packets: unknown history type %s " % event_type)
     return (packets, previous_dealer, errors)
 
+def compactReplay(packets):
+    """Remove from the packets of history2packets the positions that are
+    superseded by a later one after the blind and ante round. A client
+    only shows the last one and PokerExplain ignores them once the first
+    state change ended the blind and ante round."""
+    first_round = None
+    last_position = None
+    for index, packet in enumerate(packets):
+        if packet.type == PACKET_POKER_STATE and first_round is None:
+            first_round = index
+        elif packet.type == PACKET_POKER_POSITION:
+            last_position = index
+    if first_round is None:
+        return packets
+    return [
+        packet for index, packet in enumerate(packets)
+        if packet.type != PACKET_POKER_POSITION or index < first_round or index == last_position
+    ]
+
+def snapshotReplay(packets, game):
+    """The state of the hand replayed by the packets of history2packets,
+    without the actions that led to it: the players in game, the dealer,
+    the start of the hand, the round, the board and the pockets, the chips
+    of the players and the pot as they are in game, then the position. The
+    requests of the blind and ante round are kept while it lasts."""
+    last = {}
+    pockets = OrderedDict()
+    sit_out = OrderedDict()
+    requests = []
+    for packet in packets:
+        if packet.type == PACKET_POKER_PLAYER_CARDS:
+            pockets[packet.serial] = packet
+        elif packet.type == PACKET_POKER_SIT_OUT:
+            sit_out[packet.serial] = packet
+        elif packet.type in (PACKET_POKER_BLIND_REQUEST, PACKET_POKER_ANTE_REQUEST, PACKET_POKER_WAIT_FOR):
+            requests.append(packet)
+        elif packet.type == PACKET_POKER_STATE:
+            last[packet.type] = packet
+            requests = []
+        else:
+            last[packet.type] = packet
+    if PACKET_POKER_START not in last:
+        return packets
+    snapshot = [last[packet_type] for packet_type in (PACKET_POKER_IN_GAME, PACKET_POKER_DEALER, PACKET_POKER_START) if packet_type in last]
+    snapshot.extend(requests)
+    if PACKET_POKER_STATE in last:
+        snapshot.append(last[PACKET_POKER_STATE])
+    if PACKET_POKER_BOARD_CARDS in last:
+        snapshot.append(last[PACKET_POKER_BOARD_CARDS])
+    snapshot.extend(pockets.itervalues())
+    snapshot.extend(sit_out.itervalues())
+    players = [game.getPlayer(serial) for serial in last[PACKET_POKER_IN_GAME].players] if PACKET_POKER_IN_GAME in last else []
+    bets = 0
+    for player in players:
+        if player is None:
+            continue
+        bets += player.bet
+        snapshot.append(PacketPokerPlayerChips(
+            game_id = game.id,
+            serial = player.serial,
+            bet = player.bet,
+            money = player.money
+        ))
+    pot = game.potAndBetsAmount() - bets
+    if pot > 0:
+        snapshot.append(PacketPokerPotChips(
+            game_id = game.id,
+            index = 0,
+            bet = PokerChips([1], pot).tolist()
+        ))
+    for packet_type in (PACKET_POKER_RAKE, PACKET_POKER_MUCK_REQUEST, PACKET_POKER_POSITION):
+        if packet_type in last:
+            snapshot.append(last[packet_type])
+    return snapshot
 
 def cards2packets(game_id, board, pockets, cache):
     packets = []
@@ -1,17 +1,67 @@
-
 import twisted.application.service as _service
 import twisted.internet.protocol as _protocol
 import msgpack as _msgpack
+from collections import deque, OrderedDict
+from zope.interface import implements
+from twisted.internet.interfaces import IPushProducer
 from twisted.internet import reactor
 
+from pokernetwork import log as network_log
+log = network_log.get_child('pokerpub')
+
+#
+#   <pub buffer="1000" policy="drop"/>
+#
+# buffer is the number of messages kept for a subscriber whose connection
+# does not keep up. When it is full the policy either drops the oldest
+# message (drop) or closes the connection (disconnect).
+#
+# The poker service publishes its events with queue(), as lists of the
+# events of a reactor tick, on the channels
+#
+#   table.<game_id>.hand      end of a hand
+#   table.<game_id>.seats     players seated or leaving
+#   user.<serial>.money       buy in, buy out, hand result, refill, prize,
+#                             tourney register and unregister
+#   tourney.<serial>.state    tourney state changes
+#
+POLICY_DROP = 'drop'
+POLICY_DISCONNECT = 'disconnect'
+
+class _SubscriptionNode(object):
+
+    __slots__ = ('children', 'avatars')
+
+    def __init__(self):
+        self.children = {}
+        self.avatars = {}
+
 class PubService(_service.Service):
-    
+
+    log = log.get_child('PubService')
+
     def __init__(self, service):
         service.pub = self
         self._service = service
         self._avatars = set()
-        self._subscriptions = set()
-        # self.dummy()
+        #
+        # subscriptions are prefixes of channels: they are stored in a
+        # trie, one node per character, and each node maps the avatars
+        # subscribed to the prefix to the number of such subscriptions
+        #
+        self._subscriptions = _SubscriptionNode()
+        self._queued = OrderedDict()
+        self._queued_timer = None
+        properties = service.settings.headerGetProperties("/server/pub")
+        properties = properties[0] if properties else {}
+        self.buffer_max = int(properties.get('buffer', 1000))
+        self.policy = properties.get('policy', POLICY_DROP)
+        self.stats = {
+            'published': 0,
+            'delivered': 0,
+            'dropped': 0,
+            'disconnected': 0,
+        }
 
     def createAvatar(self):
         return PubAvatar(self)
@@ -20,7 +70,7 @@ class PubService(_service.Service):
         pass
 
     def doStop(self):
-        pass
+        self.flushQueue()
 
     def buildProtocol(self, address):
         avatar = self.createAvatar()
@@ -28,10 +78,39 @@ class PubService(_service.Service):
         avatar.setProtocol(protocol)
         return protocol
 
+    def subscribers(self, channel):
+        node = self._subscriptions
+        avatars = set(node.avatars)
+        for char in channel:
+            node = node.children.get(char)
+            if node is None:
+                break
+            avatars.update(node.avatars)
+        return avatars
+
     def publish(self, channel, message):
-        for avatar, subscription in self._subscriptions:
-            if channel.startswith(subscription):
-                avatar.send(channel, message)
+        self.stats['published'] += 1
+        avatars = self.subscribers(channel)
+        if avatars:
+            data = _msgpack.packb((channel, message))
+            for avatar in avatars:
+                avatar.sendData(data)
+
+    def queue(self, channel, message):
+        """Publish message on channel at the end of the current reactor
+        tick. All the messages queued on a channel during the same tick are
+        published together, as a list, in a single frame."""
+        self._queued.setdefault(channel, []).append(message)
+        if self._queued_timer is None:
+            self._queued_timer = reactor.callLater(0, self.flushQueue)
+
+    def flushQueue(self):
+        if self._queued_timer and self._queued_timer.active():
+            self._queued_timer.cancel()
+        self._queued_timer = None
+        queued, self._queued = self._queued, OrderedDict()
+        for channel, messages in queued.iteritems():
+            self.publish(channel, messages)
 
     def dummy(self):
         self.publish('user.2', {'test': 1})
@@ -39,19 +118,39 @@ class PubService(_service.Service):
         reactor.callLater(1, self.dummy)
 
     def subscribe(self, avatar, subscription):
-        s = (avatar, subscription)
-        self._subscriptions.add(s)
+        node = self._subscriptions
+        for char in subscription:
+            node = node.children.setdefault(char, _SubscriptionNode())
+        node.avatars[avatar] = node.avatars.get(avatar, 0) + 1
 
     def unsubscribe(self, avatar, subscription):
-        s = (avatar, subscription)
-        self._subscriptions.remove(s)        
+        path = [self._subscriptions]
+        for char in subscription:
+            node = path[-1].children.get(char)
+            if node is None:
+                return
+            path.append(node)
+        node = path[-1]
+        if avatar not in node.avatars:
+            return
+        node.avatars[avatar] -= 1
+        if node.avatars[avatar] <= 0:
+            del node.avatars[avatar]
+        #
+        # remove the nodes that lead to no subscription anymore
+        #
+        for depth in xrange(len(subscription), 0, -1):
+            node = path[depth]
+            if node.avatars or node.children:
+                break
+            del path[depth - 1].children[subscription[depth - 1]]
 
 class PubAvatar():
 
     def __init__(self, service):
         self._service = service
         self._protocol = None
-        self._subscriptions = set()
+        self._subscriptions = {}
 
     def setProtocol(self, protocol):
         self._protocol = protocol
@@ -59,30 +158,54 @@ class PubAvatar():
     def handleCommand(self, cmd, args):
         if cmd == 'subscribe':
             subscription, = args
-            self._subscriptions.add(subscription)
+            self._subscriptions[subscription] = self._subscriptions.get(subscription, 0) + 1
             self._service.subscribe(self, subscription)
         elif cmd == 'unsubscribe':
             subscription, = args
-            self._subscriptions.remove(subscription)
+            if self._subscriptions.get(subscription, 0) <= 0:
+                raise KeyError(subscription)
+            self._subscriptions[subscription] -= 1
+            if self._subscriptions[subscription] <= 0:
+                del self._subscriptions[subscription]
             self._service.unsubscribe(self, subscription)
         else:
             raise Exception("Command not defined")
 
     def handleConnectionLost(self, reason):
-        for subscription in self._subscriptions:
-            self._service.unsubscribe(self, subscription)
+        for subscription, count in self._subscriptions.items():
+            for _ in xrange(count):
+                self._service.unsubscribe(self, subscription)
+        self._subscriptions = {}
 
     def send(self, channel, message):
+        self.sendData(_msgpack.packb((channel, message)))
+
+    def sendData(self, data):
         if self._protocol:
-            self._protocol.send(channel, message)
+            self._protocol.sendData(data)
 
 class PubProtocol(_protocol.Protocol):
 
+    implements(IPushProducer)
+
+    log = log.get_child('PubProtocol')
+
     def __init__(self, avatar):
         self._unpacker = _msgpack.Unpacker()
         self._avatar = avatar
+        self._paused = False
+        self._closing = False
+        self._buffer = deque()
+
+    def connectionMade(self):
+        #
+        # the transport pauses us when its own buffer is full, messages
+        # are then kept in a bounded buffer until it resumes
+        #
+        self.transport.registerProducer(self, True)
 
     def connectionLost(self, reason):
+        self._buffer.clear()
         self._avatar.handleConnectionLost(reason)
 
     def dataReceived(self, data):
@@ -90,7 +213,37 @@ class PubProtocol(_protocol.Protocol):
         for cmd, args in self._unpacker:
             self._avatar.handleCommand(cmd, args)
 
-    def send(self, channel, message):
-        if self.transport:
-            self.transport.write(_msgpack.packb((channel, message)))
+    def pauseProducing(self):
+        self._paused = True
 
+    def resumeProducing(self):
+        self._paused = False
+        while self._buffer and not self._paused:
+            self.transport.write(self._buffer.popleft())
+
+    def stopProducing(self):
+        self._buffer.clear()
+
+    def send(self, channel, message):
+        self.sendData(_msgpack.packb((channel, message)))
+
+    def sendData(self, data):
+        if not self.transport or self._closing:
+            return
+        service = self._avatar._service
+        if not self._paused:
+            service.stats['delivered'] += 1
+            self.transport.write(data)
+        elif len(self._buffer) < service.buffer_max:
+            service.stats['delivered'] += 1
+            self._buffer.append(data)
+        elif service.policy == POLICY_DISCONNECT:
+            service.stats['disconnected'] += 1
+            self.log.warn("subscriber does not keep up, disconnecting")
+            self._buffer.clear()
+            self._closing = True
+            self.transport.loseConnection()
+        else:
+            service.stats['dropped'] += 1
+            self._buffer.popleft()
+            self._buffer.append(data)
@@ -0,0 +1,120 @@
+#
+# -*- py-indent-offset: 4; coding: utf-8; mode: python -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Queue of the packets waiting for a client that is not connected, such as a
+# REST client between two long polls.
+#
+from collections import OrderedDict
+from heapq import merge
+from itertools import count
+
+from pokerpackets.networkpackets import PACKET_POKER_PLAYER_CHIPS, PACKET_POKER_TIMEOUT_WARNING, PACKET_POKER_POSITION
+
+#
+# The state packets that are superseded by a packet of the same type, for
+# the same game and the same values of the listed attributes.
+#
+COALESCE = {
+    PACKET_POKER_PLAYER_CHIPS: ('serial',),
+    PACKET_POKER_TIMEOUT_WARNING: ('serial',),
+    PACKET_POKER_POSITION: (),
+}
+
+class _GamePackets(object):
+
+    __slots__ = ('packets', 'latest', 'superseded')
+
+    def __init__(self):
+        self.packets = OrderedDict()
+        self.latest = {}
+        self.superseded = 0
+
+class PacketQueue:
+    """The packets are kept in one partition per game_id, the packets
+    without game_id in their own partition, each of them numbered so that
+    reset() returns them in the order they were queued. Dropping the packets
+    of a game is O(1). The state packets listed in the policy are not
+    removed as they are superseded, the client sees them as they were sent
+    unless compact() is called, when the client lags."""
+
+    def __init__(self, policy=COALESCE):
+        self.policy = policy
+        self.sequence = count()
+        self.games = {}
+        self.length = 0
+        self.superseded = 0
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return (packet for _sequence, packet in merge(*[game.packets.iteritems() for game in self.games.itervalues()]))
+
+    def append(self, packet):
+        game_id = getattr(packet, 'game_id', None)
+        game = self.games.get(game_id)
+        if game is None:
+            game = self.games[game_id] = _GamePackets()
+        sequence = self.sequence.next()
+        game.packets[sequence] = packet
+        self.length += 1
+        fields = self.policy.get(getattr(packet, 'type', None))
+        if fields is not None and game_id is not None:
+            key = (packet.type,) + tuple(getattr(packet, field) for field in fields)
+            if key in game.latest:
+                game.superseded += 1
+                self.superseded += 1
+            game.latest[key] = sequence
+
+    def extend(self, packets):
+        for packet in packets:
+            self.append(packet)
+
+    def remove(self, game_id):
+        game = self.games.pop(game_id, None)
+        if game is not None:
+            self.length -= len(game.packets)
+            self.superseded -= game.superseded
+
+    def reset(self):
+        packets = list(self)
+        self.games = {}
+        self.length = 0
+        self.superseded = 0
+        return packets
+
+    def compact(self):
+        """Remove the superseded state packets and return how many were
+        removed."""
+        removed = 0
+        for game in self.games.itervalues():
+            if not game.superseded:
+                continue
+            for sequence, packet in game.packets.items():
+                fields = self.policy.get(getattr(packet, 'type', None))
+                if fields is None:
+                    continue
+                key = (packet.type,) + tuple(getattr(packet, field) for field in fields)
+                if game.latest[key] != sequence:
+                    del game.packets[sequence]
+                    removed += 1
+            game.superseded = 0
+        self.length -= removed
+        self.superseded = 0
+        return removed
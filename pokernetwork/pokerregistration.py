@@ -0,0 +1,226 @@
+#
+# -*- py-indent-offset: 4; coding: utf-8; mode: python -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Group commit of the tourney registrations. The registrations accepted by
+# PokerService.tourneyRegisterAsync, after the checks that only need the
+# tourneys in memory, are written in a single transaction every
+# flush_delay seconds or as soon as batch registrations are waiting:
+#
+#   <tourneyregister flush_delay="0.05" batch="200"/>
+#
+# A transaction checks that the tourneys still belong to this resthost,
+# locks the money of the players, debits the buy ins with one multi-row
+# UPDATE and registers the players with one multi-row INSERT. The
+# deferred of each registration fires with None when the player is
+# registered or with the PacketPokerTourneyRegister error code.
+#
+# When the transaction of a batch fails, for instance because one of its
+# rows is a duplicate, its registrations are written again one per
+# transaction so that only the faulty ones fail.
+#
+from twisted.internet import reactor, defer
+
+from pokerpackets.networkpackets import PacketPokerTourneyRegister
+
+from pokernetwork import log as network_log
+log = network_log.get_child('pokerregistration')
+
+class TourneyRegistrar:
+
+    log = log.get_child('TourneyRegistrar')
+
+    def __init__(self, settings, adb, resthost_serial):
+        self.adb = adb
+        self.resthost_serial = resthost_serial
+        properties = settings.headerGetProperties("/server/tourneyregister")
+        properties = properties[0] if properties else {}
+        self.flush_delay = float(properties.get('flush_delay', 0.05))
+        self.batch = max(1, int(properties.get('batch', 200)))
+        self.pending = []
+        #
+        # the players of the registrations waiting or being written, per
+        # tourney, so that the tourney is not registered in twice nor
+        # filled over its quota in the meantime
+        #
+        self.tourney2serials = {}
+        self.timer = None
+        self.writing = None
+
+    def isPending(self, tourney_serial, serial):
+        return serial in self.tourney2serials.get(tourney_serial, ())
+
+    def pendingCount(self, tourney_serial):
+        return len(self.tourney2serials.get(tourney_serial, ()))
+
+    def register(self, serial, tourney_serial, currency_serial, withdraw):
+        d = defer.Deferred()
+        self.pending.append((serial, tourney_serial, currency_serial, withdraw, d))
+        self.tourney2serials.setdefault(tourney_serial, set()).add(serial)
+        if self.writing is None:
+            if len(self.pending) >= self.batch:
+                self.flush()
+            elif self.timer is None:
+                self.timer = reactor.callLater(self.flush_delay, self.flush)
+        return d
+
+    def cancel(self, tourney_serial, serial):
+        """Remove the registration of serial in tourney_serial if it is
+        waiting to be written, its deferred fires with
+        REGISTRATION_REFUSED. Returns False if there is no such
+        registration or if it is being written."""
+        for index, registration in enumerate(self.pending):
+            if registration[:2] == (serial, tourney_serial):
+                del self.pending[index]
+                self._forget(serial, tourney_serial)
+                registration[4].callback(PacketPokerTourneyRegister.REGISTRATION_REFUSED)
+                return True
+        return False
+
+    def flush(self):
+        if self.timer and self.timer.active():
+            self.timer.cancel()
+        self.timer = None
+        if self.writing is not None or not self.pending:
+            return self.writing
+        batch, self.pending = self.pending[:self.batch], self.pending[self.batch:]
+        d = self.writing = self.adb.runInteraction(self._writeBatch, batch)
+        d.addCallbacks(self._writeDone, self._writeFailed, (batch,), None, (batch,))
+        return d
+
+    def _writeBatch(self, cursor, batch):
+        codes = [None] * len(batch)
+        tourney_serials = sorted(set(registration[1] for registration in batch))
+        cursor.execute(
+            "SELECT serial FROM tourneys WHERE serial IN (" + ", ".join(["%s"] * len(tourney_serials)) + ") AND resthost_serial = %s",
+            tourney_serials + [self.resthost_serial]
+        )
+        relevant = set(row[0] for row in cursor.fetchall())
+        for index, (_serial, tourney_serial, _currency_serial, _withdraw, _d) in enumerate(batch):
+            if tourney_serial not in relevant:
+                codes[index] = PacketPokerTourneyRegister.REGISTRATION_REFUSED
+        #
+        # the money of the players is locked until the end of the
+        # transaction, the buy ins are checked against it in the order of
+        # the registrations
+        #
+        accounts = sorted(set(
+            (serial, currency_serial)
+            for index, (serial, _tourney_serial, currency_serial, withdraw, _d) in enumerate(batch)
+            if codes[index] is None and withdraw > 0
+        ))
+        if accounts:
+            cursor.execute(
+                "SELECT user_serial, currency_serial, amount FROM user2money WHERE (user_serial, currency_serial) IN (" + ", ".join(["(%s, %s)"] * len(accounts)) + ") FOR UPDATE",
+                [value for account in accounts for value in account]
+            )
+            balances = dict(((row[0], row[1]), row[2]) for row in cursor.fetchall())
+            debits = {}
+            for index, (serial, _tourney_serial, currency_serial, withdraw, _d) in enumerate(batch):
+                if codes[index] is not None or withdraw <= 0:
+                    continue
+                account = (serial, currency_serial)
+                if balances.get(account, 0) < withdraw:
+                    codes[index] = PacketPokerTourneyRegister.NOT_ENOUGH_MONEY
+                    continue
+                balances[account] -= withdraw
+                debits[account] = debits.get(account, 0) + withdraw
+            if debits:
+                accounts = sorted(debits)
+                cursor.execute(
+                    "UPDATE user2money SET amount = amount - CASE " +
+                    "WHEN user_serial = %s AND currency_serial = %s THEN %s " * len(accounts) +
+                    "ELSE 0 END WHERE (user_serial, currency_serial) IN (" + ", ".join(["(%s, %s)"] * len(accounts)) + ")",
+                    [value for account in accounts for value in account + (debits[account],)] +
+                    [value for account in accounts for value in account]
+                )
+                if cursor.rowcount != len(accounts):
+                    raise UserWarning("debited %d accounts (expected %d)" % (cursor.rowcount, len(accounts)))
+        registered = [
+            (serial, currency_serial, tourney_serial)
+            for index, (serial, tourney_serial, currency_serial, _withdraw, _d) in enumerate(batch)
+            if codes[index] is None
+        ]
+        if registered:
+            cursor.execute(
+                "INSERT INTO user2tourney (user_serial, currency_serial, tourney_serial) VALUES " + ", ".join(["(%s, %s, %s)"] * len(registered)),
+                [value for registration in registered for value in registration]
+            )
+            if cursor.rowcount != len(registered):
+                raise UserWarning("inserted %d registrations (expected %d)" % (cursor.rowcount, len(registered)))
+        return codes
+
+    def _writeDone(self, codes, batch):
+        self._release(batch, codes)
+        return codes
+
+    def _writeFailed(self, fail, batch):
+        if len(batch) > 1:
+            self.log.warn("failed to register %d players, registering them one by one: %r", len(batch), fail)
+            return self._writeRows(batch)
+        self.log.error("failed to register %d players: %r", len(batch), fail)
+        self._release(batch, [PacketPokerTourneyRegister.SERVER_ERROR] * len(batch))
+
+    def _writeRows(self, batch):
+        codes = []
+        d = defer.succeed(None)
+        for registration in batch:
+            def write(result, registration=registration):
+                row = self.adb.runInteraction(self._writeBatch, [registration])
+                row.addCallbacks(codes.extend, self._writeRowFailed, errbackArgs=(registration, codes))
+                return row
+            d.addCallback(write)
+        d.addCallback(lambda result: self._writeDone(codes, batch))
+        return d
+
+    def _writeRowFailed(self, fail, registration, codes):
+        self.log.error("failed to register player %d in tourney %d: %r", registration[0], registration[1], fail)
+        codes.append(PacketPokerTourneyRegister.SERVER_ERROR)
+
+    def _release(self, batch, codes):
+        self.writing = None
+        for (serial, tourney_serial, _currency_serial, _withdraw, _d) in batch:
+            self._forget(serial, tourney_serial)
+        for (_serial, _tourney_serial, _currency_serial, _withdraw, d), code in zip(batch, codes):
+            d.callback(code)
+        if len(self.pending) >= self.batch:
+            self.flush()
+        elif self.pending and self.timer is None:
+            self.timer = reactor.callLater(self.flush_delay, self.flush)
+
+    def _forget(self, serial, tourney_serial):
+        serials = self.tourney2serials.get(tourney_serial)
+        if serials is not None:
+            serials.discard(serial)
+            if not serials:
+                del self.tourney2serials[tourney_serial]
+
+    def stop(self):
+        """Write all the pending registrations, the returned deferred
+        fires when they are written."""
+        d = defer.Deferred()
+        def drain(result=None):
+            if self.writing is not None:
+                self.writing.addBoth(drain)
+            elif self.pending:
+                self.flush().addBoth(drain)
+            else:
+                d.callback(True)
+            return result
+        drain()
+        return d
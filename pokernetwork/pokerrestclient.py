@@ -29,6 +29,15 @@ from pokerpackets.dictpack import dict2packet
 from pokernetwork import log as network_log
 log = network_log.get_child('pokerrestclient')
 
+UNIX_PREFIX = 'unix:'
+
+def connectResthost(host, port, factory, reactor=reactor):
+    """Connect factory to a resthost. A host of the form unix:/path
+    designates a local worker listening on a Unix socket (see
+    pokernetwork.pokersupervisor), the port is then ignored."""
+    if host.startswith(UNIX_PREFIX):
+        return reactor.connectUNIX(host[len(UNIX_PREFIX):], factory)
+    return reactor.connectTCP(host, int(port), factory)
 
 class RestClientFactory(protocol.ClientFactory):
 
@@ -141,7 +150,7 @@ class PokerRestClient:
     def sendPacketData(self, data):
         self.log.debug("sendPacketData %s", data)
         factory = RestClientFactory(self.host, self.port, self.path, data, self.timeout)
-        reactor.connectTCP(self.host, self.port, factory)
+        connectResthost(self.host, self.port, factory)
         self.sentTime = seconds()
         return factory.deferred
 
@@ -51,8 +51,10 @@ from pokernetwork.pokernetworkconfig import Config
 from pokernetwork.pokerservice import PokerRestTree, PokerService, IPokerFactory
 from pokernetwork.pokerpub import PubService
 from pokernetwork.protocol import ServerMsgpackProtocol
+from pokernetwork.protocol._base import keepalive_sweeper
 from pokernetwork.pokersite import PokerSite
 from pokernetwork.pokermanhole import makeService as makeManholeService
+from pokernetwork.pokersupervisor import PokerSupervisor, PokerRouterServerProtocol, PokerRouterMsgpackProtocol
 
 import reflogging
 from reflogging.handlers import GELFHandler, StreamHandler, ColorStreamHandler, SyslogHandler
@@ -128,14 +130,34 @@ def makeService(configuration):
         root_logger.add_handler(_handler)
 
     serviceCollection = service.MultiService()
+
+    #
+    # idle connections are only pinged if keepalive is set
+    #
+    keepalive_sweeper.interval = max(0, settings.headerGetInt("/server/@keepalive"))
+
+    #
+    # Supervisor: this process routes the packets to forked workers. It
+    # is started first to assign the shards before the front restores
+    # the tourneys
+    #
+    supervised = len(settings.headerGetProperties("/server/supervisor")) > 0
+    if supervised:
+        supervisor_service = PokerSupervisor(settings, configuration)
+        supervisor_service.name = 'supervisor'
+        supervisor_service.setServiceParent(serviceCollection)
+
     poker_service = PokerService(settings)
     poker_service.setServiceParent(serviceCollection)
-
+    if supervised:
+        poker_service.shard_router = True
 
     #
     # Poker protocol (with or without SSL)
     #
     poker_factory = IPokerFactory(poker_service)
+    if supervised:
+        poker_factory.setProtocol(PokerRouterServerProtocol)
     tcp_port = settings.headerGetInt("/server/listen/@tcp")
     internet.TCPServer(tcp_port, poker_factory).setServiceParent(serviceCollection)
 
@@ -149,7 +171,7 @@ def makeService(configuration):
     msgpack_port = settings.headerGetInt("/server/listen/@msgpack")
     if msgpack_port:
         msgpack_factory = IPokerFactory(poker_service)
-        msgpack_factory.setProtocol(ServerMsgpackProtocol)
+        msgpack_factory.setProtocol(PokerRouterMsgpackProtocol if supervised else ServerMsgpackProtocol)
         internet.TCPServer(msgpack_port, msgpack_factory).setServiceParent(serviceCollection)
 
     #
@@ -164,6 +186,15 @@ def makeService(configuration):
     if HAS_OPENSSL and rest_ssl_port:
         internet.SSLServer(rest_ssl_port, rest_site, SSLContextFactory(settings)).setServiceParent(serviceCollection)
 
+    #
+    # workers of a supervised server only listen to the front
+    #
+    rest_unix = settings.headerGet("/server/listen/@rest_unix")
+    if rest_unix:
+        if exists(rest_unix):
+            os.unlink(rest_unix)
+        internet.UNIXServer(rest_unix, rest_site).setServiceParent(serviceCollection)
+
     #
     # SSh twisted.conch.manhole
     #
@@ -78,7 +78,7 @@ from pokernetwork.user import checkName, checkPassword
 from pokernetwork.pokerdatabase import PokerDatabase
 from pokerpackets.packets import *
 from pokerpackets.networkpackets import *
-from pokernetwork.pokersite import PokerTourneyStartResource, PokerResource
+from pokernetwork.pokersite import PokerTourneyStartResource, PokerResource, PokerMetricsResource
 from pokernetwork.pokertable import PokerTable, PokerAvatarCollection
 from pokernetwork import pokeravatar
 from pokernetwork.user import User
@@ -86,6 +86,12 @@ from pokernetwork import pokercashier
 from pokernetwork import pokernetworkconfig
 from pokernetwork import pokermemcache
 from pokernetwork import pokerpacketizer
+from pokernetwork.pokerhandwriter import PokerHandWriter
+from pokernetwork.pokerregistration import TourneyRegistrar
+from pokernetwork.pokerchat import ChatFilter, ChatRateLimiter, ChatArchive
+from pokernetwork.pokerthrottle import ThrottlePolicy
+from pokernetwork.pokermonitor import MonitorBus
+from pokernetwork.pokermetrics import PacketMetrics, ReactorLagProbe
 from pokerauth import get_auth_instance
 from datetime import date
 
@@ -132,6 +138,7 @@ class PokerFactoryFromPokerService(protocol.ServerFactory):
 
     def __init__(self, service):
         self.service = service
+        self.throttle_policy = getattr(service, 'throttle_policy', None)
 
     def createAvatar(self):
         """ """
@@ -163,26 +170,33 @@ class PokerService(service.Service):
             settings_object.loadFromString(settings)
             settings = settings_object
         self.settings = settings
-        
-        self.joined_max = self.settings.headerGetInt("/server/@max_joined")
-        if self.joined_max <= 0: self.joined_max = 4000
-        
-        self.sng_timeout = self.settings.headerGetInt("/server/@sng_timeout")
-        if self.sng_timeout <= 0: self.sng_timeout = 3600
-        
-        self.missed_round_max = self.settings.headerGetInt("/server/@max_missed_round")
-        if self.missed_round_max <= 0: self.missed_round_max = 10
-        
-        self.client_queued_packet_max = self.settings.headerGetInt("/server/@max_queued_client_packets")
-        if self.client_queued_packet_max <= 0: self.client_queued_packet_max = 500
+        server_settings = settings.serverSettings()
+        self.joined_max = server_settings.joined_max
+        self.sng_timeout = server_settings.sng_timeout
+        self.missed_round_max = server_settings.missed_round_max
+        self.client_queued_packet_max = server_settings.client_queued_packet_max
         
         self.throttle = settings.headerGet('/server/@throttle') == 'yes'
+        self.throttle_policy = ThrottlePolicy(settings) if self.throttle else None
         self.delays = settings.headerGetProperties("/server/delays")[0]
         
         refill = settings.headerGetProperties("/server/refill")
         self.refill = refill[0] if len(refill) > 0 else None
         self.db = None
         self.adb = None
+        self.hand_writer = None
+        self.chat_archive = None
+        self.tourney_registrar = None
+        self.prizes_tables = {}
+        #
+        # serial => time until which the reads about the player are sent to
+        # the primary database, see readCursor
+        #
+        replicas = settings.headerGetProperties("/server/replicas")
+        self.db_sticky = float(replicas[0].get('sticky', 5)) if replicas else 0
+        self.db_written = {}
+        self.monitor_bus = None
+        self.reactor_lag_probe = None
         self.memcache = None
         self.cashier = None
         self.poker_auth = None
@@ -190,16 +204,21 @@ class PokerService(service.Service):
         self.down = True
         self.shutdown_deferred = None
         self.resthost_serial = 0
+        #
+        # set by pokerserver when this process is the front of a
+        # supervised server (see pokernetwork.pokersupervisor)
+        self.shard_router = False
         self.has_ladder = None
         self.monitor_plugins = [
             _import(path.content).handle_event
             for path in settings.header.xpathEval("/server/monitor")
         ]
         self.chat_filter = None
+        self.chat_rate = ChatRateLimiter(settings)
+        self.metrics = PacketMetrics() if settings.headerGet("/server/@metrics") == "yes" else None
         self.remove_completed = settings.headerGetInt("/server/@remove_completed")
         self.getPage = client.getPage
-        self.long_poll_timeout = settings.headerGetInt("/server/@long_poll_timeout")
-        if self.long_poll_timeout <= 0: self.long_poll_timeout = 20
+        self.long_poll_timeout = server_settings.long_poll_timeout
         #
         #
         self.temporary_users_cleanup = self.settings.headerGet("/server/@cleanup") == "yes" 
@@ -233,7 +252,7 @@ class PokerService(service.Service):
         return self.has_ladder
 
     def getLadder(self, game_id, currency_serial, user_serial):
-        with closing(self.db.cursor()) as c:
+        with closing(self.db.readCursor()) as c:
             c.execute("SELECT rank,percentile FROM rank WHERE currency_serial = %s AND user_serial = %s", ( currency_serial, user_serial ))
             if c.rowcount == 1:
                 row = c.fetchone()
@@ -276,14 +295,15 @@ class PokerService(service.Service):
 
     def setupChatFilter(self, chat_filter_filepath):
         try:
-            regExp = "(%s)" % "|".join(i.strip() for i in open(chat_filter_filepath,'r'))
-            self.chat_filter = re.compile(regExp,re.IGNORECASE)
+            self.chat_filter = ChatFilter.fromFile(chat_filter_filepath)
         except IOError, e:
             self.log.error("Could not access '%s': %s. Chat messages will not be filtered.", chat_filter_filepath, e.strerror)
         
     def startService(self):
         self.monitors = []
         self.db = PokerDatabase(self.settings)
+        if self.db.router is not None:
+            self.db.router.heartbeat_listeners.append(self.databaseWrittenExpire)
 
         # async database
         db_settings = self.settings.headerGetProperties("/server/database")[0]
@@ -294,6 +314,17 @@ class PokerService(service.Service):
             user=db_settings['user'],
             passwd=db_settings['password']
         )
+        self.hand_writer = PokerHandWriter(self.settings, self.db, self.adb)
+        self.chat_archive = ChatArchive(self.settings, self.adb)
+        self.monitor_bus = MonitorBus(self.settings)
+        #
+        # the plugins run in this process and keep records (bonuses, ...)
+        # that must not miss an event: they never lag by more than size
+        #
+        self.monitor_bus.addConsumer('plugins', self.monitorPluginsDeliver, lossless = True)
+        if self.metrics:
+            self.reactor_lag_probe = ReactorLagProbe(self.metrics.reactor_lag)
+            self.reactor_lag_probe.start()
 
         memcache_address = self.settings.headerGet("/server/@memcached")
         if memcache_address:
@@ -304,6 +335,8 @@ class PokerService(service.Service):
         self.setupTourneySelectInfo()
         self.setupLadder()
         self.setupResthost()
+        if self.settings.headerGetProperties("/server/tourneyregister"):
+            self.tourney_registrar = TourneyRegistrar(self.settings, self.adb, self.resthost_serial)
         
         self.cashier = pokercashier.PokerCashier(self.settings)
         self.cashier.setDb(self.db)
@@ -439,6 +472,7 @@ class PokerService(service.Service):
 
     def stopServiceFinish(self):
         self.monitors = []
+        if self.reactor_lag_probe: self.reactor_lag_probe.stop()
         if self.cashier: self.cashier.close()
         if self.db:
             self.cleanupCrashedTables()
@@ -457,6 +491,10 @@ class PokerService(service.Service):
     def stopService(self):
         deferred = self.shutdown()
         deferred.addCallback(lambda x: self.disconnectAll())
+        deferred.addCallback(lambda x: self.tourney_registrar.stop() if self.tourney_registrar else None)
+        deferred.addCallback(lambda x: self.hand_writer.stop() if self.hand_writer else None)
+        deferred.addCallback(lambda x: self.chat_archive.stop() if self.chat_archive else None)
+        deferred.addCallback(lambda x: self.monitor_bus.stop() if self.monitor_bus else None)
         deferred.addCallback(lambda x: self.stopServiceFinish())
         return deferred
 
@@ -656,17 +694,76 @@ class PokerService(service.Service):
     def monitor(self, avatar):
         if avatar not in self.monitors:
             self.monitors.append(avatar)
+            if self.monitor_bus:
+                self.monitor_bus.addConsumer(
+                    avatar,
+                    lambda events: self.monitorAvatarDeliver(avatar, events),
+                    lambda: self.forceAvatarDestroy(avatar)
+                )
         return PacketAck()
 
+    def monitorAvatarDeliver(self, avatar, events):
+        if hasattr(avatar, "protocol") and avatar.protocol:
+            for event in events:
+                avatar.sendPacketVerbose(event)
+
+    def monitorPluginsDeliver(self, events):
+        for event in events:
+            for plugin in self.monitor_plugins:
+                try:
+                    plugin(self, event)
+                except Exception:
+                    self.log.error("monitor plugin %s failed on %s", plugin, event, exc_info=1)
+
     def databaseEvent(self, **kwargs):
         event = PacketPokerMonitorEvent(**kwargs)
-        for avatar in self.monitors:
-            if hasattr(avatar, "protocol") and avatar.protocol:
-                avatar.sendPacketVerbose(event)
-        for plugin in self.monitor_plugins:
-            plugin(self, event)
+        #
+        # the monitors are given the events after the current code path
+        # returns, a slow monitor does not slow down the hands
+        #
+        if self.monitor_bus:
+            self.monitor_bus.publish(event)
+        else:
+            for avatar in self.monitors:
+                self.monitorAvatarDeliver(avatar, [event])
+            self.monitorPluginsDeliver([event])
+        if self.pub:
+            self.publishMonitorEvent(event)
+
+    def publishEvent(self, channel, **kwargs):
+        if self.pub:
+            self.pub.queue(channel, kwargs)
+
+    def publishMonitorEvent(self, event):
+        #
+        # the events that subscribers of the pub service want are derived
+        # from the monitor events so that they are emitted at the same
+        # points of the code
+        #
+        if event.event == PacketPokerMonitorEvent.HAND:
+            self.publishEvent('table.%d.hand' % event.param3, event = 'end', hand_serial = event.param1, transient = event.param2)
+        elif event.event == PacketPokerMonitorEvent.SEAT:
+            self.publishEvent('table.%d.seats' % event.param2, event = 'seat', serial = event.param1)
+        elif event.event == PacketPokerMonitorEvent.LEAVE:
+            self.publishEvent('table.%d.seats' % event.param2, event = 'leave', serial = event.param1)
+        elif event.event == PacketPokerMonitorEvent.BUY_IN:
+            self.publishEvent('user.%d.money' % event.param1, event = 'buy_in', table_id = event.param2, amount = event.param3)
+        elif event.event == PacketPokerMonitorEvent.REFILL:
+            self.publishEvent('user.%d.money' % event.param1, event = 'refill', currency_serial = event.param2, amount = event.param3)
+        elif event.event == PacketPokerMonitorEvent.PRIZE:
+            self.publishEvent('user.%d.money' % event.param1, event = 'prize', tourney_serial = event.param2, amount = event.param3)
+        elif event.event == PacketPokerMonitorEvent.REGISTER:
+            self.publishEvent('user.%d.money' % event.param1, event = 'register', tourney_serial = event.param2, amount = event.param3)
+        elif event.event == PacketPokerMonitorEvent.UNREGISTER:
+            self.publishEvent('user.%d.money' % event.param1, event = 'unregister', tourney_serial = event.param2, amount = event.param3)
 
     def stats(self, query):
+        if self.metrics:
+            return PacketPokerStats(
+                players = len(self.avatars),
+                bytesin = self.metrics.bytes_in,
+                bytesout = self.metrics.bytes_out
+            )
         return PacketPokerStats(
             players = len(self.avatars)
         )
@@ -689,6 +786,8 @@ class PokerService(service.Service):
             self.log.warn("avatar %s is not in the list of known avatars", avatar)
         if avatar in self.monitors:
             self.monitors.remove(avatar)
+            if self.monitor_bus:
+                self.monitor_bus.removeConsumer(avatar)
         avatar.connectionLost("disconnected")
 
     def auth(self, auth_type, auth_args, roles):
@@ -700,6 +799,7 @@ class PokerService(service.Service):
     def autorefill(self, serial):
         if not self.refill:
             return
+        self.databaseWrote(serial)
         user_info = self.getUserInfo(serial)
         if int(self.refill['serial']) in user_info.money:
             money = user_info.money[int(self.refill['serial'])]
@@ -900,6 +1000,7 @@ class PokerService(service.Service):
         tourney.satellite_of = self.tourneySatelliteLookup(tourney)[0]
         tourney.satellite_player_count = int(tourney_map['satellite_player_count'])
         tourney.satellite_registrations = []
+        tourney.prizes_cache = None
         tourney._kickme_after = seconds() + CANCEL_INACTIVE_TOURNEY_TIMEOUT
         tourney.callback_new_state = self.tourneyNewState
         tourney.callback_create_game = self.tourneyCreateTable
@@ -961,7 +1062,8 @@ class PokerService(service.Service):
             del self.tourneys_schedule[tourney.schedule_serial]
             
     def tourneyNewState(self, tourney, old_state, new_state):
-        
+        self.tourneyPrizesChanged(tourney)
+
         # if the tourney is not relevant for this resthost anymore, delete it and its schedule
         if old_state == TOURNAMENT_STATE_REGISTERING and not self.tourneyIsRelevant(tourney):
             self.tourneyDeleteWithSchedule(tourney)
@@ -982,6 +1084,7 @@ class PokerService(service.Service):
             c.execute(sql)
             if c.rowcount != 1:
                 self.log.error("modified %d rows (expected 1): %s", c.rowcount, c._executed)
+        self.publishEvent('tourney.%d.state' % tourney.serial, old_state = old_state, new_state = new_state)
         
         if new_state == TOURNAMENT_STATE_BREAK:
             # When we are entering BREAK state for the first time, which
@@ -1063,8 +1166,21 @@ class PokerService(service.Service):
             self.tourneyFinished(tourney)
             self.tourneySatelliteWaitingList(tourney)
 
+    def tourneyPrizes(self, tourney):
+        """Returns a copy of tourney.prizes(). The prizes are kept on the
+        tourney and only computed again after tourneyPrizesChanged, which is
+        called when a player registers, unregisters or rebuys and when the
+        tourney changes state."""
+        prizes = getattr(tourney, 'prizes_cache', None)
+        if prizes is None:
+            prizes = tourney.prizes_cache = tourney.prizes()
+        return list(prizes)
+
+    def tourneyPrizesChanged(self, tourney):
+        tourney.prizes_cache = None
+
     def tourneyFinished(self, tourney):
-        prizes = tourney.prizes()
+        prizes = self.tourneyPrizes(tourney)
         winners = tourney.winners[:len(prizes)]
         with closing(self.db.cursor()) as c:
             #
@@ -1080,6 +1196,7 @@ class PokerService(service.Service):
             #
             bail = tourney.prize_min - ( tourney.buy_in * tourney.registered )
             if bail > 0 and tourney.bailor_serial > 0:
+                self.databaseWrote(tourney.bailor_serial)
                 sql = "UPDATE user2money SET amount = amount - %s WHERE user_serial = %s AND currency_serial = %s AND amount >= %s"
                 params = (bail,tourney.bailor_serial,prize_currency,bail)
                 c.execute(sql,params)
@@ -1097,6 +1214,7 @@ class PokerService(service.Service):
                 serial = winners.pop(0)
                 if prize <= 0:
                     continue
+                self.databaseWrote(serial)
                 c.execute(
                     "UPDATE user2money SET amount = amount + %s WHERE user_serial = %s AND currency_serial = %s",
                     (prize,serial, prize_currency)
@@ -1245,7 +1363,7 @@ class PokerService(service.Service):
         tourney.finallyRemovePlayer(serial, now)
         
         with closing(self.db.cursor()) as c:
-            prizes = tourney.prizes()
+            prizes = self.tourneyPrizes(tourney)
             rank = tourney.getRank(serial)
             players = len(tourney.players)
             money = 0
@@ -1415,7 +1533,7 @@ class PokerService(service.Service):
 
     def tourneyBroadcastStart(self, tourney_serial):
         with closing(self.db.cursor()) as c:
-            c.execute("SELECT host,port FROM resthost WHERE state = %s",(self.STATE_ONLINE))
+            c.execute("SELECT host,port FROM resthost WHERE state = %s AND host NOT LIKE 'unix:%%'",(self.STATE_ONLINE))
             for host,port in c.fetchall():
                 self.getPage('http://%s:%d/TOURNEY_START?tourney_serial=%d' % (host,long(port),tourney_serial))
         
@@ -1446,7 +1564,18 @@ class PokerService(service.Service):
         packet = PacketPokerTourneyManager()
         packet.tourney_serial = tourney_serial
         with closing(self.db.cursor(DictCursor)) as c:
-            c.execute("SELECT user_serial, table_serial, rank FROM user2tourney WHERE tourney_serial = %d" % tourney_serial)
+            #
+            # the registrants with their name and the money they have at
+            # their table, if any
+            #
+            c.execute(
+                "SELECT u2t.user_serial, u2t.table_serial, u2t.rank, users.name, u2tab.money "
+                "FROM user2tourney AS u2t "
+                "LEFT JOIN users ON users.serial = u2t.user_serial "
+                "LEFT JOIN user2table AS u2tab ON u2tab.user_serial = u2t.user_serial AND u2tab.table_serial = u2t.table_serial "
+                "WHERE u2t.tourney_serial = %s",
+                (tourney_serial,)
+            )
             user2tourney = c.fetchall()
 
             table2serials = {}
@@ -1458,14 +1587,6 @@ class PokerService(service.Service):
                     table2serials[table_serial] = []
                 table2serials[table_serial].append(row['user_serial'])
             packet.table2serials = table2serials
-            user2money = {}
-            if len(table2serials) > 0:
-                c.execute("SELECT user_serial, money FROM user2table WHERE table_serial IN ( " + ",".join(map(str, table2serials.keys())) + " )")
-                for row in c.fetchall():
-                    user2money[row['user_serial']] = row['money']
-
-            c.execute("SELECT user_serial, name FROM user2tourney, users WHERE user2tourney.tourney_serial = " + str(tourney_serial) + " AND user2tourney.user_serial = users.serial")
-            user2name = dict((entry["user_serial"], entry["name"]) for entry in c.fetchall())
 
             c.execute("SELECT * FROM tourneys WHERE serial = %s",(tourney_serial,));
             if c.rowcount > 1:
@@ -1498,25 +1619,19 @@ class PokerService(service.Service):
             packet.tourney["registered"] = len(user2tourney)
             packet.tourney["rank2prize"] = None
             if tourney_serial in self.tourneys:
-                packet.tourney["rank2prize"] = self.tourneys[tourney_serial].prizes()
+                packet.tourney["rank2prize"] = self.tourneyPrizes(self.tourneys[tourney_serial])
             else:
                 player_count = packet.tourney["players_quota"] \
                     if packet.tourney["sit_n_go"] == 'y' \
                     else packet.tourney["registered"]
-                packet.tourney["rank2prize"] = pokerprizes.PokerPrizesTable(
-                    buy_in_amount = packet.tourney['buy_in'],
-                    guarantee_amount = packet.tourney['prize_min'],
-                    player_count = player_count,
-                    config_dirs = self.dirs
-                ).getPrizes()
+                packet.tourney["rank2prize"] = self.prizesTable(packet.tourney['buy_in'], packet.tourney['prize_min'], player_count)
 
         user2properties = {}
         for row in user2tourney:
             user_serial = row["user_serial"]
-            money = user_serial in user2money and user2money[user_serial] or -1
             user2properties[str(user_serial)] = {
-                "name": user2name[user_serial],
-                "money": money,
+                "name": row["name"],
+                "money": row["money"] or -1,
                 "rank": row["rank"],
                 "table_serial": row["table_serial"]
             }
@@ -1524,6 +1639,21 @@ class PokerService(service.Service):
 
         return packet
 
+    def prizesTable(self, buy_in, prize_min, player_count):
+        """Returns a copy of the prizes of a tourney that is not in memory
+        anymore. The prizes tables, which are read from the configuration
+        files, are kept for each buy in, guarantee and player count."""
+        key = (buy_in, prize_min, player_count)
+        prizes = self.prizes_tables.get(key)
+        if prizes is None:
+            prizes = self.prizes_tables[key] = pokerprizes.PokerPrizesTable(
+                buy_in_amount = buy_in,
+                guarantee_amount = prize_min,
+                player_count = player_count,
+                config_dirs = self.dirs
+            ).getPrizes()
+        return list(prizes)
+
     def tourneyPlayersList(self, tourney_serial):
         if tourney_serial not in self.tourneys:
             return PacketError(
@@ -1565,7 +1695,7 @@ class PokerService(service.Service):
                     "-limit<MAX TOURNEYS>" limit the returned packets to this value
             3. Otherwise the tourneys with the name of the query_string are returned
         """
-        cursor = self.db.cursor(DictCursor)
+        cursor = self.db.readCursor(DictCursor)
         try:
             criterion = query_string.split()
             if not criterion:
@@ -1703,11 +1833,13 @@ class PokerService(service.Service):
         else:
             return None
     
-    def tourneyRegister(self, packet, via_satellite=False):
+    def tourneyRegisterRefused(self, packet, tourney, via_satellite):
+        """Returns the PacketError refusing the registration of packet.serial
+        in tourney that can be decided without the database, or None. The
+        registrations waiting for the registrar count as registered."""
         serial = packet.serial
         tourney_serial = packet.tourney_serial
-        avatars = self.avatar_collection.get(serial)
-        tourney = self.tourneys.get(tourney_serial,None)
+        registrar = self.tourney_registrar
         if tourney is None:
             error = PacketError(
                 other_type = PACKET_POKER_TOURNEY_REGISTER,
@@ -1715,49 +1847,47 @@ class PokerService(service.Service):
                 message = "Tournament %d does not exist" % tourney_serial
             )
             self.log.error("%s", error)
-            for avatar in avatars:
-                avatar.sendPacketVerbose(error)
-            return False
-        
-        if tourney.via_satellite and not via_satellite:
+        elif tourney.via_satellite and not via_satellite:
             error = PacketError(
                 other_type = PACKET_POKER_TOURNEY_REGISTER,
                 code = PacketPokerTourneyRegister.VIA_SATELLITE,
                 message = "Player %d must register to %d via a satellite" % ( serial, tourney_serial ) 
             )
             self.log.error("%s", error)
-            for avatar in avatars:
-                avatar.sendPacketVerbose(error)
-            return False
-            
-        if tourney.isRegistered(serial):
+        elif tourney.isRegistered(serial) or (registrar and registrar.isPending(tourney_serial, serial)):
             error = PacketError(
                 other_type = PACKET_POKER_TOURNEY_REGISTER,
                 code = PacketPokerTourneyRegister.ALREADY_REGISTERED,
                 message = "Player %d already registered in tournament %d" % ( serial, tourney_serial )
             )
             self.log.inform("%s", error)
-            for avatar in avatars:
-                avatar.sendPacketVerbose(error)
-            return False
-
-        if not tourney.canRegister(serial):
+        elif not tourney.canRegister(serial) or (
+            registrar and registrar.pendingCount(tourney_serial) and
+            tourney.registered + registrar.pendingCount(tourney_serial) >= tourney.players_quota
+        ):
             error = PacketError(
                 other_type = PACKET_POKER_TOURNEY_REGISTER,
                 code = PacketPokerTourneyRegister.REGISTRATION_REFUSED,
                 message = "Registration refused in tournament %d" % tourney_serial
             )
             self.log.inform("%s", error)
-            for avatar in avatars:
-                avatar.sendPacketVerbose(error)
-            return False
+        else:
+            error = None
+        return error
 
-        if not self.tourneyIsRelevant(tourney):
+    def tourneyRegister(self, packet, via_satellite=False):
+        serial = packet.serial
+        tourney_serial = packet.tourney_serial
+        avatars = self.avatar_collection.get(serial)
+        tourney = self.tourneys.get(tourney_serial,None)
+        error = self.tourneyRegisterRefused(packet, tourney, via_satellite)
+        if error is None and not self.tourneyIsRelevant(tourney):
             error = PacketError(
                 other_type = PACKET_POKER_TOURNEY_REGISTER,
                 code = PacketPokerTourneyRegister.REGISTRATION_REFUSED,
                 message = "Registration refused in tournament %d (may be moved to another resthost)" % tourney_serial
             )
+        if error is not None:
             for avatar in avatars:
                 avatar.sendPacketVerbose(error)
             return False
@@ -1768,6 +1898,7 @@ class PokerService(service.Service):
             currency_serial = tourney.currency_serial or 0
             withdraw = tourney.buy_in + tourney.rake
             if withdraw > 0:
+                self.databaseWrote(serial)
                 c.execute(lex(
                     """ UPDATE user2money
                         SET amount = amount - %s
@@ -1817,16 +1948,77 @@ class PokerService(service.Service):
                     avatar.sendPacketVerbose(error)
                 return False
 
+        self.tourneyRegistered(packet, tourney)
+        return True
+
+    def tourneyRegistered(self, packet, tourney):
+        self.databaseWrote(packet.serial)
+        avatars = self.avatar_collection.get(packet.serial)
         # Notify success
         for avatar in avatars:
             avatar.sendPacketVerbose(packet)
 
-        tourney.register(serial,self.getName(serial))
+        tourney.register(packet.serial, self.getName(packet.serial))
+        self.tourneyPrizesChanged(tourney)
         info_packet = PacketPokerTourneyInfo(**tourney.__dict__)
         for avatar in avatars:
             avatar.sendPacketVerbose(info_packet)
 
-        return True
+    def tourneyRegisterAsync(self, packet):
+        """Same as tourneyRegister, except that the database is updated in
+        batches by the registrar when <tourneyregister> is set. Returns a
+        deferred that fires with True if the player is registered."""
+        if self.tourney_registrar is None:
+            return defer.succeed(self.tourneyRegister(packet))
+        tourney = self.tourneys.get(packet.tourney_serial, None)
+        error = self.tourneyRegisterRefused(packet, tourney, False)
+        if error is not None:
+            for avatar in self.avatar_collection.get(packet.serial):
+                avatar.sendPacketVerbose(error)
+            return defer.succeed(False)
+        withdraw = tourney.buy_in + tourney.rake
+        d = self.tourney_registrar.register(packet.serial, tourney.serial, tourney.currency_serial or 0, withdraw)
+        d.addCallback(self._tourneyRegisterWritten, packet, tourney, withdraw)
+        return d
+
+    def _tourneyRegisterWritten(self, code, packet, tourney, withdraw):
+        serial = packet.serial
+        if code is None and (self.tourneys.get(tourney.serial) is not tourney or not tourney.canRegister(serial)):
+            #
+            # the tourney stopped registering while the registration
+            # was written
+            #
+            self.tourneyRegisterCancel(serial, tourney, withdraw)
+            code = PacketPokerTourneyRegister.REGISTRATION_REFUSED
+        if code is None:
+            self.databaseEvent(event = PacketPokerMonitorEvent.REGISTER, param1 = serial, param2 = tourney.serial, param3 = withdraw)
+            self.tourneyRegistered(packet, tourney)
+            return True
+        if code == PacketPokerTourneyRegister.NOT_ENOUGH_MONEY:
+            message = "Not enough money to enter the tournament %d" % tourney.serial
+        elif code == PacketPokerTourneyRegister.REGISTRATION_REFUSED:
+            message = "Registration refused in tournament %d (may be moved to another resthost)" % tourney.serial
+        else:
+            message = "Server error"
+        error = PacketError(
+            other_type = PACKET_POKER_TOURNEY_REGISTER,
+            code = code,
+            message = message
+        )
+        self.log.inform("%s", error)
+        for avatar in self.avatar_collection.get(serial):
+            avatar.sendPacketVerbose(error)
+        return False
+
+    def tourneyRegisterCancel(self, serial, tourney, withdraw):
+        self.databaseWrote(serial)
+        with closing(self.db.cursor()) as c:
+            if withdraw > 0:
+                c.execute(
+                    "UPDATE user2money SET amount = amount + %s WHERE user_serial = %s AND currency_serial = %s",
+                    (withdraw, serial, tourney.currency_serial or 0)
+                )
+            c.execute("DELETE FROM user2tourney WHERE user_serial = %s AND tourney_serial = %s", (serial, tourney.serial))
 
     def tourneyUnregister(self, packet, force=False):
         serial = packet.serial
@@ -1839,6 +2031,20 @@ class PokerService(service.Service):
             )
         tourney = self.tourneys[tourney_serial]
 
+        registrar = self.tourney_registrar
+        if registrar and registrar.isPending(tourney_serial, serial):
+            #
+            # nothing is written until the registrar writes the
+            # registration, it can only be canceled before
+            #
+            if registrar.cancel(tourney_serial, serial):
+                return packet
+            return PacketError(
+                other_type = PACKET_POKER_TOURNEY_UNREGISTER,
+                code = PacketPokerTourneyUnregister.TOO_LATE,
+                message = "The registration of player %d in tournament %d is being written, it cannot be canceled yet" % (serial, tourney_serial)
+            )
+
         if not tourney.isRegistered(serial):
             return PacketError(
                 other_type = PACKET_POKER_TOURNEY_UNREGISTER,
@@ -1888,6 +2094,8 @@ class PokerService(service.Service):
                 )
 
         tourney.unregister(serial)
+        self.tourneyPrizesChanged(tourney)
+        self.databaseWrote(serial)
 
         return packet
 
@@ -1905,6 +2113,7 @@ class PokerService(service.Service):
             )
         tourney.start_time = now
         tourney.players_min = tourney.players_quota = tourney.registered
+        self.tourneyPrizesChanged(tourney)
         tourney.updateRunning()
         return PacketAck()
 
@@ -1938,6 +2147,7 @@ class PokerService(service.Service):
         returns the amount of tourney chips that the player should get additionally on the table
         if error is False, the reason indicates the problem
         """
+        self.databaseWrote(serial)
         with closing(self.db.cursor()) as c:
             currency_serial = tournament.currency_serial
             c.execute(
@@ -1980,6 +2190,8 @@ class PokerService(service.Service):
         
     def tourneyRebuy(self, tournament, serial, table_serial, success, error):
         table = self.tables[table_serial]
+        if success:
+            self.tourneyPrizesChanged(tournament)
         
         if not success:
             timeout_key = "%s_%s" % (tournament.serial, serial)
@@ -2027,6 +2239,8 @@ class PokerService(service.Service):
         self.timer['cancel_inactive_tourneys'] = reactor.callLater(INACTIVE_TOURNEY_CANCEL_POLL_DEALAY, self.cancelInactiveTourneys)
 
     def createHand(self, game_id, tourney_serial=None):
+        if self.hand_writer and self.hand_writer.serial_block > 1:
+            return self.hand_writer.createHand(game_id, tourney_serial)
         with closing(self.db.cursor()) as c:
             c.execute("INSERT INTO hands (description, game_id, tourney_serial) VALUES ('[]', %s, %s)",
                 (game_id, tourney_serial))
@@ -2087,6 +2301,10 @@ class PokerService(service.Service):
         if load_from_cache and hand_serial in self.hand_cache:
             return self.hand_cache[hand_serial]
         #
+        # the hand may still be waiting to be written
+        if self.hand_writer and self.hand_writer.getDescription(hand_serial):
+            return self.hand_writer.getDescription(hand_serial)
+        #
         # else fetch the hand from the database
         with closing(self.db.cursor()) as c:
             c.execute("SELECT description FROM hands WHERE serial = %s", (hand_serial,))
@@ -2109,6 +2327,9 @@ class PokerService(service.Service):
             map(self.hand_cache.pop, self.hand_cache.keys()[:-3])
             self.hand_cache[hand_id] = description
 
+        if self.hand_writer:
+            return self.hand_writer.write(hand_id, description, player_list)
+
         hand_query = "UPDATE hands SET description = %s WHERE serial = %s"
         hand_arg = (str(description), hand_id)
         d_hand = self.adb.runOperation(hand_query, hand_arg)
@@ -2125,8 +2346,11 @@ class PokerService(service.Service):
 
         return defer.DeferredList([d_hand, d_u2h])
 
+    def handWriterCongested(self):
+        return self.hand_writer is not None and self.hand_writer.isCongested()
+
     def listHands(self, sql_list, sql_total):
-        with closing(self.db.cursor()) as c:
+        with closing(self.db.readCursor()) as c:
             self.log.debug("listHands: %s %s", sql_list, sql_total)
             c.execute(sql_list)
             hands = c.fetchall()
@@ -2190,7 +2414,7 @@ class PokerService(service.Service):
         if self.resthost_serial and query_string != 'all': 
             query_suffix = (" AND t.resthost_serial = %d" % self.resthost_serial) + query_suffix
         
-        with closing(self.db.cursor(DictCursor)) as c:
+        with closing(self.readCursor(serial, DictCursor)) as c:
             if query_string == '' or query_string == 'all':
                 c.execute( default_query + "WHERE 1" + query_suffix )
 
@@ -2290,7 +2514,7 @@ class PokerService(service.Service):
             'min_players': min_players
         
         }
-        with closing(self.db.cursor(DictCursor)) as c:
+        with closing(self.db.readCursor(DictCursor)) as c:
             # Now build the SQL statement we need.
             sql = \
             """ SELECT
@@ -2405,29 +2629,46 @@ class PokerService(service.Service):
                    "AND resthost.serial != %d AND %s" % (self.resthost_serial,where)
                 )
                 result = c.fetchone() if c.rowcount > 0 else None
+                #
+                # the front of a supervised server owns no table: a table
+                # that was not spawned yet is routed to the worker it was
+                # assigned to
+                #
+                if result is None and self.shard_router and game_id:
+                    c.execute(
+                        "SELECT host, port, path FROM tables,resthost WHERE tables.resthost_serial = resthost.serial " \
+                        "AND resthost.serial != %s AND tables.serial = %s",
+                        (self.resthost_serial, game_id)
+                    )
+                    result = c.fetchone() if c.rowcount > 0 else None
             
         return (result, game_id)
 
     def cleanUpTemporaryUsers(self):
+        #
+        # a pattern that is a prefix followed by .* is a LIKE on the name
+        # index instead of a RLIKE on each row. The users and their
+        # tourney registrations are deleted by the same statement.
+        #
+        match = re.match(r'^\^([A-Za-z0-9_ -]*)\.\*\$$', self.temporary_users_pattern)
+        if match:
+            name_sql = "users.name LIKE %s"
+            name_arg = match.group(1).replace('_', '\\_') + '%'
+        else:
+            name_sql = "users.name RLIKE %s"
+            name_arg = self.temporary_users_pattern
         with closing(self.db.cursor()) as c:
-            c.execute(lex(
-                """ DELETE user2tourney FROM user2tourney, users
-                    WHERE (users.serial BETWEEN %s AND %s OR users.name RLIKE %s) AND users.serial = user2tourney.user_serial
-                """),
-                (
-                    self.temporary_serial_min,
-                    self.temporary_serial_max,
-                    self.temporary_users_pattern
-                )
-            )
             c.execute(
-                "DELETE FROM users WHERE serial BETWEEN %s AND %s OR name RLIKE %s",
+                "DELETE users, user2tourney FROM users " \
+                "LEFT JOIN user2tourney ON user2tourney.user_serial = users.serial " \
+                "WHERE users.serial BETWEEN %s AND %s OR " + name_sql,
                 (
                     self.temporary_serial_min,
                     self.temporary_serial_max,
-                    self.temporary_users_pattern
+                    name_arg
                 )
             )
+            self.log.debug("cleanUpTemporaryUsers: %s", c._executed)
 
     def abortRunningTourneys(self):
         with closing(self.db.cursor()) as c:
@@ -2465,7 +2706,30 @@ class PokerService(service.Service):
             params = (self.resthost_serial, now-2*CHECK_TOURNEYS_SCHEDULE_DELAY)
             c.execute(sql, params)
             self.log.debug("restoreTourneys: %s", c._executed)
-            for row in c.fetchall():
+            rows = c.fetchall()
+            if not rows:
+                return restored_info
+            #
+            # the routes and the registrants of all the restored tourneys
+            # are handled with one statement each
+            #
+            tourney_serials = [row['serial'] for row in rows]
+            c.execute(
+                "REPLACE INTO route VALUES " + ", ".join(["(0, %s, %s, %s)"] * len(rows)),
+                [arg for tourney_serial in tourney_serials for arg in (tourney_serial, now, self.resthost_serial)]
+            )
+            self.log.debug("restoreTourneys: %s", c._executed)
+            c.execute(
+                "SELECT u2t.tourney_serial, u.serial, u.name FROM users AS u " \
+                "JOIN user2tourney AS u2t " \
+                "ON u.serial = u2t.user_serial AND u2t.tourney_serial IN (" + ", ".join(["%s"] * len(rows)) + ")",
+                tourney_serials
+            )
+            self.log.debug("restoreTourneys: %s", c._executed)
+            registrants = {}
+            for user in c.fetchall():
+                registrants.setdefault(user['tourney_serial'], []).append(user)
+            for row in rows:
                 restored_info.append((row['serial'], row['schedule_serial']))
                 
                 tourney = self.spawnTourneyInCore(row, row['serial'], row['schedule_serial'], row['currency_serial'], row['prize_currency'])
@@ -2475,20 +2739,8 @@ class PokerService(service.Service):
                 # We cannot set the tourney state (to registering) yet because the we need to register the player first
 
                 old_state, tourney.state = tourney.state, TOURNAMENT_STATE_LOADING
-                c.execute(
-                    "SELECT u.serial, u.name FROM users AS u " \
-                    "JOIN user2tourney AS u2t " \
-                    "ON u.serial = u2t.user_serial AND u2t.tourney_serial = %s",
-                    (row['serial'],)
-                )
-                self.log.debug("restoreTourneys: %s", c._executed)
-                for user in c.fetchall():
+                for user in registrants.get(row['serial'], ()):
                     tourney.register(user['serial'],user['name'])
-                
-                c.execute(
-                    "REPLACE INTO route VALUES (0, %s, %s, %s)",
-                    (row['serial'], now, self.resthost_serial)
-                )
 
                 tourney.state = old_state
                 if tourney.state == TOURNAMENT_STATE_ANNOUNCED:
@@ -2556,6 +2808,26 @@ class PokerService(service.Service):
             # restore registering tourneys
             self.restoreTourneys()
 
+    def databaseWrote(self, serial):
+        if self.db_sticky:
+            self.db_written[serial] = seconds() + self.db_sticky
+
+    def databaseWrittenExpire(self, now):
+        for serial, until in self.db_written.items():
+            if until <= now:
+                del self.db_written[serial]
+
+    def readCursor(self, serial, *args):
+        """Returns a cursor for the read only queries about serial: on a
+        replica of the database unless serial changed the database less
+        than sticky seconds ago, so that the player reads its own writes."""
+        until = self.db_written.get(serial)
+        if until is not None:
+            if until > seconds():
+                return self.db.cursor(*args)
+            del self.db_written[serial]
+        return self.db.readCursor(*args)
+
     def getMoney(self, serial, currency_serial):
         with closing(self.db.cursor()) as c:
             c.execute(
@@ -2576,9 +2848,11 @@ class PokerService(service.Service):
         return money
 
     def cashIn(self, packet):
+        self.databaseWrote(packet.serial)
         return self.cashier.cashIn(packet)
 
     def cashOut(self, packet):
+        self.databaseWrote(packet.serial)
         return self.cashier.cashOut(packet)
 
     def cashQuery(self, packet):
@@ -2606,7 +2880,7 @@ class PokerService(service.Service):
         if serial == 0:
             return placeholder
 
-        with closing(self.db.cursor()) as c:
+        with closing(self.readCursor(serial)) as c:
             c.execute(
                 "SELECT locale,name,skin_url,skin_outfit FROM users WHERE serial = %s",
                 (serial,)
@@ -2630,7 +2904,7 @@ class PokerService(service.Service):
         return packet
 
     def getPlayerPlaces(self, serial):
-        with closing(self.db.cursor()) as c:
+        with closing(self.readCursor(serial)) as c:
             c.execute("SELECT table_serial FROM user2table WHERE user_serial = %s", serial)
             tables = [x[0] for x in c.fetchall()]
             c.execute("SELECT user2tourney.tourney_serial FROM user2tourney,tourneys WHERE user2tourney.user_serial = %s AND user2tourney.tourney_serial = tourneys.serial AND tourneys.state in ('registering', 'running', 'break', 'breakwait')", serial)
@@ -2642,7 +2916,7 @@ class PokerService(service.Service):
             )
 
     def getPlayerPlacesByName(self, name):
-        with closing(self.db.cursor()) as c:
+        with closing(self.db.readCursor()) as c:
             c.execute("SELECT serial FROM users WHERE name = %s", name)
             serial = c.fetchone()
             if serial == None:
@@ -2658,7 +2932,7 @@ class PokerService(service.Service):
         )
         
     def getUserInfo(self, serial):
-        with closing(self.db.cursor()) as c:
+        with closing(self.readCursor(serial)) as c:
             c.execute("SELECT rating, affiliate, email, name FROM users WHERE serial = %s", (serial,))
             if c.rowcount != 1:
                 self.log.error("getUserInfo(%d) expected one row got %d", serial, c.rowcount)
@@ -2700,7 +2974,7 @@ class PokerService(service.Service):
             affiliate = user_info.affiliate,
             money = user_info.money
         )
-        with closing(self.db.cursor()) as c:
+        with closing(self.readCursor(serial)) as c:
             c.execute(lex(
                 """ SELECT
                         firstname,
@@ -2728,6 +3002,7 @@ class PokerService(service.Service):
         return packet
 
     def setPersonalInfo(self, info):
+        self.databaseWrote(info.serial)
         with closing(self.db.cursor()) as c:
             c.execute(lex(
                 """ UPDATE users_private
@@ -2871,6 +3146,7 @@ class PokerService(service.Service):
             return self.getPersonalInfo(packet.serial)
 
     def setPlayerInfo(self, player_info):
+        self.databaseWrote(player_info.serial)
         with closing(self.db.cursor()) as c:
             c.execute(
                 "UPDATE users SET name = %s, skin_url = %s, skin_outfit = %s WHERE serial = %s",
@@ -2907,12 +3183,13 @@ class PokerService(service.Service):
             return c.fetchall()
 
     def getTableAutoDeal(self):
-        return self.settings.headerGet("/server/@autodeal") == "yes"
+        return self.settings.serverSettings().autodeal
     
     def buyInPlayer(self, serial, table_id, currency_serial, amount):
         if amount == None:
             self.log.error("called buyInPlayer with None amount (expected > 0); denying buyin")
             return 0
+        self.databaseWrote(serial)
         # unaccounted money is delivered regardless
         if not currency_serial: return amount
 
@@ -2938,6 +3215,7 @@ class PokerService(service.Service):
             return withdraw
 
     def seatPlayer(self, serial, table_id, amount, minimum_amount = None):
+        self.databaseWrote(serial)
         with closing(self.db.cursor()) as c:
             status = True
             if minimum_amount:
@@ -2964,6 +3242,7 @@ class PokerService(service.Service):
             return status
 
     def movePlayer(self, serial, from_table_id, to_table_id):
+        self.databaseWrote(serial)
         with closing(self.db.cursor()) as c:
             c.execute(
                 "SELECT money FROM user2table " \
@@ -2996,10 +3275,14 @@ class PokerService(service.Service):
             if c.rowcount != 1:
                 self.log.error("modified %d rows (expected 1): %s", c.rowcount, c._executed)
                 money = -1
+            else:
+                self.publishEvent('table.%d.seats' % from_table_id, event = 'leave', serial = serial)
+                self.publishEvent('table.%d.seats' % to_table_id, event = 'seat', serial = serial)
 
         return money
 
     def buyOutPlayer(self, serial, table_id, currency_serial):
+        self.databaseWrote(serial)
         with closing(self.db.cursor()) as c:
             if currency_serial:
                 c.execute(lex(
@@ -3019,6 +3302,8 @@ class PokerService(service.Service):
                 )
                 if c.rowcount not in (0, 2):
                     self.log.error("leavePlayer: modified %d rows (expected 0 or 2)\n%s", c.rowcount, c._executed, refs=[('User', serial, int)])
+                elif c.rowcount == 2:
+                    self.publishEvent('user.%d.money' % serial, event = 'buy_out', table_id = table_id, currency_serial = currency_serial)
 
     def leavePlayer(self, serial, table_id, currency_serial):
         self.buyOutPlayer(serial, table_id, currency_serial)
@@ -3031,6 +3316,7 @@ class PokerService(service.Service):
     def updatePlayerRake(self, currency_serial, serial, amount):
         if amount == 0 or currency_serial == 0:
             return True
+        self.databaseWrote(serial)
         status = True
         with closing(self.db.cursor()) as c:
             c.execute(
@@ -3046,6 +3332,7 @@ class PokerService(service.Service):
     def updatePlayerMoney(self, serial, table_id, amount):
         if amount == 0:
             return True
+        self.databaseWrote(serial)
         status = True
         with closing(self.db.cursor()) as c:
             c.execute(
@@ -3056,6 +3343,8 @@ class PokerService(service.Service):
             if c.rowcount != 1:
                 self.log.error("modified %d rows (expected 1): %s", c.rowcount, c._executed)
                 status = False
+            else:
+                self.publishEvent('user.%d.money' % serial, event = 'hand', table_id = table_id, amount = amount)
         return status
 
     def updateTableStats(self, game, observers, waiting):
@@ -3095,19 +3384,47 @@ class PokerService(service.Service):
         return next(t for t in self.tables.itervalues() if t.tourney is tourney and serial in t.game.serial2player)
 
     def cleanupCrashedTables(self):
+        #
+        # the money of all the zombies is given back with one UPDATE and
+        # they are removed with one DELETE, whatever their number: the
+        # restart after a crash does not grow with the players seated
+        #
+        zombies_from = \
+            "FROM user2table AS u2t " \
+            "JOIN tables AS t ON t.serial = u2t.table_serial " \
+            "JOIN tableconfigs AS c ON c.serial = t.tableconfig_serial "
+        zombies_where = "WHERE t.resthost_serial = %s AND c.currency_serial != 0 "
         with closing(self.db.cursor()) as c:
-            c.execute(lex(
-                """ SELECT t.serial, c.currency_serial, u2t.user_serial, u2t.money
-                    FROM user2table AS u2t
-                    LEFT JOIN tables AS t
-                        ON t.serial = u2t.table_serial
-                    LEFT JOIN tableconfigs AS c
-                        ON c.serial = t.tableconfig_serial
-                    WHERE t.resthost_serial = %s AND c.currency_serial != 0
-                """),
+            c.execute(
+                "SELECT t.serial, c.currency_serial, u2t.user_serial, u2t.money, u2m.user_serial IS NOT NULL " + \
+                zombies_from + \
+                "LEFT JOIN user2money AS u2m ON u2m.user_serial = u2t.user_serial AND u2m.currency_serial = c.currency_serial " + \
+                zombies_where,
                 (self.resthost_serial,)
             )
-            for table_serial, currency_serial, user_serial, money in c:
+            zombies = c.fetchall()
+            if zombies:
+                c.execute("START TRANSACTION")
+                try:
+                    c.execute(
+                        "UPDATE user2money AS u2m JOIN (" \
+                            "SELECT u2t.user_serial, c.currency_serial, SUM(u2t.money) AS money " + \
+                            zombies_from + zombies_where + \
+                            "GROUP BY u2t.user_serial, c.currency_serial" \
+                        ") AS refund ON refund.user_serial = u2m.user_serial AND refund.currency_serial = u2m.currency_serial " \
+                        "SET u2m.amount = u2m.amount + refund.money",
+                        (self.resthost_serial,)
+                    )
+                    self.log.debug("cleanupCrashedTables: %s", c._executed)
+                    c.execute("DELETE u2t " + zombies_from + zombies_where, (self.resthost_serial,))
+                    self.log.debug("cleanupCrashedTables: %s", c._executed)
+                    if c.rowcount != len(zombies):
+                        self.log.error("cleanupCrashedTables: deleted %d rows (expected %d)", c.rowcount, len(zombies))
+                    c.execute("COMMIT")
+                except:
+                    c.execute("ROLLBACK")
+                    raise
+            for table_serial, currency_serial, user_serial, money, has_money in zombies:
                 self.log.inform(
                     "cleanupCrashedTables: found zombie in user2table, table: %d, user: %d, currency: %d, money: %d",
                     table_serial, user_serial, currency_serial, money, refs=[
@@ -3115,7 +3432,9 @@ class PokerService(service.Service):
                         ('User', self, lambda x: user_serial)
                     ]
                 )
-                self.leavePlayer(user_serial, table_serial, currency_serial)
+                if has_money and money:
+                    self.publishEvent('user.%d.money' % user_serial, event = 'buy_out', table_id = table_serial, currency_serial = currency_serial)
+                self.databaseEvent(event = PacketPokerMonitorEvent.LEAVE, param1 = user_serial, param2 = table_serial, param3 = currency_serial)
             c.execute(lex(
                 """ UPDATE tables
                     SET players = 0, observers = 0
@@ -3143,7 +3462,12 @@ class PokerService(service.Service):
             else:
                 self.log.debug("broadcast: avatar %s excluded" % str(avatar))
 
+    def chatAllowed(self, game_id, serial):
+        return self.chat_rate.allow(game_id, serial)
+
     def chatMessageArchive(self, player_serial, game_id, message):
+        if self.chat_archive:
+            return self.chat_archive.write(player_serial, game_id, message)
         with closing(self.db.cursor()) as c:
             c.execute(
                 "INSERT INTO chat_messages (player_serial, game_id, message) VALUES (%s, %s, %s)",
@@ -3173,6 +3497,7 @@ class PokerRestTree(resource.Resource):
         self.service = service
         self.putChild("POKER_REST", PokerResource(self.service))
         self.putChild("TOURNEY_START", PokerTourneyStartResource(self.service))
+        self.putChild("metrics", PokerMetricsResource(self.service))
         self.putChild("", self)
 
     def render_GET(self, request):
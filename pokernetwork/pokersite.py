@@ -83,6 +83,12 @@ class Session(server.Session):
         if self.explain_default:
             self.avatar.setExplain(PacketPokerExplain.ALL)
         self.avatar.roles.add(PacketPokerRoles.PLAY)
+        #
+        # the requests of a session go through many connections, the
+        # session has the bucket of tokens
+        #
+        throttle_policy = getattr(site.resource.service, 'throttle_policy', None)
+        self.throttle = throttle_policy.createThrottle() if throttle_policy else None
         self.expired = False
 
     def expire(self):
@@ -172,7 +178,11 @@ class PokerResource(resource.Resource):
             return True
         
         session = request.getSession()
-        d = defer.maybeDeferred(session.avatar.handleDistributedPacket, request, packet, data)
+        error = session.throttle.check(packet) if session.throttle else None
+        if error:
+            d = defer.succeed([error])
+        else:
+            d = defer.maybeDeferred(session.avatar.handleDistributedPacket, request, packet, data)
         
         def render(packets, session=None, packet=None):
             _host_type, host = request.findProxiedIP()
@@ -201,7 +211,17 @@ class PokerResource(resource.Resource):
             #
             # Format answer
             #
-            packets_encoded = Packet.JSON.encode([packet2dict(packet, packet_type_numeric) for packet in packets])
+            packets_dicts = [packet2dict(packet, packet_type_numeric) for packet in packets]
+            packets_encoded = Packet.JSON.encode(packets_dicts)
+            metrics = self.service.metrics
+            if metrics:
+                #
+                # the size of each packet is the size of its own encoding,
+                # only computed when the metrics are enabled
+                #
+                metrics.recordIn(len(data))
+                for packet, packet_dict in zip(packets, packets_dicts):
+                    metrics.recordOut(packet.type, len(Packet.JSON.encode(packet_dict)))
             result = '%s(%s)' % (jsonp,packets_encoded) if jsonp else packets_encoded
 
             content_type = 'application/javascript' if jsonp else 'application/json'
@@ -256,6 +276,33 @@ class PokerTourneyStartResource(resource.Resource):
         request.write(body)
         return True
 
+class PokerMetricsResource(resource.Resource):
+    """The packet metrics of the service (see pokernetwork.pokermetrics)
+    in the Prometheus text format, or in JSON with ?format=json."""
+
+    _log = log.get_child('PokerMetricsResource')
+
+    def __init__(self, service):
+        resource.Resource.__init__(self)
+        self.service = service
+        self.isLeaf = True
+
+    def render_GET(self, request):
+        metrics = self.service.metrics
+        if not metrics:
+            request.setResponseCode(404)
+            body = 'metrics are not enabled, see <server metrics="yes">'
+            content_type = 'text/plain'
+        elif request.args.get('format', [''])[0] == 'json':
+            body = Packet.JSON.encode(metrics.report())
+            content_type = 'application/json'
+        else:
+            body = metrics.render()
+            content_type = 'text/plain; version=0.0.4'
+        request.setHeader('content-type', content_type)
+        request.setHeader('content-length', str(len(body)))
+        return body
+
 class PokerSite(server.Site):
 
     requestFactory = Request
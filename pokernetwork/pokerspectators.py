@@ -0,0 +1,198 @@
+#
+# -*- py-indent-offset: 4; coding: utf-8; mode: python -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Spectator tier of the tables: the observers of a table share one stream
+# of public packets.
+#
+#   <spectators delay="0" period="0" max="0"/>
+#
+# When the element is present, the packets a table broadcasts are made
+# public once and appended to the stream of the table instead of being
+# sent to each observer. They are released delay seconds after the
+# broadcast, and the observers are sent all the packets released since the
+# previous flush together, at most once every period seconds (once per
+# reactor tick when period is 0). The observers whose protocol writes the
+# packets as they are receive bytes encoded once for all the observers with
+# the same encoding. When max is not 0, a flush sends packets to at most
+# max observers, the ones that waited the longest first: the others lag
+# behind and get everything they missed at a later flush.
+#
+from collections import deque
+from itertools import islice
+from operator import itemgetter
+
+from twisted.internet import reactor
+from twisted.python.runtime import seconds
+
+from pokernetwork import log as network_log
+log = network_log.get_child('pokerspectators')
+
+class SpectatorStream:
+    """The public packets of a table, numbered in the order they were
+    published. The cursor of a spectator is the number of the first packet
+    it was not sent. A spectator added to the stream starts at its end: the
+    packets published before are in the table state it was sent when
+    joining. A packet is kept until all the spectators were sent it."""
+
+    log = log.get_child('SpectatorStream')
+
+    def __init__(self, server_settings):
+        self.delay = server_settings.spectators_delay
+        self.period = server_settings.spectators_period
+        self.max = server_settings.spectators_max
+        self.packets = deque() # (release time, packet)
+        self.first = 0 # number of packets[0]
+        self.released = 0 # number of the first packet not released
+        self.cursors = {}
+        self.lagging = 0
+        self.timer = None
+        self.flushed = 0
+        self.stats = {
+            'published': 0,
+            'flushes': 0,
+            'encoded': 0,
+            'written': 0,
+            'lagging': 0,
+        }
+
+    def __len__(self):
+        return len(self.cursors)
+
+    def end(self):
+        return self.first + len(self.packets)
+
+    def add(self, avatar):
+        self.cursors[avatar] = self.end()
+
+    def remove(self, avatar, flush=False):
+        """Remove avatar from the spectators. With flush it is first sent
+        the packets it did not get yet, released or not, because it is
+        sent the packets of the table directly from now on."""
+        cursor = self.cursors.pop(avatar, None)
+        if flush and cursor is not None:
+            for packet in self._packets(cursor, self.end()):
+                avatar.sendPacket(packet)
+        self._trim()
+
+    def publish(self, packet):
+        if not self.cursors:
+            return
+        self.stats['published'] += 1
+        self.packets.append((seconds() + self.delay, packet))
+        self._schedule()
+
+    def _packets(self, start, stop):
+        return [packet for _when, packet in islice(self.packets, start - self.first, stop - self.first)]
+
+    def _schedule(self):
+        if self.timer is not None:
+            return
+        if self.released < self.end():
+            when = self.packets[self.released - self.first][0]
+        elif self.lagging:
+            when = 0
+        else:
+            return
+        when = max(when, self.flushed + self.period)
+        self.timer = reactor.callLater(max(0, when - seconds()), self.flush)
+
+    def _cancel(self):
+        if self.timer is not None and self.timer.active():
+            self.timer.cancel()
+        self.timer = None
+
+    def flush(self, now=None):
+        self._cancel()
+        if now is None:
+            now = seconds()
+        self.flushed = now
+        end = self.end()
+        released = self.released
+        while released < end and self.packets[released - self.first][0] <= now:
+            released += 1
+        self.released = released
+        self._send(released)
+        self._schedule()
+
+    def close(self):
+        """Send all the packets, released or not, to all the spectators
+        and forget them."""
+        self._cancel()
+        self.max = 0
+        self.released = self.end()
+        self._send(self.released)
+        self.cursors = {}
+        self._trim()
+
+    def _send(self, released):
+        self.stats['flushes'] += 1
+        waiting = [(cursor, avatar) for avatar, cursor in self.cursors.iteritems() if cursor < released]
+        self.lagging = 0
+        if self.max and len(waiting) > self.max:
+            waiting.sort(key=itemgetter(0))
+            self.lagging = len(waiting) - self.max
+            self.stats['lagging'] += self.lagging
+            del waiting[self.max:]
+        groups = {}
+        for cursor, avatar in waiting:
+            groups.setdefault(cursor, []).append(avatar)
+            self.cursors[avatar] = released
+        #
+        # a packet is encoded once per encoding, whatever the number of
+        # spectators and the number of groups it is sent to
+        #
+        batches = [(cursor, self._packets(cursor, released), avatars) for cursor, avatars in groups.iteritems()]
+        encoded = {}
+        for cursor, packets, avatars in batches:
+            data = {}
+            for avatar in avatars:
+                #
+                # sending a packet may destroy an avatar, which is then
+                # removed from the spectators
+                #
+                if avatar not in self.cursors:
+                    continue
+                protocol = avatar.spectatorProtocol()
+                if protocol is None:
+                    for packet in packets:
+                        avatar.sendPacket(packet)
+                    continue
+                encoding = protocol.packetsEncoding()
+                if encoding not in data:
+                    chunks = encoded.setdefault(encoding, {})
+                    for number, packet in enumerate(packets, cursor):
+                        if number not in chunks:
+                            chunks[number] = protocol.encodePacket(packet)
+                            self.stats['encoded'] += 1
+                    chunks = [chunks[number] for number in xrange(cursor, released)]
+                    data[encoding] = (chunks, "".join(chunks))
+                chunks, joined = data[encoding]
+                if protocol.metrics:
+                    for packet, chunk in zip(packets, chunks):
+                        protocol.metrics.recordOut(packet.type, len(chunk))
+                protocol.dataWrite(joined)
+                self.stats['written'] += 1
+        self._trim()
+
+    def _trim(self):
+        first = min(self.cursors.itervalues()) if self.cursors else self.end()
+        while self.first < first:
+            self.packets.popleft()
+            self.first += 1
+        self.released = max(self.released, self.first)
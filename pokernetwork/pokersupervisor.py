@@ -0,0 +1,197 @@
+#
+# -*- py-indent-offset: 4; coding: utf-8; mode: python -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Supervisor mode of pokerserver: the process reading the configuration
+# becomes a front that accepts the client connections and forks N worker
+# processes, each of them a regular PokerService registered as a resthost
+# listening on a local Unix socket. Tables and tourney schedules are
+# sharded among the workers and packets are routed to the owning worker
+# with the same route/resthost mechanism used by separate deployments.
+#
+#   <supervisor workers="4" socket_dir="/var/run/poker-network"/>
+#
+# workers defaults to the number of cores. The workers are given the
+# resthost serials following the serial of the front unless the serial
+# attribute sets the first one. The workers authenticate the sessions of
+# the front with memcached, which is required.
+#
+# The supervisor is started before the PokerService of the front so that
+# the shards are assigned before the front restores the tourneys and
+# updates the schedules.
+#
+import sys
+import os
+import libxml2
+from contextlib import closing
+from multiprocessing import cpu_count
+
+from twisted.application import service
+from twisted.internet import reactor, protocol, defer, error
+
+from pokernetwork.server import PokerServerProtocol
+from pokernetwork.protocol import ServerMsgpackProtocol
+from pokernetwork.pokerrestclient import UNIX_PREFIX
+from pokernetwork.pokerdatabase import PokerDatabase
+
+from pokernetwork import log as network_log
+log = network_log.get_child('pokersupervisor')
+
+WORKER_RESPAWN_DELAY = 1
+
+class PokerRouterServerProtocol(PokerServerProtocol):
+
+    def handleAvatarPacket(self, packet):
+        return self.avatar.handleRoutedPacket(packet)
+
+class PokerRouterMsgpackProtocol(ServerMsgpackProtocol):
+
+    def handleAvatarPacket(self, packet):
+        return self.avatar.handleRoutedPacket(packet)
+
+class PokerWorkerProcess(protocol.ProcessProtocol):
+
+    log = log.get_child('PokerWorkerProcess')
+
+    def __init__(self, supervisor, index):
+        self.supervisor = supervisor
+        self.index = index
+        self.ended = defer.Deferred()
+
+    def outReceived(self, data):
+        self.log.inform("worker %d: %s", self.index, data.rstrip())
+
+    def errReceived(self, data):
+        self.log.warn("worker %d: %s", self.index, data.rstrip())
+
+    def processEnded(self, reason):
+        self.supervisor.workerEnded(self, reason)
+        self.ended.callback(self)
+
+class PokerSupervisor(service.Service):
+
+    log = log.get_child('PokerSupervisor')
+
+    def __init__(self, settings, configuration):
+        self.settings = settings
+        self.configuration = configuration
+        properties = settings.headerGetProperties("/server/supervisor")[0]
+        self.workers_count = int(properties.get('workers', 0)) or cpu_count()
+        self.socket_dir = properties.get('socket_dir', '/var/run/poker-network')
+        resthost = settings.headerGetProperties("/server/resthost")
+        if not resthost or 'serial' not in resthost[0]:
+            self.log.crit('supervisor requires a resthost with a serial')
+            raise Exception('supervisor requires a resthost with a serial')
+        self.resthost = resthost[0]
+        self.serial_first = int(properties.get('serial', int(self.resthost['serial']) + 1))
+        if not settings.headerGet("/server/@memcached"):
+            self.log.crit('supervisor requires memcached to share the sessions of the front with the workers')
+            raise Exception('supervisor requires memcached')
+        self.workers = {}
+
+    def workerSerial(self, index):
+        return self.serial_first + index
+
+    def workerSocket(self, index):
+        return os.path.join(self.socket_dir, 'poker.worker%d.sock' % index)
+
+    def workerConfiguration(self, index):
+        """Write the configuration of the worker and return its path. It is
+        the configuration of the front listening on a Unix socket only and
+        registered as its own resthost."""
+        doc = libxml2.parseFile(self.configuration)
+        try:
+            header = doc.xpathNewContext()
+            for node in header.xpathEval("/server/supervisor"):
+                node.unlinkNode()
+                node.freeNode()
+            for node in header.xpathEval("/server/listen"):
+                for attribute in ('tcp', 'tcp_ssl', 'msgpack', 'rest', 'rest_ssl', 'manhole', 'pub'):
+                    node.unsetProp(attribute)
+                node.setProp('rest_unix', self.workerSocket(index))
+            for node in header.xpathEval("/server/resthost"):
+                node.setProp('serial', str(self.workerSerial(index)))
+                node.setProp('name', '%s-worker%d' % (self.resthost.get('name', ''), index))
+                node.setProp('host', UNIX_PREFIX + self.workerSocket(index))
+                node.setProp('port', '0')
+            path = os.path.join(self.socket_dir, 'poker.worker%d.xml' % index)
+            doc.saveFile(path)
+            header.xpathFreeContext()
+        finally:
+            doc.freeDoc()
+        return path
+
+    def assignShards(self):
+        """Spread the cash tables and the tourney schedules of the front
+        and of the workers among the workers, by serial. It runs before
+        the front service is started and has its own connection."""
+        serials = [int(self.resthost['serial'])] + [self.workerSerial(i) for i in xrange(self.workers_count)]
+        where = "resthost_serial IN (%s)" % ", ".join(str(serial) for serial in serials)
+        db = PokerDatabase(self.settings)
+        try:
+            with closing(db.cursor()) as c:
+                c.execute(
+                    "UPDATE tables SET resthost_serial = %s + (serial %% %s) WHERE tourney_serial IS NULL AND " + where,
+                    (self.serial_first, self.workers_count)
+                )
+                c.execute(
+                    "UPDATE tourneys_schedule SET resthost_serial = %s + (serial %% %s) WHERE " + where,
+                    (self.serial_first, self.workers_count)
+                )
+        finally:
+            db.close()
+
+    def spawnWorker(self, index):
+        if not self.running:
+            return
+        path = self.workerConfiguration(index)
+        worker = PokerWorkerProcess(self, index)
+        reactor.spawnProcess(
+            worker, sys.executable,
+            [sys.executable, '-m', 'pokernetwork.pokerserver', path],
+            env=os.environ.copy()
+        )
+        self.workers[index] = worker
+        self.log.inform("spawned worker %d (resthost %d) on %s", index, self.workerSerial(index), self.workerSocket(index))
+
+    def workerEnded(self, worker, reason):
+        if self.workers.get(worker.index) is not worker:
+            return
+        del self.workers[worker.index]
+        if self.running:
+            self.log.error("worker %d ended unexpectedly: %s", worker.index, reason.getErrorMessage())
+            reactor.callLater(WORKER_RESPAWN_DELAY, self.spawnWorker, worker.index)
+
+    def startService(self):
+        service.Service.startService(self)
+        if not os.path.isdir(self.socket_dir):
+            os.makedirs(self.socket_dir)
+        self.assignShards()
+        for index in xrange(self.workers_count):
+            self.spawnWorker(index)
+
+    def stopService(self):
+        service.Service.stopService(self)
+        deferreds = []
+        for worker in self.workers.values():
+            try:
+                worker.transport.signalProcess('TERM')
+            except error.ProcessExitedAlready:
+                continue
+            deferreds.append(worker.ended)
+        return defer.DeferredList(deferreds)
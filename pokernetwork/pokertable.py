@@ -38,12 +38,15 @@ from pokerpackets.packets import *
 from pokerpackets.networkpackets import *
 from pokernetwork.lockcheck import LockCheck
 
-from pokernetwork import pokeravatar
-from pokernetwork.pokerpacketizer import createCache, history2packets, private2public
+from pokernetwork import pokeravatar, pokerdefinitions
+from pokernetwork.pokerpacketizer import createCache, history2packets, compactReplay, snapshotReplay, private2public
+from pokernetwork.pokerspectators import SpectatorStream
 
 from pokernetwork import log as network_log
 log = network_log.get_child('pokertable')
 
+GAME_URL = "poker.%s.xml"
+
 class PokerAvatarCollection:
 
     log = log.get_child('PokerAvatarCollection')
@@ -123,23 +126,21 @@ class PokerTable:
             ('Hand', self, lambda table: table.game.hand_serial if table.game.hand_serial > 1 else None)
         ])
         self.factory = factory
-        settings = self.factory.settings
-        self.game = PokerGameServer("poker.%s.xml", factory.dirs)
+        server_settings = self.factory.settings.serverSettings()
+        self.game = PokerGameServer(GAME_URL, factory.dirs)
         self.game.prefix = "[Server]"
         self.history_index = 0
-        predefined_decks = settings.headerGetList("/server/decks/deck")
-        if predefined_decks:
+        if server_settings.decks:
             self.game.shuffler = PokerPredefinedDecks(map(
-                lambda deck: self.game.eval.string2card(deck.split()),
-                predefined_decks
+                self.game.eval.string2card,
+                server_settings.decks
             ))
         self.observers = []
         self.waiting = []
         self.rebuy_stack =[]
         self.game.id = id
         self.game.name = description["name"]
-        self.game.setVariant(description["variant"])
-        self.game.setBettingStructure(description["betting_structure"])
+        pokerdefinitions.setup(self.game, GAME_URL, factory.dirs, description["variant"], description["betting_structure"])
         self.game.setMaxPlayers(int(description["seats"]))
         self.game.forced_dealer_seat = int(description.get("forced_dealer_seat", -1))
         self.skin = description.get("skin") or "default"
@@ -153,10 +154,16 @@ class PokerTable:
         # overrides the server-wide default
         self.max_missed_round = int(description.get("max_missed_round",factory.getMissedRoundMax()))
 
-        self.delays = settings.headerGetProperties("/server/delays")[0]
-        self.autodeal = settings.headerGet("/server/@autodeal") == "yes"
-        self.autodeal_temporary = settings.headerGet("/server/users/@autodeal_temporary") == 'yes'
+        self.server_settings = server_settings
+        self.delays = server_settings.delays
+        self.autodeal = server_settings.autodeal
+        self.autodeal_temporary = server_settings.autodeal_temporary
+        self.spectators = SpectatorStream(server_settings) if server_settings.spectators else None
+        self.join_snapshot = server_settings.join_snapshot
         self.cache = createCache()
+        self.hand_replay = None
+        self.ladder = {}
+        self.ladder_hand_serial = None
         self.owner = 0
         self.avatar_collection = PokerAvatarCollection("Table%d" % id)
         self.timer_info = {
@@ -209,6 +216,8 @@ class PokerTable:
         #
         # broadcast TableDestroy to connected avatars
         self.broadcast(PacketPokerTableDestroy(game_id=self.game.id))
+        if self.spectators is not None:
+            self.spectators.close()
         #
         # remove table from avatars
         for avatars in self.avatar_collection.itervalues():
@@ -236,6 +245,40 @@ class PokerTable:
         avatars = self.avatar_collection.get(serial)
         return avatars[0].getPlayerInfo() if avatars and avatars[0].user.isLogged() else self.factory.getPlayerInfo(serial)
 
+    def getLadder(self, serial):
+        """Returns the ladder packet of serial, read once per hand"""
+        if self.ladder_hand_serial != self.game.hand_serial:
+            self.ladder_hand_serial = self.game.hand_serial
+            self.ladder = {}
+        packet = self.ladder.get(serial)
+        if packet is None:
+            packet = self.ladder[serial] = self.factory.getLadder(self.game.id, self.currency_serial, serial)
+        return packet
+
+    def getHandReplay(self):
+        """Returns the packets that replay the current hand to an avatar
+        joining the table. They are computed once per step of the hand,
+        the avatars joining during the same step share them."""
+        history = self.game.historyGet()
+        key = (self.game.hand_serial, len(history))
+        last = history[-1] if history else None
+        replay = self.hand_replay
+        if replay is None or replay[0] != key or replay[1] is not last:
+            packets, _previous_dealer, errors = history2packets(history, self.game.id, -1, createCache())
+            for error in errors: self.log.error("%s", error)
+            replay = self.hand_replay = [key, last, compactReplay(packets), None]
+        return replay[2]
+
+    def getHandSnapshot(self):
+        """Returns the packets that give the state of the current hand to
+        an avatar joining the table, without the actions of the players
+        (see snapshotReplay). They are shared like getHandReplay."""
+        packets = self.getHandReplay()
+        replay = self.hand_replay
+        if replay[3] is None:
+            replay[3] = snapshotReplay(packets, self.game)
+        return replay[3]
+
     def listPlayers(self):
         """Returns a list of names of all Players in game"""
         return [
@@ -432,6 +475,7 @@ class PokerTable:
         """Broadcast a list of packets to all connected avatars on this table."""
         if type(packets) is not list:
             packets = [packets]
+        spectators = self.spectators
         for packet in packets:
             keys = self.game.serial2player.keys()
             self.log.debug("broadcast%s %s ", keys, packet)
@@ -439,8 +483,11 @@ class PokerTable:
                 # player may be in game but disconnected.
                 for avatar in self.avatar_collection.get(serial):
                     avatar.sendPacket(private2public(packet, serial))
-            for avatar in self.observers:
-                avatar.sendPacket(private2public(packet, 0))
+            if spectators is None:
+                for avatar in self.observers:
+                    avatar.sendPacket(private2public(packet, 0))
+            elif spectators:
+                spectators.publish(private2public(packet, 0))
 
         self.factory.eventTable(self)
 
@@ -640,10 +687,10 @@ class PokerTable:
             if event_type == "game":
                 self.game_delay = {
                     "start": seconds(),
-                    "delay": float(self.delays["autodeal"])
+                    "delay": self.delays["autodeal"]
                 }
             elif event_type in ('round', 'position', 'showdown', 'finish'):
-                self.game_delay["delay"] += float(self.delays[event_type])
+                self.game_delay["delay"] += self.delays[event_type]
             elif event_type == "leave":
                 quitters = event[1]
                 for serial, _seat in quitters:
@@ -695,6 +742,13 @@ class PokerTable:
                         self.log.inform("Player %d missed timeframe for PokerReadyToPlay", player.serial, refs=[('User', player, lambda p: p.serial)])
         
         if self.shouldAutoDeal():
+            if self.factory.handWriterCongested():
+                #
+                # do not add hands while the previous ones are not saved
+                #
+                self.log.debug("hand history writer congested, autodeal for %d delayed", self.game.id)
+                self.timer_info["dealTimeout"] = reactor.callLater(self.server_settings.autodeal_check, self.autoDeal)
+                return
             self.beginTurn()
             self.update()
 
@@ -789,17 +843,16 @@ class PokerTable:
         delay = self.game_delay["delay"]
         if not self.allReadyToPlay() and delay > 0:
             delta = (self.game_delay["start"] + delay) - seconds()
-            autodeal_max = float(self.delays.get("autodeal_max", 120))
-            delta = min(autodeal_max, max(0, delta))
+            delta = min(self.server_settings.autodeal_max, max(0, delta))
             self.game_delay["delay"] = (seconds() - self.game_delay["start"]) + delta
         elif self.transient:
-            delta = int(self.delays.get("autodeal_tournament_min", 15))
+            delta = self.server_settings.autodeal_tournament_min
             if seconds() - self.game_delay["start"] > delta:
                 delta = 0
         else:
             delta = 0
         self.log.debug("AutodealCheck scheduled in %f seconds", delta)
-        autodeal_check = max(0.01, float(self.delays.get("autodeal_check", 15)))
+        autodeal_check = self.server_settings.autodeal_check
         self.timer_info["dealTimeout"] = reactor.callLater(min(autodeal_check, delta), self.autoDealCheck, autodeal_check, delta)
         return True
 
@@ -899,8 +952,7 @@ class PokerTable:
             ))
         self.game.reset()
         self.game.name = "*REPLAY*"
-        self.game.setVariant(variant)
-        self.game.setBettingStructure(betting_structure)
+        pokerdefinitions.setup(self.game, GAME_URL, self.factory.dirs, variant, betting_structure)
         self.game.setTime(time)
         self.game.setHandsCount(hands_count)
         self.game.setLevel(level)
@@ -945,12 +997,26 @@ class PokerTable:
     def isStationary(self):
         return self.game.isEndOrNull() and 'dealTimeout' not in self.timer_info
 
+    def addObserver(self, avatar):
+        self.observers.append(avatar)
+        if self.spectators is not None:
+            self.spectators.add(avatar)
+
+    def removeObserver(self, avatar, flush=False):
+        self.observers.remove(avatar)
+        if self.spectators is not None:
+            self.spectators.remove(avatar, flush)
+
     def seated2observer(self, avatar):
         self.avatar_collection.remove(avatar)
-        self.observers.append(avatar)
+        self.addObserver(avatar)
 
     def observer2seated(self, avatar):
-        self.observers.remove(avatar)
+        #
+        # the packets the spectator stream did not send yet are sent
+        # before the packets sent to the seated avatar
+        #
+        self.removeObserver(avatar, flush=True)
         self.avatar_collection.add(avatar)
 
     def quitPlayer(self, avatar):
@@ -1082,7 +1148,7 @@ class PokerTable:
 
         other_table = self.factory.getTable(to_game_id)
         for avatar in avatars:
-            other_table.observers.append(avatar)
+            other_table.addObserver(avatar)
             other_table.observer2seated(avatar)
 
         money_check = self.factory.movePlayer(serial, self.game.id, to_game_id)
@@ -1129,7 +1195,7 @@ class PokerTable:
                 game_id = self.game.id,
             ))
         if self.factory.has_ladder:
-            packet = self.factory.getLadder(self.game.id, self.currency_serial, player.serial)
+            packet = self.getLadder(player.serial)
             if packet.type == PACKET_POKER_PLAYER_STATS:
                 packets.append(packet)
         packets.append(PacketPokerSeats(game_id = self.game.id, seats = self.game.seats()))
@@ -1229,7 +1295,7 @@ class PokerTable:
         # at the table.
         self.factory.joinedCountIncrease()
         if not self.game.isSeated(avatar.getSerial()):
-            self.observers.append(avatar)
+            self.addObserver(avatar)
         else:
             self.avatar_collection.add(avatar)
         #
@@ -1314,6 +1380,14 @@ class PokerTable:
         if not self.isJoined(avatar):
             self.log.error("player %d can't chat before joining", serial, refs=[('User', serial, int)])
             return False
+        if not self.factory.chatAllowed(self.game.id, serial):
+            avatar.sendPacketVerbose(PacketPokerError(
+                game_id = self.game.id,
+                serial = serial,
+                other_type = PACKET_POKER_CHAT,
+                message = "Too many chat messages, wait a little."
+            ))
+            return False
         message = self.chatFilter(message)
         self.broadcast(PacketPokerChat(
             game_id = self.game.id,
@@ -1384,7 +1458,7 @@ class PokerTable:
     def destroyPlayer(self, avatar):
         self.factory.joinedCountDecrease()
         if avatar in self.observers:
-            self.observers.remove(avatar)
+            self.removeObserver(avatar)
         else:
             self.avatar_collection.remove(avatar)
         del avatar.tables[self.game.id]
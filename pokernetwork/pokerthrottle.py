@@ -0,0 +1,168 @@
+#
+# -*- py-indent-offset: 4; coding: utf-8; mode: python -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Rate of the packets sent by each client, enabled by
+# <server throttle="yes">:
+#
+#   <throttle rate="20" burst="60" chat="4" lobby="5" action="1" other="1"/>
+#
+# Each connection has its own bucket, each session for REST.
+#
+from twisted.python.runtime import seconds
+
+from pokerpackets.packets import PACKET_PING, PacketError
+from pokerpackets.networkpackets import *
+
+from pokernetwork import log as network_log
+log = network_log.get_child('pokerthrottle')
+
+#
+# code of the PacketError answering a packet that is not allowed: the
+# HTTP status for too many requests, out of the range of the codes of the
+# packets
+#
+THROTTLED = 429
+
+#
+# The cost classes of the packets. The packets that are not listed cost
+# other.
+#
+COST_FREE = 'free'
+COST_CHAT = 'chat'
+COST_LOBBY = 'lobby'
+COST_ACTION = 'action'
+COST_OTHER = 'other'
+
+COST_CLASSES = {
+    COST_FREE: (
+        PACKET_PING,
+        PACKET_POKER_LONG_POLL,
+        PACKET_POKER_LONG_POLL_RETURN,
+    ),
+    COST_CHAT: (
+        PACKET_POKER_CHAT,
+    ),
+    COST_LOBBY: (
+        PACKET_POKER_TABLE_SELECT,
+        PACKET_POKER_TOURNEY_SELECT,
+        PACKET_POKER_TABLE_REQUEST_PLAYERS_LIST,
+        PACKET_POKER_TOURNEY_REQUEST_PLAYERS_LIST,
+        PACKET_POKER_TABLE_PICKER,
+        PACKET_POKER_HAND_SELECT,
+        PACKET_POKER_HAND_SELECT_ALL,
+        PACKET_POKER_HAND_HISTORY,
+        PACKET_POKER_HAND_REPLAY,
+        PACKET_POKER_GET_PLAYER_INFO,
+        PACKET_POKER_GET_USER_INFO,
+        PACKET_POKER_GET_PERSONAL_INFO,
+        PACKET_POKER_GET_PLAYER_PLACES,
+        PACKET_POKER_GET_TOURNEY_MANAGER,
+        PACKET_POKER_GET_TOURNEY_PLAYER_STATS,
+        PACKET_POKER_STATS_QUERY,
+    ),
+    COST_ACTION: (
+        PACKET_POKER_FOLD,
+        PACKET_POKER_CALL,
+        PACKET_POKER_RAISE,
+        PACKET_POKER_CHECK,
+        PACKET_POKER_BLIND,
+        PACKET_POKER_ANTE,
+        PACKET_POKER_SIT,
+        PACKET_POKER_SIT_OUT,
+        PACKET_POKER_WAIT_BIG_BLIND,
+        PACKET_POKER_MUCK_ACCEPT,
+        PACKET_POKER_MUCK_DENY,
+        PACKET_POKER_READY_TO_PLAY,
+        PACKET_POKER_PROCESSING_HAND,
+    ),
+}
+
+DEFAULT_COSTS = {
+    COST_FREE: 0,
+    COST_CHAT: 4,
+    COST_LOBBY: 5,
+    COST_ACTION: 1,
+    COST_OTHER: 1,
+}
+
+class ThrottlePolicy:
+    """The cost of each packet type, in tokens, and the size and refill rate
+    of the bucket of tokens of each connection."""
+
+    def __init__(self, settings):
+        properties = settings.headerGetProperties("/server/throttle")
+        properties = properties[0] if properties else {}
+        self.rate = float(properties.get('rate', 20))
+        self.burst = max(1.0, float(properties.get('burst', 60)))
+        self.default_cost = float(properties.get(COST_OTHER, DEFAULT_COSTS[COST_OTHER]))
+        self.costs = {}
+        for cost_class, packet_types in COST_CLASSES.iteritems():
+            if cost_class == COST_FREE:
+                cost = 0.0
+            else:
+                cost = float(properties.get(cost_class, DEFAULT_COSTS[cost_class]))
+            for packet_type in packet_types:
+                self.costs[packet_type] = cost
+
+    def cost(self, packet_type):
+        return self.costs.get(packet_type, self.default_cost)
+
+    def createThrottle(self):
+        return PacketThrottle(self)
+
+class PacketThrottle:
+    """Token bucket of a client: it holds at most burst tokens, refilled at
+    rate tokens per second, and a packet is allowed if the bucket has
+    enough tokens to pay for it."""
+
+    log = log.get_child('PacketThrottle')
+
+    def __init__(self, policy):
+        self.policy = policy
+        self.tokens = policy.burst
+        self.last = seconds()
+        self.rejected = 0
+
+    def allow(self, packet_type, now=None):
+        cost = self.policy.cost(packet_type)
+        if cost <= 0:
+            return True
+        if now is None:
+            now = seconds()
+        policy = self.policy
+        self.tokens = min(policy.burst, self.tokens + (now - self.last) * policy.rate)
+        self.last = now
+        if self.tokens < cost:
+            self.rejected += 1
+            return False
+        self.tokens -= cost
+        return True
+
+    def check(self, packet):
+        """Return the PacketError answering packet if it is not allowed,
+        None if it can be handled."""
+        if self.allow(packet.type):
+            return None
+        if self.rejected == 1:
+            self.log.warn("a client sends packets faster than allowed, packet type %s rejected", packet.type)
+        return PacketError(
+            other_type = packet.type,
+            code = THROTTLED,
+            message = "too many packets, try again later"
+        )
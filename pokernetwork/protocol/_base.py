@@ -1,11 +1,51 @@
 
 from twisted.internet.protocol import Protocol
 from twisted.internet.error import ConnectionDone
-from twisted.internet.task import LoopingCall
-from twisted.internet import defer
+from twisted.internet import defer, reactor
+from twisted.python.runtime import seconds
 
 from pokerpackets.packets import PacketPing
 
+class KeepaliveSweeper:
+    """Send a PacketPing to the connections that did not write anything
+    for their keepalive interval. A single timer checks all the connections
+    every resolution seconds, a write only records the time. interval is
+    the keepalive interval of the connections that did not set their own.
+    The connections are only pinged when it is not 0, which is not the
+    default: <server keepalive="10"/> sets it for a server."""
+
+    resolution = 1
+    interval = 0
+
+    def __init__(self):
+        self.protocols = set()
+        self.timer = None
+
+    def add(self, protocol):
+        self.protocols.add(protocol)
+        if self.timer is None:
+            self.timer = reactor.callLater(self.resolution, self.sweep)
+
+    def remove(self, protocol):
+        self.protocols.discard(protocol)
+        if not self.protocols and self.timer is not None:
+            if self.timer.active():
+                self.timer.cancel()
+            self.timer = None
+
+    def sweep(self):
+        self.timer = None
+        now = seconds()
+        #
+        # sending a ping may lose the connection and remove it
+        #
+        for protocol in list(self.protocols):
+            protocol._keepalive_sweep(now)
+        if self.protocols and self.timer is None:
+            self.timer = reactor.callLater(self.resolution, self.sweep)
+
+keepalive_sweeper = KeepaliveSweeper()
+
 class BaseProtocol(Protocol):
 
     def __init__(self):
@@ -14,8 +54,14 @@ class BaseProtocol(Protocol):
         self.d_established = defer.Deferred()
         self.d_connection_lost = defer.Deferred()
 
-        self.__lc_keepalive = LoopingCall(self._keepalive)
-        self.__keepalive_interval = 10
+        # PacketMetrics of the server, if it records them
+        self.metrics = None
+
+        # PacketThrottle of the connection, if the server throttles the clients
+        self.throttle = None
+
+        self.__keepalive_interval = None
+        self._keepalive_last = 0
 
     def connectionMade(self):
         self._keepalive_start()
@@ -32,23 +78,35 @@ class BaseProtocol(Protocol):
 
     def keepalive_set_interval(self, interval):
         self.__keepalive_interval = interval
-        if self.__lc_keepalive.running:
-            self._keepalive_start()
 
     def _keepalive_start(self):
         self._keepalive_reset()
+        if keepalive_sweeper.interval > 0:
+            keepalive_sweeper.add(self)
 
     def _keepalive_stop(self):
-        if self.__lc_keepalive.running:
-            self.__lc_keepalive.stop()
+        keepalive_sweeper.remove(self)
 
     def _keepalive_reset(self):
-        if self.__lc_keepalive.running:
-            self.__lc_keepalive.stop()
-            self.__lc_keepalive.start(self.__keepalive_interval, False)
+        self._keepalive_last = seconds()
+
+    def _keepalive_sweep(self, now):
+        if now - self._keepalive_last >= (self.__keepalive_interval or keepalive_sweeper.interval):
+            self._keepalive_last = now
+            self._keepalive()
 
     def _keepalive(self):
         self.sendPacket(PacketPing(), False)
 
+    def setThrottlePolicy(self, policy):
+        self.throttle = policy.createThrottle() if policy else None
+
+    def throttled(self, packet):
+        """Return the PacketError answering a packet received faster than
+        the throttle of the connection allows, None if it can be handled."""
+        if self.throttle is None:
+            return None
+        return self.throttle.check(packet)
+
     def packetReceived(self, packet):
         raise NotImplementedError('packetReceived has to be implemented by sub protocol (eg. client or server)')
@@ -32,6 +32,9 @@ class UGAMEProtocol(BaseProtocol):
         if self._ignore_incoming:
             return
 
+        if self.metrics:
+            self.metrics.recordIn(len(data))
+
         self._data += data
 
         while self._data:
@@ -94,15 +97,29 @@ class UGAMEProtocol(BaseProtocol):
     def protocolInvalid(self, local, remote):
         pass
 
+    def packetsEncoding(self):
+        """The protocols with the same encoding write the same bytes for a
+        packet. None as long as the packets are buffered."""
+        return 'binary' if self.established else None
+
+    def encodePacket(self, packet):
+        return binarypack.pack(packet)
+
+    def _pack(self, packet):
+        data = self.encodePacket(packet)
+        if self.metrics:
+            self.metrics.recordOut(packet.type, len(data))
+        return data
+
     def sendPackets(self, packets, reset_keepalive=True):
         if self.established:
-            self.dataWrite(''.join([binarypack.pack(packet) for packet in packets]))
+            self.dataWrite(''.join([self._pack(packet) for packet in packets]))
         else:
             self._out_buffer.extend(packets)
 
     def sendPacket(self, packet, reset_keepalive=True):
         if self.established:
-            self.dataWrite(binarypack.pack(packet), reset_keepalive)
+            self.dataWrite(self._pack(packet), reset_keepalive)
         else:
             self._out_buffer.append(packet)
 
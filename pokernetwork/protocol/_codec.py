@@ -0,0 +1,83 @@
+from pokernetwork.protocol import log as protocol_log
+log = protocol_log.get_child('codec')
+
+from itertools import izip
+
+from pokerpackets.packets import type_id2type, PacketPing
+from pokerpackets.dictpack import pack
+from pokerpackets.networkpackets import PacketPokerPlayerChips, PacketPokerPosition, \
+     PacketPokerCall, PacketPokerCheck, PacketPokerFold, PacketPokerRaise, \
+     PacketPokerSit, PacketPokerSitOut, PacketPokerTimeoutWarning, PacketPokerChat
+
+#
+# Compact msgpack frames: [-type_id, value, value, ...] with the values of
+# the fields declared below for the packet type, in that order. The other
+# packet types, those with a field whose value is not a scalar or is
+# converted by dictpack, are sent as [-type_id, dict] instead. The fields
+# are the keyword arguments of the constructor of the packet type.
+#
+COMPACT_FIELDS = {
+    PacketPing: (),
+    PacketPokerPlayerChips: ('game_id', 'serial', 'money', 'bet'),
+    PacketPokerPosition: ('game_id', 'serial', 'position'),
+    PacketPokerCall: ('game_id', 'serial'),
+    PacketPokerCheck: ('game_id', 'serial'),
+    PacketPokerFold: ('game_id', 'serial'),
+    PacketPokerRaise: ('game_id', 'serial', 'amount'),
+    PacketPokerSit: ('game_id', 'serial'),
+    PacketPokerSitOut: ('game_id', 'serial'),
+    PacketPokerTimeoutWarning: ('game_id', 'serial', 'timeout', 'when'),
+    PacketPokerChat: ('game_id', 'serial', 'message'),
+}
+
+_SCALARS = (int, long, float, str, unicode, bool, type(None))
+
+class PacketSchema(object):
+
+    __slots__ = ('packet_type', 'type_id', 'fields')
+
+    log = log.get_child('PacketSchema')
+
+    def __init__(self, packet_type):
+        self.packet_type = packet_type
+        self.type_id = packet_type.type
+        self.fields = COMPACT_FIELDS.get(packet_type)
+        if self.fields is not None and not self.check():
+            self.log.warn("%s does not have the fields %s, sent as a dict", packet_type.__name__, self.fields)
+            self.fields = None
+
+    def check(self):
+        """True if dictpack gives the declared fields of a packet of this
+        type, unchanged."""
+        instance = self.packet_type()
+        p_dict = pack(instance, True)
+        del p_dict['type']
+        return set(p_dict) == set(self.fields) and all(
+            isinstance(p_dict[field], _SCALARS) and p_dict[field] == getattr(instance, field)
+            for field in self.fields
+        )
+
+_schemas = {}
+
+def schema(packet_type):
+    packet_schema = _schemas.get(packet_type)
+    if packet_schema is None:
+        packet_schema = _schemas[packet_type] = PacketSchema(packet_type)
+    return packet_schema
+
+def encode(packet):
+    packet_schema = schema(packet.__class__)
+    if packet_schema.fields is not None:
+        frame = [-packet_schema.type_id]
+        frame.extend([getattr(packet, field) for field in packet_schema.fields])
+        return frame
+    p_dict = pack(packet, True)
+    del p_dict['type']
+    return [-packet_schema.type_id, p_dict]
+
+def decode(frame):
+    packet_type = type_id2type[-frame[0]]
+    packet_schema = schema(packet_type)
+    if packet_schema.fields is not None and len(frame) == len(packet_schema.fields) + 1:
+        return packet_type(**dict(izip(packet_schema.fields, frame[1:])))
+    return packet_type(**frame[1])
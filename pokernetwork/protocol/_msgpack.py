@@ -10,47 +10,89 @@ from pokernetwork.util.trace import format_exc
 import msgpack as _msgpack
 
 from pokernetwork.protocol._base import BaseProtocol
+from pokernetwork.protocol import _codec
 
 class MsgpackProtocol(BaseProtocol):
+    """Packets are sent as [type, dict] frames, with a numeric or a named
+    type, the same as the last packet received. A client that sets compact
+    sends [-type_id, value, ...] frames (see _codec) and the server answers
+    with compact frames after receiving the first one."""
 
     log = log.get_child('MsgpackProtocol')
 
+    compact = False
+
     def __init__(self):
         BaseProtocol.__init__(self)
 
         self._numeric_type = True
+        self._compact = self.compact
         self._unpacker = _msgpack.Unpacker()
         self._packer = _msgpack.Packer()
+        self._stream_packer = _msgpack.Packer(autoreset=False)
 
     def dataReceived(self, data):
+        if self.metrics:
+            self.metrics.recordIn(len(data))
         self._unpacker.feed(data)
 
-        for p_type_id, p_dict in self._unpacker:
+        for frame in self._unpacker:
+            p_type_id = frame[0]
             if isinstance(p_type_id, int):
-                self._numeric_type = True
-                self.packetReceived(type_id2type[p_type_id](**p_dict))
+                if p_type_id < 0:
+                    self._compact = True
+                    self.packetReceived(_codec.decode(frame))
+                else:
+                    self._numeric_type = True
+                    self.packetReceived(type_id2type[p_type_id](**frame[1]))
             elif isinstance(p_type_id, basestring):
                 self._numeric_type = False
-                self.packetReceived(name2type[p_type_id](**p_dict))
+                self.packetReceived(name2type[p_type_id](**frame[1]))
 
     def dataWrite(self, data, reset_keepalive=True):
         if reset_keepalive:
             self._keepalive_reset()
         self.transport.write(data)
 
+    def _frame(self, packet):
+        if self._compact:
+            return _codec.encode(packet)
+        p_dict = pack(packet, self._numeric_type)
+        p_type = p_dict.pop('type')
+        return [p_type, p_dict]
+
+    def packetsEncoding(self):
+        """The protocols with the same encoding write the same bytes for a
+        packet."""
+        return ('msgpack', self._compact, self._numeric_type)
+
+    def encodePacket(self, packet):
+        return self._packer.pack(self._frame(packet))
+
+    def _pack(self, packet):
+        data = self.encodePacket(packet)
+        if self.metrics:
+            self.metrics.recordOut(packet.type, len(data))
+        return data
+
     def _pack_packets(self, packets):
+        if self.metrics:
+            return "".join([self._pack(packet) for packet in packets])
+        #
+        # the frames are appended to the buffer of the packer, copied once
+        #
+        packer = self._stream_packer
         for packet in packets:
-            p_dict = pack(packet, self._numeric_type)
-            p_type = p_dict.pop('type')
-            yield self._packer.pack([p_type, p_dict])
+            packer.pack(self._frame(packet))
+        data = packer.bytes()
+        packer.reset()
+        return data
 
     def sendPackets(self, packets):
-        self.dataWrite("".join(self._pack_packets(packets)))
+        self.dataWrite(self._pack_packets(packets))
 
     def sendPacket(self, packet, reset_keepalive=True):
-        p_dict = pack(packet, self._numeric_type)
-        p_type = p_dict.pop('type')
-        self.dataWrite(self._packer.pack([p_type, p_dict]), reset_keepalive)
+        self.dataWrite(self._pack(packet), reset_keepalive)
 
 
 class ServerMsgpackProtocol(MsgpackProtocol):
@@ -62,14 +104,23 @@ class ServerMsgpackProtocol(MsgpackProtocol):
     def packetReceived(self, packet):
         try:
             if self.avatar:
-                self.sendPackets(self.avatar.handlePacket(packet))
+                error = self.throttled(packet)
+                if error:
+                    self.sendPacket(error)
+                else:
+                    self.sendPackets(self.handleAvatarPacket(packet))
         except:
             self.log.error(format_exc())
             self.transport.loseConnection()
 
+    def handleAvatarPacket(self, packet):
+        return self.avatar.handlePacket(packet)
+
     def connectionMade(self):
         self.avatar = self.factory.createAvatar()
         self.avatar.setProtocol(self)
+        self.metrics = self.avatar.metrics
+        self.setThrottlePolicy(getattr(self.factory, 'throttle_policy', None))
         MsgpackProtocol.connectionMade(self)
 
     def connectionLost(self, reason):
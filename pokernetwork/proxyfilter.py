@@ -20,6 +20,7 @@
 from twisted.internet import defer, protocol, reactor, error
 from twisted.web import http
 
+from pokernetwork.pokerrestclient import connectResthost
 from pokernetwork import log as network_log
 log = network_log.get_child('proxyfilter')
 
@@ -124,6 +125,6 @@ def rest_filter(site, request, packet):
             request.method, path, request.clientproto,
             request.getAllHeaders(), request.content.read(), request,
             host + ':' + str(port) + path)
-        local_reactor.connectTCP(host, int(port), clientFactory)
+        connectResthost(host, port, clientFactory, local_reactor)
         return clientFactory.deferred
     return True
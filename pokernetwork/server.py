@@ -42,14 +42,23 @@ class PokerServerProtocol(UGAMEProtocol):
     def packetReceived(self, packet):
         try:
             if self.avatar:
-                self.sendPackets(self.avatar.handlePacket(packet))
+                error = self.throttled(packet)
+                if error:
+                    self.sendPacket(error)
+                else:
+                    self.sendPackets(self.handleAvatarPacket(packet))
         except:
             self.log.error(format_exc())
             self.transport.loseConnection()
 
+    def handleAvatarPacket(self, packet):
+        return self.avatar.handlePacket(packet)
+
     def protocolEstablished(self):
         self.avatar = self.factory.createAvatar()
         self.avatar.setProtocol(self)
+        self.metrics = self.avatar.metrics
+        self.setThrottlePolicy(getattr(self.factory, 'throttle_policy', None))
 
     def connectionLost(self, reason):
         if self.avatar:
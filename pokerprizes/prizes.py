@@ -25,7 +25,7 @@ from pokernetwork.pokernetworkconfig import Config
 
 class PokerPrizes:
     def __init__(self, service, settings_or_xml):
-        self.verbose = service.verbose
+        self.verbose = getattr(service, "verbose", 0)
         if type(settings_or_xml) is StringType:
             settings = Config([])
             settings.loadFromString(settings_or_xml)
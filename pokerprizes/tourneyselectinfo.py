@@ -18,11 +18,31 @@
 # along with this program in a file in the toplevel directory called
 # "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
 #
+from twisted.python.runtime import seconds
+
 from pokerprizes.prizes import PokerPrizes
 from pokernetwork.util.sql import TimingDictCursor as DictCursor
 from pokerpackets.networkpackets import PacketPokerTourneyInfo
 
 class Handle(PokerPrizes):
+    """The prizes of each tourneys schedule are kept for cache seconds
+    (an attribute of the settings, 60 by default) so that a lobby poll
+    only queries, with a single statement, the schedules that were not
+    seen recently. The expired schedules are removed at each poll, so
+    that the schedules of past tourneys do not stay in memory."""
+
+    def __init__(self, service, settings_or_xml):
+        PokerPrizes.__init__(self, service, settings_or_xml)
+        self.cache_time = float(self.properties.get('cache', 60))
+        #
+        # schedule serial => (expiration time, list of the prize rows)
+        #
+        self.schedule2prizes = {}
+
+    def evict(self, now):
+        for serial, (expires, prizes) in self.schedule2prizes.items():
+            if expires <= now:
+                del self.schedule2prizes[serial]
 
     def __call__(self, service, packet, tourneys):
         info = PacketPokerTourneyInfo()
@@ -31,22 +51,27 @@ class Handle(PokerPrizes):
                 return tourney.schedule_serial
             else:
                 return tourney.serial
-        serials = map(schedule_serials, tourneys)
-        cursor = service.db.cursor(DictCursor)
-        serials_sql = ",".join(map(lambda serial: str(serial), set(serials)))
-        sql = "SELECT p.* FROM prizes AS p, tourneys_schedule2prizes AS t WHERE p.serial = t.prize_serial AND t.tourneys_schedule_serial IN ( %s ) GROUP BY p.serial" % serials_sql
-        if self.verbose >= 3:
-            self.message(sql)
-        cursor.execute(sql)
+        serials = set(map(schedule_serials, tourneys))
+        now = seconds()
+        self.evict(now)
+        missing = [serial for serial in serials if serial not in self.schedule2prizes]
+        if missing:
+            expires = now + self.cache_time
+            for serial in missing:
+                self.schedule2prizes[serial] = (expires, [])
+            cursor = service.db.cursor(DictCursor)
+            serials_sql = ",".join(map(lambda serial: str(serial), missing))
+            sql = "SELECT t.tourneys_schedule_serial AS schedule_serial, p.* FROM prizes AS p, tourneys_schedule2prizes AS t WHERE p.serial = t.prize_serial AND t.tourneys_schedule_serial IN ( %s )" % serials_sql
+            if self.verbose >= 3:
+                self.message(sql)
+            cursor.execute(sql)
+            for row in cursor.fetchall():
+                self.schedule2prizes[row.pop('schedule_serial')][1].append(row)
+            cursor.close()
         info.serial2prize = {}
-        for row in cursor.fetchall():
-            info.serial2prize[row['serial']] = row
-        sql = "SELECT * FROM tourneys_schedule2prizes WHERE tourneys_schedule_serial IN ( %s )" % serials_sql
-        if self.verbose >= 3:
-            self.message(sql)
-        cursor.execute(sql)
         info.tourneys_schedule2prizes = {}
-        for row in cursor.fetchall():
-            info.tourneys_schedule2prizes[row['tourneys_schedule_serial']] = row['prize_serial']
-        cursor.close()
+        for serial in serials:
+            for prize in self.schedule2prizes[serial][1]:
+                info.serial2prize[prize['serial']] = prize
+                info.tourneys_schedule2prizes[serial] = prize['serial']
         return info
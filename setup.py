@@ -19,7 +19,8 @@ class ExtendedBuild(DistutilsBuild):
 EXECUTABLES = [
     'database/pokerdatabaseupgrade',
     'pokernetwork/pokerserver',
-    'pokernetwork/pokerbot'
+    'pokernetwork/pokerbot',
+    'pokernetwork/pokerload'
 ]
 
 setup(
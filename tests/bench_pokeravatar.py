@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Cost of dispatching a packet in PokerAvatar.handlePacketLogic:
+#
+#   python tests/bench_pokeravatar.py [packets]
+#
+# The handlers are replaced with functions that do nothing so that only
+# the dispatch is measured, for packets handled early and late in the
+# order of the former if/elif chain. For comparison, "chain" is the cost
+# of the comparisons that chain made before reaching the packet.
+#
+import sys, time
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from pokerpackets.packets import *
+from pokerpackets.networkpackets import *
+
+from pokernetwork import pokeravatar
+from pokernetwork.pokeravatar import PokerAvatar, PACKET_HANDLERS
+
+class Service:
+    pass
+
+class Game:
+    id = 1
+
+class Table:
+    game = Game()
+    def update(self):
+        pass
+
+def nothing(*args):
+    pass
+
+def main(packets=100000):
+    avatar = PokerAvatar(Service())
+    avatar.log = type('Log', (), {'debug': nothing, 'inform': nothing})()
+    avatar.isAuthorized = lambda packet_type: True
+    table = Table()
+    avatar.packet2table = lambda packet: table
+    for kind, name in PACKET_HANDLERS.itervalues():
+        setattr(avatar, name, nothing)
+    #
+    # the methods are defined in the order of the former chain
+    #
+    chain = sorted(
+        PACKET_HANDLERS,
+        key = lambda packet_type: getattr(PokerAvatar, PACKET_HANDLERS[packet_type][1]).im_func.func_code.co_firstlineno
+    )
+    for packet in (
+        PacketPokerExplain(value = 0),
+        PacketPokerTableJoin(game_id = 1, serial = 1),
+        PacketPokerSit(game_id = 1, serial = 1),
+        PacketPokerFold(game_id = 1, serial = 1),
+        PacketPokerCall(game_id = 1, serial = 1),
+        PacketPokerCheck(game_id = 1, serial = 1),
+    ):
+        start = time.time()
+        for _ in xrange(packets):
+            avatar.handlePacketLogic(packet)
+        dispatch = time.time() - start
+        start = time.time()
+        for _ in xrange(packets):
+            for packet_type in chain:
+                if packet.type == packet_type:
+                    break
+        linear = time.time() - start
+        print "%-30s dispatch %6.3fus chain %6.3fus (%d comparisons)" % (
+            packet.__class__.__name__,
+            dispatch * 1000000 / packets,
+            linear * 1000000 / packets,
+            chain.index(packet.type) + 1
+        )
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Decisions per second of the bots, for each level:
+#
+#   python tests/bench_pokerboteval.py [decisions] [processes]
+#
+# "inline" is game.handEV in the reactor, as PokerBot.eval did, one
+# decision after the other. "evaluator" is BotEvaluator: all the decisions
+# are requested during the same reactor tick, as hundreds of bots in one
+# process would, and the time is measured until the last one is known. A
+# quarter of the decisions are made before the flop, the others on random
+# flops, turns and rivers, against 1 to 5 opponents. The evaluator starts
+# with an empty cache and without a preflop table unless
+# tests/preflop-equity.bin exists.
+#
+import sys, time, random
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from twisted.internet import reactor, defer
+
+from pokernetwork import pokernetworkconfig
+from pokernetwork.pokerbotlogic import LEVEL2ITERATIONS
+from pokernetwork.pokerboteval import BotEvaluator, evaluate
+
+class Cards:
+    def __init__(self, cards):
+        self.cards = cards
+    def tolist(self, visible):
+        return list(self.cards)
+
+class Player:
+    def __init__(self, pocket):
+        self.hand = Cards(pocket)
+
+class Game:
+    variant = 'holdem'
+    def __init__(self, pocket, board, opponents):
+        self.player = Player(pocket)
+        self.board = Cards(board)
+        self.opponents = opponents
+    def getPlayer(self, serial):
+        return self.player
+    def serialsNotFold(self):
+        return range(self.opponents + 1)
+    def handEV(self, serial, iterations):
+        return evaluate([(self.variant, self.player.hand.cards, self.board.cards, self.opponents, iterations)])[0][1]
+
+def games(count):
+    random.seed(1)
+    result = []
+    for _ in xrange(count):
+        board_size = random.choice((0, 3, 4, 5))
+        cards = random.sample(xrange(52), 2 + board_size)
+        result.append(Game(cards[:2], cards[2:], random.randint(1, 5)))
+    return result
+
+@defer.inlineCallbacks
+def bench(decisions, processes):
+    settings = pokernetworkconfig.Config([])
+    settings.loadFromString(
+        '<?xml version="1.0" encoding="UTF-8"?><settings><eval preflop="%s" processes="%d"/></settings>' %
+        (path.join(TESTS_PATH, "preflop-equity.bin"), processes)
+    )
+    deals = games(decisions)
+    for level in sorted(LEVEL2ITERATIONS):
+        if level == 0:
+            continue
+        iterations = LEVEL2ITERATIONS[level]
+        inline_count = max(1, min(decisions, 2000000 / iterations))
+        start = time.time()
+        for game in deals[:inline_count]:
+            game.handEV(0, iterations)
+        inline = inline_count / (time.time() - start)
+
+        evaluator = BotEvaluator(settings)
+        start = time.time()
+        yield defer.DeferredList([evaluator.handEV(game, 0, iterations) for game in deals])
+        first = decisions / (time.time() - start)
+        start = time.time()
+        yield defer.DeferredList([evaluator.handEV(game, 0, iterations) for game in deals])
+        cached = decisions / (time.time() - start)
+        evaluator.stop()
+        print "level %d (%6d iterations) inline %10.1f/s evaluator %10.1f/s cached %10.1f/s %s" % (
+            level, iterations, inline, first, cached, evaluator.stats
+        )
+
+def main(decisions=500, processes=2):
+    d = bench(decisions, processes)
+    d.addErrback(lambda reason: reason.printTraceback())
+    d.addBoth(lambda result: reactor.stop())
+    reactor.run()
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Throughput of the chat filter and of the chat archive with a 50k words
+# list:
+#
+#   python tests/bench_pokerchat.py [words] [messages]
+#
+# The filter is compared with the IGNORECASE alternation regular expression
+# it replaces. The archive is fed with a database that answers immediately,
+# it measures the cost of the writer and the number of statements sent.
+#
+import sys, re, random, string, time
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from twisted.internet import defer
+
+from pokernetwork import pokernetworkconfig
+from pokernetwork.pokerchat import ChatFilter, ChatArchive
+
+class ImmediateAsyncDatabase:
+    def __init__(self):
+        self.statements = 0
+    def runOperation(self, sql, args):
+        self.statements += 1
+        return defer.succeed(None)
+
+def words(count):
+    random.seed(1)
+    return [
+        "".join(random.choice(string.ascii_lowercase) for _ in xrange(random.randint(4, 10)))
+        for _ in xrange(count)
+    ]
+
+def messages(count, bad_words):
+    random.seed(2)
+    result = []
+    for _ in xrange(count):
+        message = " ".join(
+            "".join(random.choice(string.ascii_letters) for _ in xrange(random.randint(2, 8)))
+            for _ in xrange(random.randint(3, 20))
+        )
+        if random.random() < 0.1:
+            message += " " + random.choice(bad_words)
+        result.append(message[:128])
+    return result
+
+def bench(label, function, count):
+    start = time.time()
+    function()
+    elapsed = time.time() - start
+    print "%-30s %10.0f messages/s (%.3fs)" % (label, count / elapsed, elapsed)
+
+def main(words_count=50000, messages_count=20000):
+    bad_words = words(words_count)
+    chat = messages(messages_count, bad_words)
+
+    start = time.time()
+    chat_filter = ChatFilter(bad_words)
+    print "%-30s %10.3fs (%d states)" % ("automaton build", time.time() - start, len(chat_filter))
+    start = time.time()
+    chat_regexp = re.compile("(%s)" % "|".join(bad_words), re.IGNORECASE)
+    print "%-30s %10.3fs" % ("regexp build", time.time() - start)
+
+    bench("automaton filter", lambda: [chat_filter.sub('poker', message) for message in chat], messages_count)
+    regexp_count = min(messages_count, 500)
+    bench("regexp filter", lambda: [chat_regexp.sub('poker', message) for message in chat[:regexp_count]], regexp_count)
+
+    settings = pokernetworkconfig.Config([])
+    settings.loadFromString('<?xml version="1.0" encoding="UTF-8"?><server><chatarchive batch="200"/></server>')
+    adb = ImmediateAsyncDatabase()
+    archive = ChatArchive(settings, adb)
+    def archiveAll():
+        for i, message in enumerate(chat):
+            archive.write(i, i % 100, message)
+        archive.flush()
+    bench("archive", archiveAll, messages_count)
+    print "%-30s %10d statements for %d messages" % ("archive", adb.statements, messages_count)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
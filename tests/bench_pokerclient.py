@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Cost of the publish queues of 1000 bot clients in one process:
+#
+#   python tests/bench_pokerclient.py [clients] [seconds] [packets]
+#
+# The clients are first idle, then each of them receives packets with a
+# publishDelay() between them, as the animations of a table do. The number
+# of times the publish timers fire and the CPU used are reported for both
+# phases: idle clients should cost nothing.
+#
+import sys, time, resource
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from twisted.internet import reactor
+
+from pokerpackets.packets import PacketPing, PACKET_PING
+from pokernetwork.pokerclient import PokerClientProtocol
+
+class BenchFactory:
+    def isOutbound(self, packet):
+        return False
+    def gameExists(self, game_id):
+        return True
+    def isConnectionLess(self, packet):
+        return False
+
+wakeups = [0]
+publishPackets = PokerClientProtocol.publishPackets
+def countedPublishPackets(self):
+    wakeups[0] += 1
+    return publishPackets(self)
+PokerClientProtocol.publishPackets = countedPublishPackets
+
+def cpu():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+class Phase:
+    def __init__(self, label):
+        self.label = label
+        wakeups[0] = 0
+        self.cpu = cpu()
+        self.start = time.time()
+
+    def report(self):
+        elapsed = time.time() - self.start
+        used = cpu() - self.cpu
+        print "%-10s %8d wakeups %8.0f wakeups/s %6.2f%% cpu" % (self.label, wakeups[0], wakeups[0] / elapsed, 100 * used / elapsed)
+
+def main(clients_count=1000, duration=5, packets_count=10):
+    published = [0]
+    def handler(client, packet):
+        published[0] += 1
+        client.publishDelay(0.1)
+    clients = []
+    for _ in xrange(clients_count):
+        client = PokerClientProtocol()
+        client.factory = BenchFactory()
+        client.established = True
+        client._poll = True
+        client.registerHandler('outbound', PACKET_PING, handler)
+        clients.append(client)
+
+    def idle():
+        phase = Phase("idle")
+        reactor.callLater(duration, burst, phase)
+    def burst(idle):
+        idle.report()
+        phase = Phase("burst")
+        for client in clients:
+            for _ in xrange(packets_count):
+                client.schedulePacket(PacketPing())
+        reactor.callLater(duration, done, phase)
+    def done(burst):
+        burst.report()
+        print "%-10s %8d packets published" % ("burst", published[0])
+        reactor.stop()
+    reactor.callWhenRunning(idle)
+    reactor.run()
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
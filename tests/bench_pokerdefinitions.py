@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Spawn of tables, with the variant and betting structure definitions
+# parsed for each game or shared by all of them:
+#
+#   python tests/bench_pokerdefinitions.py [tables]
+#
+# "parsed" calls setVariant and setBettingStructure on each game, as the
+# tables used to. "shared" goes through pokernetwork.pokerdefinitions.
+# "table spawn" creates whole PokerTable with the service stand-in of
+# bench_pokertable.py.
+#
+import sys, time
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from pokerengine.pokergame import PokerGameServer
+
+from pokernetwork import pokertable, pokernetworkconfig, pokerdefinitions
+
+from bench_pokertable import settings_xml, MemoryService
+
+URL = "poker.%s.xml"
+VARIANT = "holdem"
+BETTING_STRUCTURE = "1-2_20-200_limit"
+
+def bench(label, function, count):
+    start = time.time()
+    function()
+    elapsed = time.time() - start
+    print "%-30s %10.0f tables/s (%.3fs)" % (label, count / elapsed, elapsed)
+
+def main(tables_count=500):
+    settings = pokernetworkconfig.Config([])
+    settings.loadFromString(settings_xml)
+    service = MemoryService(settings)
+    dirs = service.dirs
+
+    def parsed():
+        for _ in xrange(tables_count):
+            game = PokerGameServer(URL, dirs)
+            game.setVariant(VARIANT)
+            game.setBettingStructure(BETTING_STRUCTURE)
+    bench("parsed", parsed, tables_count)
+
+    def shared():
+        for _ in xrange(tables_count):
+            pokerdefinitions.setup(PokerGameServer(URL, dirs), URL, dirs, VARIANT, BETTING_STRUCTURE)
+    bench("shared", shared, tables_count)
+
+    description = {
+        'name': "bench",
+        'variant': VARIANT,
+        'betting_structure': BETTING_STRUCTURE,
+        'seats': 10,
+        'player_timeout': 60,
+        'muck_timeout': 5,
+        'currency_serial': 1,
+    }
+    def spawn():
+        for game_id in xrange(1, tables_count + 1):
+            pokertable.PokerTable(service, game_id, description)
+    bench("table spawn", spawn, tables_count)
+    definitions = pokerdefinitions.definitions
+    print "%-30s %10d hits, %d misses" % ("definitions", definitions.hits, definitions.misses)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Cost of a reconnect storm: avatars joining a table during a hand.
+#
+#   python tests/bench_pokerjoin.py [joins] [hands]
+#
+# A table of 9 bots plays hands and, after each action, joins avatars
+# join it, as they would when reconnecting after a network blip. "uncached"
+# forgets the hand replay and the ladder packets of the table before each
+# join, which is what each join did before they were shared; "cached" is
+# PokerAvatar.join as it is and "snapshot" sends the state of the hand
+# instead of its replay (join_snapshot). The table and the bots are those
+# of bench_pokertable.py.
+#
+import sys, time, random
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from twisted.internet import reactor
+
+from pokerpackets.networkpackets import PacketPokerPlayerStats
+
+from pokernetwork import pokernetworkconfig
+from pokernetwork.pokeravatar import PokerAvatar
+
+from bench_pokertable import settings_xml, MemoryService, createTable, act
+
+class LadderService(MemoryService):
+
+    def __init__(self, settings):
+        MemoryService.__init__(self, settings)
+        self.has_ladder = True
+        self.delays = {}
+        self.ladder_lookups = 0
+
+    def getLadder(self, game_id, currency_serial, user_serial):
+        self.ladder_lookups += 1
+        return PacketPokerPlayerStats(game_id = game_id, currency_serial = currency_serial, serial = user_serial)
+
+class Observer:
+    """What PokerAvatar.join uses of the avatar."""
+
+    join = PokerAvatar.join.im_func
+    explain = None
+
+    def __init__(self, service, serial):
+        self.service = service
+        self.serial = serial
+        self.tables = {}
+        self.packets = 0
+
+    def getSerial(self):
+        return self.serial
+
+    def sendPacketVerbose(self, packet):
+        self.packets += 1
+
+def storm(label, joins, hands, cached, snapshot=False):
+    settings = pokernetworkconfig.Config([])
+    settings.loadFromString(settings_xml)
+    service = LadderService(settings)
+    table, bots = createTable(service, 1, range(10, 19))
+    table.join_snapshot = snapshot
+    game = table.game
+    rng = random.Random(1)
+    observers = [Observer(service, serial) for serial in xrange(1000, 1000 + joins)]
+    count = 0
+    elapsed = 0.0
+    for _ in xrange(hands):
+        for bot in bots:
+            if game.isBroke(bot.serial):
+                table.rebuyPlayerRequest(bot.serial, game.maxBuyIn())
+            if not game.isSit(bot.serial):
+                table.sitPlayer(bot)
+        table.update()
+        table.beginTurn()
+        table.update()
+        while game.isRunning():
+            start = time.time()
+            for observer in observers:
+                if not cached:
+                    table.hand_replay = None
+                    table.ladder = {}
+                observer.join(table)
+            elapsed += time.time() - start
+            count += joins
+            if not act(game, game.getSerialInPosition(), rng):
+                break
+            table.update()
+    for call in reactor.getDelayedCalls():
+        if call.active():
+            call.cancel()
+    packets = sum(observer.packets for observer in observers)
+    print "%-30s %10.0f joins/s (%d joins, %.3fs) %6.1f packets/join %8d ladder lookups" % (
+        label, count / elapsed, count, elapsed, packets / float(count), service.ladder_lookups
+    )
+
+def main(joins=500, hands=5):
+    storm("uncached", joins, hands, False)
+    storm("cached", joins, hands, True)
+    storm("snapshot", joins, hands, True, True)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
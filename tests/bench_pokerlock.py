@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Concurrent cashIn/cashOut-like critical sections on the cashier locks:
+#
+#   python tests/bench_pokerlock.py [operations] [currencies] [connections]
+#
+# Each operation acquires the lock of a currency, waits for a database
+# round trip and releases it, all the operations are started at once. The
+# MySQL lock manager runs against an in-process stand-in of GET_LOCK and
+# RELEASE_LOCK that answers after a fixed latency.
+#
+import sys, time, threading
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from twisted.internet import reactor, defer, task
+
+from pokernetwork.pokerlock import PokerLockManager, PokerMySQLLockManager
+
+LATENCY = 0.0005
+
+class FakeMySQLServer:
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.owners = {}
+        self.queries = 0
+
+    def getLock(self, db, name, timeout):
+        deadline = time.time() + timeout
+        with self.condition:
+            while self.owners.get(name, db) is not db:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return 0
+                self.condition.wait(remaining)
+            self.owners[name] = db
+            return 1
+
+    def releaseLock(self, db, name):
+        with self.condition:
+            if self.owners.get(name) is not db:
+                return 0
+            del self.owners[name]
+            self.condition.notifyAll()
+            return 1
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+    def execute(self, sql, args):
+        server = self.db.server
+        server.queries += 1
+        time.sleep(LATENCY)
+        if sql.startswith("SELECT GET_LOCK"):
+            self.result = server.getLock(self.db, *args)
+        else:
+            self.result = server.releaseLock(self.db, *args)
+    def fetchone(self):
+        return (self.result,)
+    def close(self):
+        pass
+
+class FakeConnection:
+    def __init__(self, server):
+        self.server = server
+    def cursor(self):
+        return FakeCursor(self)
+    def close(self):
+        pass
+
+class FakeMySQLLockManager(PokerMySQLLockManager):
+    server = FakeMySQLServer()
+    def connect(self):
+        return FakeConnection(self.server)
+
+def operation(locks, name):
+    d = locks.acquire(name, 60)
+    d.addCallback(lambda name: task.deferLater(reactor, LATENCY, lambda: name))
+    d.addCallback(locks.release)
+    return d
+
+def bench(label, locks, operations, currencies):
+    start = time.time()
+    d = defer.gatherResults([
+        operation(locks, "cash_%d" % (i % currencies)) for i in xrange(operations)
+    ])
+    def done(result):
+        elapsed = time.time() - start
+        print "%-30s %10.0f operations/s (%.3fs)" % (label, operations / elapsed, elapsed)
+        locks.close()
+    d.addCallback(done)
+    return d
+
+def main(operations=2000, currencies=10, connections=4):
+    mysql = FakeMySQLLockManager({}, connections)
+    d = bench("local locks", PokerLockManager(), operations, currencies)
+    d.addCallback(lambda result: bench("mysql locks", mysql, operations, currencies))
+    d.addCallback(lambda result: print_queries(mysql, operations))
+    d.addBoth(lambda result: reactor.stop())
+    reactor.run()
+
+def print_queries(locks, operations):
+    print "%-30s %10d queries for %d operations, %d connections" % (
+        "mysql locks", locks.server.queries, operations, locks.connections_count
+    )
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Cost of the packet metrics:
+#
+#   python tests/bench_pokermetrics.py [packets]
+#
+# A handler doing a fixed amount of work is timed with and without the
+# instrumentation of PokerAvatar.handlePacketMeasured, the difference is
+# the overhead per packet.
+#
+import sys, time
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from twisted.python.runtime import seconds
+
+from pokerpackets.packets import PACKET_PING
+from pokernetwork.pokermetrics import PacketMetrics
+
+def handler(work):
+    # about what a simple packet handler does: build a few dicts
+    for i in xrange(work):
+        {'game_id': i, 'serial': i, 'amount': i}
+
+def main(packets=200000):
+    metrics = PacketMetrics()
+    for work in (1, 10, 50):
+        start = time.time()
+        for _ in xrange(packets):
+            handler(work)
+        plain = time.time() - start
+
+        start = time.time()
+        for _ in xrange(packets):
+            begin = seconds()
+            try:
+                handler(work)
+            finally:
+                metrics.record(PACKET_PING, seconds() - begin)
+        measured = time.time() - start
+        print "%-30s %8.3fus/packet %8.3fus overhead %6.1f%%" % (
+            "handler work=%d" % work,
+            plain * 1000000 / packets,
+            (measured - plain) * 1000000 / packets,
+            (measured - plain) * 100 / plain
+        )
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
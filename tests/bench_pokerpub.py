@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Publish throughput with 10k subscribers spread over 1k channels:
+#
+#   python tests/bench_pokerpub.py [subscribers] [channels] [messages]
+#
+# Each subscriber listens to one channel of the form table.<id>, every
+# tenth one also listens to the table. prefix. The trie with encode-once
+# delivery is compared with a linear scan of the subscriptions that
+# encodes the message for each subscriber.
+#
+import sys, random, time
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+import msgpack
+
+from pokernetwork import pokernetworkconfig
+from pokernetwork.pokerpub import PubService
+
+class NullTransport:
+    def registerProducer(self, producer, streaming):
+        pass
+    def write(self, data):
+        pass
+
+class Service:
+    def __init__(self):
+        self.settings = pokernetworkconfig.Config([])
+        self.settings.loadFromString('<?xml version="1.0" encoding="UTF-8"?><server/>')
+
+def main(subscribers=10000, channels=1000, messages=10000):
+    random.seed(1)
+    pub = PubService(Service())
+    linear = []
+    for i in xrange(subscribers):
+        protocol = pub.buildProtocol(None)
+        protocol.transport = NullTransport()
+        protocol.connectionMade()
+        subscriptions = ['table.%d' % random.randrange(channels)]
+        if i % 10 == 0:
+            subscriptions.append('table.')
+        for subscription in subscriptions:
+            protocol._avatar.handleCommand('subscribe', (subscription,))
+            linear.append((subscription, protocol))
+    published = ['table.%d' % random.randrange(channels) for _ in xrange(messages)]
+    message = {'type': 'hand', 'hand_serial': 1, 'seats': range(10)}
+
+    start = time.time()
+    for channel in published:
+        pub.publish(channel, message)
+    elapsed = time.time() - start
+    print "%-30s %10.0f messages/s (%.3fs)" % ("trie", messages / elapsed, elapsed)
+    print "%-30s %10d delivered" % ("trie", pub.stats['delivered'])
+
+    count = min(messages, 200)
+    start = time.time()
+    for channel in published[:count]:
+        for subscription, protocol in linear:
+            if channel.startswith(subscription):
+                protocol.transport.write(msgpack.packb((channel, message)))
+    elapsed = time.time() - start
+    print "%-30s %10.0f messages/s (%.3fs)" % ("linear", count / elapsed, elapsed)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
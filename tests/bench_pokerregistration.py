@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#
+# Cost of the tourney registrations written by the registrar, with a
+# database that answers immediately:
+#
+#   python tests/bench_pokerregistration.py [registrations] [batch]
+#
+# It measures the cost of building the batched statements and the number
+# of transactions sent, against one transaction per registration
+# (batch=1).
+#
+import sys, time
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from twisted.internet import defer
+
+from pokernetwork import pokernetworkconfig
+from pokernetwork.pokerregistration import TourneyRegistrar
+
+class ImmediateCursor:
+    def __init__(self, registrations):
+        self.registrations = registrations
+        self.rows = []
+        self.rowcount = 0
+    def execute(self, sql, args=()):
+        self.registrations.statements += 1
+        if sql.startswith("SELECT serial FROM tourneys"):
+            self.rows = [(serial,) for serial in args[:-1]]
+        elif sql.startswith("SELECT user_serial"):
+            self.rows = [(args[i], args[i + 1], 1000000) for i in xrange(0, len(args), 2)]
+        elif sql.startswith("UPDATE"):
+            self.rowcount = len(args) / 5
+        elif sql.startswith("INSERT"):
+            self.rowcount = len(args) / 3
+    def fetchall(self):
+        return self.rows
+
+class ImmediateAsyncDatabase:
+    def __init__(self):
+        self.statements = 0
+        self.transactions = 0
+    def runInteraction(self, function, *args):
+        self.transactions += 1
+        return defer.succeed(function(ImmediateCursor(self), *args))
+
+def main(registrations_count=20000, batch=200):
+    for label, size in (("one transaction each", 1), ("batched", batch)):
+        settings = pokernetworkconfig.Config([])
+        settings.loadFromString('<?xml version="1.0" encoding="UTF-8"?><server><tourneyregister batch="%d"/></server>' % size)
+        adb = ImmediateAsyncDatabase()
+        registrar = TourneyRegistrar(settings, adb, 1)
+        start = time.time()
+        for serial in xrange(registrations_count):
+            registrar.register(serial, serial % 50, 1, 100)
+        registrar.flush()
+        elapsed = time.time() - start
+        print "%-30s %10.0f registrations/s (%.3fs)" % (label, registrations_count / elapsed, elapsed)
+        print "%-30s %10d transactions, %d statements" % (label, adb.transactions, adb.statements)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Start of the poker service after a crash, against the MySQL database of
+# the tests (tests/config.py):
+#
+#   python tests/bench_pokerservice_startup.py [players] [tourneys] [registrants]
+#
+# The database is seeded with players seated at the tables of the
+# resthost, 10 per table, and with registering tourneys that have
+# registrants players each. startService() refunds and removes the seated
+# players, restores the tourneys and their routes.
+#
+import sys, time
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from config import config
+import sqlmanager
+
+from twisted.python.runtime import seconds
+
+from pokernetwork import pokerservice
+from pokernetwork import pokernetworkconfig
+from pokernetwork.pokerdatabase import PokerDatabase
+
+settings_xml_server = """<?xml version="1.0" encoding="UTF-8"?>
+<server verbose="0" ping="300000" autodeal="yes" simultaneous="4" chat="yes" >
+  <delays autodeal="20" round="0" position="0" showdown="0" autodeal_max="1" finish="0" />
+
+  <resthost serial="1" host="127.0.0.1" port="19481" path="/POKER_REST" name="" />
+
+  <listen tcp="19480" />
+
+  <cashier acquire_timeout="5" lock="local" />
+  <database
+    host="%(dbhost)s" name="%(dbname)s"
+    user="%(dbuser)s" password="%(dbuser_password)s"
+    root_user="%(dbroot)s" root_password="%(dbroot_password)s"
+    schema="%(tests_path)s/../database/schema.sql"
+    command="%(mysql_command)s" />
+  <path>%(engine_path)s/conf %(tests_path)s/../conf</path>
+  <users temporary="BOT.*"/>
+</server>
+""" % {
+    'dbhost': config.test.mysql.host,
+    'dbname': config.test.mysql.database,
+    'dbuser': config.test.mysql.user.name,
+    'dbuser_password': config.test.mysql.user.password,
+    'dbroot': config.test.mysql.root_user.name,
+    'dbroot_password': config.test.mysql.root_user.password,
+    'tests_path': TESTS_PATH,
+    'engine_path': config.test.engine_path,
+    'mysql_command': config.test.mysql.command
+}
+
+SERIAL_BASE = 10000
+TABLE_BASE = 1000
+TOURNEY_BASE = 1000
+
+def chunks(rows, size=1000):
+    for i in xrange(0, len(rows), size):
+        yield rows[i:i+size]
+
+def insert(cursor, sql, rows):
+    for chunk in chunks(rows):
+        cursor.executemany(sql, chunk)
+
+def seed(db, players, tourneys, registrants):
+    cursor = db.cursor()
+    tables = (players + 9) / 10
+    cursor.execute('INSERT INTO tableconfigs (serial, name, variant, betting_structure, currency_serial) VALUES (1, "Bench", "holdem", "2-4-no-limit", 1)')
+    insert(cursor,
+        "INSERT INTO tables (serial, resthost_serial, tableconfig_serial) VALUES (%s, 1, 1)",
+        [(TABLE_BASE + i,) for i in xrange(tables)]
+    )
+    users = max(players, registrants)
+    insert(cursor,
+        "INSERT INTO users (serial, created, name, password) VALUES (%s, 0, %s, '')",
+        [(SERIAL_BASE + i, "player%d" % i) for i in xrange(users)]
+    )
+    insert(cursor,
+        "INSERT INTO user2money (user_serial, currency_serial, amount) VALUES (%s, 1, 0)",
+        [(SERIAL_BASE + i,) for i in xrange(players)]
+    )
+    insert(cursor,
+        "INSERT INTO user2table (user_serial, table_serial, money) VALUES (%s, %s, 100)",
+        [(SERIAL_BASE + i, TABLE_BASE + i / 10) for i in xrange(players)]
+    )
+    start_time = int(seconds()) + 3600
+    insert(cursor,
+        "INSERT INTO tourneys (serial, name, description_short, description_long, variant, betting_structure, currency_serial, schedule_serial, resthost_serial, sit_n_go, start_time, players_quota) " \
+        "VALUES (%s, 'bench', '', '', 'holdem', '2-4-no-limit', 1, 0, 1, 'n', %s, 1000)",
+        [(TOURNEY_BASE + i, start_time) for i in xrange(tourneys)]
+    )
+    insert(cursor,
+        "INSERT INTO user2tourney (user_serial, currency_serial, tourney_serial) VALUES (%s, 1, %s)",
+        [(SERIAL_BASE + j, TOURNEY_BASE + i) for i in xrange(tourneys) for j in xrange(registrants)]
+    )
+    cursor.close()
+
+def main(players=10000, tourneys=1000, registrants=10):
+    sqlmanager.query("DROP DATABASE IF EXISTS %s" % (config.test.mysql.database,),
+        user=config.test.mysql.root_user.name,
+        password=config.test.mysql.root_user.password,
+        host=config.test.mysql.host
+    )
+    settings = pokernetworkconfig.Config([])
+    settings.loadFromString(settings_xml_server)
+    db = PokerDatabase(settings)
+    start = time.time()
+    seed(db, players, tourneys, registrants)
+    print "%-30s %10.3fs (%d players, %d tourneys)" % ("seed", time.time() - start, players, tourneys)
+
+    service = pokerservice.PokerService(settings)
+    start = time.time()
+    service.startService()
+    elapsed = time.time() - start
+    print "%-30s %10.3fs" % ("startService", elapsed)
+
+    cursor = db.cursor()
+    cursor.execute("SELECT COUNT(*) FROM user2table")
+    print "%-30s %10d" % ("user2table rows left", cursor.fetchone()[0])
+    cursor.execute("SELECT COUNT(*) FROM route WHERE table_serial = 0")
+    print "%-30s %10d" % ("tourney routes", cursor.fetchone()[0])
+    print "%-30s %10d" % ("tourneys restored", len(service.tourneys))
+    cursor.close()
+    db.close()
+    service.stopService()
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Cost of the settings read when a table is spawned and when a deal is
+# scheduled:
+#
+#   python tests/bench_pokersettings.py [tables] [schedules]
+#
+# "xpath" are the reads PokerTable used to do on the settings document,
+# "snapshot" the same values from Config.serverSettings(). The table
+# spawn and scheduleAutoDeal() are then timed with the service stand-in
+# of bench_pokertable.py.
+#
+import sys, time
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from twisted.internet import reactor
+
+from pokernetwork import pokertable, pokernetworkconfig
+
+from bench_pokertable import settings_xml, MemoryService
+
+def xpathReads(settings):
+    decks = settings.headerGetList("/server/decks/deck")
+    delays = settings.headerGetProperties("/server/delays")[0]
+    autodeal = settings.headerGet("/server/@autodeal") == "yes"
+    autodeal_temporary = settings.headerGet("/server/users/@autodeal_temporary") == 'yes'
+    return (
+        decks, autodeal, autodeal_temporary,
+        max(0.01, float(delays.get("autodeal_check", 15))),
+        float(delays.get("autodeal_max", 120))
+    )
+
+def snapshotReads(settings):
+    server_settings = settings.serverSettings()
+    return (
+        server_settings.decks, server_settings.autodeal, server_settings.autodeal_temporary,
+        server_settings.autodeal_check, server_settings.autodeal_max
+    )
+
+def bench(label, function, count):
+    start = time.time()
+    function()
+    elapsed = time.time() - start
+    print "%-30s %10.0f /s (%.3fs)" % (label, count / elapsed, elapsed)
+
+def main(tables_count=2000, schedules=100000):
+    settings = pokernetworkconfig.Config([])
+    settings.loadFromString(settings_xml)
+    service = MemoryService(settings)
+
+    reads = tables_count * 10
+    bench("xpath reads", lambda: [xpathReads(settings) for _ in xrange(reads)], reads)
+    bench("snapshot reads", lambda: [snapshotReads(settings) for _ in xrange(reads)], reads)
+
+    description = {
+        'name': "bench",
+        'variant': "holdem",
+        'betting_structure': "1-2_20-200_limit",
+        'seats': 10,
+        'player_timeout': 60,
+        'muck_timeout': 5,
+        'currency_serial': 1,
+    }
+    tables = []
+    def spawn():
+        for game_id in xrange(1, tables_count + 1):
+            tables.append(pokertable.PokerTable(service, game_id, description))
+    bench("table spawn", spawn, tables_count)
+
+    table = tables[0]
+    table.shouldAutoDeal = lambda: True
+    table.game_delay = { "start": time.time(), "delay": 1 }
+    table.allReadyToPlay = lambda: False
+    bench("scheduleAutoDeal", lambda: [table.scheduleAutoDeal() for _ in xrange(schedules)], schedules)
+
+    for call in reactor.getDelayedCalls():
+        if call.active():
+            call.cancel()
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Packets of one table delivered to its observers, per second, with and
+# without the spectator tier:
+#
+#   python tests/bench_pokerspectators.py [observers] [packets] [tick] [max]
+#
+# Half of the observers use the binary protocol, the other half msgpack.
+# "direct" is the path of PokerTable.broadcast without the tier: each
+# observer is sent its own public copy of each packet, encoded by its
+# protocol. "stream" publishes each packet once and flushes every tick
+# packets, as the reactor would at the end of a tick. "stream max" caps
+# the observers sent packets at each flush to max and flushes until none
+# of them lags behind.
+#
+import sys, time, random
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from pokerpackets.networkpackets import *
+
+from pokernetwork import pokernetworkconfig
+from pokernetwork.pokerpacketizer import private2public
+from pokernetwork.pokerspectators import SpectatorStream
+from pokernetwork.protocol import UGAMEProtocol, MsgpackProtocol
+
+settings_xml = """<?xml version="1.0" encoding="UTF-8"?>
+<server>
+  <spectators delay="0" period="0" max="%d"/>
+</server>
+"""
+
+def traffic(count):
+    random.seed(1)
+    factories = [
+        lambda serial: PacketPokerPlayerChips(game_id = 1, serial = serial, money = random.randint(0, 100000), bet = random.randint(0, 1000)),
+        lambda serial: PacketPokerPosition(game_id = 1, serial = serial, position = serial % 10),
+        lambda serial: PacketPokerCall(game_id = 1, serial = serial),
+        lambda serial: PacketPokerCheck(game_id = 1, serial = serial),
+        lambda serial: PacketPokerFold(game_id = 1, serial = serial),
+        lambda serial: PacketPokerRaise(game_id = 1, serial = serial, amount = random.randint(100, 1000)),
+        lambda serial: PacketPokerBoardCards(game_id = 1, cards = [1, 2, 3]),
+    ]
+    return [random.choice(factories)(random.randint(1, 10)) for _ in xrange(count)]
+
+class CountingTransport:
+    def __init__(self):
+        self.writes = 0
+        self.size = 0
+    def write(self, data):
+        self.writes += 1
+        self.size += len(data)
+
+class ObserverAvatar:
+    """PokerAvatar.sendPacket without locale, explain nor queue."""
+    def __init__(self, protocol):
+        self.protocol = protocol
+    def spectatorProtocol(self):
+        return self.protocol
+    def sendPacket(self, packet):
+        self.protocol.sendPacket(packet)
+
+def observers(count):
+    avatars = []
+    for i in xrange(count):
+        protocol = UGAMEProtocol() if i % 2 else MsgpackProtocol()
+        protocol.transport = CountingTransport()
+        protocol.established = True
+        avatars.append(ObserverAvatar(protocol))
+    return avatars
+
+def report(label, avatars, packets, elapsed):
+    writes = sum(avatar.protocol.transport.writes for avatar in avatars)
+    size = sum(avatar.protocol.transport.size for avatar in avatars)
+    print "%-30s %10.0f packets/s (%.3fs) %8d writes %10d bytes" % (
+        label, len(packets) * len(avatars) / elapsed, elapsed, writes, size
+    )
+
+def direct(avatars, packets):
+    start = time.time()
+    for packet in packets:
+        for avatar in avatars:
+            avatar.sendPacket(private2public(packet, 0))
+    report("direct", avatars, packets, time.time() - start)
+
+def stream(label, avatars, packets, tick, max_observers):
+    settings = pokernetworkconfig.Config([])
+    settings.loadFromString(settings_xml % max_observers)
+    spectators = SpectatorStream(settings.serverSettings())
+    for avatar in avatars:
+        spectators.add(avatar)
+    start = time.time()
+    for i in xrange(0, len(packets), tick):
+        for packet in packets[i:i + tick]:
+            spectators.publish(private2public(packet, 0))
+        spectators.flush()
+    while spectators.lagging:
+        spectators.flush()
+    spectators.close()
+    report(label, avatars, packets, time.time() - start)
+    print "%-30s %10d flushes %8d encoded %8d lagging" % (
+        label, spectators.stats['flushes'], spectators.stats['encoded'], spectators.stats['lagging']
+    )
+
+def main(observers_count=5000, packets_count=200, tick=4, max_observers=1000):
+    packets = traffic(packets_count)
+    direct(observers(observers_count), packets)
+    stream("stream", observers(observers_count), packets, tick, 0)
+    stream("stream max=%d" % max_observers, observers(observers_count), packets, tick, max_observers)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
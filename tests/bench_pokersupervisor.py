@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Hands per second of a supervised server as the number of workers grows:
+#
+#   python tests/bench_pokersupervisor.py [workers] [tables] [hands]
+#
+# For each number of workers from 1 to workers (the number of cores by
+# default), the tables are sharded among forked processes the way
+# PokerSupervisor.assignShards does (serial % workers) and each process
+# plays its tables as bench_pokertable.py does. The hands per second are
+# those of all the processes together, measured from the first process
+# that starts playing to the last one that stops, and the scaling is the
+# ratio to the hands per second of a single worker.
+#
+import sys, time, random
+from os import path
+from multiprocessing import Process, Queue, cpu_count
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from twisted.internet import reactor
+
+from pokernetwork import pokernetworkconfig
+
+from bench_pokertable import settings_xml, MemoryService, createTable, playHand
+
+def worker(index, workers, tables_count, hands, results):
+    settings = pokernetworkconfig.Config([])
+    settings.loadFromString(settings_xml)
+    service = MemoryService(settings)
+    rng = random.Random(index)
+    tables = [
+        createTable(service, game_id, range(game_id * 10, game_id * 10 + 6))
+        for game_id in xrange(1, tables_count + 1) if game_id % workers == index
+    ]
+    played = 0
+    start = time.time()
+    for _ in xrange(hands):
+        for table, bots in tables:
+            if playHand(table, bots, rng) is not None:
+                played += 1
+    end = time.time()
+    for call in reactor.getDelayedCalls():
+        if call.active():
+            call.cancel()
+    results.put((played, start, end))
+
+def run(workers, tables_count, hands):
+    results = Queue()
+    processes = [Process(target=worker, args=(index, workers, tables_count, hands, results)) for index in xrange(workers)]
+    for process in processes:
+        process.start()
+    played, starts, ends = zip(*[results.get() for _ in processes])
+    for process in processes:
+        process.join()
+    return sum(played), max(ends) - min(starts)
+
+def main(workers=0, tables_count=24, hands=100):
+    workers = workers or cpu_count()
+    single = None
+    for count in xrange(1, workers + 1):
+        played, elapsed = run(count, tables_count, hands)
+        hands_per_second = played / elapsed
+        single = single or hands_per_second
+        print "%-30s %10.1f hands/s (%d hands, %.3fs) %6.2f scaling" % (
+            "%d workers" % count, hands_per_second, played, elapsed, hands_per_second / single
+        )
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Hands per second of PokerTable, without network nor database:
+#
+#   python tests/bench_pokertable.py [tables] [hands] [output.json] [baseline.json]
+#
+# Each table is played by bots that check, call, raise or fold at random.
+# The service is replaced by a stand-in that keeps the hands, the money
+# and the events in memory. The hands are dealt with beginTurn() and the
+# bots act directly on the game, followed by update(), in a loop that does
+# not wait for the reactor, so that only the table is measured.
+#
+# The time spent in history2packets, syncDatabase, broadcast and
+# updateTimers is reported separately. "objects" is the number of objects
+# tracked by the garbage collector that are still alive after the run: it
+# grows with the number of hands when the tables leak.
+#
+# The results are written as JSON in output.json, with the revision of the
+# tree. When baseline.json, the output of a previous run, is given the
+# ratios between both runs are printed.
+#
+import sys, time, random, gc, json, subprocess, resource
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from config import config
+
+from twisted.internet import reactor
+
+from pokerpackets.networkpackets import PacketPokerPlayerInfo
+
+from pokernetwork import pokertable, pokernetworkconfig
+from pokernetwork.pokeravatar import DEFAULT_PLAYER_USER_DATA
+
+settings_xml = """<?xml version="1.0" encoding="UTF-8"?>
+<server autodeal="no" max_missed_round="1000">
+  <delays autodeal="0" round="0" position="0" showdown="0" finish="0" />
+  <path>%(engine_path)s/conf %(tests_path)s/../conf</path>
+</server>
+""" % {
+    'tests_path': TESTS_PATH,
+    'engine_path': config.test.engine_path
+}
+
+class ChatFilter:
+    def sub(self, repl, message):
+        return message
+
+class MemoryService:
+    """What the tables ask PokerService, answered from dicts instead of the
+    database, memcache and the asynchronous database."""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.dirs = settings.headerGet("/server/path").split()
+        self.simultaneous = 1
+        self.shutting_down = False
+        self.chat_filter = ChatFilter()
+        self.has_ladder = False
+        self.hand_serial = 0
+        self.hands = {}
+        self.money = {}
+        self.rake = {}
+        self.events = 0
+        self.joined_count = 0
+        self.tables = {}
+
+    def getMissedRoundMax(self):
+        return 1000
+
+    def joinedCountReachedMax(self):
+        return False
+
+    def joinedCountIncrease(self, num = 1):
+        self.joined_count += num
+        return self.joined_count
+
+    def joinedCountDecrease(self, num = 1):
+        self.joined_count -= num
+        return self.joined_count
+
+    def getTable(self, game_id):
+        return self.tables.get(game_id)
+
+    def getName(self, serial):
+        return "BOT%d" % serial
+
+    def getPlayerInfo(self, serial):
+        return None
+
+    def isTemporaryUser(self, serial):
+        return False
+
+    def seatPlayer(self, serial, table_id, amount, minimum_amount = None):
+        return True
+
+    def buyInPlayer(self, serial, game_id, currency_serial, amount):
+        self.money[serial] = self.money.get(serial, 0) - amount
+        return amount
+
+    def leavePlayer(self, serial, table_id, currency_serial):
+        return True
+
+    def movePlayer(self, serial, from_game_id, to_game_id):
+        return 0
+
+    def createHand(self, game_id, tourney_serial = None):
+        self.hand_serial += 1
+        return self.hand_serial
+
+    def saveHand(self, description, hand_serial):
+        #
+        # keep the last hand of each table, as memcache would
+        self.hands[description[0][1]] = description
+
+    def loadHand(self, hand_serial):
+        return None
+
+    def handWriterCongested(self):
+        return False
+
+    def updatePlayerMoney(self, serial, game_id, amount):
+        self.money[serial] = self.money.get(serial, 0) + amount
+
+    def updatePlayerRake(self, currency_serial, serial, amount):
+        self.rake[serial] = self.rake.get(serial, 0) + amount
+
+    def updateTableStats(self, game, observers, waiting):
+        pass
+
+    def databaseEvent(self, **kwargs):
+        self.events += 1
+
+    def eventTable(self, table):
+        pass
+
+    def despawnTable(self, game_id):
+        pass
+
+    def chatAllowed(self, game_id, serial):
+        return True
+
+class Bot:
+
+    class User:
+        def isLogged(self):
+            return True
+
+    def __init__(self, serial):
+        self.serial = serial
+        self.tables = {}
+        self.user = Bot.User()
+        self.packets = 0
+
+    def join(self, table, reason = ""):
+        pass
+
+    def addPlayer(self, table, seat):
+        self.tables[table.game.id] = table
+        if table.game.addPlayer(self.serial, seat):
+            table.game.getPlayer(self.serial).setUserData(DEFAULT_PLAYER_USER_DATA.copy())
+        return True
+
+    def removePlayer(self, table, serial):
+        return table.game.removePlayer(serial)
+
+    def autoBlindAnte(self, table, serial, auto):
+        table.game.getPlayer(serial).auto_blind_ante = auto
+        return True
+
+    def setMoney(self, table, amount):
+        return table.game.payBuyIn(self.serial, amount)
+
+    def buyOutPlayer(self, table, serial):
+        pass
+
+    def sendPacket(self, packet):
+        self.packets += 1
+
+    sendPacketVerbose = sendPacket
+
+    def getSerial(self):
+        return self.serial
+
+    def getName(self):
+        return "BOT%d" % self.serial
+
+    def getPlayerInfo(self):
+        return PacketPokerPlayerInfo(serial = self.serial, name = self.getName(), url = "", outfit = "")
+
+class Stages:
+    """Accumulate the time spent in functions replaced by timed wrappers."""
+
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+
+    def timed(self, name, function):
+        self.seconds[name] = 0.0
+        self.calls[name] = 0
+        seconds = self.seconds
+        calls = self.calls
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                seconds[name] += time.time() - start
+                calls[name] += 1
+        return wrapper
+
+def createTable(service, game_id, serials):
+    table = pokertable.PokerTable(service, game_id, {
+        'name': "bench%d" % game_id,
+        'variant': "holdem",
+        'betting_structure': "1-2_20-200_limit",
+        'seats': len(serials),
+        'player_timeout': 60,
+        'muck_timeout': 5,
+        'currency_serial': 1,
+    })
+    service.tables[game_id] = table
+    bots = []
+    for serial in serials:
+        bot = Bot(serial)
+        table.joinPlayer(bot)
+        table.seatPlayer(bot, -1)
+        table.buyInPlayer(bot, table.game.maxBuyIn())
+        table.autoBlindAnte(bot, True)
+        table.sitPlayer(bot)
+        bots.append(bot)
+    return table, bots
+
+def act(game, serial, rng):
+    actions = game.possibleActions(serial)
+    if not actions:
+        return False
+    choice = rng.random()
+    if 'raise' in actions and choice < 0.15:
+        return game.callNraise(serial, 0)
+    elif 'check' in actions:
+        return game.check(serial)
+    elif 'call' in actions and choice < 0.75:
+        return game.call(serial)
+    else:
+        return game.fold(serial)
+
+def playHand(table, bots, rng):
+    """Deal a hand and play it to the end, return the number of actions
+    or None when the hand could not be played to the end."""
+    game = table.game
+    for bot in bots:
+        if game.isBroke(bot.serial):
+            table.rebuyPlayerRequest(bot.serial, game.maxBuyIn())
+        if not game.isSit(bot.serial):
+            table.sitPlayer(bot)
+    table.update()
+    table.beginTurn()
+    table.update()
+    actions = 0
+    while game.isRunning():
+        if not act(game, game.getSerialInPosition(), rng):
+            return None
+        actions += 1
+        table.update()
+    return actions
+
+def revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd = TESTS_PATH,
+            stderr = open("/dev/null", "w")
+        ).strip()
+    except Exception:
+        return None
+
+def compare(result, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print "%-30s %12s %12s %8s" % ("compared to " + str(baseline.get('revision')), "before", "after", "ratio")
+    rows = [('hands/s', baseline['hands_per_second'], result['hands_per_second'])]
+    for name in sorted(result['stages']):
+        if name in baseline['stages']:
+            rows.append((name + " us/hand", baseline['stages'][name]['us_per_hand'], result['stages'][name]['us_per_hand']))
+    rows.append(('objects', baseline['objects'], result['objects']))
+    for label, before, after in rows:
+        print "%-30s %12.1f %12.1f %8.2f" % (label, before, after, float(after) / before if before else 0)
+
+def main(tables_count=20, hands=200, output=None, baseline=None):
+    settings = pokernetworkconfig.Config([])
+    settings.loadFromString(settings_xml)
+    service = MemoryService(settings)
+    rng = random.Random(1)
+
+    stages = Stages()
+    history2packets = pokertable.history2packets
+    pokertable.history2packets = stages.timed('history2packets', history2packets)
+    saved = {}
+    for name in ('syncDatabase', 'broadcast', 'updateTimers'):
+        saved[name] = getattr(pokertable.PokerTable, name)
+        setattr(pokertable.PokerTable, name, stages.timed(name, saved[name].im_func))
+
+    try:
+        tables = [
+            createTable(service, game_id, range(game_id * 10, game_id * 10 + 6))
+            for game_id in xrange(1, tables_count + 1)
+        ]
+        for name in stages.seconds:
+            stages.seconds[name] = 0.0
+            stages.calls[name] = 0
+
+        gc.collect()
+        objects = len(gc.get_objects())
+        played = 0
+        failed = 0
+        actions = 0
+        start = time.time()
+        for _ in xrange(hands):
+            for table, bots in tables:
+                count = playHand(table, bots, rng)
+                if count is None:
+                    failed += 1
+                else:
+                    played += 1
+                    actions += count
+        elapsed = time.time() - start
+        gc.collect()
+        objects = len(gc.get_objects()) - objects
+    finally:
+        pokertable.history2packets = history2packets
+        for name, method in saved.iteritems():
+            setattr(pokertable.PokerTable, name, method)
+        for call in reactor.getDelayedCalls():
+            if call.active():
+                call.cancel()
+
+    result = {
+        'revision': revision(),
+        'tables': tables_count,
+        'hands': played,
+        'failed': failed,
+        'actions': actions,
+        'seconds': elapsed,
+        'hands_per_second': played / elapsed,
+        'stages': dict(
+            (name, {
+                'calls': stages.calls[name],
+                'seconds': stages.seconds[name],
+                'us_per_hand': stages.seconds[name] * 1000000 / max(played, 1),
+            }) for name in stages.seconds
+        ),
+        'packets': sum(bot.packets for _table, bots in tables for bot in bots),
+        'events': service.events,
+        'objects': objects,
+        'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+    print "%-30s %10.1f hands/s (%d hands, %d failed, %d actions, %.3fs)" % (
+        "%d tables" % tables_count, result['hands_per_second'], played, failed, actions, elapsed
+    )
+    for name in sorted(result['stages']):
+        stage = result['stages'][name]
+        print "%-30s %10.1fus/hand %5.1f%% (%d calls)" % (
+            name, stage['us_per_hand'], stage['seconds'] * 100 / elapsed, stage['calls']
+        )
+    print "%-30s %10d packets, %d events" % ("sent", result['packets'], result['events'])
+    print "%-30s %10d objects, %dkB max rss" % ("memory", objects, result['maxrss_kb'])
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+    if baseline:
+        compare(result, baseline)
+    return result
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(*[int(arg) for arg in args[:2]] + args[2:4])
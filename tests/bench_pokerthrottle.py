@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Latency of well behaved clients while a hostile client floods the server
+# with lobby queries, without and with <throttle>:
+#
+#   python tests/bench_pokerthrottle.py [clients] [seconds]
+#
+# The clients and the server run in the same process and talk over the
+# loopback. Each well behaved client sends a game action every 100ms and
+# the round trip is measured. The avatar of the server spends 2ms on a
+# lobby query, as a table or tourney list does on a busy server.
+#
+import sys, time
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from twisted.internet import reactor, protocol
+
+from pokerpackets.packets import PacketAck
+from pokerpackets.networkpackets import PacketPokerFold, PacketPokerTableSelect, PACKET_POKER_TABLE_SELECT
+
+from pokernetwork import pokernetworkconfig
+from pokernetwork.protocol import UGAMEProtocol
+from pokernetwork.server import PokerServerProtocol
+from pokernetwork.pokermetrics import Histogram
+from pokernetwork.pokerthrottle import ThrottlePolicy
+
+def busy(duration):
+    end = time.time() + duration
+    while time.time() < end:
+        pass
+
+class BenchAvatar:
+    metrics = None
+
+    def setProtocol(self, protocol):
+        self.protocol = protocol
+
+    def handlePacket(self, packet):
+        busy(0.002 if packet.type == PACKET_POKER_TABLE_SELECT else 0.00005)
+        return [PacketAck()]
+
+class BenchServerFactory(protocol.ServerFactory):
+    protocol = PokerServerProtocol
+
+    def __init__(self):
+        self.avatars = []
+
+    def createAvatar(self):
+        avatar = BenchAvatar()
+        self.avatars.append(avatar)
+        return avatar
+
+    def destroyAvatar(self, avatar):
+        self.avatars.remove(avatar)
+
+class WellBehavedClient(UGAMEProtocol):
+
+    def protocolEstablished(self):
+        self.sent = []
+        self.send()
+
+    def send(self):
+        self.sent.append(time.time())
+        self.sendPacket(PacketPokerFold(game_id = 1, serial = 1))
+        self.timer = reactor.callLater(0.1, self.send)
+
+    def packetReceived(self, packet):
+        self.factory.latency.record(int((time.time() - self.sent.pop(0)) * 1000000))
+
+class HostileClient(UGAMEProtocol):
+
+    def protocolEstablished(self):
+        self.flood()
+
+    def flood(self):
+        if self.factory.flooding:
+            self.sendPackets([PacketPokerTableSelect()] * 100)
+        self.timer = reactor.callLater(0.01, self.flood)
+
+    def packetReceived(self, packet):
+        pass
+
+class BenchClientFactory(protocol.ClientFactory):
+
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.latency = Histogram()
+        self.flooding = False
+
+def report(label, latency):
+    print "%-22s p50 %7.1fms p99 %7.1fms max %7.1fms (%d round trips)" % (
+        label, latency.percentile(50) / 1000.0, latency.percentile(99) / 1000.0, latency.max / 1000.0, latency.count
+    )
+
+def main(clients_count=50, duration=5):
+    settings = pokernetworkconfig.Config([])
+    settings.loadFromString('<?xml version="1.0" encoding="UTF-8"?><server throttle="yes"><throttle/></server>')
+    policy = ThrottlePolicy(settings)
+
+    server_factory = BenchServerFactory()
+    port = reactor.listenTCP(0, server_factory, interface="127.0.0.1")
+    well_behaved = BenchClientFactory(WellBehavedClient)
+    hostile = BenchClientFactory(HostileClient)
+    for _ in xrange(clients_count):
+        reactor.connectTCP("127.0.0.1", port.getHost().port, well_behaved)
+    reactor.connectTCP("127.0.0.1", port.getHost().port, hostile)
+
+    phases = [
+        ("quiet", False, False),
+        ("flood", True, False),
+        ("flood with throttle", True, True),
+    ]
+    def phase(index):
+        if index > 0:
+            report(phases[index - 1][0], well_behaved.latency)
+        if index == len(phases):
+            reactor.stop()
+            return
+        _label, flooding, throttle = phases[index]
+        hostile.flooding = flooding
+        for avatar in server_factory.avatars:
+            avatar.protocol.setThrottlePolicy(policy if throttle else None)
+        well_behaved.latency = Histogram()
+        reactor.callLater(duration, phase, index + 1)
+    reactor.callLater(1, phase, 0)
+    reactor.run()
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
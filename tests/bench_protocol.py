@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Cost of the keepalive of 20k connections:
+#
+#   python tests/bench_protocol.py [connections] [packets]
+#
+# Each connection sends packets to a transport that discards them. The
+# delayed calls of the reactor are counted after the writes and the time
+# of a sweep of all the connections is reported.
+#
+import sys, time
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from twisted.internet import reactor
+
+from pokerpackets.packets import PacketPing
+from pokernetwork.protocol import UGAMEProtocol
+from pokernetwork.protocol._base import keepalive_sweeper
+
+class NullTransport:
+    def write(self, data):
+        pass
+
+def main(connections_count=20000, packets_count=10):
+    keepalive_sweeper.interval = 10
+    protocols = []
+    for _ in xrange(connections_count):
+        protocol = UGAMEProtocol()
+        protocol.transport = NullTransport()
+        protocol.established = True
+        protocol._keepalive_start()
+        protocols.append(protocol)
+
+    packet = PacketPing()
+    start = time.time()
+    for _ in xrange(packets_count):
+        for protocol in protocols:
+            protocol.sendPacket(packet)
+    elapsed = time.time() - start
+    count = connections_count * packets_count
+    print "%-20s %10.0f packets/s (%.3fs)" % ("send", count / elapsed, elapsed)
+    print "%-20s %10d" % ("delayed calls", len(reactor.getDelayedCalls()))
+
+    start = time.time()
+    keepalive_sweeper.sweep()
+    print "%-20s %10.3fs for %d connections" % ("sweep", time.time() - start, connections_count)
+
+    for protocol in protocols:
+        protocol._keepalive_stop()
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+# Encoding and decoding of typical table traffic by MsgpackProtocol, with
+# [type, dict] frames and with compact frames:
+#
+#   python tests/bench_protocol_msgpack.py [packets] [batch]
+#
+# The packets are sent in batches, as the answers to a packet are.
+#
+import sys, time, random
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from pokerpackets.networkpackets import *
+from pokernetwork.protocol import MsgpackProtocol
+
+def traffic(count):
+    random.seed(1)
+    factories = [
+        lambda serial: PacketPokerPlayerChips(game_id = 1, serial = serial, money = random.randint(0, 100000), bet = random.randint(0, 1000)),
+        lambda serial: PacketPokerPosition(game_id = 1, serial = serial, position = serial % 10),
+        lambda serial: PacketPokerCall(game_id = 1, serial = serial),
+        lambda serial: PacketPokerCheck(game_id = 1, serial = serial),
+        lambda serial: PacketPokerFold(game_id = 1, serial = serial),
+        lambda serial: PacketPokerRaise(game_id = 1, serial = serial, amount = random.randint(100, 1000)),
+        lambda serial: PacketPokerTimeoutWarning(game_id = 1, serial = serial, timeout = 30, when = 1300000000),
+        lambda serial: PacketPokerChat(game_id = 1, serial = serial, message = "nice hand"),
+        lambda serial: PacketPokerBoardCards(game_id = 1, cards = [1, 2, 3]),
+    ]
+    return [random.choice(factories)(random.randint(1, 10)) for _ in xrange(count)]
+
+class NullTransport:
+    def __init__(self):
+        self.data = []
+    def write(self, data):
+        self.data.append(data)
+
+def bench(label, compact, packets, batch):
+    sender = MsgpackProtocol()
+    sender._compact = compact
+    sender.transport = NullTransport()
+    start = time.time()
+    for i in xrange(0, len(packets), batch):
+        sender.sendPackets(packets[i:i + batch])
+    encode = time.time() - start
+    size = sum(len(data) for data in sender.transport.data)
+
+    received = []
+    receiver = MsgpackProtocol()
+    receiver.packetReceived = received.append
+    start = time.time()
+    for data in sender.transport.data:
+        receiver.dataReceived(data)
+    decode = time.time() - start
+    assert received == packets
+    print "%-10s encode %9.0f packets/s decode %9.0f packets/s %6.1f bytes/packet" % (
+        label, len(packets) / encode, len(packets) / decode, size / float(len(packets))
+    )
+
+def main(packets_count=200000, batch=10):
+    packets = traffic(packets_count)
+    bench("map", False, packets, batch)
+    bench("compact", True, packets, batch)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
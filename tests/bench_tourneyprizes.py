@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+#
+# Lobby polling of 100 concurrent tourneys:
+#
+#   python tests/bench_tourneyprizes.py [polls] [tourneys] [schedules]
+#
+# Each poll asks the tourneyselectinfo plugin for the prizes of the
+# schedules of all the tourneys and asks the service for the prizes of
+# each tourney, while one player registers in a random tourney. Without
+# the caches (cache="0" and tourney.prizes() each time) it measures the
+# cost the lobby used to have, with them the cost it has now. The
+# database answers immediately, only its statements are counted.
+#
+import sys, time, random
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from pokernetwork import pokerservice
+from pokerprizes.tourneyselectinfo import Handle
+
+settings_xml_server = """<?xml version="1.0" encoding="UTF-8"?>
+<server verbose="0" autodeal="yes" simultaneous="4" chat="yes">
+  <delays autodeal="20" round="0" position="0" showdown="0" autodeal_max="1" finish="0" />
+  <users temporary="BOT.*"/>
+</server>
+"""
+
+settings_xml_prizes = """<?xml version="1.0" encoding="UTF-8"?>
+<settings tourneys_schedule2prizes="tourneys_schedule2prizes" prizes="prizes" cache="%d"/>
+"""
+
+class ImmediateResult:
+    def num_rows(self):
+        return 1
+
+class ImmediateConnection:
+    def query(self, sql):
+        pass
+    def store_result(self):
+        return ImmediateResult()
+
+class ImmediateCursor:
+    def __init__(self, database):
+        self.database = database
+        self.rows = []
+    def execute(self, sql, args=()):
+        self.database.statements += 1
+        serials = sql[sql.index("IN ( ") + 5:sql.index(" )")].split(",")
+        self.rows = [{'schedule_serial': int(serial), 'serial': int(serial), 'name': 'prize%s' % serial} for serial in serials]
+    def fetchall(self):
+        return self.rows
+    def close(self):
+        pass
+
+class ImmediateDatabase:
+    def __init__(self):
+        self.statements = 0
+        self.db = ImmediateConnection()
+    def cursor(self, cursorclass=None):
+        return ImmediateCursor(self)
+
+class Tourney:
+    def __init__(self, serial, schedule_serial):
+        self.serial = serial
+        self.schedule_serial = schedule_serial
+        self.registered = 0
+        self.computed = 0
+    def prizes(self):
+        #
+        # the payout of the winners as a share of the buy ins, as
+        # PokerPrizes does for the registered players
+        #
+        self.computed += 1
+        winners = max(1, self.registered / 10)
+        pool = 1000 * self.registered
+        weights = [1.0 / (rank + 1) for rank in xrange(winners)]
+        total = sum(weights)
+        return [int(pool * weight / total) for weight in weights]
+
+def main(polls=2000, tourneys_count=100, schedules=10):
+    random.seed(1)
+    service = pokerservice.PokerService(settings_xml_server)
+    service.db = ImmediateDatabase()
+    for label, cache in (("uncached", 0), ("cached", 60)):
+        tourneys = [Tourney(serial, serial % schedules) for serial in xrange(tourneys_count)]
+        handle = Handle(service, settings_xml_prizes % cache)
+        if cache:
+            prizes = service.tourneyPrizes
+        else:
+            prizes = lambda tourney: list(tourney.prizes())
+        service.db.statements = 0
+        start = time.time()
+        for _ in xrange(polls):
+            tourney = random.choice(tourneys)
+            tourney.registered += 1
+            service.tourneyPrizesChanged(tourney)
+            handle(service, None, tourneys)
+            for tourney in tourneys:
+                prizes(tourney)
+        elapsed = time.time() - start
+        print "%-30s %10.0f polls/s (%.3fs)" % (label, polls / elapsed, elapsed)
+        print "%-30s %10d statements, %d prizes computed" % (label, service.db.statements, sum(tourney.computed for tourney in tourneys))
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -67,6 +67,8 @@ class FakeService(service.Service):
         self._keepalive_delay = 0.1
 
 class FakeAvatar:
+    metrics = None
+
     def __init__(self):
         pass
 
@@ -63,6 +63,7 @@ from pokerpackets.networkpackets import *
 from pokerpackets.clientpackets import *
 from pokernetwork.pokertable import PokerAvatarCollection
 from pokernetwork.pokerrestclient import PokerRestClient
+from pokernetwork.pokerqueue import PacketQueue
 
 try:
     from nose.plugins.attrib import attr
@@ -618,7 +619,7 @@ class PokerAvatarTestCase(PokerAvatarTestCaseBaseClass):
         self.assertNotEqual(None, avatar.explain)
         avatar.queuePackets()
         avatar.handlePacketLogic(PacketLogin(name = 'user0', password = 'password1'))
-        answer = avatar._packets_queue[0]
+        answer = list(avatar._packets_queue)[0]
         self.assertEqual(PACKET_ERROR, answer.type)
         return (client, packet)
     # ------------------------------------------------------------------------
@@ -3587,8 +3588,9 @@ class PokerAvatarTestCase(PokerAvatarTestCaseBaseClass):
                 log_history.search('removing player %d from game' % (av2.getSerial(),)), 
                 True
             )
-            self.assertTrue(len(av2._packets_queue) > 21)
-            for pack in av0._packets_queue[-1:], av0._packets_queue[-1:]:
+            # the superseded packets were removed before the disconnection
+            self.assertTrue(len(av2._packets_queue) >= self.service.getClientQueuedPacketMax())
+            for pack in list(av0._packets_queue)[-1:], list(av0._packets_queue)[-1:]:
                 pack = pack[0]
                 self.assertEquals(pack.type, PACKET_POKER_PLAYER_LEAVE)
                 self.assertEquals(pack.serial, av2.getSerial())
@@ -3871,7 +3873,8 @@ class PokerAvatarTestCase(PokerAvatarTestCaseBaseClass):
             self.assertEquals(d, avatar._longpoll_deferred)
             self.assertEquals(False, avatar._block_longpoll_deferred)
             self.assertEquals(True, avatar.longPollTimer.active())
-            avatar._packets_queue = ['foo']
+            avatar._packets_queue = PacketQueue()
+            avatar._packets_queue.append('foo')
             avatar._longpoll_deferred.addCallback(self.assertEquals, ['foo'])
             return d
         d.addCallback(handleLongPoll)
@@ -3903,7 +3906,8 @@ class PokerAvatarTestCase(PokerAvatarTestCaseBaseClass):
         def handleLongPollReturn(x):
             avatar = self.service.avatars[0]
             d = avatar.handlePacketDefer(PacketPokerLongPoll())
-            avatar._packets_queue = ['foo']
+            avatar._packets_queue = PacketQueue()
+            avatar._packets_queue.append('foo')
             d.addCallback(self.assertEquals, ['foo'])
             avatar.handlePacketDefer(PacketPokerLongPollReturn())
             self.assertEquals(False, avatar.longPollTimer.active())
@@ -3936,7 +3940,8 @@ class PokerAvatarTestCase(PokerAvatarTestCaseBaseClass):
         d.addCallback(self.joinTable, 0, 2, 'Table2', '1-2_20-200_limit')
         def handleLongPollReturn(x):
             avatar = self.service.avatars[0]
-            avatar._packets_queue = ['foo']
+            avatar._packets_queue = PacketQueue()
+            avatar._packets_queue.append('foo')
             packets = avatar.handlePacketDefer(PacketPokerLongPollReturn())
             self.assertEquals([], packets)
         d.addCallback(handleLongPollReturn)
@@ -3950,7 +3955,8 @@ class PokerAvatarTestCase(PokerAvatarTestCaseBaseClass):
         d.addCallback(self.joinTable, 0, 2, 'Table2', '1-2_20-200_limit')
         def handleLongPoll(x):
             avatar = self.service.avatars[0]
-            avatar._packets_queue = ['foo']
+            avatar._packets_queue = PacketQueue()
+            avatar._packets_queue.append('foo')
             d = avatar.handlePacketDefer(PacketPokerLongPoll())
             d.addCallback(self.assertEquals, ['foo'])
             self.assertNotEquals(None, d)
@@ -4288,6 +4294,74 @@ def fixIt(client_info):
     return client
 ##############################################################################
 
+class PokerAvatarDispatchTestCase(unittest.TestCase):
+
+    class MockTable:
+        def __init__(mtSelf):
+            mtSelf.game = PokerAvatarDispatchTestCase.MockGame()
+            mtSelf.updated = 0
+        def update(mtSelf):
+            mtSelf.updated += 1
+
+    class MockGame:
+        id = 1
+
+    def setUp(self):
+        from pokernetwork import pokeravatar
+        self.avatar = pokeravatar.PokerAvatar(PokerAvatarNoClientServerTestCase.MockService())
+        self.avatar.isAuthorized = lambda packet_type: True
+        self.table = None
+        self.avatar.packet2table = lambda packet: self.table
+        self.calls = []
+
+    def test01_handlers(self):
+        from pokernetwork import pokeravatar
+        for packet_type, (kind, name) in pokeravatar.PACKET_HANDLERS.iteritems():
+            self.failUnless(hasattr(pokeravatar.PokerAvatar, name), name)
+        for packet_type in (PACKET_POKER_FOLD, PACKET_POKER_CALL, PACKET_POKER_RAISE, PACKET_POKER_CHECK):
+            self.assertEquals(pokeravatar.HANDLER_TABLE, pokeravatar.PACKET_HANDLERS[packet_type][0])
+        self.assertEquals(pokeravatar.HANDLER_PUBLIC, pokeravatar.PACKET_HANDLERS[PACKET_PING][0])
+
+    def test02_table(self):
+        self.avatar.handlePacketPokerFold = lambda packet, table, game: self.calls.append((packet, table, game))
+        packet = PacketPokerFold(game_id = 1, serial = 2)
+        self.avatar.handlePacketLogic(packet)
+        self.assertEquals([], self.calls)
+        self.table = PokerAvatarDispatchTestCase.MockTable()
+        self.avatar.handlePacketLogic(packet)
+        self.assertEquals([(packet, self.table, self.table.game)], self.calls)
+        self.assertEquals(1, self.table.updated)
+        #
+        # a packet without handler still updates the table
+        #
+        self.avatar.handlePacketLogic(PacketPokerTableDestroy(game_id = 1))
+        self.assertEquals(2, self.table.updated)
+
+    def test03_no_table(self):
+        self.avatar.handlePacketLogout = lambda packet: self.calls.append(packet)
+        packet = PacketLogout()
+        self.table = PokerAvatarDispatchTestCase.MockTable()
+        self.avatar.handlePacketLogic(packet)
+        self.assertEquals([], self.calls)
+        self.assertEquals(1, self.table.updated)
+        self.table = None
+        self.avatar.handlePacketLogic(packet)
+        self.assertEquals([packet], self.calls)
+
+    def test04_unauthorized(self):
+        self.avatar.isAuthorized = lambda packet_type: False
+        self.avatar.handlePacketPing = lambda packet: self.calls.append(packet)
+        self.avatar.handlePacketPokerFold = lambda packet, table, game: self.calls.append(packet)
+        sent = []
+        self.avatar.sendPacketVerbose = sent.append
+        self.table = PokerAvatarDispatchTestCase.MockTable()
+        ping = PacketPing()
+        self.avatar.handlePacketLogic(ping)
+        self.avatar.handlePacketLogic(PacketPokerFold(game_id = 1, serial = 2))
+        self.assertEquals([ping], self.calls)
+        self.assertEquals([PACKET_AUTH_REQUEST], [packet.type for packet in sent])
+        self.assertEquals(0, self.table.updated)
+
 def GetTestSuite():
     loader = runner.TestLoader()
     # loader.methodPrefix = "_test"
@@ -4295,6 +4369,7 @@ def GetTestSuite():
     suite.addTest(loader.loadClass(PokerAvatarLocaleTestCase))
     suite.addTest(loader.loadClass(PokerAvatarTestCase))
     suite.addTest(loader.loadClass(PokerAvatarNoClientServerTestCase))
+    suite.addTest(loader.loadClass(PokerAvatarDispatchTestCase))
     return suite
 
 def Run():
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+import sys
+import os
+import tempfile
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from twisted.trial import unittest, runner, reporter
+
+from pokernetwork import pokernetworkconfig
+from pokernetwork import pokerboteval
+from pokernetwork.pokerboteval import handClass, classPocket, PreflopEquity, EquityCache, BotEvaluator, CLASSES, MAX_OPPONENTS
+
+settings_xml = """<?xml version="1.0" encoding="UTF-8"?>
+<settings>
+  <eval processes="0" batch="2" cache="10"/>
+</settings>
+"""
+
+class Cards:
+    def __init__(self, cards):
+        self.cards = cards
+    def tolist(self, visible):
+        return list(self.cards)
+
+class Player:
+    def __init__(self, pocket):
+        self.hand = Cards(pocket)
+
+class Game:
+    variant = 'holdem'
+    def __init__(self, pocket, board, opponents):
+        self.player = Player(pocket)
+        self.board = Cards(board)
+        self.opponents = opponents
+    def getPlayer(self, serial):
+        return self.player
+    def serialsNotFold(self):
+        return range(self.opponents + 1)
+
+class HandClassTestCase(unittest.TestCase):
+
+    def test01_classes(self):
+        classes = {}
+        for card1 in xrange(52):
+            for card2 in xrange(card1 + 1, 52):
+                index = handClass((card1, card2))
+                classes[index] = classes.get(index, 0) + 1
+        self.assertEqual(CLASSES, len(classes))
+        # 6 pairs, 4 suited and 12 offsuit hands of each class
+        self.assertEqual([4, 6, 12], sorted(set(classes.values())))
+        for index in xrange(CLASSES):
+            self.assertEqual(index, handClass(classPocket(index)))
+
+class PreflopEquityTestCase(unittest.TestCase):
+
+    def test01_saveLoad(self):
+        table = PreflopEquity(range(CLASSES * MAX_OPPONENTS))
+        fd, filename = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            table.save(filename)
+            self.assertEqual(6 + 2 * CLASSES * MAX_OPPONENTS, path.getsize(filename))
+            loaded = PreflopEquity.load(filename)
+        finally:
+            os.unlink(filename)
+        pocket = classPocket(20)
+        self.assertEqual(20, loaded.get(pocket, 1))
+        self.assertEqual(CLASSES + 20, loaded.get(pocket, 2))
+        self.assertEqual(None, loaded.get(pocket, MAX_OPPONENTS + 1))
+        self.assertEqual(None, PreflopEquity().get(pocket, 1))
+
+class EquityCacheTestCase(unittest.TestCase):
+
+    def test01_lru(self):
+        cache = EquityCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(1, cache.get('a'))
+        cache.set('c', 3)
+        self.assertEqual(None, cache.get('b'))
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(2, len(cache))
+
+class BotEvaluatorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        settings = pokernetworkconfig.Config([])
+        settings.loadFromString(settings_xml)
+        self.evaluator = BotEvaluator(settings)
+        self.requests = []
+        def evaluate(requests):
+            self.requests.append(requests)
+            return [(True, 500 + len(request[2])) for request in requests]
+        self.evaluate = pokerboteval.evaluate
+        pokerboteval.evaluate = evaluate
+
+    def tearDown(self):
+        pokerboteval.evaluate = self.evaluate
+        self.evaluator.stop()
+
+    def test01_batch(self):
+        results = []
+        for board in ((1, 2, 3), (3, 2, 1), (4, 5, 6), (7, 8, 9)):
+            self.evaluator.handEV(Game((10, 11), board, 2), 1, 100).addCallback(results.append)
+        self.assertEqual([], results)
+        self.evaluator.flush()
+        self.assertEqual([503] * 4, results)
+        # the same board in another order is the same request
+        self.assertEqual([2, 1], [len(requests) for requests in self.requests])
+        self.evaluator.handEV(Game((11, 10), (9, 8, 7), 2), 1, 100).addCallback(results.append)
+        self.assertEqual(503, results[-1])
+        self.assertEqual(1, self.evaluator.stats['cached'])
+
+    def test02_preflop(self):
+        results = []
+        self.evaluator.handEV(Game((0, 13), (), 1), 1, 100).addCallback(results.append)
+        self.evaluator.handEV(Game((26, 39), (), 1), 1, 100).addCallback(results.append)
+        self.evaluator.flush()
+        # both are a pair of deuces
+        self.assertEqual([500, 500], results)
+        self.assertEqual(1, len(self.requests[0]))
+        self.evaluator.preflop = PreflopEquity([7] * (CLASSES * MAX_OPPONENTS))
+        self.evaluator.handEV(Game((0, 13), (), 1), 1, 100).addCallback(results.append)
+        self.assertEqual(7, results[-1])
+
+    def test03_failure(self):
+        pokerboteval.evaluate = lambda requests: [(False, "error")] * len(requests)
+        d = self.evaluator.handEV(Game((10, 11), (1, 2, 3), 2), 1, 100)
+        self.evaluator.flush()
+        return self.assertFailure(d, Exception)
+
+    def test04_exception(self):
+        def evaluate(requests):
+            raise ImportError("No module named pokereval")
+        pokerboteval.evaluate = evaluate
+        d = self.evaluator.handEV(Game((10, 11), (1, 2, 3), 2), 1, 100)
+        self.evaluator.flush()
+        return self.assertFailure(d, Exception)
+
+    def test05_setup(self):
+        pokerboteval.evaluate = self.evaluate
+        module = sys.modules.get('pokereval')
+        poker_eval = pokerboteval._poker_eval
+        pokerboteval._poker_eval = None
+        # the import of the module fails
+        sys.modules['pokereval'] = None
+        try:
+            results = pokerboteval.evaluate([('holdem', (10, 11), (), 1, 100)] * 2)
+        finally:
+            if module is None:
+                del sys.modules['pokereval']
+            else:
+                sys.modules['pokereval'] = module
+            pokerboteval._poker_eval = poker_eval
+        self.assertEqual([False, False], [ok for ok, ev in results])
+
+    def test06_pool_timeout(self):
+        class Pool:
+            def apply_async(poolSelf, function, args, callback):
+                pass
+            def terminate(poolSelf):
+                pass
+        self.evaluator.processes = 1
+        self.evaluator.pool = Pool()
+        d = self.evaluator.handEV(Game((10, 11), (1, 2, 3), 2), 1, 100)
+        self.evaluator.flush()
+        self.assertEqual(1, len(self.evaluator.running))
+        (serial, (requests, waiting, timer)), = self.evaluator.running.items()
+        timer.cancel()
+        self.evaluator._applied(serial, None)
+        self.assertEqual({}, self.evaluator.running)
+        return self.assertFailure(d, Exception)
+
+    def test07_stop(self):
+        class Pool:
+            def apply_async(poolSelf, function, args, callback):
+                pass
+            def terminate(poolSelf):
+                pass
+        self.evaluator.processes = 1
+        self.evaluator.pool = Pool()
+        running = self.evaluator.handEV(Game((10, 11), (1, 2, 3), 2), 1, 100)
+        self.evaluator.flush()
+        pending = self.evaluator.handEV(Game((10, 11), (4, 5, 6), 2), 1, 100)
+        self.evaluator.stop()
+        self.assertEqual({}, self.evaluator.running)
+        self.assertEqual(0, len(self.evaluator.pending))
+        return self.assertFailure(running, Exception).addCallback(lambda result: self.assertFailure(pending, Exception))
+
+    def test08_default_processes(self):
+        settings = pokernetworkconfig.Config([])
+        settings.loadFromString('<?xml version="1.0" encoding="UTF-8"?><settings/>')
+        self.assertEqual(0, BotEvaluator(settings).processes)
+
+def GetTestSuite():
+    loader = runner.TestLoader()
+    suite = loader.suiteFactory()
+    suite.addTest(loader.loadClass(HandClassTestCase))
+    suite.addTest(loader.loadClass(PreflopEquityTestCase))
+    suite.addTest(loader.loadClass(EquityCacheTestCase))
+    suite.addTest(loader.loadClass(BotEvaluatorTestCase))
+    return suite
+
+def Run():
+    return runner.TrialRunner(
+        reporter.TextReporter,
+        tracebackFormat='default',
+    ).run(GetTestSuite())
+
+if __name__ == '__main__':
+    if Run().wasSuccessful():
+        sys.exit(0)
+    else:
+        sys.exit(1)
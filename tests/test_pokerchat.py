@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+import sys
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from twisted.trial import unittest, runner, reporter
+from twisted.internet import defer
+
+from pokernetwork import pokernetworkconfig
+from pokernetwork.pokerchat import ChatFilter, ChatRateLimiter, ChatArchive
+
+settings_xml = """<?xml version="1.0" encoding="UTF-8"?>
+<server>
+  <chatrate user="2" table="3" period="10"/>
+  <chatarchive flush_delay="60" batch="2" max_pending="3"/>
+</server>
+"""
+
+class MockAsyncDatabase:
+    def __init__(self):
+        self.operations = []
+        self.deferreds = []
+    def runOperation(self, sql, args):
+        self.operations.append((sql, args))
+        d = defer.Deferred()
+        self.deferreds.append(d)
+        return d
+
+class ChatFilterTestCase(unittest.TestCase):
+
+    def test01_sub(self):
+        chat_filter = ChatFilter(["badword\n", "\n", "BAD", "word"])
+        self.assertEqual("no match", chat_filter.sub('poker', "no match"))
+        self.assertEqual("a poker and poker", chat_filter.sub('poker', "a BadWord and bad"))
+        self.assertEqual("pokerpoker", chat_filter.sub('poker', "badbad"))
+
+    def test02_overlap(self):
+        chat_filter = ChatFilter(["abc", "cd", "d", "bcde"])
+        #
+        # leftmost first, then longest
+        #
+        self.assertEqual("XX X", chat_filter.sub('X', "abcd d"))
+        self.assertEqual("XXe", chat_filter.sub('X', "abcde"))
+
+class ChatRateLimiterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        settings = pokernetworkconfig.Config([])
+        settings.loadFromString(settings_xml)
+        self.limiter = ChatRateLimiter(settings)
+
+    def test01_user(self):
+        self.assertTrue(self.limiter.allow(1, 10, now=0))
+        self.assertTrue(self.limiter.allow(1, 10, now=0))
+        self.assertFalse(self.limiter.allow(1, 10, now=1))
+        self.assertTrue(self.limiter.allow(1, 10, now=5))
+
+    def test02_table(self):
+        self.assertTrue(self.limiter.allow(1, 10, now=0))
+        self.assertTrue(self.limiter.allow(1, 11, now=0))
+        self.assertTrue(self.limiter.allow(1, 12, now=0))
+        self.assertFalse(self.limiter.allow(1, 13, now=0))
+        self.assertTrue(self.limiter.allow(2, 13, now=0))
+
+    def test03_prune(self):
+        self.limiter.allow(1, 10, now=0)
+        self.limiter.pruned = 0
+        self.limiter.allow(2, 11, now=20)
+        self.assertEqual([11], self.limiter.users.keys())
+        self.assertEqual([2], self.limiter.tables.keys())
+
+class ChatArchiveTestCase(unittest.TestCase):
+
+    def setUp(self):
+        settings = pokernetworkconfig.Config([])
+        settings.loadFromString(settings_xml)
+        self.adb = MockAsyncDatabase()
+        self.archive = ChatArchive(settings, self.adb)
+
+    def tearDown(self):
+        if self.archive.timer and self.archive.timer.active():
+            self.archive.timer.cancel()
+
+    def test01_batch(self):
+        self.archive.write(1, 10, "one")
+        self.assertEqual([], self.adb.operations)
+        self.archive.write(2, 10, "two")
+        self.assertEqual([(
+            "INSERT INTO chat_messages (player_serial, game_id, message) VALUES (%s, %s, %s), (%s, %s, %s)",
+            [1, 10, "one", 2, 10, "two"]
+        )], self.adb.operations)
+
+    def test02_drop_oldest(self):
+        self.archive.write(1, 10, "one")
+        self.archive.write(2, 10, "two")
+        for i in range(3, 7):
+            self.archive.write(i, 10, str(i))
+        self.assertEqual(3, len(self.archive.pending))
+        self.assertEqual(1, self.archive.dropped)
+        self.assertEqual(4, self.archive.pending[0][0])
+
+    def test03_stop(self):
+        for i in range(3):
+            self.archive.write(i, 10, str(i))
+        d = self.archive.stop()
+        self.adb.deferreds[0].callback(None)
+        self.assertFalse(d.called)
+        self.adb.deferreds[1].callback(None)
+        self.assertTrue(d.called)
+        self.assertEqual([2, 10, "2"], self.adb.operations[1][1])
+        return d
+
+def GetTestSuite():
+    loader = runner.TestLoader()
+    suite = loader.suiteFactory()
+    suite.addTest(loader.loadClass(ChatFilterTestCase))
+    suite.addTest(loader.loadClass(ChatRateLimiterTestCase))
+    suite.addTest(loader.loadClass(ChatArchiveTestCase))
+    return suite
+
+def Run():
+    return runner.TrialRunner(
+        reporter.TextReporter,
+        tracebackFormat='default',
+    ).run(GetTestSuite())
+
+if __name__ == '__main__':
+    if Run().wasSuccessful():
+        sys.exit(0)
+    else:
+        sys.exit(1)
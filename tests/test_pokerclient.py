@@ -1224,7 +1224,7 @@ class PokerClientTestCase(unittest.TestCase):
 
     # ---------------------------------------------------------------------------
     def publishDeadPacket(self, client):
-        if client.publish_packets == []:
+        if not client.publish_packets:
             client.publish_packets.append(PacketPing())
         log_history.reset()
         client.publishPacket()
@@ -1592,6 +1592,71 @@ class PokerClientFactoryUnitMethodCoverageTestCase(unittest.TestCase):
         sys.executable = self.saveExecutable
         reactor.disconnectAll = self.saveReactorDisconnectAll
 # ------------------------------------------------------
+class PublishFactoryMockup:
+    def isOutbound(self, packet):
+        return False
+    def gameExists(self, game_id):
+        return True
+    def isConnectionLess(self, packet):
+        return False
+
+class PokerClientPublishTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.client = pokerclient.PokerClientProtocol()
+        self.client.factory = PublishFactoryMockup()
+        self.client.established = True
+        self.client._poll = True
+        self.published = []
+        self.client.registerHandler('outbound', PACKET_PING, lambda client, packet: self.published.append(packet))
+
+    def tearDown(self):
+        self.client.publishPacketCancelTimer()
+
+    def test01_idle(self):
+        self.assertEqual(None, self.client.publish_timer)
+        self.client.publishPackets()
+        self.assertEqual(None, self.client.publish_timer)
+
+    def test02_publish(self):
+        for _ in range(3):
+            self.client.schedulePacket(PacketPing())
+        timer = self.client.publish_timer
+        self.assertTrue(timer.active())
+        self.client.schedulePacket(PacketPing())
+        self.assertTrue(timer is self.client.publish_timer)
+        timer.cancel()
+        self.client.publishPackets()
+        self.assertEqual(4, len(self.published))
+        self.assertEqual(0, len(self.client.publish_packets))
+        self.assertEqual(None, self.client.publish_timer)
+
+    def test03_deadline(self):
+        self.client.schedulePacket(PacketPing())
+        self.client.publishDelay(10)
+        timer = self.client.publish_timer
+        self.assertApproximates(self.client.publish_time, timer.getTime(), 1)
+        timer.cancel()
+        self.client.publishPackets()
+        self.assertEqual([], self.published)
+        self.assertApproximates(self.client.publish_time, self.client.publish_timer.getTime(), 1)
+
+    def test04_unschedule(self):
+        self.client.schedulePacket(PacketPing())
+        self.client.unschedulePackets(lambda packet: packet.type == PACKET_PING)
+        self.assertEqual(0, len(self.client.publish_packets))
+        self.assertEqual(None, self.client.publish_timer)
+
+    def test05_handlers(self):
+        self.client.schedulePacket(PacketPing())
+        self.client.publishAllPackets()
+        self.assertEqual(1, len(self.published))
+        self.client.unregisterHandler('outbound', PACKET_PING, self.client.callbacks['outbound'][PACKET_PING][0])
+        self.client.schedulePacket(PacketPing())
+        self.client.publishAllPackets()
+        self.assertEqual(1, len(self.published))
+
+# ------------------------------------------------------
 
 def GetTestSuite():
     loader = runner.TestLoader()
@@ -1601,6 +1666,7 @@ def GetTestSuite():
     suite.addTest(loader.loadClass(PokerClientFactoryTestCase))
     suite.addTest(loader.loadClass(PokerSkinMethodUnitTest))
     suite.addTest(loader.loadClass(PokerClientFactoryUnitMethodCoverageTestCase))
+    suite.addTest(loader.loadClass(PokerClientPublishTestCase))
     return suite
 
 def Run():
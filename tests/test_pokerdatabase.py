@@ -38,7 +38,8 @@ from twisted.trial import unittest, runner, reporter
 import _mysql_exceptions
 import warnings
 import twisted.internet.base
-from twisted.internet import reactor
+from twisted.internet import reactor, task
+from twisted.python import failure
 
 twisted.internet.base.DelayedCall.debug = False
 import libxml2
@@ -348,6 +349,163 @@ class PokerDatabaseTestCase(unittest.TestCase):
         self.assertEquals(self.db.literal("ahoy hoy!"),  "LITERAL TEST ahoy hoy!")
         self.db.db = saveRealDb
         
+class ReplicaRouterTestCase(unittest.TestCase):
+
+    class MockDatabase:
+        def __init__(dbSelf):
+            dbSelf.parameters = {'host': 'primary', 'port': '3306', 'user': 'poker', 'password': 'secret', 'name': 'pokernetwork'}
+
+    class MockReplica:
+        def __init__(replicaSelf, replica):
+            replicaSelf.parameters = replica.parameters
+            replicaSelf.connect_timeout = replica.connect_timeout
+            replicaSelf.applied = 0
+            replicaSelf.available = True
+            replicaSelf.lag = None
+            replicaSelf.retry_at = 0
+            replicaSelf.retry_delay = 0
+            replicaSelf.reads = 0
+            replicaSelf.heartbeat_closed = 0
+        def getBeat(replicaSelf):
+            replicaSelf.reads += 1
+            if not replicaSelf.available:
+                raise MySQLdb.OperationalError(2003, "Can't connect")
+            return replicaSelf.applied
+        def incrementBeat(replicaSelf):
+            if not replicaSelf.available:
+                raise MySQLdb.OperationalError(2003, "Can't connect")
+            replicaSelf.applied += 1
+            return replicaSelf.applied
+        def cursor(replicaSelf, *args):
+            if not replicaSelf.available:
+                raise MySQLdb.OperationalError(2003, "Can't connect")
+            return replicaSelf.parameters['host']
+        def close(replicaSelf):
+            pass
+        def closeHeartbeat(replicaSelf):
+            replicaSelf.heartbeat_closed += 1
+
+    def setUp(self):
+        self.now = 100.0
+        self.seconds = pokerdatabase.seconds
+        pokerdatabase.seconds = lambda: self.now
+        self.db = ReplicaRouterTestCase.MockDatabase()
+        self.router = pokerdatabase.ReplicaRouter(self.db, {'lag_max': '2', 'check': '1', 'retry_max': '3'}, [{'host': 'replica1'}, {'host': 'replica2', 'port': '3307'}])
+        self.router.replicas = [ReplicaRouterTestCase.MockReplica(replica) for replica in self.router.replicas]
+        self.router.primary = ReplicaRouterTestCase.MockReplica(self.router.primary)
+        self.replica1, self.replica2 = self.router.replicas
+
+    def tearDown(self):
+        pokerdatabase.seconds = self.seconds
+
+    def heartbeat(self, now):
+        """What a beat of the router does, without the thread."""
+        self.now = now
+        try:
+            result = self.router.heartbeat(now)
+        except MySQLdb.Error, e:
+            self.router.heartbeatFailed(failure.Failure(e), now)
+        else:
+            self.router.heartbeatDone(result, now)
+
+    def test01_parameters(self):
+        self.assertEqual('poker', self.replica1.parameters['user'])
+        self.assertEqual('3306', self.replica1.parameters['port'])
+        self.assertEqual('3307', self.replica2.parameters['port'])
+        self.assertEqual('primary', self.router.primary.parameters['host'])
+        self.assertEqual(2, self.replica1.connect_timeout)
+
+    def test02_lag(self):
+        #
+        # the replicas are not used before the first heartbeat
+        #
+        self.assertEqual(None, self.router.cursor())
+        self.heartbeat(100.0)
+        self.assertEqual('replica1', self.router.cursor())
+        self.assertEqual('replica2', self.router.cursor())
+        self.replica1.applied = 1
+        self.heartbeat(103.0)
+        self.assertEqual(0, self.replica1.lag)
+        self.assertEqual(3.0, self.replica2.lag)
+        self.assertEqual('replica1', self.router.cursor())
+        self.assertEqual('replica1', self.router.cursor())
+        self.replica2.applied = 2
+        self.heartbeat(104.0)
+        self.assertEqual(1.0, self.replica1.lag)
+        self.assertEqual(0, self.replica2.lag)
+        self.assertEqual((1, 100.0), self.router.forgotten)
+        self.assertEqual([(2, 103.0), (3, 104.0)], list(self.router.beats))
+
+    def test03_unavailable(self):
+        self.replica1.available = False
+        self.replica2.available = False
+        self.heartbeat(100.0)
+        self.assertEqual(None, self.router.cursor())
+        self.assertEqual(None, self.replica1.lag)
+        self.assertEqual(1, self.replica1.heartbeat_closed)
+        self.assertEqual(101.0, self.replica1.retry_at)
+        #
+        # the replicas that cannot be reached are checked less and less
+        # often, up to retry_max seconds
+        #
+        self.heartbeat(100.5)
+        self.assertEqual(1, self.replica1.reads)
+        self.heartbeat(101.0)
+        self.assertEqual(2, self.replica1.reads)
+        self.assertEqual(103.0, self.replica1.retry_at)
+        self.heartbeat(103.0)
+        self.assertEqual(106.0, self.replica1.retry_at)
+        self.heartbeat(106.0)
+        self.assertEqual(109.0, self.replica1.retry_at)
+        self.replica2.available = True
+        self.replica2.applied = 100
+        self.heartbeat(109.0)
+        self.assertEqual(0, self.replica2.retry_delay)
+        self.assertEqual('replica2', self.router.cursor())
+        #
+        # a replica that fails to connect is not used until it is checked
+        #
+        self.replica2.available = False
+        self.assertEqual(None, self.router.cursor())
+        self.assertEqual(None, self.replica2.lag)
+        self.assertEqual(110.0, self.replica2.retry_at)
+
+    def test04_forgotten(self):
+        self.router.beats_max = 2
+        self.router.primary.applied = 0
+        self.replica1.applied = 10
+        for now in (100.0, 101.0, 102.0):
+            self.heartbeat(now)
+        self.assertEqual((1, 100.0), self.router.forgotten)
+        self.heartbeat(110.0)
+        self.assertEqual(0, self.replica1.lag)
+        self.assertEqual(10.0, self.replica2.lag)
+
+    def test05_primary_unavailable(self):
+        self.heartbeat(100.0)
+        self.assertEqual(0, self.replica1.lag)
+        self.router.primary.available = False
+        self.heartbeat(101.0)
+        self.assertEqual(1, self.router.primary.heartbeat_closed)
+        self.assertEqual(None, self.replica1.lag)
+        self.assertEqual(None, self.router.cursor())
+
+    def test06_listeners(self):
+        times = []
+        self.router.heartbeat_listeners.append(times.append)
+        self.heartbeat(100.0)
+        self.router.primary.available = False
+        self.heartbeat(101.0)
+        self.assertEqual([100.0], times)
+
+    def test07_close(self):
+        self.router.loop = task.LoopingCall(lambda: None)
+        self.router.loop.start(60, now = False)
+        self.router.close()
+        self.assertEqual(None, self.router.loop)
+        self.assertEqual(1, self.router.primary.heartbeat_closed)
+        self.assertEqual(1, self.replica1.heartbeat_closed)
+
 # --------------------------------------------------------------------------------
 def GetTestedModule():
     return pokerdatabase
@@ -356,7 +514,9 @@ def GetTestedModule():
 
 def GetTestSuite():
     loader = runner.TestLoader()
-    suite = loader.loadClass(PokerDatabaseTestCase)
+    suite = loader.suiteFactory()
+    suite.addTest(loader.loadClass(PokerDatabaseTestCase))
+    suite.addTest(loader.loadClass(ReplicaRouterTestCase))
     return suite
 
 def Run():
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+#
+import sys, os, shutil, tempfile
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from config import config
+
+from twisted.trial import unittest, runner, reporter
+
+from pokerengine.pokergame import PokerGameServer
+
+from pokernetwork.pokerdefinitions import GameDefinitions, SharedConfig, GAME_CONFIGS
+
+URL = "poker.%s.xml"
+VARIANT = "holdem"
+BETTING_STRUCTURE = "1-2_20-200_limit"
+
+class SortedDeckShuffler:
+    def shuffle(self, what):
+        what.sort()
+
+def playHand(game):
+    game.shuffler = SortedDeckShuffler()
+    for serial in (1, 2, 3):
+        game.addPlayer(serial)
+        game.payBuyIn(serial, game.buyIn())
+        game.sit(serial)
+        game.autoBlindAnte(serial)
+    game.beginTurn(1)
+    while not game.isEndOrNull():
+        serial = game.getSerialInPosition()
+        if "call" in game.possibleActions(serial):
+            game.call(serial)
+        else:
+            game.check(serial)
+    return game.historyGet()
+
+class GameDefinitionsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dirs = [path.join(config.test.engine_path, 'conf')]
+        self.definitions = GameDefinitions()
+
+    def test01_same_as_game(self):
+        direct = PokerGameServer(URL, self.dirs)
+        direct.setVariant(VARIANT)
+        direct.setBettingStructure(BETTING_STRUCTURE)
+        games = []
+        for _ in xrange(2):
+            game = PokerGameServer(URL, self.dirs)
+            self.definitions.setup(game, URL, self.dirs, VARIANT, BETTING_STRUCTURE)
+            games.append(game)
+        self.assertEqual(2, self.definitions.misses)
+        self.assertEqual(2, self.definitions.hits)
+        for game in games:
+            self.assertEqual(set(direct.__dict__), set(game.__dict__))
+            self.assertEqual(direct.variant, game.variant)
+            self.assertEqual(direct.betting_structure, game.betting_structure)
+            self.assertEqual(direct.maxBuyIn(), game.maxBuyIn())
+
+    def test02_modified(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        for name in (VARIANT, BETTING_STRUCTURE):
+            shutil.copy(path.join(self.dirs[0], URL % name), tmpdir)
+        dirs = [tmpdir]
+        self.definitions.setup(PokerGameServer(URL, dirs), URL, dirs, VARIANT, BETTING_STRUCTURE)
+        self.definitions.setup(PokerGameServer(URL, dirs), URL, dirs, VARIANT, BETTING_STRUCTURE)
+        self.assertEqual(2, self.definitions.misses)
+        variant_path = path.join(tmpdir, URL % VARIANT)
+        mtime = os.stat(variant_path).st_mtime
+        os.utime(variant_path, (mtime + 10, mtime + 10))
+        self.definitions.setup(PokerGameServer(URL, dirs), URL, dirs, VARIANT, BETTING_STRUCTURE)
+        self.assertEqual(3, self.definitions.misses)
+        self.assertEqual(3, self.definitions.hits)
+
+    def test03_hand(self):
+        direct = PokerGameServer(URL, self.dirs)
+        direct.setVariant(VARIANT)
+        direct.setBettingStructure(BETTING_STRUCTURE)
+        history = playHand(direct)
+        for _ in xrange(2):
+            game = PokerGameServer(URL, self.dirs)
+            self.definitions.setup(game, URL, self.dirs, VARIANT, BETTING_STRUCTURE)
+            self.assertEqual(history, playHand(game))
+        self.assertEqual(2, self.definitions.hits)
+
+    def test04_shared_documents(self):
+        games = []
+        for _ in xrange(2):
+            game = PokerGameServer(URL, self.dirs)
+            self.definitions.setup(game, URL, self.dirs, VARIANT, BETTING_STRUCTURE)
+            games.append(game)
+        for name in GAME_CONFIGS:
+            configs = [getattr(game, name) for game in games]
+            for config in configs:
+                self.assertTrue(isinstance(config, SharedConfig), name)
+            self.failIf(configs[0] is configs[1])
+            self.assertTrue(configs[0].doc is configs[1].doc)
+        #
+        # a game that goes away leaves the documents to the others
+        #
+        del games[0]
+        playHand(games[0])
+
+def GetTestSuite():
+    loader = runner.TestLoader()
+    suite = loader.suiteFactory()
+    suite.addTest(loader.loadClass(GameDefinitionsTestCase))
+    return suite
+
+def Run():
+    return runner.TrialRunner(
+        reporter.TextReporter,
+        tracebackFormat='default',
+    ).run(GetTestSuite())
+
+if __name__ == '__main__':
+    if Run().wasSuccessful():
+        sys.exit(0)
+    else:
+        sys.exit(1)
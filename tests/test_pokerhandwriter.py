@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+import sys
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from twisted.trial import unittest, runner, reporter
+from twisted.internet import defer
+
+from pokernetwork import pokernetworkconfig
+from pokernetwork.pokerhandwriter import PokerHandWriter
+
+settings_xml = """<?xml version="1.0" encoding="UTF-8"?>
+<server>
+  <handwriter flush_delay="60" batch="2" max_pending="3" max_queued="6" retries="2" retry_max="150" serial_block="5"/>
+</server>
+"""
+
+class MockCursor:
+    def __init__(self, executed):
+        self.executed = executed
+        self.lastrowid = 100
+    def execute(self, sql, args=()):
+        self.executed.append((sql, list(args)))
+    def close(self):
+        pass
+
+class MockDatabase:
+    def __init__(self):
+        self.executed = []
+    def cursor(self):
+        return MockCursor(self.executed)
+
+class MockAsyncDatabase:
+    def __init__(self):
+        self.executed = []
+        self.deferreds = []
+    def runInteraction(self, function, *args):
+        function(MockCursor(self.executed), *args)
+        d = defer.Deferred()
+        self.deferreds.append(d)
+        return d
+
+class PokerHandWriterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        settings = pokernetworkconfig.Config([])
+        settings.loadFromString(settings_xml)
+        self.db = MockDatabase()
+        self.adb = MockAsyncDatabase()
+        self.writer = PokerHandWriter(settings, self.db, self.adb)
+
+    def tearDown(self):
+        if self.writer.timer and self.writer.timer.active():
+            self.writer.timer.cancel()
+
+    def test01_createHand(self):
+        self.assertEqual(100, self.writer.createHand(1, None))
+        self.assertEqual(101, self.writer.createHand(2, 7))
+        self.assertEqual(1, len(self.db.executed))
+        self.assertEqual(("INSERT INTO hands (description) VALUES " + ", ".join(["('[]')"] * 5), []), self.db.executed[0])
+
+    def test02_batch(self):
+        hand_serial = self.writer.createHand(1, None)
+        d = self.writer.write(hand_serial, [('game',)], [3, 4])
+        self.assertEqual([], self.adb.executed)
+        self.assertEqual([('game',)], self.writer.getDescription(hand_serial))
+        self.writer.write(200, [('game',)], [5])
+        self.assertEqual(2, len(self.adb.executed))
+        sql, args = self.adb.executed[0]
+        self.assertEqual(
+            "UPDATE hands SET description = CASE serial WHEN %s THEN %s WHEN %s THEN %s END"
+            ", game_id = CASE serial WHEN %s THEN %s ELSE game_id END"
+            ", tourney_serial = CASE serial WHEN %s THEN %s ELSE tourney_serial END"
+            " WHERE serial IN (%s, %s)", sql)
+        self.assertEqual([100, "[('game',)]", 200, "[('game',)]", 100, 1, 100, None, 100, 200], args)
+        self.assertEqual(("INSERT INTO user2hand (user_serial, hand_serial) VALUES (%s, %s), (%s, %s), (%s, %s)", [3, 100, 4, 100, 5, 200]), self.adb.executed[1])
+        self.adb.deferreds[0].callback(None)
+        self.assertEqual(None, self.writer.getDescription(hand_serial))
+        return d
+
+    def test03_congested(self):
+        for hand_serial in range(1, 6):
+            self.writer.write(hand_serial, [], [1])
+        self.assertTrue(self.writer.isCongested())
+        self.adb.deferreds[0].callback(None)
+        self.assertTrue(self.writer.isCongested())
+        self.adb.deferreds[1].callback(None)
+        self.assertFalse(self.writer.isCongested())
+        self.assertEqual(1, len(self.writer.pending))
+
+    def test04_stop(self):
+        self.writer.createHand(1, None)
+        for hand_serial in range(1, 4):
+            self.writer.write(hand_serial, [], [1])
+        d = self.writer.stop()
+        self.assertFalse(d.called)
+        self.adb.deferreds[0].callback(None)
+        self.adb.deferreds[1].callback(None)
+        self.assertTrue(d.called)
+        self.assertEqual([], self.writer.pending)
+        self.assertEqual(("DELETE FROM hands WHERE serial IN (%s, %s, %s, %s)", [104, 103, 102, 101]), self.db.executed[-1])
+        return d
+
+    def test05_retry(self):
+        hand_serial = self.writer.createHand(1, None)
+        saved = []
+        self.writer.write(hand_serial, [], [1]).addCallback(saved.append)
+        self.writer.write(200, [], [2]).addCallback(saved.append)
+        self.adb.deferreds[0].errback(UserWarning("deadlock"))
+        self.assertEqual([], saved)
+        self.assertEqual([hand_serial, 200], [hand[0] for hand in self.writer.pending])
+        self.assertEqual((1, None), self.writer.hand2game[hand_serial])
+        self.assertEqual(120, self.writer.timer.getTime() - self.writer.timer.seconds())
+        #
+        # no batch is written before the retry, even when enough hands wait
+        #
+        self.writer.write(300, [], [3])
+        self.assertEqual(1, len(self.adb.deferreds))
+        self.writer.flush()
+        self.adb.deferreds[1].errback(UserWarning("deadlock"))
+        self.assertEqual(150, self.writer.timer.getTime() - self.writer.timer.seconds())
+        self.writer.flush()
+        self.adb.deferreds[2].callback(None)
+        self.assertEqual([hand_serial, 200], saved)
+        self.assertEqual(0, self.writer.failures)
+        self.assertEqual([300], [hand[0] for hand in self.writer.pending])
+
+    def test06_give_up(self):
+        failed = []
+        for hand_serial in (1, 2):
+            self.writer.write(hand_serial, [], [1]).addErrback(failed.append)
+        for index in range(3):
+            self.writer.flush()
+            self.adb.deferreds[index].errback(UserWarning("deadlock"))
+        self.assertEqual(2, len(failed))
+        self.assertTrue(failed[0].check(UserWarning))
+        self.assertEqual([], self.writer.pending)
+        self.assertEqual(None, self.writer.getDescription(1))
+        self.assertEqual(0, self.writer.failures)
+
+    def test07_max_queued(self):
+        for hand_serial in range(1, 9):
+            self.writer.write(hand_serial, [], [1])
+        self.assertEqual(6, len(self.writer.pending))
+        failed = []
+        self.writer.write(9, [], [1]).addErrback(failed.append)
+        self.assertTrue(failed[0].check(UserWarning))
+        self.assertEqual(None, self.writer.getDescription(9))
+        self.assertEqual(6, len(self.writer.pending))
+
+def GetTestSuite():
+    loader = runner.TestLoader()
+    suite = loader.suiteFactory()
+    suite.addTest(loader.loadClass(PokerHandWriterTestCase))
+    return suite
+
+def Run():
+    return runner.TrialRunner(
+        reporter.TextReporter,
+        tracebackFormat='default',
+    ).run(GetTestSuite())
+
+if __name__ == '__main__':
+    if Run().wasSuccessful():
+        sys.exit(0)
+    else:
+        sys.exit(1)
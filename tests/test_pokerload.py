@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+import sys
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from twisted.trial import unittest, runner, reporter
+
+from pokerpackets.packets import *
+from pokerpackets.networkpackets import *
+
+from pokernetwork import pokernetworkconfig
+from pokernetwork.pokerload import LoadGenerator, LoadPlayer, parseServerLag, renderReport
+from pokernetwork.pokermetrics import PacketMetrics
+
+settings_xml = """<?xml version="1.0" encoding="UTF-8"?>
+<settings name_prefix="LOAD">
+  <servers>127.0.0.1:19380</servers>
+  <load clients="100" rate="10" ramp="10" duration="60" protocols="binarypack,rest" rest="19384"/>
+</settings>
+"""
+
+class LoadGeneratorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        settings = pokernetworkconfig.Config([])
+        settings.loadFromString(settings_xml)
+        self.generator = LoadGenerator(settings)
+
+    def test01_settings(self):
+        self.assertEqual(['binarypack', 'rest'], self.generator.protocols)
+        self.assertEqual({'binarypack': 19380, 'msgpack': 0, 'rest': 19384}, self.generator.ports)
+
+    def test02_target(self):
+        self.assertEqual(0, self.generator.target(0))
+        self.assertEqual(5, self.generator.target(1 * 10 ** 0.5))
+        self.assertEqual(50, self.generator.target(10))
+        self.assertEqual(60, self.generator.target(11))
+        self.assertEqual(100, self.generator.target(1000))
+
+    def test03_assignTable(self):
+        tables = [
+            PacketPokerTable(id = 1, seats = 2, players = 1),
+            PacketPokerTable(id = 2, seats = 2, players = 0),
+        ]
+        self.assertEqual([1, 2, 2, None], [self.generator.assignTable(tables) for _ in range(4)])
+
+    def test04_serverLag(self):
+        metrics = PacketMetrics()
+        for value in (10, 20, 30000):
+            metrics.reactor_lag.record(value)
+        lag = parseServerLag(metrics.render())
+        self.assertEqual(3, lag['count'])
+        self.assertEqual(30000, lag['max'])
+        self.assertEqual(20, lag['p50'])
+
+    def test05_report(self):
+        report = self.generator.stats.report(10, None)
+        self.assertEqual(0, report['hands_per_second'])
+        self.assertTrue("reactor lag (server)     unknown" in renderReport(report))
+
+class LoadPlayerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        settings = pokernetworkconfig.Config([])
+        settings.loadFromString(settings_xml)
+        self.generator = LoadGenerator(settings)
+        self.sent = []
+        self.player = LoadPlayer(self.generator, "LOAD1", "LOAD1")
+        self.player.start(self.sent.append)
+
+    def test01_login(self):
+        self.assertEqual([PACKET_POKER_SET_ROLE, PACKET_LOGIN], [packet.type for packet in self.sent])
+        self.player.packetReceived(PacketAuthOk())
+        self.player.packetReceived(PacketSerial(serial = 4))
+        self.assertEqual(1, self.generator.stats.login.count)
+        self.assertEqual(PACKET_POKER_TABLE_SELECT, self.sent[-1].type)
+        del self.sent[:]
+        self.player.packetReceived(PacketPokerTableList(packets = [PacketPokerTable(id = 7, seats = 2, players = 0)]))
+        self.assertEqual(7, self.player.game_id)
+        self.assertEqual(
+            [PACKET_POKER_TABLE_JOIN, PACKET_POKER_SEAT, PACKET_POKER_BUY_IN, PACKET_POKER_AUTO_BLIND_ANTE, PACKET_POKER_SIT],
+            [packet.type for packet in self.sent]
+        )
+        self.assertEqual(4, self.sent[0].serial)
+
+    def test02_act(self):
+        self.player.serial = 4
+        self.player.game_id = 7
+        self.player.packetReceived(PacketPokerPosition(game_id = 7, serial = 4))
+        self.assertEqual(PACKET_POKER_CHECK, self.sent[-1].type)
+        self.player.packetReceived(PacketPokerCheck(game_id = 7, serial = 4))
+        self.assertEqual(1, self.generator.stats.action.count)
+        self.player.packetReceived(PacketPokerPlayerChips(game_id = 7, serial = 5, bet = 20, money = 100))
+        self.player.packetReceived(PacketPokerPosition(game_id = 7, serial = 4))
+        self.assertTrue(self.sent[-1].type in (PACKET_POKER_CALL, PACKET_POKER_FOLD))
+        self.player.packetReceived(PacketPokerState(game_id = 7, string = "flop"))
+        self.assertEqual({}, self.player.bets)
+
+    def test03_rebuy(self):
+        self.player.serial = 4
+        self.player.game_id = 7
+        self.player.packetReceived(PacketPokerPlayerChips(game_id = 7, serial = 4, bet = 0, money = 0))
+        self.assertEqual([PACKET_POKER_REBUY, PACKET_POKER_SIT], [packet.type for packet in self.sent[-2:]])
+
+def GetTestSuite():
+    loader = runner.TestLoader()
+    suite = loader.suiteFactory()
+    suite.addTest(loader.loadClass(LoadGeneratorTestCase))
+    suite.addTest(loader.loadClass(LoadPlayerTestCase))
+    return suite
+
+def Run():
+    return runner.TrialRunner(
+        reporter.TextReporter,
+        tracebackFormat='default',
+    ).run(GetTestSuite())
+
+if __name__ == '__main__':
+    if Run().wasSuccessful():
+        sys.exit(0)
+    else:
+        sys.exit(1)
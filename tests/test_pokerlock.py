@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+import sys
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from twisted.trial import unittest, runner, reporter
+from twisted.internet import defer, reactor
+
+from pokerpackets.networkpackets import PacketPokerCashIn
+
+from pokernetwork import pokernetworkconfig
+from pokernetwork.pokerlock import PokerLockManager, PokerMySQLLockManager
+from pokernetwork.pokercashier import PokerCashier
+
+settings_xml_cashier = """<?xml version="1.0" encoding="UTF-8"?>
+<server>
+  <database name="pokernetworktest" host="localhost" user="pokernetworktest" password="pokernetwork"/>
+  <cashier acquire_timeout="0" lock="local"/>
+</server>
+"""
+
+class PokerLockManagerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.locks = PokerLockManager()
+
+    def tearDown(self):
+        self.locks.close()
+
+    def test01_order(self):
+        granted = []
+        d1 = self.locks.acquire("one", 10)
+        d1.addCallback(granted.append)
+        d2 = self.locks.acquire("one", 10)
+        d2.addCallback(lambda name: granted.append(2))
+        d3 = self.locks.acquire("two", 10)
+        d3.addCallback(lambda name: granted.append(3))
+        self.assertEqual(["one", 3], granted)
+        self.assertTrue(self.locks.isLocked("one"))
+        self.locks.release("one")
+        self.assertTrue(self.locks.isLocked("one"))
+        def released(result):
+            self.assertEqual(["one", 3, 2], granted)
+            self.locks.release("one")
+            self.locks.release("two")
+            self.assertFalse(self.locks.isLocked("one"))
+            self.assertFalse(self.locks.isLocked("two"))
+        d2.addCallback(released)
+        return d2
+
+    def test02_timeout(self):
+        self.locks.acquire("one", 10)
+        d = self.locks.acquire("one", 0.01)
+        def timedOut(reason):
+            self.assertEqual(PokerLockManager.TIMED_OUT, reason.value.args[0])
+            self.assertEqual(0, len(self.locks.locks["one"]))
+        d.addCallbacks(self.fail, timedOut)
+        return d
+
+    def test03_release(self):
+        self.assertRaises(Exception, self.locks.release, "one")
+
+    def test04_close(self):
+        self.locks.acquire("one", 10)
+        d = self.locks.acquire("one", 10)
+        self.locks.close()
+        self.assertFailure(d, Exception)
+        self.assertFailure(self.locks.acquire("one", 10), Exception)
+        return d
+
+class MockCursor:
+    def __init__(self, db):
+        self.db = db
+    def execute(self, sql, args):
+        self.db.queries.append(sql % args)
+        self.result = self.db.results.pop(0) if self.db.results else 1
+    def fetchone(self):
+        return (self.result,)
+    def close(self):
+        pass
+
+class MockDB:
+    def __init__(self):
+        self.queries = []
+        self.results = []
+        self.closed = False
+    def cursor(self):
+        return MockCursor(self)
+    def close(self):
+        self.closed = True
+
+class MockMySQLLockManager(PokerMySQLLockManager):
+    def connect(self):
+        db = MockDB()
+        self.dbs.append(db)
+        return db
+    def _run(self, function, *args):
+        return defer.maybeDeferred(function, *args)
+
+class PokerMySQLLockManagerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.locks = MockMySQLLockManager({}, 1)
+        self.locks.dbs = []
+
+    def tearDown(self):
+        self.locks.close()
+
+    def test01_connections(self):
+        d1 = self.locks.acquire("one", 10)
+        d2 = self.locks.acquire("two", 10)
+        self.assertTrue(d1.called)
+        self.assertFalse(d2.called)
+        self.assertEqual(1, len(self.locks.dbs))
+        db = self.locks.dbs[0]
+        self.assertEqual(["SELECT GET_LOCK(one, 10)"], db.queries)
+        self.locks.release("one")
+        self.assertTrue(d2.called)
+        self.assertEqual(["SELECT GET_LOCK(one, 10)", "SELECT RELEASE_LOCK(one)", "SELECT GET_LOCK(two, 10)"], db.queries)
+        self.assertTrue(self.locks.held["two"] is db)
+
+    def test02_timeout(self):
+        self.locks.acquire("one", 10)
+        db = self.locks.dbs[0]
+        self.locks.release("one")
+        db.results.append(0)
+        d = self.locks.acquire("one", 10)
+        self.assertFailure(d, Exception)
+        self.assertFalse(self.locks.isLocked("one"))
+        self.assertEqual([db], self.locks.idle)
+        return d
+
+class PokerCashierLockTestCase(unittest.TestCase):
+
+    def setUp(self):
+        settings = pokernetworkconfig.Config([])
+        settings.loadFromString(settings_xml_cashier)
+        self.cashier = PokerCashier(settings)
+        self.cashier.locks.close()
+        self.cashier.locks = MockMySQLLockManager({}, 2)
+        self.cashier.locks.dbs = []
+        self.cashier.getCurrencySerial = lambda url, reentrant = True: 1
+
+    def tearDown(self):
+        self.cashier.close()
+
+    def test01_timeout(self):
+        cashier = self.cashier
+        #
+        # another request holds the lock of the currency
+        #
+        held = cashier.lock(1)
+        self.assertTrue(held.called)
+        cashier.cashInValidateNote = lambda lock_name, packet: self.fail("the lock was not granted")
+        packet = PacketPokerCashIn(serial = 3, url = "http://fake/", value = 100)
+        d = cashier.cashIn(packet)
+        self.assertFailure(d, Exception)
+        def timedOut(reason):
+            self.assertEqual(PokerLockManager.TIMED_OUT, reason.args[0])
+            self.assertFalse(hasattr(packet, "currency_serial"))
+            #
+            # the lock and its connection still belong to the holder
+            #
+            self.assertTrue(cashier.locks.isLocked("cash_1"))
+            self.assertTrue("cash_1" in cashier.locks.held)
+            cashier.unlock(1)
+            self.assertFalse(cashier.locks.isLocked("cash_1"))
+            self.assertEqual(["SELECT GET_LOCK(cash_1, 0)", "SELECT RELEASE_LOCK(cash_1)"], cashier.locks.dbs[0].queries)
+        d.addCallback(timedOut)
+        return d
+
+    def test02_release(self):
+        cashier = self.cashier
+        def validate(lock_name, packet):
+            self.assertTrue(cashier.locks.isLocked(lock_name))
+            raise UserWarning("currency server unreachable")
+        cashier.cashInValidateNote = validate
+        packet = PacketPokerCashIn(serial = 3, url = "http://fake/", value = 100)
+        d = cashier.cashIn(packet)
+        self.assertFailure(d, UserWarning)
+        def failed(reason):
+            self.assertFalse(cashier.locks.isLocked("cash_1"))
+        d.addCallback(failed)
+        return d
+
+def GetTestSuite():
+    loader = runner.TestLoader()
+    suite = loader.suiteFactory()
+    suite.addTest(loader.loadClass(PokerLockManagerTestCase))
+    suite.addTest(loader.loadClass(PokerMySQLLockManagerTestCase))
+    suite.addTest(loader.loadClass(PokerCashierLockTestCase))
+    return suite
+
+def Run():
+    return runner.TrialRunner(
+        reporter.TextReporter,
+        tracebackFormat='default',
+    ).run(GetTestSuite())
+
+if __name__ == '__main__':
+    if Run().wasSuccessful():
+        sys.exit(0)
+    else:
+        sys.exit(1)
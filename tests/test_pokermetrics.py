@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+import sys
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from twisted.trial import unittest, runner, reporter
+
+from pokerpackets.packets import PACKET_PING
+
+from twisted.python.runtime import seconds
+
+from pokernetwork.pokermetrics import Histogram, PacketMetrics, ReactorLagProbe
+
+class HistogramTestCase(unittest.TestCase):
+
+    def test01_bucket(self):
+        self.assertEqual(31, Histogram.bucket(31))
+        self.assertEqual(32, Histogram.bucket(32))
+        self.assertEqual(32, Histogram.bucket(33))
+        self.assertEqual(33, Histogram.bucket(34))
+        previous = 0
+        for value in xrange(100000):
+            index = Histogram.bucket(value)
+            self.assertTrue(index >= previous)
+            self.assertTrue(value <= Histogram.bucketMax(index))
+            if index > 0:
+                self.assertTrue(value > Histogram.bucketMax(index - 1))
+            previous = index
+
+    def test02_percentile(self):
+        histogram = Histogram()
+        self.assertEqual(0, histogram.percentile(50))
+        for value in xrange(1, 1001):
+            histogram.record(value)
+        self.assertEqual(1000, histogram.count)
+        self.assertEqual(1000, histogram.max)
+        self.assertEqual(500500, histogram.total)
+        for percent, value in ((50, 500), (90, 900), (99, 990)):
+            self.assertTrue(abs(histogram.percentile(percent) - value) <= value / Histogram.SUB_BUCKETS)
+        self.assertEqual(1000, histogram.percentile(100))
+
+class PacketMetricsTestCase(unittest.TestCase):
+
+    def test01_record(self):
+        metrics = PacketMetrics()
+        metrics.record(PACKET_PING, 0.000010)
+        metrics.record(PACKET_PING, 0.000020)
+        metrics.recordOut(PACKET_PING, 7)
+        metrics.recordIn(3)
+        self.assertEqual(3, metrics.bytes_in)
+        self.assertEqual(7, metrics.bytes_out)
+        report = metrics.report()
+        self.assertEqual(1, len(report))
+        report = report.values()[0]
+        self.assertEqual(2, report['handled'])
+        self.assertEqual(20, report['latency_us']['max'])
+        self.assertEqual(30, report['latency_us']['total'])
+        self.assertEqual(1, report['packets_out'])
+        self.assertEqual(7, report['bytes_out'])
+        text = metrics.render()
+        self.assertTrue("poker_bytes_in_total 3\n" in text)
+        self.assertTrue('quantile="0.5"} 10\n' in text)
+
+    def test02_reactorLag(self):
+        metrics = PacketMetrics()
+        probe = ReactorLagProbe(metrics.reactor_lag)
+        probe.expected = seconds() - 0.5
+        probe._probe()
+        probe.stop()
+        self.assertEqual(1, metrics.reactor_lag.count)
+        self.assertTrue(metrics.reactor_lag.max >= 500000)
+        self.assertTrue("poker_reactor_lag_us_count 1\n" in metrics.render())
+
+def GetTestSuite():
+    loader = runner.TestLoader()
+    suite = loader.suiteFactory()
+    suite.addTest(loader.loadClass(HistogramTestCase))
+    suite.addTest(loader.loadClass(PacketMetricsTestCase))
+    return suite
+
+def Run():
+    return runner.TrialRunner(
+        reporter.TextReporter,
+        tracebackFormat='default',
+    ).run(GetTestSuite())
+
+if __name__ == '__main__':
+    if Run().wasSuccessful():
+        sys.exit(0)
+    else:
+        sys.exit(1)
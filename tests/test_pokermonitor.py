@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+import sys
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from twisted.trial import unittest, runner, reporter
+
+from pokernetwork import pokernetworkconfig
+from pokernetwork.pokermonitor import MonitorBus
+
+settings_xml = """<?xml version="1.0" encoding="UTF-8"?>
+<server>
+  <monitorbus size="3" batch="2" flush_delay="60" policy="%s"/>
+</server>
+"""
+
+class MonitorBusTestCase(unittest.TestCase):
+
+    def createBus(self, policy):
+        settings = pokernetworkconfig.Config([])
+        settings.loadFromString(settings_xml % policy)
+        self.bus = MonitorBus(settings)
+        return self.bus
+
+    def tearDown(self):
+        if self.bus.timer and self.bus.timer.active():
+            self.bus.timer.cancel()
+
+    def test01_batch(self):
+        bus = self.createBus('drop')
+        bus.publish(0)
+        self.assertEqual(None, bus.timer)
+        delivered = []
+        bus.addConsumer('a', delivered.append)
+        bus.publish(1)
+        bus.publish(2)
+        bus.publish(3)
+        self.assertEqual([], delivered)
+        self.assertEqual({'a': 3}, bus.lag())
+        bus.flush()
+        self.assertEqual([[1, 2]], delivered)
+        self.assertTrue(bus.timer.active())
+        bus.flush()
+        self.assertEqual([[1, 2], [3]], delivered)
+        self.assertEqual(None, bus.timer)
+        self.assertEqual(0, len(bus.events))
+
+    def test02_cursors(self):
+        bus = self.createBus('drop')
+        a = []
+        b = []
+        bus.addConsumer('a', a.append)
+        bus.publish(1)
+        bus.addConsumer('b', b.append)
+        bus.publish(2)
+        bus.flush()
+        self.assertEqual([[1, 2]], a)
+        self.assertEqual([[2]], b)
+        bus.removeConsumer('a')
+        self.assertEqual({'b': 0}, bus.lag())
+
+    def test03_drop(self):
+        bus = self.createBus('drop')
+        delivered = []
+        consumer = bus.addConsumer('a', delivered.append, lambda: self.fail("disconnected"))
+        for event in range(5):
+            bus.publish(event)
+        bus.flush()
+        self.assertEqual([[2, 3]], delivered)
+        self.assertEqual(2, consumer.dropped)
+        self.assertEqual(2, bus.stats['dropped'])
+
+    def test04_disconnect(self):
+        bus = self.createBus('disconnect')
+        delivered = []
+        disconnected = []
+        bus.addConsumer('a', delivered.append, lambda: disconnected.append(True))
+        bus.addConsumer('b', delivered.append)
+        for event in range(5):
+            bus.publish(event)
+        bus.stop()
+        self.assertEqual([True], disconnected)
+        self.assertEqual(['b'], [consumer.key for consumer in bus.consumers])
+        self.assertEqual([[2, 3], [4]], delivered)
+        self.assertEqual(None, bus.timer)
+
+    def test05_failure(self):
+        bus = self.createBus('drop')
+        def deliver(events):
+            raise Exception("fail")
+        bus.addConsumer('a', deliver)
+        bus.publish(1)
+        bus.flush()
+        self.assertEqual(0, len(bus.events))
+
+    def test06_lossless(self):
+        for policy in ('drop', 'disconnect'):
+            bus = self.createBus(policy)
+            delivered = []
+            lossless = []
+            bus.addConsumer('a', delivered.append)
+            consumer = bus.addConsumer('b', lossless.append, lambda: self.fail("disconnected"), lossless = True)
+            for event in range(5):
+                bus.publish(event)
+            self.assertEqual([[0, 1]], lossless)
+            bus.stop()
+            self.assertEqual([[0, 1], [2, 3], [4]], lossless)
+            self.assertEqual(0, consumer.dropped)
+            self.assertEqual([[2, 3], [4]], delivered)
+
+def GetTestSuite():
+    loader = runner.TestLoader()
+    suite = loader.suiteFactory()
+    suite.addTest(loader.loadClass(MonitorBusTestCase))
+    return suite
+
+def Run():
+    return runner.TrialRunner(
+        reporter.TextReporter,
+        tracebackFormat='default',
+    ).run(GetTestSuite())
+
+if __name__ == '__main__':
+    if Run().wasSuccessful():
+        sys.exit(0)
+    else:
+        sys.exit(1)
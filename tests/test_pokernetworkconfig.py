@@ -66,6 +66,35 @@ class PokerNetworkConfigTestCase(unittest.TestCase):
         self.Config.denotifyUpdates(f)
         self.Config.notifyUpdates(f)
         self.Config.headerSet("/server/@name", "othervalue")
+
+    #--------------------------------------------------------------
+    def test_serverSettings(self):
+        self.Config.loadFromString("""<?xml version="1.0" encoding="UTF-8"?>
+<server autodeal="yes" max_joined="100">
+  <delays autodeal="18" round="12" autodeal_max="1" />
+  <decks><deck>As Ah</deck></decks>
+</server>""")
+        server_settings = self.Config.serverSettings()
+        self.assertTrue(server_settings is self.Config.serverSettings())
+        self.assertEqual(18.0, server_settings.delays['autodeal'])
+        self.assertEqual(1.0, server_settings.autodeal_max)
+        self.assertEqual(15, server_settings.autodeal_check)
+        self.assertEqual(True, server_settings.autodeal)
+        self.assertEqual(100, server_settings.joined_max)
+        self.assertEqual(10, server_settings.missed_round_max)
+        self.assertEqual((['As', 'Ah'],), server_settings.decks)
+        self.assertEqual(False, server_settings.spectators)
+        self.assertEqual(False, server_settings.join_snapshot)
+        updated = []
+        self.Config.notifyUpdates(lambda config: updated.append(config.serverSettings().autodeal))
+        self.Config.headerSet("/server/@autodeal", "no")
+        self.assertEqual([False], updated)
+        self.assertEqual(True, server_settings.autodeal)
+        #
+        # a new document is a new snapshot
+        #
+        self.Config.loadFromString("""<?xml version="1.0" encoding="UTF-8"?><server autodeal="yes"/>""")
+        self.assertEqual({}, self.Config.serverSettings().delays)
         
 #--------------------------------------------------------------
 def GetTestSuite():
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+import sys
+import sys
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from twisted.trial import unittest, runner, reporter
+
+import msgpack
+
+from pokernetwork import pokernetworkconfig
+from pokernetwork.pokerpub import PubService
+
+settings_xml = """<?xml version="1.0" encoding="UTF-8"?>
+<server>
+  <pub buffer="2" policy="%s"/>
+</server>
+"""
+
+class MockService:
+    def __init__(self, policy):
+        self.settings = pokernetworkconfig.Config([])
+        self.settings.loadFromString(settings_xml % policy)
+
+class MockTransport:
+    def __init__(self):
+        self.written = []
+        self.producer = None
+        self.lost = False
+    def registerProducer(self, producer, streaming):
+        self.producer = producer
+    def write(self, data):
+        self.written.append(data)
+    def loseConnection(self):
+        self.lost = True
+
+class PubServiceTestCase(unittest.TestCase):
+
+    def connect(self, pub):
+        protocol = pub.buildProtocol(None)
+        protocol.transport = MockTransport()
+        protocol.connectionMade()
+        return protocol
+
+    def command(self, protocol, cmd, *args):
+        protocol.dataReceived(msgpack.packb((cmd, args)))
+
+    def test01_prefix(self):
+        pub = PubService(MockService('drop'))
+        all = self.connect(pub)
+        self.command(all, 'subscribe', '')
+        user = self.connect(pub)
+        self.command(user, 'subscribe', 'user.')
+        self.command(user, 'subscribe', 'user.1')
+        table = self.connect(pub)
+        self.command(table, 'subscribe', 'table.1')
+        pub.publish('user.12', {'a': 1})
+        pub.publish('table.2', {'b': 2})
+        self.assertEqual([msgpack.packb(('user.12', {'a': 1})), msgpack.packb(('table.2', {'b': 2}))], all.transport.written)
+        #
+        # subscribed twice through two prefixes, delivered once
+        #
+        self.assertEqual([msgpack.packb(('user.12', {'a': 1}))], user.transport.written)
+        self.assertEqual([], table.transport.written)
+        self.assertEqual(2, pub.stats['published'])
+        self.assertEqual(3, pub.stats['delivered'])
+
+    def test02_unsubscribe(self):
+        pub = PubService(MockService('drop'))
+        protocol = self.connect(pub)
+        self.command(protocol, 'subscribe', 'user.1')
+        self.command(protocol, 'subscribe', 'user.1')
+        self.command(protocol, 'unsubscribe', 'user.1')
+        self.assertEqual(set([protocol._avatar]), pub.subscribers('user.1'))
+        self.command(protocol, 'unsubscribe', 'user.1')
+        self.assertEqual(set(), pub.subscribers('user.1'))
+        self.assertEqual({}, pub._subscriptions.children)
+        self.command(protocol, 'subscribe', 'user.1')
+        self.command(protocol, 'subscribe', 'user.2')
+        protocol.connectionLost(None)
+        self.assertEqual({}, pub._subscriptions.children)
+
+    def test03_drop(self):
+        pub = PubService(MockService('drop'))
+        protocol = self.connect(pub)
+        self.command(protocol, 'subscribe', 'user.1')
+        protocol.pauseProducing()
+        for i in range(4):
+            pub.publish('user.1', i)
+        self.assertEqual([], protocol.transport.written)
+        self.assertEqual(2, pub.stats['dropped'])
+        protocol.resumeProducing()
+        self.assertEqual([msgpack.packb(('user.1', 2)), msgpack.packb(('user.1', 3))], protocol.transport.written)
+
+    def test04_disconnect(self):
+        pub = PubService(MockService('disconnect'))
+        protocol = self.connect(pub)
+        self.command(protocol, 'subscribe', 'user.1')
+        protocol.pauseProducing()
+        for i in range(4):
+            pub.publish('user.1', i)
+        self.assertTrue(protocol.transport.lost)
+        self.assertEqual(1, pub.stats['disconnected'])
+        self.assertEqual(0, len(protocol._buffer))
+
+    def test05_queue(self):
+        pub = PubService(MockService('drop'))
+        protocol = self.connect(pub)
+        self.command(protocol, 'subscribe', 'table.1.')
+        pub.queue('table.1.seats', {'event': 'seat', 'serial': 1})
+        pub.queue('table.1.hand', {'event': 'end', 'hand_serial': 2})
+        pub.queue('table.1.seats', {'event': 'leave', 'serial': 1})
+        self.assertEqual([], protocol.transport.written)
+        self.assertTrue(pub._queued_timer.active())
+        pub.flushQueue()
+        self.assertEqual(None, pub._queued_timer)
+        self.assertEqual([
+            msgpack.packb(('table.1.seats', [{'event': 'seat', 'serial': 1}, {'event': 'leave', 'serial': 1}])),
+            msgpack.packb(('table.1.hand', [{'event': 'end', 'hand_serial': 2}])),
+        ], protocol.transport.written)
+        self.assertEqual(2, pub.stats['published'])
+
+def GetTestSuite():
+    loader = runner.TestLoader()
+    suite = loader.suiteFactory()
+    suite.addTest(loader.loadClass(PubServiceTestCase))
+    return suite
+
+def Run():
+    return runner.TrialRunner(
+        reporter.TextReporter,
+        tracebackFormat='default',
+    ).run(GetTestSuite())
+
+if __name__ == '__main__':
+    if Run().wasSuccessful():
+        sys.exit(0)
+    else:
+        sys.exit(1)
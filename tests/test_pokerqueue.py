@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+import sys
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from twisted.trial import unittest, runner, reporter
+
+from pokerpackets.packets import PacketPing
+from pokerpackets.networkpackets import PacketPokerPlayerChips, PacketPokerPosition, PacketPokerChat
+
+from pokernetwork.pokerqueue import PacketQueue
+
+class PacketQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = PacketQueue()
+
+    def test01_order(self):
+        packets = [
+            PacketPokerChat(game_id = 1, serial = 10, message = "one"),
+            PacketPing(),
+            PacketPokerChat(game_id = 2, serial = 10, message = "two"),
+            PacketPokerChat(game_id = 1, serial = 10, message = "three"),
+        ]
+        self.queue.extend(packets)
+        self.assertEqual(4, len(self.queue))
+        self.assertEqual(packets, self.queue.reset())
+        self.assertEqual(0, len(self.queue))
+        self.assertEqual([], self.queue.reset())
+
+    def test02_remove(self):
+        ping = PacketPing()
+        chat = PacketPokerChat(game_id = 2, serial = 10, message = "two")
+        self.queue.extend([
+            PacketPokerChat(game_id = 1, serial = 10, message = "one"),
+            ping,
+            chat,
+            PacketPokerPlayerChips(game_id = 1, serial = 10, money = 100, bet = 0),
+            PacketPokerPlayerChips(game_id = 1, serial = 10, money = 50, bet = 50),
+        ])
+        self.queue.remove(1)
+        self.queue.remove(3)
+        self.assertEqual(2, len(self.queue))
+        self.assertEqual(0, self.queue.superseded)
+        self.assertEqual([ping, chat], self.queue.reset())
+
+    def test03_compact(self):
+        chat = PacketPokerChat(game_id = 1, serial = 10, message = "one")
+        chips10 = PacketPokerPlayerChips(game_id = 1, serial = 10, money = 50, bet = 50)
+        chips11 = PacketPokerPlayerChips(game_id = 1, serial = 11, money = 100, bet = 0)
+        chips_other_game = PacketPokerPlayerChips(game_id = 2, serial = 10, money = 100, bet = 0)
+        position = PacketPokerPosition(game_id = 1, serial = 11, position = 1)
+        self.queue.extend([
+            PacketPokerPlayerChips(game_id = 1, serial = 10, money = 100, bet = 0),
+            PacketPokerPosition(game_id = 1, serial = 10, position = 0),
+            chat,
+            chips_other_game,
+            chips10,
+            chips11,
+            position,
+        ])
+        self.assertEqual(2, self.queue.superseded)
+        self.assertEqual(2, self.queue.compact())
+        self.assertEqual(0, self.queue.compact())
+        self.assertEqual(5, len(self.queue))
+        self.assertEqual([chat, chips_other_game, chips10, chips11, position], self.queue.reset())
+
+def GetTestSuite():
+    loader = runner.TestLoader()
+    suite = loader.suiteFactory()
+    suite.addTest(loader.loadClass(PacketQueueTestCase))
+    return suite
+
+def Run():
+    return runner.TrialRunner(
+        reporter.TextReporter,
+        tracebackFormat='default',
+    ).run(GetTestSuite())
+
+if __name__ == '__main__':
+    if Run().wasSuccessful():
+        sys.exit(0)
+    else:
+        sys.exit(1)
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+import sys
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from twisted.trial import unittest, runner, reporter
+from twisted.internet import defer
+
+from pokerpackets.networkpackets import PacketPokerTourneyRegister
+
+from pokernetwork import pokernetworkconfig
+from pokernetwork.pokerregistration import TourneyRegistrar
+
+settings_xml = """<?xml version="1.0" encoding="UTF-8"?>
+<server>
+  <tourneyregister flush_delay="60" batch="3"/>
+</server>
+"""
+
+class MockCursor:
+    def __init__(self, executed, tourneys, balances):
+        self.executed = executed
+        self.tourneys = tourneys
+        self.balances = balances
+        self.rows = []
+        self.rowcount = 0
+    def execute(self, sql, args=()):
+        self.executed.append((sql, list(args)))
+        if sql.startswith("SELECT serial FROM tourneys"):
+            self.rows = [(serial,) for serial in args[:-1] if serial in self.tourneys]
+        elif sql.startswith("SELECT user_serial"):
+            accounts = zip(args[::2], args[1::2])
+            self.rows = [account + (self.balances[account],) for account in accounts if account in self.balances]
+        elif sql.startswith("UPDATE"):
+            self.rowcount = len(args) / 5
+        elif sql.startswith("INSERT"):
+            self.rowcount = len(args) / 3
+    def fetchall(self):
+        return self.rows
+
+class MockAsyncDatabase:
+    def __init__(self):
+        self.executed = []
+        self.tourneys = set()
+        self.balances = {}
+        self.results = []
+        self.deferreds = []
+    def runInteraction(self, function, *args):
+        self.results.append(function(MockCursor(self.executed, self.tourneys, self.balances), *args))
+        d = defer.Deferred()
+        self.deferreds.append(d)
+        return d
+
+class TourneyRegistrarTestCase(unittest.TestCase):
+
+    def setUp(self):
+        settings = pokernetworkconfig.Config([])
+        settings.loadFromString(settings_xml)
+        self.adb = MockAsyncDatabase()
+        self.registrar = TourneyRegistrar(settings, self.adb, 1)
+
+    def tearDown(self):
+        if self.registrar.timer and self.registrar.timer.active():
+            self.registrar.timer.cancel()
+
+    def test01_batch(self):
+        self.adb.tourneys.update([10, 20])
+        self.adb.balances.update({(3, 1): 100, (4, 1): 50})
+        codes = []
+        for serial, tourney_serial, withdraw in ((3, 10, 60), (4, 10, 60), (3, 20, 60)):
+            self.registrar.register(serial, tourney_serial, 1, withdraw).addCallback(codes.append)
+        self.assertTrue(self.registrar.isPending(10, 4))
+        self.assertEqual(2, self.registrar.pendingCount(10))
+        self.assertEqual(4, len(self.adb.executed))
+        self.assertEqual(("SELECT serial FROM tourneys WHERE serial IN (%s, %s) AND resthost_serial = %s", [10, 20, 1]), self.adb.executed[0])
+        self.assertEqual(
+            ("UPDATE user2money SET amount = amount - CASE WHEN user_serial = %s AND currency_serial = %s THEN %s "
+             "ELSE 0 END WHERE (user_serial, currency_serial) IN ((%s, %s))", [3, 1, 60, 3, 1]),
+            self.adb.executed[2]
+        )
+        self.assertEqual(("INSERT INTO user2tourney (user_serial, currency_serial, tourney_serial) VALUES (%s, %s, %s)", [3, 1, 10]), self.adb.executed[3])
+        self.adb.deferreds[0].callback(self.adb.results[0])
+        self.assertEqual([None, PacketPokerTourneyRegister.NOT_ENOUGH_MONEY, PacketPokerTourneyRegister.NOT_ENOUGH_MONEY], codes)
+        self.assertFalse(self.registrar.isPending(10, 4))
+        self.assertEqual(0, self.registrar.pendingCount(10))
+
+    def test02_refused(self):
+        self.adb.tourneys.add(10)
+        codes = []
+        self.registrar.register(3, 10, 1, 0).addCallback(codes.append)
+        self.registrar.register(4, 30, 1, 0).addCallback(codes.append)
+        self.registrar.flush()
+        self.assertEqual(("INSERT INTO user2tourney (user_serial, currency_serial, tourney_serial) VALUES (%s, %s, %s)", [3, 1, 10]), self.adb.executed[-1])
+        self.adb.deferreds[0].callback(self.adb.results[0])
+        self.assertEqual([None, PacketPokerTourneyRegister.REGISTRATION_REFUSED], codes)
+
+    def test03_failed(self):
+        self.adb.tourneys.add(10)
+        codes = []
+        for serial in (3, 4, 5, 6):
+            self.registrar.register(serial, 10, 1, 0).addCallback(codes.append)
+        self.assertEqual(1, len(self.adb.deferreds))
+        self.assertEqual(1, len(self.registrar.pending))
+        self.adb.deferreds[0].errback(UserWarning("duplicate entry"))
+        #
+        # the registrations of the batch are written one by one
+        #
+        self.assertEqual([], codes)
+        self.assertEqual(2, len(self.adb.deferreds))
+        self.assertEqual(("INSERT INTO user2tourney (user_serial, currency_serial, tourney_serial) VALUES (%s, %s, %s)", [3, 1, 10]), self.adb.executed[-1])
+        self.adb.deferreds[1].callback(self.adb.results[1])
+        self.assertEqual(3, len(self.adb.deferreds))
+        self.assertEqual(("INSERT INTO user2tourney (user_serial, currency_serial, tourney_serial) VALUES (%s, %s, %s)", [4, 1, 10]), self.adb.executed[-1])
+        self.adb.deferreds[2].errback(UserWarning("duplicate entry"))
+        self.assertEqual(4, len(self.adb.deferreds))
+        self.assertEqual(4, self.registrar.pendingCount(10))
+        self.adb.deferreds[3].callback(self.adb.results[3])
+        self.assertEqual([None, PacketPokerTourneyRegister.SERVER_ERROR, None], codes)
+        self.assertEqual(1, self.registrar.pendingCount(10))
+        #
+        # a registration that fails alone is not written again
+        #
+        self.registrar.flush()
+        self.adb.deferreds[4].errback(UserWarning("deadlock"))
+        self.assertEqual(5, len(self.adb.deferreds))
+        self.assertEqual([None, PacketPokerTourneyRegister.SERVER_ERROR, None, PacketPokerTourneyRegister.SERVER_ERROR], codes)
+        self.assertEqual(0, self.registrar.pendingCount(10))
+
+    def test04_stop(self):
+        self.adb.tourneys.add(10)
+        for serial in (3, 4, 5, 6):
+            self.registrar.register(serial, 10, 1, 0)
+        d = self.registrar.stop()
+        self.assertFalse(d.called)
+        self.adb.deferreds[0].callback(self.adb.results[0])
+        self.assertFalse(d.called)
+        self.adb.deferreds[1].callback(self.adb.results[1])
+        self.assertTrue(d.called)
+        self.assertEqual([], self.registrar.pending)
+        self.assertEqual({}, self.registrar.tourney2serials)
+        return d
+
+    def test05_cancel(self):
+        self.adb.tourneys.add(10)
+        codes = []
+        self.registrar.register(3, 10, 1, 0).addCallback(codes.append)
+        self.registrar.register(4, 10, 1, 0).addCallback(codes.append)
+        self.assertFalse(self.registrar.cancel(10, 5))
+        self.assertTrue(self.registrar.cancel(10, 3))
+        self.assertEqual([PacketPokerTourneyRegister.REGISTRATION_REFUSED], codes)
+        self.assertFalse(self.registrar.isPending(10, 3))
+        self.assertEqual(1, self.registrar.pendingCount(10))
+        self.registrar.flush()
+        self.assertEqual(("INSERT INTO user2tourney (user_serial, currency_serial, tourney_serial) VALUES (%s, %s, %s)", [4, 1, 10]), self.adb.executed[-1])
+        #
+        # a registration being written cannot be canceled
+        #
+        self.assertFalse(self.registrar.cancel(10, 4))
+        self.assertTrue(self.registrar.isPending(10, 4))
+        self.adb.deferreds[0].callback(self.adb.results[0])
+        self.assertEqual([PacketPokerTourneyRegister.REGISTRATION_REFUSED, None], codes)
+
+def GetTestSuite():
+    loader = runner.TestLoader()
+    suite = loader.suiteFactory()
+    suite.addTest(loader.loadClass(TourneyRegistrarTestCase))
+    return suite
+
+def Run():
+    return runner.TrialRunner(
+        reporter.TextReporter,
+        tracebackFormat='default',
+    ).run(GetTestSuite())
+
+if __name__ == '__main__':
+    if Run().wasSuccessful():
+        sys.exit(0)
+    else:
+        sys.exit(1)
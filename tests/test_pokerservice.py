@@ -268,6 +268,7 @@ class MockDatabase:
         dbSelf.db = MockInternalDatabase()
         dbSelf.cursorValue = cursorClass()
     def cursor(dbSelf): return dbSelf.cursorValue
+    def readCursor(dbSelf): return dbSelf.cursorValue
     def literal(dbSelf, val): return dbSelf.db.literal(val)
     def close(dbSelf): return
 
@@ -410,6 +411,8 @@ class MonitorTestCase(unittest.TestCase):
         avatar = Avatar()
         self.assertEquals(PACKET_ACK, self.service.monitor(avatar).type)
         self.service.databaseEvent(event = 1, param1 = 2, param2 = 3)
+        self.failIf(hasattr(avatar, 'sent'))
+        self.service.monitor_bus.flush()
         self.failUnless(avatar.sent)
         self.failUnless(hasattr(self.service, 'HERE'))
 
@@ -438,6 +441,21 @@ class CleanUpTemporaryUsersTestCase(PokerServiceTestCaseBase):
         self.assertEqual(1, cursor.fetchone()[0])
         cursor.close()
 
+    def test02_cleanUpTemporaryUsers_regexp(self):
+        self.service.startService()
+        db = self.service.db
+        cursor = db.cursor()
+        cursor.execute("INSERT INTO users (serial, name, password, created) VALUES (43, 'BOT12', 'passwordAA', 0)")
+        cursor.execute("INSERT INTO users (serial, name, password, created) VALUES (44, 'BOTAA', 'passwordAA', 0)")
+        cursor.execute("INSERT INTO user2tourney (user_serial, currency_serial, tourney_serial) VALUES (43, 1, 200)")
+        self.service.temporary_users_pattern = '^BOT[0-9]+$'
+        self.service.cleanUpTemporaryUsers()
+        cursor.execute("SELECT name FROM users WHERE name LIKE 'BOT%'")
+        self.assertEqual((('BOTAA',),), cursor.fetchall())
+        cursor.execute("SELECT COUNT(*) FROM user2tourney WHERE user_serial = 43")
+        self.assertEqual(0, cursor.fetchone()[0])
+        cursor.close()
+
 list_table_xml = """<?xml version="1.0" encoding="UTF-8"?>
 <server verbose="6" ping="300000" autodeal="yes" max_joined="1000" simultaneous="4" chat="yes" remove_completed="1" >
   <delays autodeal="18" round="12" position="60" showdown="30" finish="18" />
@@ -1612,6 +1630,7 @@ class PokerServiceTestCase(PokerServiceTestCaseBase):
         self.service.monitor_plugins = [monitor]
         tourney.rank = 99
         self.service.tourneyRemovePlayer(tourney, self.user1_serial, True)
+        self.service.monitor_bus.flush()
         
         event = events[0]
         self.assertEqual(event.param1,self.user1_serial)
@@ -2161,14 +2180,150 @@ class PokerServiceTestCase(PokerServiceTestCaseBase):
         game_id = 42
         message = 'yeah'
         self.service.chatMessageArchive(player_serial, game_id, message)
-        cursor = self.service.db.cursor(DictCursor)
-        cursor.execute("SELECT * FROM chat_messages")
-        result = cursor.fetchone()
-        self.assertEquals(player_serial, result['player_serial'])
-        self.assertEquals(game_id, result['game_id'])
-        self.assertEquals(message, result['message'])
-        self.assertNotEquals(0, result['timestamp'])
-        
+        def check(result):
+            cursor = self.service.db.cursor(DictCursor)
+            cursor.execute("SELECT * FROM chat_messages")
+            result = cursor.fetchone()
+            self.assertEquals(player_serial, result['player_serial'])
+            self.assertEquals(game_id, result['game_id'])
+            self.assertEquals(message, result['message'])
+            self.assertNotEquals(0, result['timestamp'])
+        d = self.service.chat_archive.flush()
+        d.addCallback(check)
+        return d
+
+    def startTourneyRegistrar(self):
+        settings_data = settings_xml.replace('<delays', '<tourneyregister flush_delay="60" batch="10"/>\n  <delays')
+        settings = pokernetworkconfig.Config([])
+        settings.doc = libxml2.parseMemory(settings_data, len(settings_data))
+        settings.header = settings.doc.xpathNewContext()
+        self.service = pokerservice.PokerService(settings)
+        self.service.startService()
+        self.createUsers()
+        clients = []
+        for serial in (self.user1_serial, self.user2_serial, self.user3_serial):
+            client = self.ClientMockup(serial, self)
+            self.service.avatar_collection.add(client)
+            clients.append(client)
+        heads_up = [t for t in self.service.tourneys.values() if t.name=='sitngo2'][0]
+        return clients, heads_up
+
+    def registrations(self, tourney_serial):
+        cursor = self.db.cursor()
+        cursor.execute("SELECT user_serial FROM user2tourney WHERE tourney_serial = %s ORDER BY user_serial", (tourney_serial,))
+        serials = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+        return serials
+
+    def test26_tourneyRegisterAsyncQuota(self):
+        (client1, client2, client3), heads_up = self.startTourneyRegistrar()
+        results = []
+        for serial in (self.user1_serial, self.user2_serial):
+            self.service.tourneyRegisterAsync(PacketPokerTourneyRegister(serial = serial, tourney_serial = heads_up.serial)).addCallback(results.append)
+        self.assertEquals(2, self.service.tourney_registrar.pendingCount(heads_up.serial))
+        #
+        # the registrations waiting for the registrar fill the tourney
+        #
+        self.service.tourneyRegisterAsync(PacketPokerTourneyRegister(serial = self.user3_serial, tourney_serial = heads_up.serial)).addCallback(results.append)
+        self.assertEquals([False], results)
+        self.assertEquals(PACKET_ERROR, client3.packets[-1].type)
+        self.assertEquals(PacketPokerTourneyRegister.REGISTRATION_REFUSED, client3.packets[-1].code)
+        #
+        # the second is canceled so that the tourney does not start
+        #
+        packet = PacketPokerTourneyUnregister(serial = self.user2_serial, tourney_serial = heads_up.serial)
+        self.assertEquals(packet, self.service.tourneyUnregister(packet))
+        self.assertEquals([False, False], results)
+        def check(status):
+            self.assertEquals([False, False, True], results)
+            self.assertEquals([self.user1_serial], heads_up.players.keys())
+            self.assertEquals([self.user1_serial], self.registrations(heads_up.serial))
+            self.assertEquals(self.default_money - heads_up.buy_in, self.service.getMoney(self.user1_serial, 1))
+            self.assertEquals(self.default_money, self.service.getMoney(self.user2_serial, 1))
+        d = self.service.tourney_registrar.flush()
+        d.addCallback(check)
+        return d
+
+    def test27_tourneyRegisterAsyncCancel(self):
+        (client1, client2, client3), heads_up = self.startTourneyRegistrar()
+        results = []
+        self.service.tourneyRegisterAsync(PacketPokerTourneyRegister(serial = self.user1_serial, tourney_serial = heads_up.serial)).addCallback(results.append)
+        #
+        # the tourney stops registering while the registration is written
+        #
+        heads_up.state = pokertournament.TOURNAMENT_STATE_CANCELED
+        def check(status):
+            self.assertEquals([False], results)
+            self.assertEquals(PACKET_ERROR, client1.packets[-1].type)
+            self.assertEquals(PacketPokerTourneyRegister.REGISTRATION_REFUSED, client1.packets[-1].code)
+            self.assertEquals({}, heads_up.players)
+            self.assertEquals([], self.registrations(heads_up.serial))
+            self.assertEquals(self.default_money, self.service.getMoney(self.user1_serial, 1))
+        d = self.service.tourney_registrar.flush()
+        d.addCallback(check)
+        return d
+
+    def test28_tourneyRegisterAsyncRollback(self):
+        (client1, client2, client3), heads_up = self.startTourneyRegistrar()
+        registrar = self.service.tourney_registrar
+        writeBatch = registrar._writeBatch
+        def writeBatchFailed(cursor, batch):
+            writeBatch(cursor, batch)
+            raise UserWarning("deadlock")
+        registrar._writeBatch = writeBatchFailed
+        results = []
+        self.service.tourneyRegisterAsync(PacketPokerTourneyRegister(serial = self.user1_serial, tourney_serial = heads_up.serial)).addCallback(results.append)
+        def check(status):
+            self.assertEquals([False], results)
+            self.assertEquals(PACKET_ERROR, client1.packets[-1].type)
+            self.assertEquals(PacketPokerTourneyRegister.SERVER_ERROR, client1.packets[-1].code)
+            self.assertFalse(registrar.isPending(heads_up.serial, self.user1_serial))
+            self.assertEquals({}, heads_up.players)
+            self.assertEquals([], self.registrations(heads_up.serial))
+            self.assertEquals(self.default_money, self.service.getMoney(self.user1_serial, 1))
+        d = registrar.flush()
+        d.addCallback(check)
+        return d
+
+    def test29_tourneyUnregisterPending(self):
+        (client1, client2, client3), heads_up = self.startTourneyRegistrar()
+        registrar = self.service.tourney_registrar
+        results = []
+        self.service.tourneyRegisterAsync(PacketPokerTourneyRegister(serial = self.user1_serial, tourney_serial = heads_up.serial)).addCallback(results.append)
+        d = registrar.flush()
+        #
+        # the registration is being written
+        #
+        error = self.service.tourneyUnregister(PacketPokerTourneyUnregister(serial = self.user1_serial, tourney_serial = heads_up.serial))
+        self.assertEquals(PACKET_ERROR, error.type)
+        self.assertEquals(PacketPokerTourneyUnregister.TOO_LATE, error.code)
+        def check(status):
+            self.assertEquals([True], results)
+            self.assertEquals([self.user1_serial], self.registrations(heads_up.serial))
+            packet = PacketPokerTourneyUnregister(serial = self.user1_serial, tourney_serial = heads_up.serial)
+            self.assertEquals(packet, self.service.tourneyUnregister(packet))
+            self.assertEquals([], self.registrations(heads_up.serial))
+            self.assertEquals(self.default_money, self.service.getMoney(self.user1_serial, 1))
+        d.addCallback(check)
+        return d
+
+    def test30_databaseWrittenExpire(self):
+        self.service.db_written = {1: 10.0, 2: 20.0}
+        self.service.databaseWrittenExpire(15.0)
+        self.assertEquals({2: 20.0}, self.service.db_written)
+
+    def test31_databaseWroteMoney(self):
+        self.service.db_sticky = 5
+        self.service.startService()
+        self.createUsers()
+        heads_up = [t for t in self.service.tourneys.values() if t.name=='sitngo2'][0]
+        self.service.tourneyRegisterCancel(self.user1_serial, heads_up, heads_up.buy_in)
+        self.assertTrue(self.user1_serial in self.service.db_written)
+        self.service.tourneyRebuyPayment(heads_up, self.user2_serial, 1, 10, 10)
+        self.assertTrue(self.user2_serial in self.service.db_written)
+        self.service.updatePlayerRake(1, self.user3_serial, 10)
+        self.assertTrue(self.user3_serial in self.service.db_written)
+
 
 ##############################################################################
 class RefillTestCase(unittest.TestCase):
@@ -2548,8 +2703,7 @@ class TourneyManagerTestCase(PokerServiceTestCaseBase):
         self.assertEquals(packet.code, PacketPokerGetTourneyManager.DOES_NOT_EXIST)
     def test05_moreThanOneTourneyRow(self):
         validStatements = [
-           "SELECT user_serial, table_serial, rank FROM user2tourney WHERE tourney_serial =",
-           'SELECT user_serial, name FROM user2tourney, users WHERE user2tourney.tourney_serial',
+           "SELECT u2t.user_serial, u2t.table_serial, u2t.rank, users.name, u2tab.money FROM user2tourney AS u2t",
            "SELECT * FROM tourneys WHERE serial = "
         ]
         class MockCursor(MockCursorBase):
@@ -2635,6 +2789,30 @@ class TourneyManagerTestCase(PokerServiceTestCaseBase):
         self.assertEquals(int(rank2prize[1]), 3000)
         self.assertEquals(packet.tourney['registered'], 4)
 
+    def test09_prizes_cache(self):
+        class Tournament:
+            def __init__(self):
+                self.computed = 0
+            def prizes(self):
+                self.computed += 1
+                return [self.computed * 100]
+        tourney = Tournament()
+        self.service.tourneyPrizes(tourney).pop()
+        self.assertEquals([100], self.service.tourneyPrizes(tourney))
+        self.assertEquals(1, tourney.computed)
+        self.service.tourneyPrizesChanged(tourney)
+        self.assertEquals([200], self.service.tourneyPrizes(tourney))
+
+    def test10_prizes_table_cache(self):
+        self.service.startService()
+        db = self.service.db.db
+        tourney_serial = 11791
+        db.query("INSERT INTO tourneys (serial, sit_n_go, state, buy_in, players_quota) VALUES (%d, '%s', '%s', %d, %d)" % (tourney_serial, 'y', 'complete', 1000, 10))
+        first = self.service.tourneyManager(tourney_serial).tourney['rank2prize']
+        second = self.service.tourneyManager(tourney_serial).tourney['rank2prize']
+        self.assertEquals(first, second)
+        self.assertEquals([(1000, 0, 10)], self.service.prizes_tables.keys())
+
 ###########################################################################
 class TourneyCreateTestCase(PokerServiceTestCaseBase):
 
@@ -4642,6 +4820,7 @@ class PokerServiceCoverageTests(unittest.TestCase):
                 dbSelf.db = MockInternalDatabase()
                 dbSelf.cursorValue = MockCursor()
             def cursor(dbSelf): return dbSelf.cursorValue
+            def readCursor(dbSelf): return dbSelf.cursorValue
             def literal(dbSelf, val): return dbSelf.db.literal(val)
 
         self.service = pokerservice.PokerService(self.settings)
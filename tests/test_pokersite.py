@@ -56,6 +56,7 @@ class PokerServiceMockup:
         self.dirs = []
         self.poker_auth = PokerAuthMockup()
         self.memcache = None
+        self.metrics = None
 
     def getPlayerInfo(self, serial):
         packet = PacketPokerPlayerInfo(serial=serial)
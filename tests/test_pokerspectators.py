@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+import sys
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from twisted.trial import unittest, runner, reporter
+from twisted.python.runtime import seconds
+
+from pokernetwork import pokernetworkconfig
+from pokernetwork.pokerspectators import SpectatorStream
+
+settings_xml = """<?xml version="1.0" encoding="UTF-8"?>
+<server>
+  <spectators delay="%s" period="0" max="%s"/>
+</server>
+"""
+
+class MockPacket:
+    def __init__(self, name):
+        self.type = 1
+        self.name = name
+
+class MockMetrics:
+    def __init__(self):
+        self.out = []
+    def recordOut(self, packet_type, length):
+        self.out.append((packet_type, length))
+
+class MockProtocol:
+    def __init__(self, encoding='binary'):
+        self.encoding = encoding
+        self.metrics = None
+        self.data = []
+    def packetsEncoding(self):
+        return self.encoding
+    def encodePacket(self, packet):
+        return "<%s:%s>" % (self.encoding, packet.name)
+    def dataWrite(self, data):
+        self.data.append(data)
+
+class MockAvatar:
+    def __init__(self, protocol=None):
+        self.protocol = protocol
+        self.packets = []
+    def spectatorProtocol(self):
+        return self.protocol
+    def sendPacket(self, packet):
+        self.packets.append(packet.name)
+
+class SpectatorStreamTestCase(unittest.TestCase):
+
+    def setUpStream(self, delay=0, max=0):
+        settings = pokernetworkconfig.Config([])
+        settings.loadFromString(settings_xml % (delay, max))
+        self.stream = SpectatorStream(settings.serverSettings())
+        return self.stream
+
+    def tearDown(self):
+        self.stream._cancel()
+
+    def test01_shared(self):
+        stream = self.setUpStream()
+        protocols = [MockProtocol(), MockProtocol(), MockProtocol('other')]
+        avatars = [MockAvatar(protocol) for protocol in protocols]
+        explained = MockAvatar()
+        for avatar in avatars + [explained]:
+            stream.add(avatar)
+        protocols[1].metrics = MockMetrics()
+        stream.publish(MockPacket('a'))
+        stream.publish(MockPacket('b'))
+        self.assertTrue(stream.timer.active())
+        stream.flush()
+        self.assertEqual(None, stream.timer)
+        self.assertEqual(["<binary:a><binary:b>"], protocols[0].data)
+        self.assertEqual(["<binary:a><binary:b>"], protocols[1].data)
+        self.assertEqual([(1, 10), (1, 10)], protocols[1].metrics.out)
+        self.assertEqual(["<other:a><other:b>"], protocols[2].data)
+        self.assertEqual(['a', 'b'], explained.packets)
+        self.assertEqual(4, stream.stats['encoded'])
+        self.assertEqual(0, len(stream.packets))
+
+    def test02_delay(self):
+        stream = self.setUpStream(delay=10)
+        protocol = MockProtocol()
+        stream.add(MockAvatar(protocol))
+        stream.publish(MockPacket('a'))
+        stream.flush(seconds())
+        self.assertEqual([], protocol.data)
+        self.assertTrue(stream.timer.active())
+        stream.flush(seconds() + 11)
+        self.assertEqual(["<binary:a>"], protocol.data)
+
+    def test03_max(self):
+        stream = self.setUpStream(max=1)
+        protocols = [MockProtocol(), MockProtocol()]
+        for protocol in protocols:
+            stream.add(MockAvatar(protocol))
+        stream.publish(MockPacket('a'))
+        stream.flush()
+        self.assertEqual(1, stream.lagging)
+        self.assertEqual(["<binary:a>"], protocols[0].data + protocols[1].data)
+        self.assertEqual(1, len(stream.packets))
+        #
+        # the lagging spectator is sent packet a with packet b, before
+        # the other one is sent packet b
+        #
+        stream.publish(MockPacket('b'))
+        stream.flush()
+        self.assertEqual(1, stream.lagging)
+        self.assertTrue("<binary:a><binary:b>" in protocols[0].data + protocols[1].data)
+        stream.flush()
+        self.assertEqual(0, stream.lagging)
+        self.assertEqual(
+            ["<binary:a>", "<binary:a><binary:b>", "<binary:b>"],
+            sorted(protocols[0].data + protocols[1].data)
+        )
+        self.assertEqual(0, len(stream.packets))
+
+    def test04_add_remove(self):
+        stream = self.setUpStream(delay=10)
+        first = MockAvatar()
+        stream.add(first)
+        stream.publish(MockPacket('a'))
+        second = MockAvatar()
+        stream.add(second)
+        stream.publish(MockPacket('b'))
+        #
+        # the removed spectator is sent the packets that are not released
+        #
+        stream.remove(first, flush=True)
+        self.assertEqual(['a', 'b'], first.packets)
+        self.assertEqual(1, len(stream.packets))
+        stream.flush(seconds() + 11)
+        self.assertEqual(['b'], second.packets)
+        stream.remove(second)
+        stream.publish(MockPacket('c'))
+        self.assertEqual(0, len(stream.packets))
+
+    def test05_close(self):
+        stream = self.setUpStream(delay=10)
+        avatar = MockAvatar(MockProtocol())
+        stream.add(avatar)
+        stream.publish(MockPacket('a'))
+        stream.close()
+        self.assertEqual(["<binary:a>"], avatar.protocol.data)
+        self.assertEqual(0, len(stream))
+        self.assertEqual(None, stream.timer)
+
+def GetTestSuite():
+    loader = runner.TestLoader()
+    suite = loader.suiteFactory()
+    suite.addTest(loader.loadClass(SpectatorStreamTestCase))
+    return suite
+
+def Run():
+    return runner.TrialRunner(
+        reporter.TextReporter,
+        tracebackFormat='default',
+    ).run(GetTestSuite())
+
+if __name__ == '__main__':
+    if Run().wasSuccessful():
+        sys.exit(0)
+    else:
+        sys.exit(1)
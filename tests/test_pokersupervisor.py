@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+import sys, os, tempfile, shutil
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from twisted.trial import unittest, runner, reporter
+
+from pokerpackets.networkpackets import PacketPokerTableJoin, PacketPokerTourneyRegister
+
+from pokernetwork import pokernetworkconfig, pokersupervisor
+from pokernetwork.pokersupervisor import PokerSupervisor
+from pokernetwork.pokeravatar import PokerAvatar
+
+settings_xml_supervisor = """<?xml version="1.0" encoding="UTF-8"?>
+<server ping="300000" verbose="6" chat="yes" autodeal="yes" simultaneous="4" memcached="127.0.0.1:11211">
+  <supervisor workers="3" socket_dir="%(socket_dir)s"/>
+  <listen tcp="19480" rest="19481" msgpack="19482"/>
+  <resthost serial="10" name="front" host="127.0.0.1" port="19481" path="/POKER_REST"/>
+  <path>%(script_dir)s/../conf</path>
+</server>
+"""
+
+class MockCursor:
+    def __init__(self, executed):
+        self.executed = executed
+    def execute(self, sql, args=()):
+        self.executed.append((sql, args))
+    def close(self):
+        pass
+
+class MockDatabase:
+    executed = []
+    closed = 0
+    def __init__(self, settings):
+        pass
+    def cursor(self):
+        return MockCursor(MockDatabase.executed)
+    def close(self):
+        MockDatabase.closed += 1
+
+class MockMemcache:
+    def __init__(self):
+        self.cache = {}
+    def set(self, key, value, time=0):
+        self.cache[key] = value
+
+class MockService:
+    def __init__(self):
+        self.memcache = MockMemcache()
+        self.routes = {}
+    def packet2resthost(self, packet):
+        game_id = getattr(packet, 'game_id', None)
+        return (self.routes.get(game_id), game_id)
+
+class PokerSupervisorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = path.join(self.tmpdir, "poker.server.xml")
+        with open(self.filename, "w") as f:
+            f.write(settings_xml_supervisor % {'socket_dir': self.tmpdir, 'script_dir': TESTS_PATH})
+        self.settings = pokernetworkconfig.Config([])
+        self.settings.load(self.filename)
+        self.supervisor = PokerSupervisor(self.settings, self.filename)
+        MockDatabase.executed = []
+        MockDatabase.closed = 0
+        self.PokerDatabase = pokersupervisor.PokerDatabase
+        pokersupervisor.PokerDatabase = MockDatabase
+
+    def tearDown(self):
+        pokersupervisor.PokerDatabase = self.PokerDatabase
+        shutil.rmtree(self.tmpdir)
+
+    def test01_workers(self):
+        self.assertEqual(3, self.supervisor.workers_count)
+        self.assertEqual([11, 12, 13], [self.supervisor.workerSerial(i) for i in range(3)])
+        self.assertEqual(path.join(self.tmpdir, 'poker.worker1.sock'), self.supervisor.workerSocket(1))
+
+    def test02_workerConfiguration(self):
+        settings = pokernetworkconfig.Config([])
+        settings.load(self.supervisor.workerConfiguration(2))
+        self.assertEqual([], settings.headerGetProperties("/server/supervisor"))
+        listen = settings.headerGetProperties("/server/listen")[0]
+        self.assertEqual({'rest_unix': self.supervisor.workerSocket(2)}, listen)
+        resthost = settings.headerGetProperties("/server/resthost")[0]
+        self.assertEqual('13', resthost['serial'])
+        self.assertEqual('front-worker2', resthost['name'])
+        self.assertEqual('unix:' + self.supervisor.workerSocket(2), resthost['host'])
+        self.assertEqual('/POKER_REST', resthost['path'])
+
+    def test03_memcached(self):
+        with open(self.filename, "w") as f:
+            f.write((settings_xml_supervisor % {'socket_dir': self.tmpdir, 'script_dir': TESTS_PATH}).replace(' memcached="127.0.0.1:11211"', ''))
+        settings = pokernetworkconfig.Config([])
+        settings.load(self.filename)
+        self.assertRaises(Exception, PokerSupervisor, settings, self.filename)
+
+    def test04_assignShards(self):
+        self.supervisor.assignShards()
+        where = "resthost_serial IN (10, 11, 12, 13)"
+        self.assertEqual([
+            ("UPDATE tables SET resthost_serial = %s + (serial %% %s) WHERE tourney_serial IS NULL AND " + where, (11, 3)),
+            ("UPDATE tourneys_schedule SET resthost_serial = %s + (serial %% %s) WHERE " + where, (11, 3)),
+        ], MockDatabase.executed)
+        self.assertEqual(1, MockDatabase.closed)
+
+    def test05_startService(self):
+        spawned = []
+        self.supervisor.spawnWorker = spawned.append
+        self.supervisor.startService()
+        self.assertEqual(2, len(MockDatabase.executed))
+        self.assertEqual([0, 1, 2], spawned)
+        self.supervisor.running = False
+
+    def test06_routing(self):
+        service = MockService()
+        service.routes[42] = ('127.0.0.1', 0, 'unix:' + self.supervisor.workerSocket(1))
+        avatar = PokerAvatar(service)
+        local = []
+        distributed = []
+        avatar.handlePacket = lambda packet: local.append(packet) or ['local']
+        avatar.distributePacket = lambda packet, data, resthost, game_id: distributed.append((packet.type, resthost, game_id))
+        #
+        # packets of a table owned by no worker are handled by the front
+        #
+        packet = PacketPokerTourneyRegister(serial = 3, tourney_serial = 1)
+        self.assertEqual(['local'], avatar.handleRoutedPacket(packet))
+        self.assertEqual([packet], local)
+        self.assertEqual([], distributed)
+        #
+        # packets of a table owned by a worker are forwarded to the worker
+        # and the answers are sent when they come back
+        #
+        packet = PacketPokerTableJoin(serial = 3, game_id = 42)
+        self.assertEqual([], avatar.handleRoutedPacket(packet))
+        self.assertEqual([(packet.type, service.routes[42], 42)], distributed)
+        self.assertNotEqual(None, avatar.distributed_uid)
+        self.assertEqual({}, service.memcache.cache)
+        avatar.user.serial = 3
+        avatar.user.name = 'user3'
+        avatar.handleRoutedPacket(packet)
+        self.assertEqual({avatar.distributed_auth: '3'}, service.memcache.cache)
+
+def GetTestSuite():
+    loader = runner.TestLoader()
+    suite = loader.suiteFactory()
+    suite.addTest(loader.loadClass(PokerSupervisorTestCase))
+    return suite
+
+def Run():
+    return runner.TrialRunner(
+        reporter.TextReporter,
+        tracebackFormat='default',
+    ).run(GetTestSuite())
+
+if __name__ == '__main__':
+    if Run().wasSuccessful():
+        sys.exit(0)
+    else:
+        sys.exit(1)
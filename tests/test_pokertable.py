@@ -54,6 +54,7 @@ log = reflogging.root_logger.get_child('test-pokertable')
 
 from pokerengine import pokertournament
 from pokernetwork import pokertable, pokernetworkconfig
+from pokernetwork.pokerpacketizer import createCache, history2packets, private2public
 from pokerpackets.packets import *
 from pokerpackets.networkpackets import *
 from pokernetwork.pokeravatar import DEFAULT_PLAYER_USER_DATA, PokerAvatar
@@ -294,6 +295,12 @@ class MockService:
                 else:
                     self.testObject.assertEqual(origDict[action], fields)
 
+    def handWriterCongested(self):
+        return False
+
+    def chatAllowed(self, game_id, serial):
+        return True
+
     def updatePlayerMoney(self, serial, gameId, amount):
         # Most of this function matches up with the false hand history above
         #  Compare it to that when figuring out where these numbers come from,
@@ -3423,6 +3430,154 @@ class PokerTableExplainedTestCase(PokerTableTestCaseBase):
         table.scheduleAutoDeal()
         return d1
         
+# --------------------------------------------------------------------------------
+class PokerTableHandReplayTestCase(PokerTableTestCaseBase):
+    def setUp(self, ServiceClass = MockServiceWithLadder):
+        PokerTableTestCaseBase.setUp(self, ServiceClass = MockServiceWithLadder)
+
+    def test01_differential(self):
+        """At each step of a hand, the replay sent to the joining avatars
+        is the replay of the whole history without the positions
+        superseded after the blind and ante round"""
+        table = self.table
+        game = table.game
+        for serial in (1, 2, 3):
+            self.createPlayer(serial)
+            game.autoBlindAnte(serial)
+        table.cancelDealTimeout()
+        table.beginTurn()
+        table.update()
+        def key(packet):
+            return (packet.type, sorted(packet.__dict__.items()))
+        steps = 0
+        while not game.isEndOrNull():
+            replay = table.getHandReplay()
+            self.assertTrue(replay is table.getHandReplay())
+            packets = history2packets(game.historyGet(), game.id, -1, createCache())[0]
+            self.assertEqual(
+                [key(packet) for packet in packets if packet.type != PACKET_POKER_POSITION],
+                [key(packet) for packet in replay if packet.type != PACKET_POKER_POSITION]
+            )
+            positions = [packet for packet in packets if packet.type == PACKET_POKER_POSITION]
+            replay_positions = [packet for packet in replay if packet.type == PACKET_POKER_POSITION]
+            if positions:
+                self.assertEqual(key(positions[-1]), key(replay_positions[-1]))
+            first_round = [packet.type for packet in packets].index(PACKET_POKER_STATE)
+            self.assertEqual(
+                [key(packet) for packet in packets[:first_round] if packet.type == PACKET_POKER_POSITION],
+                [key(packet) for packet in replay[:first_round] if packet.type == PACKET_POKER_POSITION]
+            )
+            serial = game.getSerialInPosition()
+            if 'check' in game.possibleActions(serial):
+                game.check(serial)
+            else:
+                game.call(serial)
+            table.update()
+            self.assertFalse(replay is table.getHandReplay())
+            steps += 1
+        self.assertTrue(steps > 3)
+
+    def test03_snapshot(self):
+        """At each step of a hand, the state of the hand given by the
+        snapshot is the state of the game of an explain client after the
+        replay of the whole hand"""
+        table = self.table
+        game = table.game
+        for serial in (1, 2, 3):
+            self.createPlayer(serial)
+            game.autoBlindAnte(serial)
+        table.cancelDealTimeout()
+        table.beginTurn()
+        table.update()
+        def snapshotState(packets, observer):
+            state = {'chips': {}, 'pockets': {}, 'board': [], 'pot': 0, 'position': 0, 'state': 'blindAnte'}
+            for packet in packets:
+                packet = private2public(packet, observer)
+                if packet.type == PACKET_POKER_START:
+                    state['hand_serial'] = packet.hand_serial
+                elif packet.type == PACKET_POKER_IN_GAME:
+                    state['players'] = sorted(packet.players)
+                elif packet.type == PACKET_POKER_STATE:
+                    state['state'] = packet.string
+                elif packet.type == PACKET_POKER_BOARD_CARDS:
+                    state['board'] = packet.cards
+                elif packet.type == PACKET_POKER_PLAYER_CARDS:
+                    state['pockets'][packet.serial] = packet.cards
+                elif packet.type == PACKET_POKER_PLAYER_CHIPS:
+                    state['chips'][packet.serial] = (packet.money, packet.bet)
+                elif packet.type == PACKET_POKER_POT_CHIPS:
+                    state['pot'] += sum(value * count for value, count in zip(packet.bet[::2], packet.bet[1::2]))
+                elif packet.type == PACKET_POKER_POSITION:
+                    state['position'] = packet.serial
+            return state
+        def explainState(client_game):
+            players = [client_game.getPlayer(serial) for serial in client_game.player_list]
+            bets = sum(player.bet for player in players)
+            return {
+                'hand_serial': client_game.hand_serial,
+                'players': sorted(client_game.player_list),
+                'state': client_game.state,
+                'board': client_game.board.tolist(False),
+                'pockets': dict((player.serial, player.hand.toRawList()) for player in players if player.hand.toRawList()),
+                'chips': dict((player.serial, (player.money, player.bet)) for player in players),
+                'pot': client_game.potAndBetsAmount() - bets,
+                'position': client_game.getSerialInPosition() if client_game.isRunning() else 0,
+            }
+        observer = 100
+        snapshots = 0
+        while not game.isEndOrNull():
+            snapshot = table.getHandSnapshot()
+            self.assertTrue(snapshot is table.getHandSnapshot())
+            self.assertTrue(len(snapshot) <= len(table.getHandReplay()))
+            client = self.createPlayer(observer, getReadyToPlay=False, clientClass=MockClientWithExplain)
+            client.service = self.service
+            client.setExplain(PacketPokerExplain.REST)
+            self.assertTrue(table.joinPlayer(client, reason="MockCreatePlayerJoin"))
+            self.assertEqual(explainState(client.explain.games.getGame(game.id)), snapshotState(snapshot, observer))
+            observer += 1
+            serial = game.getSerialInPosition()
+            if 'check' in game.possibleActions(serial):
+                game.check(serial)
+            else:
+                game.call(serial)
+            table.update()
+            snapshots += 1
+        self.assertTrue(snapshots > 3)
+
+    def test04_join_snapshot(self):
+        table = self.table
+        game = table.game
+        for serial in (1, 2, 3):
+            self.createPlayer(serial)
+            game.autoBlindAnte(serial)
+        table.cancelDealTimeout()
+        table.beginTurn()
+        table.update()
+        for serial in (1, 2):
+            game.call(game.getSerialInPosition())
+            table.update()
+        calls = []
+        table.getHandSnapshot = lambda: calls.append('snapshot') or []
+        table.getHandReplay = lambda: calls.append('replay') or []
+        table.join_snapshot = True
+        for serial, explain in ((100, 0), (101, PacketPokerExplain.REST)):
+            client = self.createPlayer(serial, getReadyToPlay=False, clientClass=MockClientWithExplain)
+            client.service = self.service
+            client.setExplain(explain)
+            self.assertTrue(table.joinPlayer(client, reason="MockCreatePlayerJoin"))
+        self.assertEqual(['snapshot', 'replay'], calls)
+
+    def test02_ladder(self):
+        table = self.table
+        self.assertEqual(PACKET_POKER_PLAYER_STATS, table.getLadder(1).type)
+        self.assertEqual(1, self.service.calledLadderMockup)
+        self.service.calledLadderMockup = None
+        table.getLadder(1)
+        self.assertEqual(None, self.service.calledLadderMockup)
+        table.game.hand_serial += 1
+        table.getLadder(1)
+        self.assertEqual(1, self.service.calledLadderMockup)
+
 # --------------------------------------------------------------------------------
 
 def GetTestSuite():
@@ -3437,6 +3592,7 @@ def GetTestSuite():
     suite.addTest(loader.loadClass(PokerTableMoveTestCase))
     suite.addTest(loader.loadClass(PokerTableRejoinTestCase))
     suite.addTest(loader.loadClass(PokerTableExplainedTestCase))
+    suite.addTest(loader.loadClass(PokerTableHandReplayTestCase))
     return suite
 
 def Run():
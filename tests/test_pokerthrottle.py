@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This software's license gives you freedom; you can copy, convey,
+# propagate, redistribute and/or modify this program under the terms of
+# the GNU Affero General Public License (AGPL) as published by the Free
+# Software Foundation (FSF), either version 3 of the License, or (at your
+# option) any later version of the AGPL published by the FSF.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Affero
+# General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program in a file in the toplevel directory called
+# "AGPLv3".  If not, see <http://www.gnu.org/licenses/>.
+#
+import sys
+from os import path
+
+TESTS_PATH = path.dirname(path.realpath(__file__))
+sys.path.insert(0, path.join(TESTS_PATH, ".."))
+
+from twisted.trial import unittest, runner, reporter
+
+from pokerpackets.packets import PACKET_PING, PACKET_ERROR, PacketPing
+from pokerpackets.networkpackets import PACKET_POKER_CHAT, PACKET_POKER_TABLE_SELECT, PACKET_POKER_FOLD, PACKET_POKER_SEAT, PacketPokerTableSelect
+
+from pokernetwork import pokernetworkconfig
+from pokernetwork.pokerthrottle import ThrottlePolicy, THROTTLED
+from pokernetwork.server import PokerServerProtocol
+
+settings_xml = """<?xml version="1.0" encoding="UTF-8"?>
+<server throttle="yes">
+  <throttle rate="2" burst="10" chat="4" lobby="5" action="1" other="2"/>
+</server>
+"""
+
+class PacketThrottleTestCase(unittest.TestCase):
+
+    def setUp(self):
+        settings = pokernetworkconfig.Config([])
+        settings.loadFromString(settings_xml)
+        self.policy = ThrottlePolicy(settings)
+        self.throttle = self.policy.createThrottle()
+        self.throttle.last = 0
+
+    def test01_costs(self):
+        self.assertEqual(0, self.policy.cost(PACKET_PING))
+        self.assertEqual(4, self.policy.cost(PACKET_POKER_CHAT))
+        self.assertEqual(5, self.policy.cost(PACKET_POKER_TABLE_SELECT))
+        self.assertEqual(1, self.policy.cost(PACKET_POKER_FOLD))
+        self.assertEqual(2, self.policy.cost(PACKET_POKER_SEAT))
+
+    def test02_burst(self):
+        self.assertTrue(self.throttle.allow(PACKET_POKER_TABLE_SELECT, now=0))
+        self.assertTrue(self.throttle.allow(PACKET_POKER_TABLE_SELECT, now=0))
+        self.assertFalse(self.throttle.allow(PACKET_POKER_TABLE_SELECT, now=0))
+        self.assertFalse(self.throttle.allow(PACKET_POKER_FOLD, now=0))
+        self.assertTrue(self.throttle.allow(PACKET_PING, now=0))
+        self.assertEqual(2, self.throttle.rejected)
+
+    def test03_refill(self):
+        for _ in range(10):
+            self.throttle.allow(PACKET_POKER_FOLD, now=0)
+        self.assertFalse(self.throttle.allow(PACKET_POKER_CHAT, now=1))
+        self.assertTrue(self.throttle.allow(PACKET_POKER_CHAT, now=2))
+        #
+        # the bucket never holds more than burst tokens
+        #
+        self.assertTrue(self.throttle.allow(PACKET_POKER_TABLE_SELECT, now=1000))
+        self.assertTrue(self.throttle.allow(PACKET_POKER_TABLE_SELECT, now=1000))
+        self.assertFalse(self.throttle.allow(PACKET_POKER_TABLE_SELECT, now=1000))
+
+    def test04_check(self):
+        self.policy.rate = 0
+        for _ in range(2):
+            self.assertEqual(None, self.throttle.check(PacketPokerTableSelect()))
+        error = self.throttle.check(PacketPokerTableSelect())
+        self.assertEqual(PACKET_ERROR, error.type)
+        self.assertEqual(PACKET_POKER_TABLE_SELECT, error.other_type)
+        self.assertEqual(THROTTLED, error.code)
+        self.assertEqual(None, self.throttle.check(PacketPing()))
+
+class MockAvatar:
+    metrics = None
+    def __init__(self):
+        self.handled = []
+    def setProtocol(self, protocol):
+        self.protocol = protocol
+    def handlePacket(self, packet):
+        self.handled.append(packet)
+        return []
+
+class MockFactory:
+    def __init__(self, throttle_policy):
+        self.throttle_policy = throttle_policy
+    def createAvatar(self):
+        return MockAvatar()
+
+class ProtocolThrottleTestCase(unittest.TestCase):
+
+    def setUp(self):
+        settings = pokernetworkconfig.Config([])
+        settings.loadFromString(settings_xml)
+        self.policy = ThrottlePolicy(settings)
+        self.policy.rate = 0
+
+    def connect(self, factory):
+        protocol = PokerServerProtocol()
+        protocol.factory = factory
+        protocol.sent = []
+        protocol.sendPacket = protocol.sent.append
+        protocol.sendPackets = protocol.sent.extend
+        protocol.protocolEstablished()
+        return protocol
+
+    def test01_per_connection(self):
+        factory = MockFactory(self.policy)
+        first = self.connect(factory)
+        second = self.connect(factory)
+        for _ in range(3):
+            first.packetReceived(PacketPokerTableSelect())
+        self.assertEqual(2, len(first.avatar.handled))
+        self.assertEqual([THROTTLED], [packet.code for packet in first.sent])
+        #
+        # the bucket of the other connection is full
+        #
+        second.packetReceived(PacketPokerTableSelect())
+        self.assertEqual(1, len(second.avatar.handled))
+        self.assertEqual([], second.sent)
+
+    def test02_disabled(self):
+        protocol = self.connect(MockFactory(None))
+        self.assertEqual(None, protocol.throttle)
+        for _ in range(3):
+            protocol.packetReceived(PacketPokerTableSelect())
+        self.assertEqual(3, len(protocol.avatar.handled))
+
+def GetTestSuite():
+    loader = runner.TestLoader()
+    suite = loader.suiteFactory()
+    suite.addTest(loader.loadClass(PacketThrottleTestCase))
+    suite.addTest(loader.loadClass(ProtocolThrottleTestCase))
+    return suite
+
+def Run():
+    return runner.TrialRunner(
+        reporter.TextReporter,
+        tracebackFormat='default',
+    ).run(GetTestSuite())
+
+if __name__ == '__main__':
+    if Run().wasSuccessful():
+        sys.exit(0)
+    else:
+        sys.exit(1)
@@ -2,7 +2,9 @@
 # -*- coding: utf-8 -*-
 
 from pokernetwork import protocol
-from pokerpackets import packets, binarypack
+from pokernetwork.protocol._base import KeepaliveSweeper, keepalive_sweeper
+from pokernetwork.protocol import _codec
+from pokerpackets import packets, networkpackets, binarypack
 import sys, unittest
 
 
@@ -118,6 +120,116 @@ class UGAMEProtocolTestCase(unittest.TestCase):
                 self._data_list.append(data)
         return MockTransport(data_list)
 
+class KeepaliveSweeperTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.sweeper = KeepaliveSweeper()
+        self.protocol = protocol.UGAMEProtocol()
+        self.protocol.established = True
+        self.data_list = []
+        class MockTransport:
+            def write(transport, data):
+                self.data_list.append(data)
+        self.protocol.transport = MockTransport()
+
+    def tearDown(self):
+        self.sweeper.remove(self.protocol)
+
+    def test_timer(self):
+        assert self.sweeper.timer is None
+        self.sweeper.add(self.protocol)
+        assert self.sweeper.timer.active()
+        self.sweeper.remove(self.protocol)
+        assert self.sweeper.timer is None
+
+    def test_sweep(self):
+        self.protocol.keepalive_set_interval(10)
+        self.protocol._keepalive_reset()
+        self.sweeper.add(self.protocol)
+        self.sweeper.sweep()
+        assert self.data_list == []
+
+        self.protocol._keepalive_last -= 11
+        self.sweeper.sweep()
+        assert self.data_list == [binarypack.pack(packets.PacketPing())]
+        # the ping counts as activity
+        self.sweeper.sweep()
+        assert len(self.data_list) == 1
+
+        self.protocol._keepalive_last -= 11
+        self.protocol.dataWrite("test")
+        self.sweeper.sweep()
+        assert self.data_list[1:] == ["test"]
+        assert self.sweeper.timer.active()
+
+    def test_disabled(self):
+        # no ping unless the server sets keepalive
+        assert keepalive_sweeper.interval == 0
+        self.protocol._keepalive_start()
+        assert self.protocol not in keepalive_sweeper.protocols
+        assert keepalive_sweeper.timer is None
+
+    def test_enabled(self):
+        keepalive_sweeper.interval = 10
+        try:
+            self.protocol._keepalive_start()
+            assert self.protocol in keepalive_sweeper.protocols
+            self.protocol._keepalive_last -= 11
+            keepalive_sweeper.sweep()
+            assert self.data_list == [binarypack.pack(packets.PacketPing())]
+        finally:
+            keepalive_sweeper.interval = 0
+            self.protocol._keepalive_stop()
+        assert keepalive_sweeper.timer is None
+
+class MsgpackProtocolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.received = []
+        self.server = protocol.MsgpackProtocol()
+        self.server.packetReceived = self.received.append
+        self.client = protocol.MsgpackProtocol()
+        self.client.packetReceived = self.received.append
+        self.data_list = []
+        class MockTransport:
+            def write(transport, data):
+                self.data_list.append(data)
+        self.server.transport = self.client.transport = MockTransport()
+
+    def test_codec(self):
+        chips = networkpackets.PacketPokerPlayerChips(game_id = 1, serial = 2, money = 3, bet = 4)
+        frame = _codec.encode(chips)
+        assert frame[0] == -chips.type
+        assert _codec.decode(frame) == chips
+        assert frame[1:] == [1, 2, 3, 4]
+        cards = networkpackets.PacketPokerBoardCards(game_id = 1, cards = [1, 2, 3])
+        assert _codec.decode(_codec.encode(cards)) == cards
+
+    def test_schema(self):
+        for packet_type, fields in _codec.COMPACT_FIELDS.iteritems():
+            assert _codec.schema(packet_type).fields == fields, packet_type
+            packet = packet_type(**dict((field, "hello" if field == 'message' else 1) for field in fields))
+            assert _codec.decode(_codec.encode(packet)) == packet, packet_type
+        assert _codec.schema(networkpackets.PacketPokerBoardCards).fields is None
+
+    def test_map(self):
+        self.client.sendPacket(packets.PacketPing())
+        self.server.dataReceived(self.data_list.pop())
+        assert self.received == [packets.PacketPing()]
+        assert not self.server._compact
+
+    def test_compact(self):
+        self.client._compact = True
+        chips = networkpackets.PacketPokerPlayerChips(game_id = 1, serial = 2, money = 3, bet = 4)
+        self.client.sendPackets([packets.PacketPing(), chips])
+        self.server.dataReceived(self.data_list.pop())
+        assert self.received == [packets.PacketPing(), chips]
+        assert self.server._compact
+
+        self.server.sendPackets([chips, chips])
+        self.client.dataReceived(self.data_list.pop())
+        assert self.received[2:] == [chips, chips]
+
 
 if __name__ == '__main__':
     unittest.main()
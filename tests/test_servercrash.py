@@ -140,6 +140,26 @@ class PokerCrashTestCase(unittest.TestCase):
         # self.assertEqual(11, cursor.fetchall())
         cursor.close()
 
+    def test01_cleanupCrashedTables_refund(self):
+        cursor = self.db.cursor()
+        cursor.execute('INSERT INTO tableconfigs (serial, name, variant, betting_structure, currency_serial) VALUES (1, "Table1", "holdem", "2-4-no-limit", 1)')
+        cursor.execute('INSERT INTO tables (serial, resthost_serial, tableconfig_serial) VALUES (303, 1, 1), (304, 1, 1)')
+        #
+        # seated at two tables of the same currency, both are given back
+        #
+        cursor.execute('INSERT INTO user2table (user_serial, table_serial, money) VALUES (1000, 303, 10), (1000, 304, 20)')
+        cursor.execute("INSERT INTO user2money (user_serial, currency_serial, amount) VALUES (1000, 1, 5)")
+        #
+        # no user2money row, the zombie is removed nevertheless
+        #
+        cursor.execute('INSERT INTO user2table (user_serial, table_serial, money) VALUES (1001, 303, 10)')
+        self.service.startService()
+        cursor.execute("SELECT COUNT(*) FROM user2table")
+        self.assertEqual((0,), cursor.fetchone())
+        cursor.execute("SELECT amount FROM user2money WHERE user_serial = 1000 AND currency_serial = 1")
+        self.assertEqual((35,), cursor.fetchone())
+        cursor.close()
+
     def test02_cleanupTourneys_refund(self):
         tourney_serial = '10'
         user_serial = '200'
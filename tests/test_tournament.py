@@ -128,6 +128,7 @@ class MockService(PokerService):
         self.dirs = settings.headerGet("/server/path").split()
         
         self.tourney_table_serial = 1
+        self.hand_writer = None
         
         self.missed_round_max = 5
         self.shutting_down = False
@@ -1,14 +1,12 @@
 from twisted.internet import reactor, defer
 
-class PokerLockMockup:
-    def __init__(self, params):
+class PokerLockManagerMockup:
+    def __init__(self, parameters = None, connections = 4):
         pass
-    def isAlive(self):
+    def isLocked(self, name):
         return True
     def close(self):
         pass
-    def start(self):
-        pass
     def acquire(self, name, timeout):
         d = defer.Deferred()
         reactor.callLater(0.1, lambda: d.callback(name))
@@ -17,4 +15,4 @@ class PokerLockMockup:
         pass
 
 from pokernetwork import pokercashier
-pokercashier.PokerLock = PokerLockMockup
+pokercashier.PokerMySQLLockManager = PokerLockManagerMockup